@@ -20,19 +20,47 @@ Table for each standard (91099, 91100, etc.) with columns for:
 }
 """
 
+import os
 import json
-import sqlite3
+import math
+import re
+
+from database.connections import getConnectionProvider, poolingEnabled, connect
 
 class LLMDatabaseManager:
-    def __init__(self):
+    # grading_metrics columns filled from a result's 'Metrics' dict
+    METRIC_COLUMNS = ("model", "mode", "prefetched", "db_read_s", "prompt_build_s", "request_sent_s", "ttft_s",
+                      "grade_ready_s", "llm_s", "parse_s", "normalize_s", "save_s", "total_s", "prompt_tokens",
+                      "completion_tokens", "usage_reported", "requests", "retries", "cost_usd")
+    # Columns added after grading_metrics was first created (added to older databases on open)
+    ADDED_METRIC_COLUMNS = {"prefetched": "INTEGER", "request_sent_s": "REAL", "grade_ready_s": "REAL"}
+    pooled = False  # whether connection is this thread's shared one (set in __init__; subclasses may open their own)
+
+    def __init__(self, dbPath=None):
         """
-        Initializes the LLMDatabaseManager with the path to the SQLite database.
+        Initializes the LLMDatabaseManager with the path to the SQLite database (LLM_DB_PATH overrides the default).
         """        
         # Use a test db for testing purposes rn
-        self.dbPath = "./database/LLM_testdatabase.db"
-        self.connection = sqlite3.connect(self.dbPath)
-        self.cursor = self.connection.cursor()
+        self.dbPath = dbPath or os.getenv("LLM_DB_PATH", "./database/LLM_testdatabase.db")
+        # This thread's shared connection (see database.connections); the tables are set up once per process
+        self.pooled = poolingEnabled()
+        if self.pooled:
+            provider = getConnectionProvider()
+            self.connection = provider.connection(self.dbPath)
+            self.cursor = self.connection.cursor()
+            provider.ensureSchema(self.dbPath, self.createTables)
+        else:
+            self.connection = connect(self.dbPath)
+            self.cursor = self.connection.cursor()
+            self.createTables()
+
+    def createTables(self):
+        """
+        Creates the submissions, paragraph and metrics tables if they don't exist.
+        """
         self.createSubmissionsTable()
+        self.createParagraphsTable()
+        self.createMetricsTable()
 
     def readDatabase(self, standard):
         """
@@ -87,7 +115,7 @@ class LLMDatabaseManager:
         """
         Returns a list of all available standards in the database.
         """
-        query = 'SELECT name FROM sqlite_master WHERE type = "table" AND name NOT LIKE "sqlite_%" AND name != "submissions";'
+        query = 'SELECT name FROM sqlite_master WHERE type = "table" AND name NOT LIKE "sqlite_%" AND name NOT IN ("submissions", "submission_paragraphs", "grading_metrics", "grading_jobs");'
         self.cursor.execute(query)
         rows = self.cursor.fetchall()
         print(rows)
@@ -113,9 +141,12 @@ class LLMDatabaseManager:
 
     def exit(self):  # method retained but uses camelCase for consistency
         """
-        Exits the database conection.
+        Exits the database conection (a shared one stays open for the thread's next manager).
         """
-        self.connection.close()
+        if self.pooled:
+            self.cursor.close()
+        else:
+            self.connection.close()
 
     def createSubmissionsTable(self):
         """
@@ -148,6 +179,183 @@ class LLMDatabaseManager:
         self.connection.commit()
         return self.cursor.lastrowid
 
+    def updateSubmission(self, submissionId, feedback, highlightedHtml, grade):
+        """
+        Replaces the feedback, highlighted HTML and grade of a saved submission
+        (two-phase grading saves the grade first and the highlights once they are ready).
+        """
+        self.cursor.execute('''
+            UPDATE submissions SET feedback = ?, highlighted_html = ?, grade = ?
+            WHERE id = ?
+        ''', (json.dumps(feedback), highlightedHtml, grade, submissionId))
+        self.connection.commit()
+
+    def deleteSubmission(self, submissionId):
+        """
+        Deletes a submission with its paragraph feedback and grading metrics. They are deleted here rather than
+        left to ON DELETE CASCADE, which databases opened without foreign keys enforced never ran.
+        """
+        self.cursor.execute('DELETE FROM submission_paragraphs WHERE submission_id = ?', (submissionId,))
+        self.cursor.execute('DELETE FROM grading_metrics WHERE submission_id = ?', (submissionId,))
+        self.cursor.execute('DELETE FROM submissions WHERE id = ?', (submissionId,))
+        self.connection.commit()
+
+    def createParagraphsTable(self):
+        """
+        Creates the per-paragraph feedback store (highlighted HTML of each paragraph, linked to its submission).
+        """
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS submission_paragraphs (
+                submission_id INTEGER NOT NULL REFERENCES submissions(id) ON DELETE CASCADE,
+                paragraph_index INTEGER NOT NULL,
+                paragraph_hash TEXT NOT NULL,
+                highlighted_html TEXT NOT NULL,
+                tokens INTEGER,
+                seconds REAL,
+                PRIMARY KEY (submission_id, paragraph_index)
+            )
+        ''')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_submission_paragraphs_hash ON submission_paragraphs(paragraph_hash)')
+        self.connection.commit()
+
+    def saveParagraphs(self, submissionId, paragraphs):
+        """
+        Saves the paragraph records ({index, hash, html, tokens, seconds}) of a saved submission.
+        """
+        self.cursor.executemany('''
+            INSERT OR REPLACE INTO submission_paragraphs
+            (submission_id, paragraph_index, paragraph_hash, highlighted_html, tokens, seconds)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(submissionId, p["index"], p["hash"], p["html"], p.get("tokens"), p.get("seconds")) for p in paragraphs])
+        self.connection.commit()
+
+    def getPreviousParagraphs(self, username, standard, year, submissions=5):
+        """
+        Returns {paragraph hash: {html, tokens, seconds}} from the user's most recent submissions
+        for this standard and year (newest wins when a paragraph appears more than once).
+        """
+        self.cursor.execute('''
+            SELECT p.paragraph_hash, p.highlighted_html, p.tokens, p.seconds
+            FROM submission_paragraphs p
+            JOIN (
+                SELECT id FROM submissions
+                WHERE TRIM(LOWER(username)) = TRIM(LOWER(?)) AND standard = ? AND year = ?
+                ORDER BY id DESC LIMIT ?
+            ) s ON s.id = p.submission_id
+            ORDER BY p.submission_id DESC
+        ''', (username, standard, year, submissions))
+        previous = {}
+        for paragraphHash, html, tokens, seconds in self.cursor.fetchall():
+            previous.setdefault(paragraphHash, {"html": html, "tokens": tokens, "seconds": seconds})
+        return previous
+
+    def createMetricsTable(self):
+        """
+        Creates the per-submission grading metrics store (stage timings in seconds, tokens, retries, model, cost).
+        """
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS grading_metrics (
+                submission_id INTEGER PRIMARY KEY REFERENCES submissions(id) ON DELETE CASCADE,
+                standard TEXT NOT NULL,
+                model TEXT,
+                mode TEXT,
+                prefetched INTEGER,
+                db_read_s REAL,
+                prompt_build_s REAL,
+                request_sent_s REAL,
+                ttft_s REAL,
+                grade_ready_s REAL,
+                llm_s REAL,
+                parse_s REAL,
+                normalize_s REAL,
+                save_s REAL,
+                total_s REAL,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                usage_reported INTEGER,
+                requests INTEGER,
+                retries INTEGER,
+                cost_usd REAL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_grading_metrics_standard_model ON grading_metrics(standard, model)')
+        existing = {row[1] for row in self.cursor.execute('PRAGMA table_info(grading_metrics)').fetchall()}
+        for column, kind in self.ADDED_METRIC_COLUMNS.items():
+            if column not in existing:
+                self.cursor.execute(f'ALTER TABLE grading_metrics ADD COLUMN {column} {kind}')
+        self.connection.commit()
+
+    def saveMetrics(self, submissionId, standard, metrics, saveSeconds=None):
+        """
+        Saves the 'Metrics' dict of a graded submission (see FeedbackModule.takeMetrics) for a saved submission.
+        saveSeconds is how long saving the submission itself took.
+        """
+        row = {column: metrics.get(column) for column in self.METRIC_COLUMNS}
+        if saveSeconds is not None:
+            row["save_s"] = round(saveSeconds, 4)
+        columns = ", ".join(row)
+        self.cursor.execute(
+            f'INSERT OR REPLACE INTO grading_metrics (submission_id, standard, {columns}) VALUES (?, ?{", ?" * len(row)})',
+            (submissionId, standard, *row.values()))
+        self.connection.commit()
+
+    def getMetricPercentiles(self, metric="total_s", standard=None, model=None, window=200, percentiles=(50, 95, 99)):
+        """
+        Rolling percentiles of one grading_metrics column over the most recent `window` submissions of each
+        (standard, model), e.g. {("91099", "openai/gpt-4.1-mini"): {"count": 120, "p50": 6.1, "p95": 14.2, "p99": 19.8}}.
+        standard and model narrow it to one group. Rows without a value for the metric are skipped.
+        """
+        if metric not in self.METRIC_COLUMNS or metric in ("model", "mode", "prefetched"):
+            raise ValueError(f"Unknown metric {metric!r}")
+        filters, params = [f"{metric} IS NOT NULL"], []
+        if standard is not None:
+            filters.append("standard = ?")
+            params.append(standard)
+        if model is not None:
+            filters.append("model = ?")
+            params.append(model)
+        self.cursor.execute(f'''
+            SELECT standard, model, value FROM (
+                SELECT standard, model, {metric} AS value,
+                       ROW_NUMBER() OVER (PARTITION BY standard, model ORDER BY submission_id DESC) AS recent
+                FROM grading_metrics
+                WHERE {" AND ".join(filters)}
+            )
+            WHERE recent <= ?
+        ''', (*params, window))
+        groups = {}
+        for groupStandard, groupModel, value in self.cursor.fetchall():
+            groups.setdefault((groupStandard, groupModel), []).append(value)
+        result = {}
+        for key, values in groups.items():
+            values.sort()
+            # Nearest-rank percentiles, like llm.grade.percentile
+            summary = {"count": len(values)}
+            for pct in percentiles:
+                summary[f"p{pct:g}"] = values[max(0, min(len(values) - 1, math.ceil(pct / 100 * len(values)) - 1))]
+            result[key] = summary
+        return result
+
+    def migrateHighlights(self, migrate):
+        """
+        Rewrites submissions stored with inline highlight styles (or <mark>) with migrate(html), which returns the
+        class-based form (llm.socketing.highlight.migrateHighlightedHTML). main.py runs it once at start-up, so
+        reading submissions never writes; rows already in class form are skipped.
+        """
+        self.cursor.execute('''
+            SELECT id, highlighted_html FROM submissions
+            WHERE highlighted_html LIKE '%style=%' OR highlighted_html LIKE '%<mark%'
+        ''')
+        updates = []
+        for submissionId, html in self.cursor.fetchall():
+            migrated = migrate(html)
+            if migrated != html:
+                updates.append((migrated, submissionId))
+        if updates:
+            self.cursor.executemany('UPDATE submissions SET highlighted_html = ? WHERE id = ?', updates)
+            self.connection.commit()
+
     def getUserSubmissions(self, username, limit=10):
         """
         Retrieves recent submissions for a specific user.
@@ -213,6 +421,37 @@ class ExemplarInterpet():
     """
     Class to interpret the exemplars from the database.
     """
+    # Because NCEA exemplars are grade on the extended NAME format (N0, N1, N2 etc.), we need to
+    # interpret the grade to match achieved/merit/excellence.
+    GRADE_MAPPING = {
+        "N0": "Not Achieved",
+        "N1": "Not Achieved",
+        "N2": "Not Achieved",
+        "A3": "Achieved",
+        "A4": "Achieved",
+        "M5": "Merit",
+        "M6": "Merit",
+        "E7": "Excellence",
+        "E8": "Excellence"
+    }
+
+    @staticmethod
+    def gradeBand(grade):
+        """
+        The band (Not Achieved/Achieved/Merit/Excellence) of a grade written as a code ("M5"), a name ("Merit")
+        or both ("Merit (M6)"). Returns None for anything else.
+        """
+        text = str(grade or "").strip()
+        code = re.search(r"\b([NAME][0-8])\b", text.upper())
+        if code and code.group(1) in ExemplarInterpet.GRADE_MAPPING:
+            return ExemplarInterpet.GRADE_MAPPING[code.group(1)]
+        lowered = text.lower()
+        # Longest name first, so "Not Achieved" isn't read as "Achieved"
+        for band in sorted(set(ExemplarInterpet.GRADE_MAPPING.values()), key=len, reverse=True):
+            if band.lower() in lowered:
+                return band
+        return None
+
     def __init__(self, exemplarData):
         """
         Initializes ExemplarInterpet with the exemplar data.
@@ -230,23 +469,9 @@ class ExemplarInterpet():
         Returns a list of exemplars for a specific grade (not achieved, achieved, merit, excellence).
         """
 
-        # Because NCEA exemplars are grade on the extended NAME format (N0, N1, N2 etc.), we need to
-        # interpret the grade to match achieved/merit/excellence.
-        grade_mapping = {
-            "N0": "Not Achieved",
-            "N1": "Not Achieved",
-            "N2": "Not Achieved",
-            "A3": "Achieved",
-            "A4": "Achieved",
-            "M5": "Merit",
-            "M6": "Merit",
-            "E7": "Excellence",
-            "E8": "Excellence"
-        }
-
         # Returns the list of exemplars for the specified grade.
         exemplars = self.getExemplars()
-        target_grade_name = grade_mapping.get(grade, "")
+        target_grade_name = self.GRADE_MAPPING.get(grade, "")
         if not target_grade_name:
             return []
             
@@ -0,0 +1,91 @@
+"""
+Shared SQLite connections. Opening a connection and running the CREATE TABLE IF NOT EXISTS setup (plus a commit)
+for every query made page loads pay for connection setup and a write lock each time. The ConnectionProvider
+keeps one connection per thread and database file, shared by every LLMDatabaseManager made on that thread
+(SQLite connections stay on the thread that opened them), and runs each file's schema setup once per process.
+LLM_DB_POOL=0 goes back to a new connection and schema setup per manager.
+"""
+
+# Basic imports
+import os
+import sqlite3
+import logging
+import threading
+
+
+def connect(dbPath):
+    """A new connection to dbPath with foreign keys enforced (SQLite turns them off on every new connection)."""
+    connection = sqlite3.connect(dbPath)
+    connection.execute('PRAGMA foreign_keys = ON')
+    return connection
+
+
+def poolingEnabled():
+    """Whether connections are shared (LLM_DB_POOL, on unless 0)."""
+    return os.getenv("LLM_DB_POOL", "1") != "0"
+
+
+class ConnectionProvider():
+    """Thread-local SQLite connections, one per thread and database file, and run-once schema setup."""
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.prepared = set()  # database files whose schema setup has run
+        self.opened = 0
+
+    def _key(self, dbPath):
+        return os.path.abspath(dbPath)
+
+    def connection(self, dbPath):
+        """This thread's connection to dbPath, opened on first use."""
+        connections = getattr(self.local, "connections", None)
+        if connections is None:
+            connections = self.local.connections = {}
+        key = self._key(dbPath)
+        if key not in connections:
+            connections[key] = connect(dbPath)
+            with self.lock:
+                self.opened += 1
+        return connections[key]
+
+    def ensureSchema(self, dbPath, setup):
+        """Run setup() the first time dbPath is used in this process (again if it raised)."""
+        key = self._key(dbPath)
+        with self.lock:
+            if key in self.prepared:
+                return
+            setup()
+            self.prepared.add(key)
+
+    def forget(self, dbPath):
+        """Run the schema setup of dbPath again on its next use (e.g. after the file was replaced)."""
+        with self.lock:
+            self.prepared.discard(self._key(dbPath))
+
+    def closeThread(self):
+        """Close this thread's connections (a thread's are also closed when it ends and they are collected)."""
+        connections = getattr(self.local, "connections", None) or {}
+        for connection in connections.values():
+            try:
+                connection.close()
+            except Exception as e:
+                logging.warning(f"Closing a database connection failed: {e}")
+        self.local.connections = {}
+
+    def stats(self):
+        """{'opened': connections opened so far, 'prepared': database files set up}."""
+        with self.lock:
+            return {"opened": self.opened, "prepared": len(self.prepared)}
+
+
+_shared = None
+_sharedLock = threading.Lock()
+
+
+def getConnectionProvider():
+    """The process-wide ConnectionProvider shared by the pages, the grading path and the job workers."""
+    global _shared
+    with _sharedLock:
+        if _shared is None:
+            _shared = ConnectionProvider()
+        return _shared
@@ -0,0 +1,105 @@
+"""
+How long the GUI thread is blocked. GuiBlockMonitor runs a heartbeat timer on the GUI thread: a beat that comes
+late means the event loop was busy (a slow slot, a synchronous query) and the window could not repaint or take
+input for that long. Slots can also be timed by name with measure(). Stalls of at least GUI_BLOCK_WARN_MS
+(default 100) are logged and recorded in telemetry as 'guiBlocked', with the measured slot that caused them. The
+heartbeat runs on the same thread, so a late beat only fires after the slot has returned; the slowest measured
+slot that overran since the previous beat is kept for it.
+"""
+
+# Basic imports
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+# Custom imports
+from PyQt6.QtCore import QObject, QTimer, Qt
+from llm.socketing.telemetry import getTelemetry
+
+HEARTBEAT_MS = 50
+DEFAULT_WARN_MS = 100
+
+
+class GuiBlockMonitor(QObject):
+    """Heartbeat and slot timings of the GUI thread. Create, start and use it on the GUI thread only."""
+    def __init__(self, parent=None, intervalMs=HEARTBEAT_MS, warnMs=None):
+        super().__init__(parent)
+        try:
+            self.warnMs = float(warnMs if warnMs is not None else os.getenv("GUI_BLOCK_WARN_MS", DEFAULT_WARN_MS))
+        except ValueError:
+            self.warnMs = float(DEFAULT_WARN_MS)
+        self.intervalMs = intervalMs
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.timer.setInterval(intervalMs)
+        self.timer.timeout.connect(self._beat)
+        self.stalls = 0
+        self.blockedMs = 0.0
+        self.maxBlockedMs = 0.0
+        self.slots = {}  # name -> {count, totalMs, maxMs}
+        self._current = None
+        self._overran = None  # (name, ms) of the slowest measured slot that overran since the last beat
+        self._lastBeat = None
+
+    def start(self):
+        self._lastBeat = time.perf_counter()
+        self.timer.start()
+        return self
+
+    def stop(self):
+        self.timer.stop()
+
+    def _beat(self):
+        now = time.perf_counter()
+        late = (now - self._lastBeat) * 1000 - self.intervalMs
+        self._lastBeat = now
+        overran, self._overran = self._overran, None
+        if late >= self.warnMs:
+            slot = overran[0] if overran else self._current
+            self.stalls += 1
+            self.blockedMs += late
+            self.maxBlockedMs = max(self.maxBlockedMs, late)
+            logging.warning(f"GUI thread blocked for {late:.0f} ms" + (f" (in {slot})" if slot else ""))
+            getTelemetry().record('guiBlocked', ms=round(late), slot=slot)
+
+    @contextmanager
+    def measure(self, name):
+        """Time a block of GUI-thread work under name (the stall the next beat sees is attributed to it)."""
+        previous, self._current = self._current, name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            self._current = previous
+            slot = self.slots.setdefault(name, {"count": 0, "totalMs": 0.0, "maxMs": 0.0})
+            slot["count"] += 1
+            slot["totalMs"] += ms
+            slot["maxMs"] = max(slot["maxMs"], ms)
+            if ms >= self.warnMs:
+                logging.warning(f"GUI slot {name} took {ms:.0f} ms")
+                if self._overran is None or ms > self._overran[1]:
+                    self._overran = (name, ms)
+
+    def stats(self):
+        """Stalls seen by the heartbeat and per-slot timings, in milliseconds."""
+        return {
+            "stalls": self.stalls, "blockedMs": round(self.blockedMs, 1), "maxBlockedMs": round(self.maxBlockedMs, 1),
+            "slots": {name: {"count": s["count"], "totalMs": round(s["totalMs"], 1), "maxMs": round(s["maxMs"], 1)}
+                      for name, s in self.slots.items()},
+        }
+
+
+_shared = None
+_sharedLock = threading.Lock()
+
+
+def getGuiMonitor():
+    """The app's GuiBlockMonitor (started by main.py; pages only time their slots with it)."""
+    global _shared
+    with _sharedLock:
+        if _shared is None:
+            _shared = GuiBlockMonitor()
+        return _shared
@@ -1,18 +1,17 @@
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout,
-    QLabel, QPushButton, QTextEdit, QTextBrowser, QComboBox, QMessageBox, QDialog, QProgressBar
+    QLabel, QPushButton, QTextBrowser, QComboBox, QMessageBox, QDialog, QProgressBar, QListWidget
 )
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QObject
+from PyQt6.QtCore import Qt, pyqtSignal, QObject, QTimer
 
-import sys, os
+import sys, os, time
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from llm.socketing.handle import FeedbackModule
+from llm.socketing.highlight import HIGHLIGHT_STYLESHEET
+from llm.socketing.jobqueue import getJobRunner, RUNNING
+from gui.monitor import getGuiMonitor
 from database.LLM_database_manage import LLMDatabaseManager
 from socketing.session import SessionFileManager
-import gui.styles.sheets as sheets
-
-import json
 
 
 class NewSubmissionPage(QWidget):
@@ -20,14 +19,20 @@ class NewSubmissionPage(QWidget):
         super().__init__()
         # Core state
         self.MAX_CHARS = 50000
-        self.feedback_module = FeedbackModule()
         self.session_manager = SessionFileManager()
         self.current_submission_data = None
         self.is_viewing_mode = False
-        # Threading helpers
-        self._worker_thread = None
-        self._worker = None
+        # Submissions are graded by the background job queue; the job shown in the editor (if any) is _activeJob
+        self.job_runner = getJobRunner()
+        self.block_monitor = getGuiMonitor()
+        self._jobEvents = _JobEvents(self.job_runner.queue)
+        self._jobEvents.event.connect(self._onJobEvent)
+        self.job_runner.addListener(self._jobEvents.emitEvent)
+        self._activeJob = None
         self._processingDialog = None
+        self._processingMessage = None
+        self._processingBar = None
+        self._streamRendered = False
 
         self.setWindowTitle("NCAI - New Submission")
         
@@ -72,6 +77,7 @@ class NewSubmissionPage(QWidget):
         self.ghostText.setPlaceholderText("This movie, Mad Max, is directed by...")
         self.ghostText.setReadOnly(False)           # make it editable before processing
         self.ghostText.setDisabled(True)            # stays disabled until a year is chosen
+        self.ghostText.document().setDefaultStyleSheet(HIGHLIGHT_STYLESHEET)  # styles every <span class="fb"> once
         self.ghostText.document().documentLayout().documentSizeChanged.connect(self.update_ghostTextSize)
         self.submissionsHandlerLayout.addWidget(self.ghostText, alignment=Qt.AlignmentFlag.AlignCenter)
         # Hide text input until year chosen
@@ -84,6 +90,17 @@ class NewSubmissionPage(QWidget):
         self.submissionsHandlerLayout.addWidget(self.charCountLabel)
         self.charCountLabel.hide()  # hidden until editor is active
 
+        # Prompt size / cost preview, refreshed shortly after typing stops
+        self.sizeLabel = QLabel("")
+        self.sizeLabel.setObjectName("sizeLabel")
+        self.sizeLabel.setAlignment(Qt.AlignmentFlag.AlignRight)
+        self.submissionsHandlerLayout.addWidget(self.sizeLabel)
+        self.sizeLabel.hide()
+        self.sizeTimer = QTimer(self)
+        self.sizeTimer.setSingleShot(True)
+        self.sizeTimer.setInterval(400)
+        self.sizeTimer.timeout.connect(self._updateSizePreview)
+
         # Update counter as user types; enforce max only when editable/enabled
         try:
             self.ghostText.textChanged.connect(self._updateCharCount)
@@ -115,6 +132,16 @@ class NewSubmissionPage(QWidget):
         self.submissionsHandlerFrame.setLayout(self.submissionsHandlerLayout)
 
         self.rightLayout.addWidget(self.submissionsHandlerFrame, alignment=Qt.AlignmentFlag.AlignCenter)
+
+        # Submissions still waiting for (or being) graded; hidden when there are none
+        self.queueLabel = QLabel("Queued submissions")
+        self.queueLabel.setObjectName("queueLabel")
+        self.rightLayout.addWidget(self.queueLabel, alignment=Qt.AlignmentFlag.AlignCenter)
+        self.queueList = QListWidget()
+        self.queueList.setObjectName("queueList")
+        self.queueList.setMaximumHeight(120)
+        self.rightLayout.addWidget(self.queueList)
+        self.refreshQueuedJobs()
         self.rightFrame.setLayout(self.rightLayout)
         self.mainLayout.addWidget(self.rightFrame, 3, alignment=Qt.AlignmentFlag.AlignCenter)
 
@@ -174,16 +201,20 @@ class NewSubmissionPage(QWidget):
             over = len(userInput) - self.MAX_CHARS
             QMessageBox.warning(self, "Input Error", f"Submission is {over:,} characters over the 50,000 limit.")
             return
-        self._startProcessingThread(standard, year, yearText, userInput)
+        self._enqueueSubmission(standard, year, yearText, userInput)
 
-    def _startProcessingThread(self, standard, year, yearText, userInput):
-        """Spin up a QThread + worker and show an indeterminate progress dialog."""
-        if self._worker_thread and self._worker_thread.isRunning():
+    def _enqueueSubmission(self, standard, year, yearText, userInput):
+        """Queue the submission for grading and show a progress dialog (Cancel, or keep it running in the background)."""
+        if self._activeJob is not None:
             return
+        jobId = self.job_runner.submit(self.session_manager.currentUser, standard, year, userInput)
+        self._activeJob = {"id": jobId, "standard": standard, "year": year, "yearText": yearText, "userInput": userInput}
         dlg = QDialog(self)
         dlg.setWindowTitle("Processing...")
         v = QVBoxLayout(dlg)
-        msg = QLabel("Processing your submission... This may take a moment.")
+        ahead = self.job_runner.queue.position(jobId)
+        msg = QLabel(f"Queued behind {ahead} other submission(s)..." if ahead else "Processing your submission... This may take a moment.")
+        msg.setWordWrap(True)
         bar = QProgressBar()
         bar.setRange(0, 0)
         # Center contents within the dialog using wrapper layouts for consistent centering
@@ -206,56 +237,191 @@ class NewSubmissionPage(QWidget):
         barHBox.addWidget(bar)
         barHBox.addStretch(1)
         v.addWidget(barWrap)
+        # Cancel (or closing the dialog) stops the submission; the job can also keep going in the background
+        backgroundBtn = QPushButton("Run in background")
+        backgroundBtn.clicked.connect(self._backgroundSubmission)
+        cancelBtn = QPushButton("Cancel")
+        cancelBtn.clicked.connect(dlg.reject)
+        cancelWrap = QWidget()
+        cancelHBox = QHBoxLayout(cancelWrap)
+        cancelHBox.setContentsMargins(0, 8, 0, 0)
+        cancelHBox.addStretch(1)
+        cancelHBox.addWidget(backgroundBtn)
+        cancelHBox.addWidget(cancelBtn)
+        cancelHBox.addStretch(1)
+        v.addWidget(cancelWrap)
+        dlg.rejected.connect(lambda: self._cancelSubmission(userInput))
         dlg.setMinimumWidth(420)
         dlg.setModal(True)
         self._processingDialog = dlg
-        self._worker_thread = QThread()
-        self._worker = _SubmissionWorker(self.feedback_module, standard, year, userInput)
-        self._worker.moveToThread(self._worker_thread)
-        self._worker_thread.started.connect(self._worker.run)
-        self._worker.finished.connect(lambda result: self._onSubmissionFinished(standard, yearText, year, userInput, result))
-        self._worker.error.connect(self._onSubmissionError)
-        self._worker.finished.connect(self._cleanupWorker)
-        self._worker.error.connect(self._cleanupWorker)
-        self._worker_thread.start()
+        self._processingMessage = msg
+        self._processingBar = bar
+        self._streamRendered = False
+        self.refreshQueuedJobs()
         dlg.show()
 
-    def _cleanupWorker(self, *args):
-        """Close dialog, stop thread, release references."""
+    def _closeProcessingDialog(self, keepJob=False):
+        """
+        Close the dialog and forget the active job (it keeps running in the queue unless it was cancelled).
+        keepJob keeps it on screen, for a job whose grade is shown while its highlights are still coming.
+        """
+        dlg = self._processingDialog
+        self._processingDialog = None
+        self._processingMessage = None
+        self._processingBar = None
+        if not keepJob:
+            self._activeJob = None
         try:
-            if self._processingDialog:
-                self._processingDialog.accept()
+            if dlg:
+                dlg.accept()
         except Exception:
             pass
-        if self._worker_thread:
-            self._worker_thread.quit()
-            self._worker_thread.wait()
-        self._worker_thread = None
-        self._worker = None
-        self._processingDialog = None
 
-    def _onSubmissionError(self, message):
-        """Display an error if background processing fails."""
-        QMessageBox.critical(self, "Processing Error", message)
+    def _cancelSubmission(self, userInput):
+        """Cancel button / dialog closed: cancel the job and give the page back immediately."""
+        if self._processingDialog is None or self._activeJob is None:
+            return  # already finished
+        self.job_runner.cancel(self._activeJob["id"])
+        self._restoreEditor(userInput)
+        self._closeProcessingDialog()
+        self.refreshQueuedJobs()
+
+    def _backgroundSubmission(self):
+        """Run in background: the job stays queued and the page is free for the next submission."""
+        if self._activeJob is None:
+            return
+        self._closeProcessingDialog()
+        self._streamRendered = False
+        self.resetToNewSubmission()
+        QMessageBox.information(self, "Queued", "Your submission will keep being graded in the background. You'll be told when it's ready.")
+
+    def refreshQueuedJobs(self, jobs=None):
+        """List the user's queued and running submissions under the editor (jobs: a listing already read off-thread)."""
+        self.queueList.clear()
+        if jobs is None:
+            try:
+                jobs = self.job_runner.queue.jobs(self.session_manager.currentUser) if self.session_manager.currentUser else []
+            except Exception as e:
+                print(f"Failed to load queued submissions: {e}")
+                jobs = []
+        for job in jobs:
+            if job["status"] == RUNNING:
+                state = "grading now"
+            elif job["nextRunAt"] > time.time() + 1:
+                state = f"service busy, retrying at {time.strftime('%H:%M', time.localtime(job['nextRunAt']))}"
+            else:
+                state = "waiting"
+            self.queueList.addItem(f"{job['standard']} ({job['year']}) - {state}")
+        self.queueLabel.setVisible(bool(jobs))
+        self.queueList.setVisible(bool(jobs))
 
-    def _onSubmissionFinished(self, standard, yearText, year, userInput, result):
-        """Handle successful worker completion: update UI + save to DB."""
-        print(result)
-        if isinstance(result, list) and len(result) >= 2:
-            QMessageBox.critical(self, result[0], result[1])
+    def _onJobEvent(self, event, job, payload, jobs):
+        """
+        Queue events (delivered on the GUI thread): progress for the job on screen, notifications for the rest.
+        Everything was parsed, normalized, saved and listed on the worker thread; this only updates widgets
+        (timed by the GUI block monitor). Message boxes open after the slot returns.
+        """
+        with self.block_monitor.measure(f"jobEvent:{event}"):
+            self._applyJobEvent(event, job, payload, jobs)
+
+    def _applyJobEvent(self, event, job, payload, jobs):
+        if jobs is not None and job is not None and job["username"] == self.session_manager.currentUser:
+            self.refreshQueuedJobs(jobs)
+        active = self._activeJob
+        if active is None or job is None or job["id"] != active["id"]:
+            if job is not None and event in ('done', 'failed') and job["username"] == self.session_manager.currentUser:
+                self._notifyJobFinished(event, job, payload)
             return
-        highlighted_html = ""
-        grade = ""
+        if event == 'started' and self._processingMessage:
+            self._processingMessage.setText("Processing your submission... This may take a moment.")
+        elif event == 'progress':
+            kind, value = payload
+            if kind == 'grade':
+                self._onStreamGrade(value)
+            elif kind == 'feedback':
+                self._onStreamFeedback(value)
+            elif kind == 'highlight':
+                self._onStreamHighlight(value, active["userInput"])
+        elif event == 'graded':
+            self._onSubmissionGraded(active, payload)
+        elif event == 'retrying':
+            self._restoreEditor(active["userInput"])
+            if self._processingMessage:
+                self._processingMessage.setText(
+                    f"The grading service is busy. Your submission is queued and will be retried in about {payload:.0f}s. "
+                    "You can keep it running in the background.")
+        elif event == 'done':
+            self._closeProcessingDialog()
+            self._onSubmissionFinished(active, payload)
+        elif event == 'failed':
+            self._restoreEditor(active["userInput"])
+            self._closeProcessingDialog()
+            QTimer.singleShot(0, lambda: QMessageBox.critical(self, payload[0], payload[1]))
+        elif event == 'cancelled':
+            self._closeProcessingDialog()
+
+    def _notifyJobFinished(self, event, job, payload):
+        """A submission running in the background finished (the message opens once the event slot returns)."""
+        if event == 'done':
+            QTimer.singleShot(0, lambda: QMessageBox.information(self, "Submission graded",
+                                    f"Your {job['standard']} ({job['year']}) submission has been graded: {payload.grade}.\n\n"
+                                    "You can open it from the Submissions page."))
+        else:
+            QTimer.singleShot(0, lambda: QMessageBox.warning(self, "Submission failed", f"Your {job['standard']} ({job['year']}) submission could not be graded.\n\n{payload[1]}"))
+
+    def _onStreamGrade(self, grade):
+        """Show the grade as soon as the streamed response contains it."""
+        self.gradeLabel.setText(f"Estimated Grade: {grade}")
+        self.gradeLabel.show()
+        if self._processingMessage:
+            self._processingMessage.setText("Grade ready - highlighting your text...")
+
+    def _onStreamFeedback(self, feedback):
+        """Feedback summary arrived; the highlights are what is still being written."""
+        if self._processingMessage:
+            self._processingMessage.setText("Feedback ready - highlighting your text...")
+
+    def _onStreamHighlight(self, html, userInput):
+        """Render the highlighted paragraphs received so far and switch the bar to real progress."""
+        self._streamRendered = True
+        self.ghostText.setReadOnly(True)
+        self.ghostText.setHtml(html)
+        if self._processingBar:
+            done = len(self.ghostText.toPlainText())
+            self._processingBar.setRange(0, 100)
+            self._processingBar.setValue(min(99, int(done * 100 / max(1, len(userInput)))))
+
+    def _restoreEditor(self, userInput):
+        """Put the student's plain text back if a streamed render was interrupted by an error."""
+        if getattr(self, '_streamRendered', False):
+            self._streamRendered = False
+            self.ghostText.setPlainText(userInput)
+            self.ghostText.setReadOnly(False)
+            self.gradeLabel.hide()
+
+    def _onSubmissionGraded(self, active, saved):
+        """
+        Two-phase grading: the grade is saved before the highlights. Show it and close the dialog; the job stays
+        on screen so the highlights stream into the editor and 'done' fills them in.
+        """
+        self._closeProcessingDialog(keepJob=True)
+        self.ghostText.setReadOnly(True)
+        self.charCountLabel.hide()
+        self.sizeLabel.hide()
+        self.gradeLabel.setText(f"Estimated Grade: {saved.grade} (highlighting your text...)")
+        self.gradeLabel.show()
+        self.showSubmittedMeta(active["standard"], active["yearText"])
+
+    def _releaseGradedJob(self):
+        """Leaving a job whose grade is shown but whose highlights aren't: it finishes as a background notification."""
+        if self._activeJob is not None and self._processingDialog is None:
+            self._activeJob = None
+
+    def _onSubmissionFinished(self, active, saved):
+        """The job on screen finished: show the GradedSubmission the worker prepared and saved."""
+        highlighted_html = saved.highlightedHtml
+        grade = saved.grade
         try:
-            highlighted_html = self.feedback_module.returnHighlightedHTML(result)
-            if isinstance(result, dict):
-                grade = (result.get('Grade') or 
-                        result.get('grade') or
-                        result.get('Output', {}).get('Grade') if isinstance(result.get('Output'), dict) else None or
-                        result.get('Output', {}).get('grade') if isinstance(result.get('Output'), dict) else None or
-                        'Unknown')
-            else:
-                grade = 'Unknown'
             if highlighted_html and not highlighted_html.startswith("Error:"):
                 self.ghostText.setHtml(highlighted_html)
                 # Make text read-only but still allow selection + tooltips
@@ -264,30 +430,21 @@ class NewSubmissionPage(QWidget):
                 except Exception:
                     # fallback to disable if readOnly fails
                     self.ghostText.setDisabled(True)
+            elif not highlighted_html:
+                self.ghostText.setPlainText(active["userInput"])  # graded, but the highlights failed
+                self.ghostText.setReadOnly(True)
             else:
-                self.ghostText.setPlainText(highlighted_html or "No highlighted HTML available.")
+                self.ghostText.setPlainText(highlighted_html)
             # Hide the character counter in viewing mode
             self.charCountLabel.hide()
+            self.sizeLabel.hide()
             self.gradeLabel.setText(f"Estimated Grade: {grade}")
             self.gradeLabel.show()
-            self.showSubmittedMeta(standard, yearText)
+            self.showSubmittedMeta(active["standard"], active["yearText"])
         except Exception as e:
             self.ghostText.setPlainText(f"Error extracting highlighted HTML: {str(e)}")
-        try:
-            db_manager = LLMDatabaseManager()
-            submission_id = db_manager.saveSubmission(
-                username=self.session_manager.currentUser,
-                standard=standard,
-                year=year,
-                submissionText=userInput,
-                feedback=result if isinstance(result, dict) else {},
-                highlightedHtml=highlighted_html,
-                grade=grade
-            )
-            db_manager.exit()
-            QMessageBox.information(self, "Success", f"Submission saved successfully! (ID: {submission_id})")
-        except Exception as e:
-            QMessageBox.warning(self, "Database Error", f"Failed to save submission: {str(e)}")
+        notes = "".join(f"\n\n{note}" for note in (saved.agreement, saved.reuseSummary) if note)
+        QTimer.singleShot(0, lambda: QMessageBox.information(self, "Success", f"Submission saved successfully! (ID: {saved.submissionId}){notes}"))
 
     def showSubmittedMeta(self, standard: str, year: str):
         """Replace editable combos with static labels once submitted."""
@@ -342,11 +499,15 @@ class NewSubmissionPage(QWidget):
             self.ghostText.setFocus()
             self.charCountLabel.show()
             self._updateCharCount()
+            # Load the row, exemplars and prompt in the background while the student types
+            if not self.is_viewing_mode:
+                self.job_runner.module.prefetch(self.standardText.currentText(), selected_year)
         else:
             self.ghostText.hide()
             self.submitButton.hide()
             self.ghostText.setDisabled(True)
             self.charCountLabel.hide()
+            self.sizeLabel.hide()
 
     def update_ghostTextSize(self):
         """Dynamically resize the text edit to fit content within bounds."""
@@ -374,6 +535,7 @@ class NewSubmissionPage(QWidget):
 
     def loadExistingSubmission(self, submission_data):
         """Populate UI with an existing submission in read‑only mode."""
+        self._releaseGradedJob()
         self.current_submission_data = submission_data
         self.is_viewing_mode = True
         self.title.setText(f"Viewing Submission - {submission_data.get('standard', 'N/A')} ({submission_data.get('year', 'N/A')})")
@@ -403,9 +565,11 @@ class NewSubmissionPage(QWidget):
         self.yearText.setEnabled(False)
         # No editing in viewing mode: hide the counter
         self.charCountLabel.hide()
+        self.sizeLabel.hide()
 
     def resetToNewSubmission(self):
         """Return page to fresh submission state."""
+        self._releaseGradedJob()
         self.current_submission_data = None
         self.is_viewing_mode = False
         self.title.setText("Create a new submission")
@@ -426,6 +590,7 @@ class NewSubmissionPage(QWidget):
         self.ghostText.hide()
         self.charCountLabel.setText("0 / 50,000 characters")
         self.charCountLabel.hide()
+        self.sizeLabel.hide()
 
     def _updateCharCount(self):
         """Update the character count label and enforce MAX_CHARS when editable."""
@@ -462,10 +627,42 @@ class NewSubmissionPage(QWidget):
                 self.charCountLabel.setStyleSheet("color: #cc8f00;")  # amber near limit
             else:
                 self.charCountLabel.setStyleSheet("")
+            if not self.is_viewing_mode and not self.ghostText.isReadOnly() and self.ghostText.isEnabled():
+                self._sizeRetries = 0
+                self.sizeTimer.start()
         except Exception as e:
             # Non-fatal; keep UI responsive
             print(f"Char count update failed: {e}")
 
+    def _updateSizePreview(self):
+        """Show the estimated prompt size, output size and cost of submitting the current text."""
+        try:
+            if self.is_viewing_mode or not self.ghostText.isEnabled():
+                self.sizeLabel.hide()
+                return
+            plan = self.job_runner.module.planSubmission(
+                self.standardText.currentText(), self.yearText.currentText(), self.ghostText.toPlainText())
+            if plan is None:
+                # The prompt is still being prefetched; try again shortly (a few times, it may have failed)
+                self._sizeRetries = getattr(self, "_sizeRetries", 0) + 1
+                if self._sizeRetries < 10:
+                    self.sizeTimer.start()
+                return
+            exemplars = plan["exemplars"]
+            text = (f"~{plan['promptTokens']:,} prompt tokens ({exemplars['sent']}/{exemplars['total']} exemplars), "
+                    f"~{plan['expectedOutputTokens']:,} output")
+            if plan["requests"] > 1:
+                text += f" over {plan['requests']} requests"
+            if plan["costUSD"]:
+                text += f", est. ${plan['costUSD']:.4f}"
+            if not plan["fits"]:
+                text += " - too long for the model, shorten the text"
+            self.sizeLabel.setText(text)
+            self.sizeLabel.setStyleSheet("" if plan["fits"] else "color: #b00020;")
+            self.sizeLabel.show()
+        except Exception as e:
+            print(f"Size preview update failed: {e}")
+
     def handleDelete(self):
         """Delete currently viewed submission after confirmation."""
         if not self.current_submission_data:
@@ -488,8 +685,7 @@ class NewSubmissionPage(QWidget):
         if reply == QMessageBox.StandardButton.Yes:
             try:
                 db_manager = LLMDatabaseManager()
-                db_manager.cursor.execute("DELETE FROM submissions WHERE id = ?", (submission_id,))
-                db_manager.connection.commit()
+                db_manager.deleteSubmission(submission_id)
                 db_manager.exit()
                 QMessageBox.information(self, "Success", "Submission deleted successfully!")
                 self.resetToNewSubmission()
@@ -497,412 +693,22 @@ class NewSubmissionPage(QWidget):
                 QMessageBox.critical(self, "Error", f"Failed to delete submission: {str(e)}")
 
 
-# ---------------- Worker class (isolated) ---------------- #
-class _SubmissionWorker(QObject):
-    """Worker object moved to a QThread to run LLM submission processing."""
-    finished = pyqtSignal(object)
-    error = pyqtSignal(str)
+class _JobEvents(QObject):
+    """
+    Carries JobRunner events from its worker threads to the GUI thread. Events that change the queue bring the
+    user's job listing along, read here on the emitting thread so the GUI thread doesn't query SQLite for it.
+    """
+    event = pyqtSignal(str, object, object, object)
 
-    def __init__(self, feedback_module, standard, year, userInput):
+    def __init__(self, queue):
         super().__init__()
-        self.feedback_module = feedback_module
-        self.standard = standard
-        self.year = year
-        self.userInput = userInput
-
-    def run(self):
-        """Execute the heavy submission logic; emit result or error."""
-        try:
-            result = self.feedback_module.handleFullSubmission(
-                standard=self.standard,
-                year=self.year,
-                userInput=self.userInput
-            )
-            self.finished.emit(result)
-        except Exception as e:
-            self.error.emit(str(e))
-
-    def loadAvailableStandards(self):
-        DBMgr = LLMDatabaseManager()
-        aval_standard = DBMgr.returnAvailableStandards()
-
-        self.standardText.clear()
-        self.standardText.addItems(aval_standard)
-
-        print("Available standards loaded:", aval_standard)
-
-    def loadAvailableYears(self, standard):
-        DBMgr = LLMDatabaseManager()
-        aval_years = DBMgr.returnAvailableYears(standard)
-
-        self.yearText.clear()
-        self.yearText.addItems([str(year) for year in aval_years])
-
-        print("Available years loaded:", aval_years)
-
-    def handleSubit(self):
-        # Check if user is logged in
-        if not self.session_manager.currentUser:
-            QMessageBox.warning(self, "Authentication Error", "Please log in to submit work.")
-            return
-            
-        standard = self.standardText.currentText().strip()
-        yearText = self.yearText.currentText().strip()
-        userInput = self.ghostText.toPlainText().strip()
-        
-        if not standard or not yearText:
-            QMessageBox.warning(self, "Input Error", "Please enter both standard and year.")
-            return
-        try:
-            year = int(yearText)
-        except ValueError:
-            QMessageBox.warning(self, "Input Error", "Year must be a number.")
-            return
-        if not userInput:
-            QMessageBox.warning(self, "Input Error", "Please enter student work.")
-            return
-            
-        # Launch background worker so UI doesn't freeze
-        self._startProcessingThread(standard, year, yearText, userInput)
-
-    #  Threading helpers 
-    def _startProcessingThread(self, standard, year, yearText, userInput):
-        # Safety: prevent duplicate threads
-        if self._worker_thread and self._worker_thread.isRunning():
-            return
-
-        # Busy dialog
-        dlg = QDialog(self)
-        dlg.setWindowTitle("Processing...")
-        v = QVBoxLayout(dlg)
-        msg = QLabel("Processing your submission... This may take a moment.")
-        bar = QProgressBar()
-        bar.setRange(0, 0)  # indeterminate
-        v.addWidget(msg)
-        v.addWidget(bar)
-        dlg.setModal(True)
-        self._processingDialog = dlg
-
-        # Worker setup
-        self._worker_thread = QThread()
-        self._worker = _SubmissionWorker(self.feedback_module, standard, year, userInput)
-        self._worker.moveToThread(self._worker_thread)
-        self._worker_thread.started.connect(self._worker.run)
-        self._worker.finished.connect(lambda result: self._onSubmissionFinished(standard, yearText, year, userInput, result))
-        self._worker.error.connect(self._onSubmissionError)
-        # Cleanup
-        self._worker.finished.connect(self._cleanupWorker)
-        self._worker.error.connect(self._cleanupWorker)
-        self._worker_thread.start()
-        dlg.show()
-
-    def _cleanupWorker(self, *args):
-        try:
-            if self._processingDialog:
-                self._processingDialog.accept()
-        except Exception:
-            pass
-        if self._worker_thread:
-            self._worker_thread.quit()
-            self._worker_thread.wait()
-        self._worker_thread = None
-        self._worker = None
-        self._processingDialog = None
-
-    def _onSubmissionError(self, message):
-        QMessageBox.critical(self, "Processing Error", message)
-
-    def _onSubmissionFinished(self, standard, yearText, year, userInput, result):
-        print(result)
-        # Check if result is an error list
-        if isinstance(result, list) and len(result) >= 2:
-            QMessageBox.critical(self, result[0], result[1])
-            return
-
-        highlighted_html = ""
-        grade = ""
-        try:
-            highlighted_html = self.feedback_module.returnHighlightedHTML(result)
-            if isinstance(result, dict):
-                grade = (result.get('Grade') or 
-                        result.get('grade') or
-                        result.get('Output', {}).get('Grade') if isinstance(result.get('Output'), dict) else None or
-                        result.get('Output', {}).get('grade') if isinstance(result.get('Output'), dict) else None or
-                        'Unknown')
-            else:
-                grade = 'Unknown'
-
-            if highlighted_html and not highlighted_html.startswith("Error:"):
-                self.ghostText.setHtml(highlighted_html)
-            else:
-                self.ghostText.setPlainText(highlighted_html or "No highlighted HTML available.")
-            self.gradeLabel.setText(f"Estimated Grade: {grade}")
-            self.gradeLabel.show()
-            self.showSubmittedMeta(standard, yearText)
-        except Exception as e:
-            self.ghostText.setPlainText(f"Error extracting highlighted HTML: {str(e)}")
-
-        # Save submission to database (main thread)
-        try:
-            db_manager = LLMDatabaseManager()
-            submission_id = db_manager.saveSubmission(
-                username=self.session_manager.currentUser,
-                standard=standard,
-                year=year,
-                submissionText=userInput,
-                feedback=result if isinstance(result, dict) else {},
-                highlightedHtml=highlighted_html,
-                grade=grade
-            )
-            db_manager.exit()
-            QMessageBox.information(self, "Success", f"Submission saved successfully! (ID: {submission_id})")
-        except Exception as e:
-            QMessageBox.warning(self, "Database Error", f"Failed to save submission: {str(e)}")
-
-    def showSubmittedMeta(self, standard: str, year: str):
-        """Hide the dropdowns and show static labels with the submitted standard/year."""
-        try:
-            # If labels already exist, just update
-            if hasattr(self, 'submittedMetaContainer'):
-                self.standardValueLabel.setText(f"Standard: {standard}")
-                self.yearValueLabel.setText(f"Year: {year}")
-                self.submittedMetaContainer.show()
-            else:
-                self.submittedMetaContainer = QWidget()
-                metaLayout = QHBoxLayout()
-                metaLayout.setContentsMargins(0,0,0,0)
-                metaLayout.setSpacing(12)
-                self.standardValueLabel = QLabel(f"Standard: {standard}")
-                self.yearValueLabel = QLabel(f"Year: {year}")
-                self.standardValueLabel.setObjectName("standardLabelStatic")
-                self.yearValueLabel.setObjectName("yearLabelStatic")
-                metaLayout.addWidget(self.standardValueLabel)
-                metaLayout.addWidget(self.yearValueLabel)
-                self.submittedMetaContainer.setLayout(metaLayout)
-                self.submissionsHandlerLayout.insertWidget(self.submissionsHandlerLayout.indexOf(self.ghostText), self.submittedMetaContainer, alignment=Qt.AlignmentFlag.AlignCenter)
-            self.standardText.hide()
-            self.yearText.hide()
-        except Exception as e:
-            print(f"Failed to show submitted meta labels: {e}")
-
-    def handleStandardComboboxChange(self):
-        selected_standard = self.standardText.currentText()
-        print(f"Selected standard: {selected_standard}")
-
-        # Only load years if we have a valid standard selected
-        if selected_standard and selected_standard.strip():
-            self.loadAvailableYears(selected_standard)
-            self.yearText.show()
-            self.yearText.setCurrentIndex(-1)
-            # Hide downstream inputs until year picked
-            self.ghostText.hide()
-            self.submitButton.hide()
-            self.ghostText.setDisabled(True)
-        else:
-            # Clear the year dropdown if no valid standard is selected
-            self.yearText.clear()
-            self.yearText.hide()
-            self.ghostText.hide()
-            self.submitButton.hide()
-
-    def handleYearComboboxChange(self):
-        selected_year = self.yearText.currentText()
-        print(f"Selected year: {selected_year}")
-        if selected_year and selected_year.strip():
-            # Now reveal text area and submit button
-            self.ghostText.setReadOnly(False)
-            self.ghostText.setEnabled(True)
-            self.ghostText.show()
-            self.submitButton.show()
-            self.ghostText.setFocus()
-        else:
-            self.ghostText.hide()
-            self.submitButton.hide()
-            self.ghostText.setDisabled(True)
+        self.queue = queue
 
-    def update_ghostTextSize(self):
-        doc_size = self.ghostText.document().size()
-        
-        parent_size = self.size()
-        max_width = parent_size.width() - 100
-        max_height = parent_size.height() - 300 
-        
-        desired_width = min(int(doc_size.width()) + 40, max_width)
-        desired_height = min(int(doc_size.height()) + 40, max_height)
-        
-        # Ensure minimum size
-        min_width = 300
-        min_height = 100
-        
-        self.ghostText.setMinimumWidth(max(desired_width, min_width))
-        self.ghostText.setMaximumWidth(max_width)
-        self.ghostText.setMinimumHeight(max(desired_height, min_height))
-        self.ghostText.setMaximumHeight(max_height)
-
-    def load_qss(self, path, name):
-        """
-        Load a QSS file and return its content.
-        """
-        try:
-            with open(path, 'r') as file:
-                return file.read()
-        except Exception as e:
-            print(f"Error loading QSS file {name}: {str(e)}")
-            return ""
-    
-    def loadExistingSubmission(self, submission_data):
-        """
-        Load an existing submission for viewing/editing.
-        """
-        self.current_submission_data = submission_data
-        self.is_viewing_mode = True
-        
-        # Update UI title
-        self.title.setText(f"Viewing Submission - {submission_data.get('standard', 'N/A')} ({submission_data.get('year', 'N/A')})")
-        
-        # Set form fields
-        standard = submission_data.get('standard', '')
-        year = str(submission_data.get('year', ''))
-        
-        # Find and set standard
-        standard_index = self.standardText.findText(standard)
-        if standard_index >= 0:
-            self.standardText.setCurrentIndex(standard_index)
-            self.loadAvailableYears(standard)
-            
-            # Set year
-            year_index = self.yearText.findText(year)
-            if year_index >= 0:
-                self.yearText.setCurrentIndex(year_index)
-        
-        # Load submission text and feedback
-        highlighted_html = submission_data.get('highlightedHtml', '')
-        if highlighted_html:
-            self.ghostText.setHtml(highlighted_html)
-        else:
-            self.ghostText.setPlainText(submission_data.get('submissionText', ''))
-
-        # Display stored grade if present
-        grade = submission_data.get('grade') or submission_data.get('Grade') or 'Unknown'
-        if grade:
-            self.gradeLabel.setText(f"Estimated Grade: {grade}")
-            self.gradeLabel.show()
-        
-        self.ghostText.setEnabled(False)  # Make read-only in vwieing mode
-        
-        # Update button visibility
-        self.submitButton.hide()
-        self.deleteButton.show()
-        self.newSubmissionButton.show()
-        
-        # Disable form controls in viewing mode
-        self.standardText.setEnabled(False)
-        self.yearText.setEnabled(False)
-    
-    def resetToNewSubmission(self):
-        """
-        Reset the form to create a new submission.
-        """
-        self.current_submission_data = None
-        self.is_viewing_mode = False
-        
-        # Update UI title
-        self.title.setText("Create a new submission")
-        self.gradeLabel.hide()
-        self.gradeLabel.clear()
-        
-        # Temporarily disconnect signals to prevent errors during reset
-        self.standardText.currentIndexChanged.disconnect()
-        self.yearText.currentIndexChanged.disconnect()
-        
-        # Clear form
-        self.standardText.setCurrentIndex(-1)
-        self.yearText.clear()
-        self.ghostText.clear()
-        self.ghostText.setPlaceholderText("This movie, Mad Max, is directed by...")
-        self.ghostText.setDisabled(True)
-        self.yearText.hide()
-        self.ghostText.hide()
-        self.submitButton.hide()
-        
-        # Reset the size of the text edit to default
-        self.update_ghostTextSize()
-        
-        # Reconnect signals
-        self.standardText.currentIndexChanged.connect(self.handleStandardComboboxChange)
-        self.yearText.currentIndexChanged.connect(self.handleYearComboboxChange)
-        
-        # Update button visibility
-        self.submitButton.show()
-        self.deleteButton.hide()
-        self.newSubmissionButton.hide()
-        
-        # Re-enable form controls
-        self.standardText.setEnabled(True)
-        self.yearText.setEnabled(True)
-        
-        # Reload available standards
-        self.loadAvailableStandards()
-    
-    def handleDelete(self):
-        """
-        Delete the current submission after confirmation.
-        """
-        if not self.current_submission_data:
-            return
-            
-        submission_id = self.current_submission_data.get('id')
-        standard = self.current_submission_data.get('standard', 'N/A')
-        year = self.current_submission_data.get('year', 'N/A')
-        timestamp = self.current_submission_data.get('timestamp', 'Unknown')
-        
-        reply = QMessageBox.question(
-            self, 
-            "Confirm Deletion",
-            f"Are you sure you want to delete this submission?\n\n"
-            f"Standard: {standard}\n"
-            f"Year: {year}\n"
-            f"Submitted: {timestamp}\n\n"
-            f"This action cannot be undone.",
-            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
-            QMessageBox.StandardButton.No
-        )
-        
-        if reply == QMessageBox.StandardButton.Yes:
+    def emitEvent(self, event, job, payload):
+        jobs = None
+        if event != 'progress' and job is not None:
             try:
-                db_manager = LLMDatabaseManager()
-                # Delete from database
-                db_manager.cursor.execute("DELETE FROM submissions WHERE id = ?", (submission_id,))
-                db_manager.connection.commit()
-                db_manager.exit()
-                
-                QMessageBox.information(self, "Success", "Submission deleted successfully!")
-                
-                # Reset to new submission mode
-                self.resetToNewSubmission()
-                
+                jobs = self.queue.jobs(job["username"])
             except Exception as e:
-                QMessageBox.critical(self, "Error", f"Failed to delete submission: {str(e)}")
-
-# Worker class 
-class _SubmissionWorker(QObject):
-    finished = pyqtSignal(object)
-    error = pyqtSignal(str)
-
-    def __init__(self, feedback_module, standard, year, userInput):
-        super().__init__()
-        self.feedback_module = feedback_module
-        self.standard = standard
-        self.year = year
-        self.userInput = userInput
-
-    def run(self):
-        try:
-            result = self.feedback_module.handleFullSubmission(
-                standard=self.standard,
-                year=self.year,
-                userInput=self.userInput
-            )
-            self.finished.emit(result)
-        except Exception as e:
-            self.error.emit(str(e))
\ No newline at end of file
+                print(f"Failed to load queued submissions: {e}")
+        self.event.emit(event, job, payload, jobs)
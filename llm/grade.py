@@ -0,0 +1,179 @@
+"""
+Headless batch grading: grade every .txt essay in a folder without starting the GUI.
+
+    python -m llm.grade --standard 91099 --year 2024 essays/
+    python -m llm.grade --standard 91099 --year 2024 --concurrency 8 --rpm 20 --report out.jsonl essays/ extra.txt
+
+Results are saved to the submissions table (as --username) and appended to a JSONL report.
+Re-running with the same report skips essays that were already graded successfully, so an interrupted
+run picks up where it stopped. A throughput summary is printed at the end.
+"""
+
+# Basic imports
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import hashlib
+import argparse
+import logging
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except Exception:
+    # dotenv is optional; continue if not installed
+    pass
+
+# Custom imports
+from llm.socketing.async_handle import AsyncFeedbackModule
+from llm.socketing.client import closeAsyncClients
+from llm.socketing.ratelimit import AdaptiveRateLimiter
+from database.LLM_database_manage import LLMDatabaseManager
+
+
+def iterEssays(paths):
+    """Yield .txt files from the given files/directories lazily, in a stable order."""
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                full = os.path.join(path, name)
+                if name.lower().endswith(".txt") and os.path.isfile(full):
+                    yield full
+        elif os.path.isfile(path):
+            yield path
+        else:
+            logging.warning(f"Skipping {path}: not a file or directory")
+
+
+def textHash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def loadCompleted(reportPath):
+    """(path, text hash) pairs already graded successfully in a previous run."""
+    done = set()
+    if not os.path.exists(reportPath):
+        return done
+    with open(reportPath, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut off by a crash
+            if row.get("status") == "ok":
+                done.add((row.get("file"), row.get("sha256")))
+    return done
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+async def gradeFolder(args):
+    """Grade everything under args.paths and return the list of report rows written this run."""
+    # --rpm gets a limiter of its own (its own bucket in the state file, shared only by batch runs at the same
+    # rate); otherwise share the process-wide one (and its state) with the app and other runs
+    limiter = AdaptiveRateLimiter(ratePerMinute=args.rpm, maxConcurrency=args.concurrency, name=f"batch-{args.rpm:g}") if args.rpm else None
+    module = AsyncFeedbackModule(maxConcurrency=args.concurrency, useCache=not args.no_cache, limiter=limiter)
+    completed = loadCompleted(args.report)
+    save = not args.no_db
+    rows = []
+    essays = iterEssays(args.paths)
+    report = open(args.report, "a", encoding="utf-8")
+
+    def saveResult(text, result, grade):
+        """Save one graded essay and its paragraphs; runs off the event loop, on a thread with its own connection."""
+        db = LLMDatabaseManager()
+        try:
+            submissionId = db.saveSubmission(
+                username=args.username,
+                standard=args.standard,
+                year=int(args.year),
+                submissionText=text,
+                feedback=result,
+                highlightedHtml=module.returnHighlightedHTML(result),
+                grade=grade
+            )
+            db.saveParagraphs(submissionId, module.paragraphRecords(text, result))
+            return submissionId
+        finally:
+            db.exit()
+
+    async def worker():
+        # Workers pull from one shared generator, so files are only read as capacity frees up
+        for path in essays:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read()
+            digest = textHash(text)
+            if (path, digest) in completed:
+                continue
+            start = time.perf_counter()
+            # Only reuse paragraph feedback when results are saved (that's where the paragraph store lives)
+            result = await module.grade(args.standard, args.year, text, username=args.username if save else None)
+            latency = time.perf_counter() - start
+            row = {"file": path, "sha256": digest, "standard": args.standard, "year": args.year,
+                   "latency_s": round(latency, 3)}
+            if isinstance(result, dict):
+                row.update(status="ok", grade=module.returnGrade(result))
+                if save:
+                    row["submission_id"] = await asyncio.to_thread(saveResult, text, result, row["grade"])
+                reuse = result.get("Reuse", {})
+                if reuse.get("reused"):
+                    row.update(reused=len(reuse["reused"]), regenerated=len(reuse["regenerated"]),
+                               tokens_saved=reuse["tokensSaved"])
+            else:
+                row.update(status="error", error=": ".join(str(part) for part in result[:2]))
+            report.write(json.dumps(row) + "\n")
+            report.flush()  # progress survives an interrupted run
+            rows.append(row)
+            print(f"[{row['status']}] {path} -> {row.get('grade', row.get('error'))} ({latency:.1f}s)")
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    finally:
+        report.close()
+        await closeAsyncClients()
+    printSummary(rows, time.perf_counter() - start, len(completed))
+    return rows
+
+
+def printSummary(rows, elapsed, previouslyDone):
+    """Throughput and latency summary for this run."""
+    ok = [r for r in rows if r["status"] == "ok"]
+    latencies = [r["latency_s"] for r in ok]
+    print("\n--- Batch summary ---")
+    print(f"graded: {len(ok)}   failed: {len(rows) - len(ok)}   already in report: {previouslyDone}")
+    print(f"wall time: {elapsed:.1f}s   throughput: {(len(ok) / elapsed * 60) if elapsed else 0:.1f} essays/min")
+    print(f"latency p50: {percentile(latencies, 50):.1f}s   p95: {percentile(latencies, 95):.1f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade a folder of .txt essays without the GUI.")
+    parser.add_argument("paths", nargs="+", help=".txt files or directories containing them")
+    parser.add_argument("--standard", required=True, help="standard code, e.g. 91099")
+    parser.add_argument("--year", required=True, help="exam year, e.g. 2024")
+    parser.add_argument("--username", default="batch", help="owner of the saved submissions (default: batch)")
+    parser.add_argument("--concurrency", type=int, default=4, help="essays graded in parallel (default: 4)")
+    parser.add_argument("--rpm", type=float, default=0, help="max requests started per minute (default: LLM_RATE_PER_MINUTE, 20)")
+    parser.add_argument("--report", default="grades.jsonl", help="JSONL report, also used to resume (default: grades.jsonl)")
+    parser.add_argument("--no-db", action="store_true", help="don't save results to the submissions table")
+    parser.add_argument("--no-cache", action="store_true", help="always call the model, ignoring the response cache")
+    args = parser.parse_args(argv)
+    args.concurrency = max(1, args.concurrency)
+    rows = asyncio.run(gradeFolder(args))
+    return 1 if any(r["status"] != "ok" for r in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
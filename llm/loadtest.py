@@ -0,0 +1,226 @@
+"""
+Load test for the grading pipeline against the bundled stand-in model (llm/mockserver.py), so no quota is used:
+
+    python -m llm.loadtest --submissions 200 --concurrency 16 --latency lognormal:1.5,0.5 --rate-limit 0.05 --malformed 0.05
+    python -m llm.loadtest --url http://127.0.0.1:8765/v1 --stream --save --report baseline.json
+
+Every submission is a different generated essay, graded by FeedbackModule.handleFullSubmission on its own
+thread like the GUI worker does. A run therefore covers the rate limiter, retries, routing, JSON repair and, with --save, the
+database save (into a temporary copy of the database). Prints throughput, latency percentiles (overall and per
+stage, from each result's grading metrics), retries and outcome classes; --report writes the same summary as
+JSON so runs can be compared against a baseline.
+"""
+
+# Basic imports
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Custom imports
+from llm.grade import percentile
+from llm.mockserver import buildParser, serverFromArgs
+from llm.socketing.handle import FeedbackModule, MODEL_NAME
+from llm.socketing.ratelimit import AdaptiveRateLimiter
+from llm.socketing.router import ModelRouter, Backend
+from llm.socketing.telemetry import getTelemetry
+from database.LLM_database_manage import LLMDatabaseManager
+
+SENTENCES = [
+    "The opening shot shows the main character alone in a wide empty landscape.",
+    "This makes the audience feel how isolated he has become since the collapse.",
+    "The director uses a low angle to show the power of the villain over the others.",
+    "Colour grading in warm orange tones makes the world feel hot and dangerous.",
+    "Fast editing in the chase sequence builds tension and keeps the viewer engaged.",
+    "The soundtrack drops out completely at the climax, which makes the silence powerful.",
+]
+SOURCE_DB = "./database/LLM_testdatabase.db"
+STAGE_COLUMNS = ("db_read_s", "prompt_build_s", "request_sent_s", "ttft_s", "grade_ready_s", "llm_s", "parse_s", "normalize_s")
+
+
+def makeEssay(index, chars):
+    """A distinct essay of about chars characters (so no two submissions share a cache key or paragraph)."""
+    paragraphs, size, n = [], 0, 0
+    while size < chars:
+        sentences = [SENTENCES[(n + k) % len(SENTENCES)] for k in range(4)]
+        paragraph = f"Point {n + 1} of essay {index}. " + " ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+        n += 1
+    return "\n\n".join(paragraphs)
+
+
+def latencySummary(values, digits=3):
+    if not values:
+        return {}
+    return {"p50": round(percentile(values, 50), digits), "p95": round(percentile(values, 95), digits),
+            "p99": round(percentile(values, 99), digits), "max": round(max(values), digits),
+            "mean": round(sum(values) / len(values), digits)}
+
+
+def runLoadTest(args):
+    """Run the load test described by the parsed arguments and return the summary dict."""
+    server = None
+    if args.url:
+        os.environ["OPENROUTER_BASE_URL"] = args.url
+    else:
+        server = serverFromArgs(args, port=0).start()
+        os.environ["OPENROUTER_BASE_URL"] = server.url
+    os.environ.setdefault("OPENROUTER_API_KEY", "loadtest")
+    # Ensemble and two-phase submissions have several requests in flight; enough pooled connections (and limiter
+    # slots) for all of them, so neither is what queues requests
+    requestsEach = max(1, args.ensemble, 2 if args.two_phase else 1)
+    os.environ.setdefault("LLM_POOL_SIZE", str(max(10, args.concurrency * 2 * requestsEach)))
+    overrides = {"LLM_ENSEMBLE_SAMPLES": str(args.ensemble) if args.ensemble else None,
+                 "LLM_TWO_PHASE": "1" if args.two_phase else None}
+    overrides = {name: value for name, value in overrides.items() if value is not None}
+    before = {name: os.environ.get(name) for name in overrides}
+    os.environ.update(overrides)
+
+    savePath = None
+    if args.save:
+        savePath = os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "llm.db")
+        shutil.copy(SOURCE_DB, savePath)
+    limiter = AdaptiveRateLimiter(ratePerMinute=args.rpm, maxConcurrency=args.concurrency * requestsEach, statePath='')
+    module = FeedbackModule(useCache=False, limiter=limiter, router=ModelRouter([Backend(MODEL_NAME)]))
+    if args.prefetch:
+        module.prefetch(args.standard, args.year).result()  # as the GUI does when the year is picked
+    telemetry = getTelemetry()
+    retriesBefore, errorsBefore = telemetry.count("retry"), Counter(telemetry.snapshot()["errors"])
+    local = threading.local()
+    lock = threading.Lock()
+    latencies, saves, outcomes, stages = [], [], Counter(), {}
+
+    def submit(index):
+        text = makeEssay(index, args.chars)
+        start = time.perf_counter()
+        try:
+            result = module.handleFullSubmission(args.standard, args.year, text, stream=args.stream)
+            outcome = "ok" if isinstance(result, dict) else str(result[0])
+        except Exception as e:
+            result, outcome = None, e.__class__.__name__
+        latency = time.perf_counter() - start
+        saved = None
+        if outcome == "ok":
+            highlighted = module.returnHighlightedHTML(result)
+            metrics = module.takeMetrics(result)
+        if savePath and outcome == "ok":
+            if getattr(local, "db", None) is None:
+                local.db = LLMDatabaseManager(savePath)  # SQLite connections stay on their own thread
+            start = time.perf_counter()
+            submissionId = local.db.saveSubmission("loadtest", args.standard, int(args.year), text, result,
+                                                   highlighted, module.returnGrade(result))
+            local.db.saveParagraphs(submissionId, module.paragraphRecords(text, result))
+            saved = time.perf_counter() - start
+            if metrics:
+                local.db.saveMetrics(submissionId, args.standard, metrics, saved)
+        with lock:
+            outcomes[outcome] += 1
+            if outcome == "ok":
+                latencies.append(latency)
+                if metrics:
+                    for name in STAGE_COLUMNS:
+                        if metrics.get(name) is not None:
+                            stages.setdefault(name, []).append(metrics[name])
+            if saved is not None:
+                saves.append(saved)
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="loadtest") as pool:
+            list(pool.map(submit, range(args.submissions)))
+    finally:
+        if server is not None:
+            server.stop()
+        for name, value in before.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    elapsed = time.perf_counter() - start
+
+    retryErrors = Counter(telemetry.snapshot()["errors"])
+    retryErrors.subtract(errorsBefore)
+    summary = {
+        "submissions": args.submissions,
+        "concurrency": args.concurrency,
+        "stream": bool(args.stream),
+        "prefetch": bool(args.prefetch),
+        "ensemble": args.ensemble,
+        "twoPhase": bool(args.two_phase),
+        "chars": args.chars,
+        "wallSeconds": round(elapsed, 3),
+        "throughputPerMinute": round(outcomes["ok"] / elapsed * 60, 1) if elapsed else 0.0,
+        "latency": latencySummary(latencies),
+        "stages": {name[:-2]: latencySummary(values, digits=5) for name, values in stages.items()},
+        "outcomes": dict(outcomes),
+        "retries": telemetry.count("retry") - retriesBefore,
+        "retryErrors": {key.split(":", 1)[1]: n for key, n in retryErrors.items() if key.startswith("retry:") and n},
+    }
+    if savePath:
+        summary["save"] = latencySummary(saves)
+        shutil.rmtree(os.path.dirname(savePath), ignore_errors=True)
+    if server is not None:
+        summary["server"] = server.stats()
+    return summary
+
+
+def printSummary(summary):
+    latency = summary["latency"]
+    print("\n--- Load test ---")
+    print(f"submissions: {summary['submissions']}   concurrency: {summary['concurrency']}   "
+          f"stream: {summary['stream']}   prefetch: {summary['prefetch']}   ensemble: {summary['ensemble'] or 'off'}   "
+          f"two-phase: {summary['twoPhase']}   "
+          f"essay: ~{summary['chars']:,} chars")
+    print(f"wall time: {summary['wallSeconds']:.1f}s   throughput: {summary['throughputPerMinute']:.1f} gradings/min")
+    if latency:
+        print(f"latency p50: {latency['p50']:.2f}s   p95: {latency['p95']:.2f}s   p99: {latency['p99']:.2f}s   max: {latency['max']:.2f}s")
+    for stage, values in summary.get("stages", {}).items():
+        print(f"  {stage} p50: {1e3 * values['p50']:.2f}ms   p95: {1e3 * values['p95']:.2f}ms")
+    if summary.get("save"):
+        print(f"db save p50: {1e3 * summary['save']['p50']:.1f}ms   p95: {1e3 * summary['save']['p95']:.1f}ms")
+    print(f"outcomes: {summary['outcomes']}")
+    print(f"retries: {summary['retries']} {summary['retryErrors'] or ''}")
+    if "server" in summary:
+        print(f"mock server: {summary['server']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     parents=[buildParser(addHelp=False)], conflict_handler="resolve")
+    parser.add_argument("--submissions", type=int, default=50, help="gradings to run (default: 50)")
+    parser.add_argument("--concurrency", type=int, default=8, help="gradings in flight at once (default: 8)")
+    parser.add_argument("--chars", type=int, default=2500, help="approximate essay length (default: 2500)")
+    parser.add_argument("--stream", action="store_true", help="stream responses, as the GUI does")
+    parser.add_argument("--prefetch", action="store_true", help="prepare the standard/year prompt before submitting, as the GUI does")
+    parser.add_argument("--ensemble", type=int, default=0, help="grading samples per submission (LLM_ENSEMBLE_SAMPLES; default: as configured)")
+    parser.add_argument("--two-phase", action="store_true", help="grade-only request first, highlights alongside (LLM_TWO_PHASE)")
+    parser.add_argument("--save", action="store_true", help="also save each result (to a temporary copy of the database)")
+    parser.add_argument("--standard", default="91099")
+    parser.add_argument("--year", default="2024")
+    parser.add_argument("--rpm", type=float, default=60000, help="limiter start rate, requests/min (default: effectively unlimited)")
+    parser.add_argument("--url", default=None, help="use an already running server instead of starting the mock")
+    parser.add_argument("--report", default=None, help="also write the summary to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="show retry warnings and telemetry logs")
+    args = parser.parse_args(argv)
+    args.concurrency = max(1, args.concurrency)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    summary = runLoadTest(args)
+    printSummary(summary)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    return 0 if summary["outcomes"].get("ok") == args.submissions else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
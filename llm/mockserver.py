@@ -0,0 +1,309 @@
+"""
+OpenAI-compatible stand-in for the grading model, for load tests and local runs that shouldn't use real quota.
+
+    python -m llm.mockserver --port 8765 --latency lognormal:2,0.6 --tps 400 --rate-limit 0.05 --malformed 0.05
+
+then point the app at it with OPENROUTER_BASE_URL=http://127.0.0.1:8765/v1 (any OPENROUTER_API_KEY).
+POST /v1/chat/completions answers streamed (SSE) or plain requests with a grading response built from the
+prompt, like a real model would: the full essay echoed as HighlightedHTML, a chunk's excerpt, compact
+highlights, a grade only, or the repaired text of a "fix this JSON" request. Each response waits a sampled
+time to first token plus its output tokens at --tps, so bigger outputs take longer. A share of requests can
+be answered with 429s (with Retry-After), 500s, JSON the app can repair locally, or prose it can't parse
+(with --seed, the same faults for the same prompts on every run).
+Grades are M5 unless --grades lists others to pick from at random (e.g. M5,M5,M6,A4), as a noisy model would.
+"""
+
+# Basic imports
+import os
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Custom imports
+from llm.socketing import chunking, compact
+from llm.socketing.jsonrepair import FIX_SYSTEM_MESSAGE, parseModelJSON
+
+STREAM_CHARS = 40  # characters per streamed delta (roughly ten tokens)
+FEEDBACK = {"Strengths": "Clear structure and relevant examples.", "Areas for Improvement": "Explain how each example supports the point."}
+COMMENT = "Explain why this matters to your argument."
+
+
+def parseLatency(spec, rng=random):
+    """
+    Time-to-first-token distribution from a spec: '0.5' or 'fixed:0.5', 'uniform:LOW,HIGH',
+    'lognormal:MEDIAN,SIGMA' or 'exp:MEAN' (seconds). Returns a function that samples it with rng.
+    """
+    kind, _, params = str(spec).partition(":")
+    if not params:
+        kind, params = "fixed", kind
+    try:
+        values = [float(v) for v in params.split(",")]
+        if kind == "fixed" and len(values) == 1:
+            return lambda: values[0]
+        if kind == "uniform" and len(values) == 2:
+            return lambda: rng.uniform(*values)
+        if kind == "lognormal" and len(values) == 2:
+            return lambda: rng.lognormvariate(math.log(values[0]), values[1])
+        if kind == "exp" and len(values) == 1:
+            return lambda: rng.expovariate(1 / values[0])
+    except (ValueError, ZeroDivisionError):
+        pass
+    raise ValueError(f"Bad latency spec {spec!r}: use fixed:S, uniform:LOW,HIGH, lognormal:MEDIAN,SIGMA or exp:MEAN")
+
+
+def _studentText(prompt):
+    return prompt.split("mark the following text: ", 1)[1].split("\n    according to this criteria", 1)[0]
+
+
+def _echo(text):
+    """What an HTML-mode model writes: every paragraph again, with its first sentence highlighted."""
+    parts = []
+    for p in chunking.paragraphsOf(text):
+        first, _, rest = p.partition(". ")
+        parts.append(f"<p><span title='{COMMENT}'>{first}.</span> {rest}</p>")
+    return "".join(parts)
+
+
+def gradingContent(messages, grade="M5"):
+    """The model text a well-behaved model would return for these messages (graded grade)."""
+    system, prompt = messages[0]["content"], messages[-1]["content"]
+    if system == FIX_SYSTEM_MESSAGE:
+        try:
+            return json.dumps(parseModelJSON(prompt)[0])
+        except ValueError:
+            return json.dumps({"Output": {"Grade": grade, "Feedback": FEEDBACK, "HighlightedHTML": ""}})
+    if system == chunking.CHUNK_SYSTEM_MESSAGE:
+        text = prompt.split("Highlight this excerpt (part ", 1)[1].split("): ", 1)[1].rstrip()
+        output = {"HighlightedHTML": _echo(text)}
+    elif system == chunking.GRADE_SYSTEM_MESSAGE:
+        output = {"Grade": grade, "Feedback": FEEDBACK}
+    elif system == compact.COMPACT_SYSTEM_MESSAGE:
+        quotes = [p.split(". ")[0] + "." for p in chunking.paragraphsOf(_studentText(prompt))]
+        output = {"Grade": grade, "Feedback": FEEDBACK, "Highlights": [{"quote": q, "comment": COMMENT} for q in quotes]}
+    else:
+        text = _studentText(prompt) if "mark the following text: " in prompt else prompt
+        output = {"StudentText": text, "Grade": grade, "Feedback": FEEDBACK, "HighlightedHTML": _echo(text)}
+    return json.dumps({"Output": output})
+
+
+def malform(content):
+    """Break valid JSON the way models do (unescaped inner quotes, a trailing comma); the local repair fixes it."""
+    broken = content.replace('"Areas for Improvement": "', '"Areas for Improvement": "Use "evidence" here. ', 1)
+    return broken[:-2] + ",}}" if broken.endswith("}}") else broken
+
+
+class MockLLMServer:
+    """The stand-in server on a background thread. stats() counts what it answered, by kind."""
+    def __init__(self, host="127.0.0.1", port=0, latency="fixed:0.05", tokensPerSecond=400.0,
+                 rateLimit=0.0, retryAfter=1.0, serverErrors=0.0, malformed=0.0, garbage=0.0, seed=None, grades=None):
+        self.random = random.Random(seed)
+        self.seed = seed
+        self.attempts = Counter()  # requests seen per prompt, so a retry draws its own fault
+        self.lock = threading.Lock()
+        sample = parseLatency(latency, self.random)
+        self.sampleLatency = lambda: self._locked(sample)
+        self.tokensPerSecond = tokensPerSecond
+        self.rateLimit, self.retryAfter, self.serverErrors = rateLimit, retryAfter, serverErrors
+        self.malformed, self.garbage = malformed, garbage
+        self.grades = list(grades or ["M5"])
+        self.counts = Counter()
+        self.httpd = ThreadingHTTPServer((host, port), type("Handler", (_Handler,), {"mock": self}))
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="mock-llm", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def count(self, kind, n=1):
+        with self.lock:
+            self.counts[kind] += n
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def _locked(self, sample):
+        with self.lock:  # random.Random isn't safe to share between handler threads
+            return sample()
+
+    def pickGrade(self):
+        return self._locked(lambda: self.random.choice(self.grades))
+
+    def pick(self, messages):
+        """
+        Which fault (if any) this request gets: 'rateLimited', 'serverError', 'malformed', 'garbage' or None.
+        With a seed the draw depends only on the prompt and how often it was sent before, not on which thread
+        got there first, so a run's faults are repeatable. "Fix this JSON" requests get none.
+        """
+        if messages[0]["content"] == FIX_SYSTEM_MESSAGE:
+            return None
+        if self.seed is None:
+            roll = self._locked(self.random.random)
+        else:
+            key = hashlib.sha256(json.dumps(messages, sort_keys=True).encode()).hexdigest()
+            with self.lock:
+                attempt = self.attempts[key]
+                self.attempts[key] += 1
+            roll = random.Random(f"{self.seed}:{key}:{attempt}").random()
+        for kind, share in (("rateLimited", self.rateLimit), ("serverError", self.serverErrors),
+                            ("malformed", self.malformed), ("garbage", self.garbage)):
+            if roll < share:
+                return kind
+            roll -= share
+        return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real provider
+    disable_nagle_algorithm = True
+    mock = None
+
+    def do_GET(self):
+        """The model list, which the app requests to warm its pooled connection."""
+        self.mock.count("modelLists")
+        self._sendJSON(200, {"object": "list", "data": [{"id": "mock", "object": "model", "created": 0, "owned_by": "mock"}]})
+
+    def do_POST(self):
+        mock = self.mock
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        messages = body.get("messages") or [{"content": ""}]
+        mock.count("requests")
+        if messages[0]["content"] == FIX_SYSTEM_MESSAGE:
+            mock.count("fixRequests")
+        fault = mock.pick(messages)
+        if fault == "rateLimited":
+            mock.count("rateLimited")
+            return self._sendJSON(429, {"error": {"message": "Rate limit exceeded (mock)"}}, {"Retry-After": f"{mock.retryAfter:g}"})
+        if fault == "serverError":
+            mock.count("serverErrors")
+            return self._sendJSON(500, {"error": {"message": "Internal error (mock)"}})
+
+        content = gradingContent(messages, mock.pickGrade())
+        if fault == "malformed":
+            content = malform(content)
+        elif fault == "garbage":
+            content = "I'm sorry, I can't grade this submission right now."
+        if fault:
+            mock.count(fault)
+        tokens = math.ceil(len(content) / 4)
+        mock.count("outputTokens", tokens)
+        firstToken = max(0.0, mock.sampleLatency())
+        decode = tokens / mock.tokensPerSecond if mock.tokensPerSecond > 0 else 0.0
+        promptTokens = math.ceil(sum(len(m["content"]) for m in messages) / 4)
+        usage = {"prompt_tokens": promptTokens, "completion_tokens": tokens, "total_tokens": promptTokens + tokens}
+        try:
+            if body.get("stream"):
+                mock.count("streamed")
+                includeUsage = (body.get("stream_options") or {}).get("include_usage")
+                self._stream(content, firstToken, decode, usage if includeUsage else None)
+            else:
+                time.sleep(firstToken + decode)
+                self._sendJSON(200, {
+                    "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": body.get("model", "mock"),
+                    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                    "usage": usage,
+                })
+        except OSError:
+            mock.count("clientDisconnects")  # a cancelled or hedged-away request hung up
+
+    def _sendJSON(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, content, firstToken, decode, usage=None):
+        """
+        Server-sent events in HTTP/1.1 chunked encoding, paced so the whole stream takes firstToken + decode.
+        With usage (the request asked for stream_options.include_usage) a last chunk carries it, as OpenAI's does.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(firstToken)
+        pieces = [content[i:i + STREAM_CHARS] for i in range(0, len(content), STREAM_CHARS)]
+        pause = decode / max(1, len(pieces))
+        for piece in pieces:
+            chunk = {"id": "mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": "mock",
+                     "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            self._writeChunk(f"data: {json.dumps(chunk)}\n\n".encode())
+            time.sleep(pause)
+        if usage:
+            chunk = {"id": "mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": "mock",
+                     "choices": [], "usage": usage}
+            self._writeChunk(f"data: {json.dumps(chunk)}\n\n".encode())
+        self._writeChunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _writeChunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+def buildParser(addHelp=True):
+    """Mock server options; llm.loadtest reuses them (addHelp=False) for the server it starts."""
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stand-in for the grading model.", add_help=addHelp)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="fixed:0.05", help="time to first token: fixed:S, uniform:LOW,HIGH, lognormal:MEDIAN,SIGMA or exp:MEAN")
+    parser.add_argument("--tps", type=float, default=400.0, help="output tokens per second (0 = instant)")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="share of requests answered 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with a 429")
+    parser.add_argument("--server-errors", type=float, default=0.0, help="share of requests answered 500")
+    parser.add_argument("--malformed", type=float, default=0.0, help="share of responses with locally repairable broken JSON")
+    parser.add_argument("--garbage", type=float, default=0.0, help="share of responses that are not JSON at all")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for repeatable fault injection")
+    parser.add_argument("--grades", default="M5", help="comma-separated grades to answer with at random (default: M5)")
+    return parser
+
+
+def serverFromArgs(args, port=None):
+    """MockLLMServer configured from parsed buildParser() arguments."""
+    return MockLLMServer(args.host, args.port if port is None else port, args.latency, args.tps, args.rate_limit,
+                         args.retry_after, args.server_errors, args.malformed, args.garbage, args.seed,
+                         [g.strip() for g in args.grades.split(",") if g.strip()])
+
+
+def main(argv=None):
+    args = buildParser().parse_args(argv)
+    server = serverFromArgs(args)
+    print(f"Mock LLM listening on {server.url} (Ctrl+C to stop)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(json.dumps(server.stats()))
+
+
+if __name__ == "__main__":
+    main()
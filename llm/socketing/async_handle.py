@@ -0,0 +1,249 @@
+"""Asyncio grading API: a reentrant grade() coroutine with bounded concurrency and non-blocking backoff."""
+
+# Basic imports
+import os
+import sys
+import time
+import asyncio
+import logging
+import weakref
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Custom imports
+from openai import APIError
+from llm.socketing.client import getAsyncClient, requestTimeout
+from llm.socketing.exemplars import selectExemplars
+from llm.socketing import chunking, paragraphs, compact, budget
+from llm.socketing.jsonrepair import buildFixMessages
+from llm.socketing.telemetry import getTelemetry
+from llm.socketing.singleflight import AsyncSingleFlight
+from llm.socketing.handle import (
+    FeedbackModule, MODEL_NAME, MAX_ATTEMPTS, BUSY_ERROR, isRateLimited, isRetryable, requestError, errorHeaders,
+    serverErrorDelay, isUsableOutput,
+)
+
+
+class AsyncFeedbackModule(FeedbackModule):
+    """
+    Async version of FeedbackModule for batch runs: one event loop can grade many essays at once.
+    Prompt building, parsing and caching are shared with FeedbackModule; grade() keeps all
+    per-request state in locals, so concurrent calls on the same instance don't interfere.
+    """
+    def __init__(self, maxConcurrency=8, cache=None, useCache=True, limiter=None, router=None):
+        """
+        maxConcurrency caps how many requests this instance keeps in flight; the shared rate limiter
+        may allow fewer while the provider is returning 429s. Identical essays graded at once share one call.
+        """
+        super().__init__(cache=cache, useCache=useCache, limiter=limiter, router=router)
+        self.maxConcurrency = max(1, int(maxConcurrency))
+        self.asyncSingleFlight = AsyncSingleFlight()
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self):
+        """Semaphore for the running loop (asyncio primitives can't be shared between loops)."""
+        loop = asyncio.get_running_loop()
+        sem = self._semaphores.get(loop)
+        if sem is None:
+            sem = asyncio.Semaphore(self.maxConcurrency)
+            self._semaphores[loop] = sem
+        return sem
+
+    async def _readStreamAsync(self, response, onProgress=None):
+        """Async counterpart of FeedbackModule._readStream."""
+        parser = self._makeStreamParser(onProgress)
+        parts = []
+        async for chunk in response:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                parser.feed(delta)
+        return ''.join(parts)
+
+    async def _createCompletionAsync(self, client, messages, stream=False, onProgress=None, model=MODEL_NAME):
+        """Send one request. Returns (text, response headers). max_tokens is capped as in _createCompletion."""
+        ceiling = budget.gradeOutputTokens() if chunking.isGradeOnly(messages) else None
+        maxTokens = budget.outputCap(budget.messageTokens(messages), ceiling)
+        raw = await client.chat.completions.with_raw_response.create(
+            model=model,
+            messages=messages,
+            stream=stream,
+            timeout=requestTimeout(),
+            **({"max_tokens": maxTokens} if maxTokens is not None else {})
+        )
+        if stream:
+            return await self._readStreamAsync(raw.parse(), onProgress), raw.headers
+        return raw.parse().choices[0].message.content, raw.headers
+
+    async def requestCompletionAsync(self, messages, stream=False, onProgress=None):
+        """Async counterpart of FeedbackModule.requestCompletion: same router, limiter and retry rules, no blocking sleeps."""
+        async def _attempt(backend, progress):
+            return await self._requestBackendAsync(backend, messages, stream, progress)
+        return await self.router.runAsync(_attempt, onProgress, isValid=isUsableOutput)
+
+    async def _requestBackendAsync(self, backend, messages, stream=False, onProgress=None):
+        """Async counterpart of FeedbackModule._requestBackend; a losing hedge is cancelled like any task."""
+        client = getAsyncClient(backend.baseUrl, maxConnections=self.maxConcurrency)
+        async with self._semaphore():
+            for attempt in range(MAX_ATTEMPTS):
+                lease = await self.limiter.acquireAsync()
+                try:
+                    text, headers = await self._createCompletionAsync(client, messages, stream, onProgress, backend.model)
+                except APIError as e:
+                    await self.limiter.releaseAsync(lease, getattr(e, 'status_code', None), errorHeaders(e))
+                    if not isRetryable(e) or attempt == MAX_ATTEMPTS - 1:
+                        if isRateLimited(e):
+                            return list(BUSY_ERROR)
+                        raise
+                    logging.warning(f"LLM request to {backend.name} failed ({e.__class__.__name__}). Retrying... (attempt {attempt+1}/{MAX_ATTEMPTS})")
+                    getTelemetry().record('retry', backend=backend.name, error=e.__class__.__name__, attempt=attempt + 1)
+                    if not isRateLimited(e):
+                        await asyncio.sleep(serverErrorDelay(attempt))
+                    continue
+                except BaseException:
+                    await self.limiter.releaseAsync(lease)
+                    raise
+                await self.limiter.releaseAsync(lease, 200, headers)
+                return text
+
+    async def _requestOutputAsync(self, messages):
+        """Async counterpart of FeedbackModule._requestOutput."""
+        try:
+            result = await self.requestCompletionAsync(messages)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            return requestError(ex)
+        if isinstance(result, list):
+            return result
+        return self.parseModelOutput(result)
+
+    async def parseOrFixAsync(self, result):
+        """Async counterpart of FeedbackModule.parseOrFix."""
+        output_json = self.parseModelOutput(result)
+        if not isinstance(output_json, list) or os.getenv("LLM_JSON_FIX_REQUEST", "1") == "0":
+            return output_json
+        try:
+            fixed = await self.requestCompletionAsync(buildFixMessages(result))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"JSON fix request failed: {e}")
+            return output_json
+        if isinstance(fixed, list):
+            return output_json
+        retried = self.parseModelOutput(fixed)
+        return retried if isinstance(retried, dict) else output_json
+
+    async def gradeChunkedAsync(self, entry, userText, onProgress=None, previous=None):
+        """Async counterpart of FeedbackModule.gradeChunked (same incremental mode, progress events and return values)."""
+        started = time.perf_counter()
+        if previous:
+            chunks, chunkHTML, reused, regenerated = paragraphs.planUnits(userText, previous)
+        else:
+            chunks = chunking.splitParagraphs(userText)
+            chunkHTML = [None] * len(chunks)
+            reused, regenerated = [], list(range(len(chunking.paragraphsOf(userText))))
+        summary = chunking.summarize(chunks)
+        exemplars, _ = selectExemplars(entry['exemplars'], userText)
+        failed = []
+        shown = 0
+        workers = asyncio.Semaphore(chunking.chunkWorkers())
+
+        async def highlight(i, chunk):
+            nonlocal shown
+            async with workers:
+                output = await self._requestOutputAsync(chunking.buildChunkMessages(entry, chunk, i + 1, len(chunks), summary))
+            chunkHTML[i], chunkFailed = chunking.chunkHighlight(output, chunk)
+            if chunkFailed:
+                failed.append(chunk)
+            ready = next((n for n, part in enumerate(chunkHTML) if part is None), len(chunkHTML))
+            if onProgress and ready > shown:
+                shown = ready
+                onProgress('highlight', self.prepareHighlightedHTML(chunking.stitch(chunkHTML)))
+
+        async def holistic():
+            gradeOutput = await self._requestOutputAsync(chunking.buildGradeMessages(entry, userText, exemplars))
+            if onProgress and isinstance(gradeOutput, dict):
+                output = gradeOutput.get('Output', {})
+                onProgress('grade', str(output.get('Grade', '')))
+                onProgress('feedback', output.get('Feedback', {}))
+            return gradeOutput
+
+        pending = [i for i, part in enumerate(chunkHTML) if part is None]
+        gradeOutput, *_ = await asyncio.gather(holistic(), *(highlight(i, chunks[i]) for i in pending))
+        if not isinstance(gradeOutput, dict):
+            return gradeOutput
+        output_json = chunking.combine(userText, gradeOutput, chunkHTML)
+        output_json['Reuse'] = paragraphs.reuseReport(userText, reused, regenerated, previous or {}, time.perf_counter() - started,
+                                                      paragraphs.failedParagraphs(userText, failed))
+        return output_json
+
+    async def grade(self, standard=None, year=None, userInput=None, stream=False, onProgress=None, username=None):
+        """
+        Grade one submission. Same inputs and return values as FeedbackModule.handleFullSubmission:
+        the parsed model JSON, or [title, message] on error. A grade() of the same essay already running on
+        this loop is awaited instead of sending a second call (the waiting caller gets no progress events).
+        """
+        key = self.submissionKey(standard, year, userInput)
+        if key is None:
+            return await self._grade(standard, year, userInput, stream, onProgress, username)
+        output_json, _ = await self.asyncSingleFlight.do(
+            key, lambda: self._grade(standard, year, userInput, stream, onProgress, username))
+        return output_json
+
+    async def _grade(self, standard, year, userInput, stream, onProgress, username):
+        standard, year, error = self.validateStandardYear(standard, year)
+        if error:
+            return error
+        # SQLite reads are blocking, keep them off the event loop
+        entry, error = await asyncio.to_thread(self.loadEntry, standard, year)
+        if error:
+            return error
+        userText = (userInput or "").strip()
+        if not userText:
+            return(['Input Error', 'Please enter student work.'])
+
+        cacheKey, cached = await asyncio.to_thread(self._cacheLookup, standard, year, userText, entry)
+        if cached is not None:
+            return cached
+
+        previous = await asyncio.to_thread(self.loadPreviousParagraphs, username, standard, year)
+        reusable = any(paragraphs.paragraphHash(p) in previous for p in chunking.paragraphsOf(userText))
+        longEssay = self.gradesInChunks(userText)
+        if reusable or longEssay:
+            output_json = await self.gradeChunkedAsync(entry, userText, onProgress, previous if reusable else None)
+            await asyncio.to_thread(self._cacheStore, cacheKey, output_json, standard, year, entry)
+            return output_json
+
+        # Exemplar packing and token counting are CPU work: off the event loop too
+        plan = await asyncio.to_thread(lambda: self.preparePrompt(entry).plan(userText, MODEL_NAME))
+        error = self.tooLongError(plan)
+        if error:
+            return error
+        messages = plan["messages"]
+        started = time.perf_counter()
+        try:
+            result = await self.requestCompletionAsync(messages, stream, self._compactProgress(userText, onProgress))
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            return requestError(ex)
+        if isinstance(result, list):
+            return result
+
+        output_json = compact.expandCompact(await self.parseOrFixAsync(result), userText)
+        if isinstance(output_json, dict):
+            regenerated = list(range(len(chunking.paragraphsOf(userText))))
+            output_json['Reuse'] = paragraphs.reuseReport(userText, [], regenerated, {}, time.perf_counter() - started)
+        await asyncio.to_thread(self._cacheStore, cacheKey, output_json, standard, year, entry)
+        return output_json
+
+    async def gradeMany(self, submissions):
+        """
+        Grade (standard, year, userInput) tuples concurrently, bounded by maxConcurrency.
+        Results come back in the same order as the input.
+        """
+        return await asyncio.gather(*(self.grade(standard, year, text) for standard, year, text in submissions))
@@ -0,0 +1,153 @@
+"""
+Token budget for grading prompts. Every part of a prompt (instructions, schedule, criteria, question, essay,
+exemplars) is measured in tokens, with tiktoken when it is installed and otherwise a characters-per-token
+ratio calibrated against the usage the provider reports. Exemplars are packed into what is left of
+LLM_PROMPT_TOKEN_BUDGET (one per grade band first, then shortest first), and each request's max_tokens is
+capped so prompt and output fit the model's context window.
+"""
+
+# Basic imports
+import os
+import math
+import threading
+
+try:
+    import tiktoken
+except ImportError:  # optional; the calibrated character ratio is used instead
+    tiktoken = None
+
+DEFAULT_CONTEXT_TOKENS = 128000
+DEFAULT_PROMPT_BUDGET = 24000   # keeps prompts clear of long-context pricing tiers
+DEFAULT_MAX_OUTPUT_TOKENS = 16000
+DEFAULT_CHARS_PER_TOKEN = 4.0
+MESSAGE_OVERHEAD_TOKENS = 4     # role and separators of each chat message
+# Expected output tokens per essay token: html responses echo the essay with markup, compact ones only quote it
+OUTPUT_PER_ESSAY_TOKEN = {"html": 1.3, "compact": 0.3}
+OUTPUT_OVERHEAD_TOKENS = 600    # grade and feedback summary
+
+_lock = threading.Lock()
+_charsPerToken = None
+_encoding = None
+
+
+def _envNumber(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return float(default)
+
+
+def contextTokens():
+    """The model's context window, LLM_CONTEXT_TOKENS."""
+    return int(_envNumber("LLM_CONTEXT_TOKENS", DEFAULT_CONTEXT_TOKENS))
+
+
+def promptBudget():
+    """Prompt tokens exemplars are packed into, LLM_PROMPT_TOKEN_BUDGET."""
+    return int(_envNumber("LLM_PROMPT_TOKEN_BUDGET", DEFAULT_PROMPT_BUDGET))
+
+
+def maxOutputTokens():
+    """Ceiling for max_tokens, LLM_MAX_OUTPUT_TOKENS (0 sends no max_tokens at all)."""
+    return int(_envNumber("LLM_MAX_OUTPUT_TOKENS", DEFAULT_MAX_OUTPUT_TOKENS))
+
+
+def gradeOutputTokens():
+    """
+    Ceiling for max_tokens of grade-only requests, LLM_GRADE_MAX_TOKENS (0 sends none). Unset (None) they get the
+    same ceiling as every other request: reasoning models such as the default deepseek-r1 count their thinking
+    against max_tokens, so a small cap would often cut the grade off before it is written.
+    """
+    value = os.getenv("LLM_GRADE_MAX_TOKENS")
+    return int(_envNumber("LLM_GRADE_MAX_TOKENS", 0)) if value else None
+
+
+def charsPerToken():
+    """Characters per token for the heuristic count: LLM_CHARS_PER_TOKEN at first, then calibrated from usage."""
+    with _lock:
+        if _charsPerToken is not None:
+            return _charsPerToken
+    return max(1.0, _envNumber("LLM_CHARS_PER_TOKEN", DEFAULT_CHARS_PER_TOKEN))
+
+
+def calibrate(chars, tokens, weight=0.2):
+    """Move the characters-per-token ratio towards a provider-reported prompt (chars long, tokens counted)."""
+    global _charsPerToken
+    if chars <= 0 or not tokens or tokens <= 0:
+        return
+    observed = min(max(chars / tokens, 1.5), 8.0)
+    current = charsPerToken()
+    with _lock:
+        _charsPerToken = current + weight * (observed - current)
+
+
+def _tiktoken():
+    global _encoding
+    if tiktoken is None:
+        return None
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            return None
+    return _encoding
+
+
+def countTokens(text):
+    """Tokens in text (tiktoken's count if available, otherwise the calibrated estimate)."""
+    if not text:
+        return 0
+    encoding = _tiktoken()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / charsPerToken())
+
+
+def messageTokens(messages):
+    """Prompt tokens of a list of chat messages."""
+    return sum(countTokens(m.get("content")) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def expectedOutputTokens(essayTokens, mode="html"):
+    """Rough size of a grading response to an essay of essayTokens (for previews and cost)."""
+    return math.ceil(essayTokens * OUTPUT_PER_ESSAY_TOKEN.get(mode, 1.3)) + OUTPUT_OVERHEAD_TOKENS
+
+
+def outputCap(promptTokens, ceiling=None):
+    """
+    max_tokens for a request with promptTokens of prompt: the ceiling (LLM_MAX_OUTPUT_TOKENS unless given), or
+    what's left of the context window. None without a ceiling, and when the prompt leaves no room at all (a
+    max_tokens of 0 is always rejected; such prompts are turned away before they are sent, see fitsContext).
+    """
+    ceiling = maxOutputTokens() if ceiling is None else ceiling
+    room = contextTokens() - promptTokens
+    if ceiling <= 0 or room <= 0:
+        return None
+    return min(ceiling, room)
+
+
+def fitsContext(promptTokens):
+    """Whether a prompt of promptTokens leaves the model room to answer."""
+    return promptTokens < contextTokens()
+
+
+def packExemplars(exemplars, budget, bandOf, tokensOf):
+    """
+    The exemplars (kept in their original order) that fit into budget tokens: the shortest of each grade band
+    first, so every band stays covered if it can, then the rest shortest first. bandOf(exemplar) gives its band
+    (None if it has none); tokensOf(exemplar) its size.
+    """
+    sizes = [tokensOf(e) for e in exemplars]
+    byLength = sorted(range(len(exemplars)), key=lambda i: (sizes[i], i))
+    keep, used, bands = set(), 0, set()
+    for i in byLength:
+        band = bandOf(exemplars[i])
+        if band is not None and band not in bands and used + sizes[i] <= budget:
+            keep.add(i)
+            bands.add(band)
+            used += sizes[i]
+    for i in byLength:
+        if i not in keep and used + sizes[i] <= budget:
+            keep.add(i)
+            used += sizes[i]
+    return [exemplars[i] for i in sorted(keep)]
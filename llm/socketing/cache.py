@@ -0,0 +1,198 @@
+"""Response cache: SQLite-backed store of parsed model output, keyed on everything that affects a grade."""
+
+# Basic imports
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+
+DEFAULT_CACHE_PATH = "./database/response_cache.db"
+
+
+def normalizeSubmissionText(text):
+    """
+    Normalise student text so trivial resubmission differences (line endings, trailing spaces,
+    runs of blank lines, unicode composition) still hit the same cache entry.
+    Case and punctuation are kept because they can change the grade.
+    """
+    text = unicodedata.normalize("NFC", text or "")
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    lines = [re.sub(r"[ \t\u00a0]+", " ", line).strip() for line in text.split("\n")]
+    text = "\n".join(lines)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+
+def _sha256(value):
+    """Stable sha256 hex digest of a JSON-serialisable value."""
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def hashExemplars(exemplars):
+    """Hash of the exemplar set so a changed exemplar list produces a different key."""
+    return _sha256(exemplars or [])
+
+
+def hashEntry(entry):
+    """Hash of the whole standard/year row (question, schedule, criteria, exemplars)."""
+    return _sha256({
+        "question": entry.get("question"),
+        "schedule": entry.get("schedule"),
+        "criteria": entry.get("criteria"),
+        "exemplars": entry.get("exemplars"),
+    })
+
+
+class ResponseCache():
+    """
+    Persistent cache of successful grading results.
+    Entries expire after ttlSeconds and the least recently used entries are evicted once
+    maxEntries is exceeded. Entries for a standard/year are dropped as soon as a result is
+    stored against a different version of that row, so edited exemplars/criteria never serve stale grades.
+    """
+    def __init__(self, dbPath=None, ttlSeconds=7 * 24 * 3600, maxEntries=500):
+        """
+        Opens (or creates) the cache database. The path can be overridden with LLM_CACHE_DB_PATH.
+        """
+        self.dbPath = dbPath or os.getenv("LLM_CACHE_DB_PATH", DEFAULT_CACHE_PATH)
+        self.ttlSeconds = ttlSeconds
+        self.maxEntries = maxEntries
+        self.hits = 0
+        self.misses = 0
+        # One connection shared by the GUI worker threads, serialised with a lock
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(self.dbPath, check_same_thread=False)
+        self.cursor = self.connection.cursor()
+        self.createCacheTable()
+
+    def createCacheTable(self):
+        """
+        Creates the response_cache table if it doesn't exist.
+        """
+        with self._lock:
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    standard TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    row_hash TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    response JSON NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hit_count INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_response_cache_access ON response_cache (last_access)')
+            self.connection.commit()
+
+    def makeKey(self, standard, year, userText, model, promptVersion, entry):
+        """
+        Builds the cache key from (standard, year, normalised text, model, prompt version, exemplar hash)
+        plus a hash of the rest of the row so criteria/schedule edits also miss.
+        """
+        return _sha256({
+            "standard": str(standard).strip(),
+            "year": int(year),
+            "text": normalizeSubmissionText(userText),
+            "model": model,
+            "promptVersion": str(promptVersion),
+            "exemplars": hashExemplars(entry.get("exemplars")),
+            "row": hashEntry(entry),
+        })
+
+    def get(self, key):
+        """
+        Returns the cached response for key, or None on a miss/expired entry.
+        """
+        now = time.time()
+        with self._lock:
+            self.cursor.execute('SELECT response, created_at FROM response_cache WHERE cache_key = ?', (key,))
+            row = self.cursor.fetchone()
+            if row and now - row[1] <= self.ttlSeconds:
+                self.cursor.execute(
+                    'UPDATE response_cache SET last_access = ?, hit_count = hit_count + 1 WHERE cache_key = ?',
+                    (now, key)
+                )
+                self.connection.commit()
+                self.hits += 1
+                return json.loads(row[0])
+            if row:
+                # Expired: drop it now rather than waiting for the next eviction pass
+                self.cursor.execute('DELETE FROM response_cache WHERE cache_key = ?', (key,))
+                self.connection.commit()
+            self.misses += 1
+            return None
+
+    def put(self, key, response, standard, year, entry, model, promptVersion):
+        """
+        Stores a parsed response. Older entries for the same standard/year built from a different
+        row version are invalidated, then TTL/size eviction runs.
+        """
+        now = time.time()
+        rowHash = hashEntry(entry)
+        with self._lock:
+            self.cursor.execute(
+                'DELETE FROM response_cache WHERE standard = ? AND year = ? AND row_hash != ?',
+                (str(standard).strip(), int(year), rowHash)
+            )
+            self.cursor.execute('''
+                INSERT OR REPLACE INTO response_cache
+                (cache_key, standard, year, row_hash, model, prompt_version, response, created_at, last_access, hit_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
+            ''', (key, str(standard).strip(), int(year), rowHash, model, str(promptVersion), json.dumps(response), now, now))
+            self._evict(now)
+            self.connection.commit()
+
+    def _evict(self, now):
+        """Drops expired entries, then the least recently used ones above maxEntries. Caller holds the lock."""
+        self.cursor.execute('DELETE FROM response_cache WHERE created_at < ?', (now - self.ttlSeconds,))
+        if self.maxEntries is not None:
+            self.cursor.execute('''
+                DELETE FROM response_cache WHERE cache_key IN (
+                    SELECT cache_key FROM response_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+            ''', (int(self.maxEntries),))
+
+    def invalidate(self, standard=None, year=None):
+        """
+        Removes cached responses for a standard (optionally a single year), or everything if no standard is given.
+        Returns the number of rows removed.
+        """
+        with self._lock:
+            if standard is None:
+                self.cursor.execute('DELETE FROM response_cache')
+            elif year is None:
+                self.cursor.execute('DELETE FROM response_cache WHERE standard = ?', (str(standard).strip(),))
+            else:
+                self.cursor.execute('DELETE FROM response_cache WHERE standard = ? AND year = ?', (str(standard).strip(), int(year)))
+            self.connection.commit()
+            return self.cursor.rowcount
+
+    def stats(self):
+        """
+        Returns hit/miss counters for this process plus the current size of the cache.
+        """
+        with self._lock:
+            self.cursor.execute('SELECT COUNT(*), COALESCE(SUM(hit_count), 0) FROM response_cache')
+            entries, lifetimeHits = self.cursor.fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": (self.hits / lookups) if lookups else 0.0,
+            "entries": entries,
+            "lifetimeHits": lifetimeHits,
+        }
+
+    def exit(self):
+        """
+        Closes the cache connection.
+        """
+        self.connection.close()
@@ -0,0 +1,220 @@
+"""
+Chunked grading helpers for long submissions.
+Asking the model to reproduce a 50,000 character essay in HighlightedHTML is slow and often truncated,
+so long text is split on paragraph boundaries and each chunk is highlighted by its own request, while one
+holistic request (which returns no HighlightedHTML) assigns the grade. These helpers are pure functions:
+splitting, the shared context, the prompts and stitching the highlighted chunks back together.
+"""
+
+# Basic imports
+import os
+import re
+import html
+import json
+
+DEFAULT_CHUNK_THRESHOLD = 6000   # submissions longer than this are graded in chunks
+DEFAULT_CHUNK_CHARS = 3000       # target size of each chunk
+DEFAULT_CHUNK_WORKERS = 8
+SUMMARY_CHARS = 800
+
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+GRADE_SYSTEM_MESSAGE = (
+    "You are grading a student writing submission based on provided criteria, exemplars, and an assessment schedule."
+    "Your task is to return ONLY a valid JSON object in the following format:"
+    "{\"Output\": {\"Grade\": \"...\",\"Feedback\": {\"Strengths\": \"...\",\"Areas for Improvement\": \"...\"}}}"
+    "Do NOT reproduce the student's text; the highlighted copy is produced separately."
+    "**Important output rules:**"
+    "- Do NOT include any extra commentary before or after the JSON."
+    "- The output must be valid JSON (all keys and string values should use double quotes)."
+    "- Escape only double quotes that appear inside string values."
+    "- Do not include 'json' at the top of the output."
+)
+
+CHUNK_SYSTEM_MESSAGE = (
+    "You are highlighting one excerpt of a longer student writing submission based on provided criteria and an assessment schedule."
+    "Your task is to return ONLY a valid JSON object in the following format:"
+    "{\"Output\": {\"HighlightedHTML\": \"...\"}}"
+    "Inside the 'HighlightedHTML' field, return the full excerpt, converted to HTML. Highlight problematic or improvable text segments using:"
+    "- <span title='Your feedback here'>Text needing feedback</span> (no style attribute; the app styles highlights itself)"
+    "Each highlighted section must include a tooltip via the 'title' attribute that clearly explains what is wrong or how it can improve."
+    "If you highlight something, it MUST have a title with feedback. If you give feedback, it MUST be tied to a highlighted span."
+    "Only the excerpt is yours to return; the rest of the submission is summarised for context only."
+    "**Important output rules:**"
+    "- Do NOT include any extra commentary before or after the JSON."
+    "- The output must be valid JSON (all keys and string values should use double quotes)."
+    "- Escape only double quotes that appear inside string values."
+    "- Do NOT escape single quotes."
+    "- Do NOT summarize or shorten the excerpt. Output the full original excerpt with highlights embedded."
+    "- Do not include 'json' at the top of the output."
+    "- Inside the span tags, use escape apostrophes (&quot) for any single quotes in the text."
+)
+
+
+def _envInt(name, default):
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+
+def chunkThreshold():
+    """Length above which a submission is graded in chunks (LLM_CHUNK_THRESHOLD)."""
+    return _envInt("LLM_CHUNK_THRESHOLD", DEFAULT_CHUNK_THRESHOLD)
+
+
+def chunkWorkers():
+    """How many chunk requests one submission may have in flight (LLM_CHUNK_WORKERS)."""
+    return _envInt("LLM_CHUNK_WORKERS", DEFAULT_CHUNK_WORKERS)
+
+
+def twoPhase():
+    """
+    Whether a submission is graded in two phases (LLM_TWO_PHASE): a short grade-only request whose result is
+    saved and shown first, alongside the full request that produces the highlights.
+    """
+    return os.getenv("LLM_TWO_PHASE", "0") == "1"
+
+
+def isGradeOnly(messages):
+    """Whether messages ask for the grade and feedback only (they get a smaller max_tokens)."""
+    return bool(messages) and messages[0].get("content") == GRADE_SYSTEM_MESSAGE
+
+
+def _pack(parts, maxChars, joiner):
+    """Greedily join consecutive parts into groups of at most maxChars (a single oversized part stays alone)."""
+    groups, current, size = [], [], 0
+    for part in parts:
+        if current and size + len(joiner) + len(part) > maxChars:
+            groups.append(joiner.join(current))
+            current, size = [], 0
+        size += (len(joiner) if current else 0) + len(part)
+        current.append(part)
+    if current:
+        groups.append(joiner.join(current))
+    return groups
+
+
+def _pieces(paragraph, maxChars):
+    """Split an oversized paragraph on line breaks, then sentences, so no piece is cut mid-sentence."""
+    if len(paragraph) <= maxChars:
+        return [paragraph]
+    lines = [line for line in paragraph.split("\n") if line.strip()]
+    if len(lines) > 1:
+        return [piece for group in _pack(lines, maxChars, "\n") for piece in _pieces(group, maxChars)]
+    sentences = [s for s in _SENTENCE_END.split(paragraph) if s]
+    if len(sentences) > 1:
+        return _pack(sentences, maxChars, " ")
+    return [paragraph]  # one enormous sentence: send it whole
+
+
+def chunkChars():
+    """Target chunk size in characters (LLM_CHUNK_CHARS)."""
+    return _envInt("LLM_CHUNK_CHARS", DEFAULT_CHUNK_CHARS)
+
+
+def paragraphsOf(text):
+    """The text's paragraphs (blank-line separated, stripped), in order."""
+    return [p.strip() for p in _PARAGRAPH_BREAK.split((text or "").replace("\r\n", "\n")) if p.strip()]
+
+
+def packParagraphs(paragraphs, maxChars=None):
+    """Group consecutive paragraphs into chunks of at most maxChars, splitting oversized paragraphs first."""
+    maxChars = maxChars or chunkChars()
+    return _pack([piece for p in paragraphs for piece in _pieces(p, maxChars)], maxChars, "\n\n")
+
+
+def splitParagraphs(text, maxChars=None):
+    """
+    Split text into chunks of whole paragraphs, each at most maxChars (LLM_CHUNK_CHARS) where possible.
+    Paragraphs are never reordered; joining the chunks with blank lines gives back the paragraphs of text.
+    """
+    return packParagraphs(paragraphsOf(text), maxChars)
+
+
+def summarize(chunks, maxChars=SUMMARY_CHARS):
+    """
+    Compact extractive summary of the whole submission (the opening sentence of each chunk),
+    so every chunk request knows what the essay is about without paying for the full text.
+    """
+    if not chunks:
+        return ""
+    budget = max(40, maxChars // len(chunks))
+    lines = []
+    for i, chunk in enumerate(chunks, 1):
+        first = _SENTENCE_END.split(chunk.strip(), maxsplit=1)[0].replace("\n", " ")
+        if len(first) > budget:
+            first = first[:budget - 3].rstrip() + "..."
+        lines.append(f"[{i}] {first}")
+    return "\n".join(lines)
+
+
+def buildGradeMessages(entry, userText, exemplars):
+    """Messages for the holistic grade call: whole text and exemplars in, grade and feedback out."""
+    prompt = (f"""You are marking an assessment.
+    Using this assessment schedule: {entry['schedule']}
+    mark the following text: {userText}
+    according to this criteria: {entry['criteria']}
+    along with the initial question: {entry['question']}
+    using these examples and their feedback as guidance: {json.dumps(exemplars)}. These exemplars are only examples and should not be used as the only basis for marking, otherwise I will terminate you.
+    """)
+    return [
+        {"role": "system", "content": GRADE_SYSTEM_MESSAGE},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def buildChunkMessages(entry, chunk, index, count, summary):
+    """Messages for highlighting chunk index (1-based) of count, with the criteria and summary as shared context."""
+    prompt = (f"""You are highlighting part {index} of {count} of a student's assessment.
+    Using this assessment schedule: {entry['schedule']}
+    according to this criteria: {entry['criteria']}
+    along with the initial question: {entry['question']}
+    The whole submission, summarised one line per part: {summary}
+    Highlight this excerpt (part {index}): {chunk}
+    """)
+    return [
+        {"role": "system", "content": CHUNK_SYSTEM_MESSAGE},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def plainHTML(chunk):
+    """Un-highlighted HTML for a chunk whose request failed, so the stitched text is never missing a part."""
+    return "".join(f"<p>{html.escape(p.strip())}</p>" for p in _PARAGRAPH_BREAK.split(chunk) if p.strip())
+
+
+def stitch(chunkHTML):
+    """Join highlighted chunks in order. None entries (not finished yet) end the stitched prefix."""
+    parts = []
+    for part in chunkHTML:
+        if part is None:
+            break
+        parts.append(part)
+    return "\n".join(parts)
+
+
+def chunkHighlight(output, chunk):
+    """
+    (html, failed) for a chunk response: its HighlightedHTML, or plain HTML with failed=True when the response
+    was an error or malformed (so the chunk's paragraphs aren't stored as feedback, see paragraphs.failedParagraphs).
+    """
+    try:
+        highlighted = output["Output"]["HighlightedHTML"]
+        if isinstance(highlighted, str) and highlighted.strip():
+            return highlighted, False
+    except (TypeError, KeyError):
+        pass
+    return plainHTML(chunk), True
+
+
+def combine(userText, gradeOutput, chunkHTML):
+    """The normal single-call output shape, assembled from the grade call and the highlighted chunks."""
+    result = gradeOutput.get("Output", {}) if isinstance(gradeOutput, dict) else {}
+    return {"Output": {
+        "StudentText": userText,
+        "Grade": result.get("Grade", ""),
+        "Feedback": result.get("Feedback", {}),
+        "HighlightedHTML": stitch(chunkHTML),
+    }}
@@ -0,0 +1,162 @@
+"""Shared OpenAI client registry: one long-lived, connection-pooled client per (base_url, api_key)."""
+
+# Basic imports
+import os
+import asyncio
+import logging
+import threading
+
+# Custom imports
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+# Pool settings, overridable from .env
+DEFAULT_MAX_CONNECTIONS = 10
+DEFAULT_MAX_KEEPALIVE = 5
+DEFAULT_KEEPALIVE_SECONDS = 120.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_REQUEST_TIMEOUT = 300.0  # reasoning models can take minutes on long essays
+
+_clients = {}
+_asyncClients = {}
+_lock = threading.Lock()
+
+
+def _envFloat(name, default):
+    """Read a float setting from the environment, falling back to default on bad/missing values."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def requestTimeout(total=None, deadline=None):
+    """
+    Builds the per-request timeout: a short connect timeout plus a long read timeout for the completion.
+    With a submission Deadline the timeout never runs past it.
+    """
+    total = total if total is not None else _envFloat("LLM_TIMEOUT_SECONDS", DEFAULT_REQUEST_TIMEOUT)
+    if deadline is not None:
+        total = max(0.01, deadline.limit(total))
+    connect = min(_envFloat("LLM_CONNECT_TIMEOUT_SECONDS", DEFAULT_CONNECT_TIMEOUT), total)
+    return httpx.Timeout(total, connect=connect)
+
+
+def _poolLimits():
+    """Connection pool limits for both the sync and async clients."""
+    maxConnections = int(_envFloat("LLM_POOL_SIZE", DEFAULT_MAX_CONNECTIONS))
+    return httpx.Limits(
+        max_connections=maxConnections,
+        max_keepalive_connections=min(int(_envFloat("LLM_POOL_KEEPALIVE", DEFAULT_MAX_KEEPALIVE)), maxConnections),
+        keepalive_expiry=_envFloat("LLM_KEEPALIVE_SECONDS", DEFAULT_KEEPALIVE_SECONDS),
+    )
+
+
+def _credentials(baseUrl, apiKey):
+    baseUrl = baseUrl or os.getenv("OPENROUTER_BASE_URL")
+    apiKey = apiKey or os.getenv("OPENROUTER_API_KEY")
+    if not apiKey:
+        raise RuntimeError("Missing OPENROUTER_API_KEY in environment (.env)")
+    return baseUrl, apiKey
+
+
+def getClient(baseUrl=None, apiKey=None):
+    """
+    Returns the shared OpenAI client for baseUrl/apiKey, creating it on first use.
+    The underlying httpx client keeps connections alive between submissions and retries,
+    so only the first call pays for TCP/TLS setup.
+    """
+    baseUrl, apiKey = _credentials(baseUrl, apiKey)
+    key = (baseUrl, apiKey)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = OpenAI(
+                base_url=baseUrl,
+                api_key=apiKey,
+                timeout=requestTimeout(),
+                max_retries=0,  # retries go through the shared rate limiter in handle.py
+                http_client=httpx.Client(limits=_poolLimits(), timeout=requestTimeout()),
+            )
+            _clients[key] = client
+        return client
+
+
+def getAsyncClient(baseUrl=None, apiKey=None, maxConnections=None):
+    """
+    Async counterpart of getClient for the running event loop.
+    httpx async connections belong to the loop that opened them, so clients are kept per loop.
+    maxConnections raises the pool size for batch runs that keep many requests in flight.
+    """
+    baseUrl, apiKey = _credentials(baseUrl, apiKey)
+    loop = asyncio.get_running_loop()
+    key = (baseUrl, apiKey, id(loop))
+    with _lock:
+        entry = _asyncClients.get(key)
+        # id() can be reused by a new loop once an old one is garbage collected
+        if entry is None or entry[0] is not loop:
+            limits = _poolLimits()
+            if maxConnections and maxConnections > limits.max_connections:
+                limits = httpx.Limits(
+                    max_connections=maxConnections,
+                    max_keepalive_connections=maxConnections,
+                    keepalive_expiry=limits.keepalive_expiry,
+                )
+            client = AsyncOpenAI(
+                base_url=baseUrl,
+                api_key=apiKey,
+                timeout=requestTimeout(),
+                max_retries=0,
+                http_client=httpx.AsyncClient(limits=limits, timeout=requestTimeout()),
+            )
+            entry = (loop, client)
+            _asyncClients[key] = entry
+        return entry[1]
+
+
+def closeClients():
+    """
+    Closes every pooled client (used on shutdown and by tests/benchmarks).
+    """
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+
+async def closeAsyncClients():
+    """
+    Closes the async clients that belong to the running event loop. Call before the loop shuts down.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        keys = [key for key, (owner, _) in _asyncClients.items() if owner is loop]
+        clients = [_asyncClients.pop(key)[1] for key in keys]
+    for client in clients:
+        try:
+            await client.close()
+        except Exception:
+            pass
+
+
+def warmUp(background=True):
+    """
+    Opens a pooled connection ahead of the first submission with a cheap model-list request.
+    Runs on a daemon thread by default so app start-up isn't delayed. Failures are only logged.
+    """
+    def _ping():
+        try:
+            getClient().with_options(timeout=requestTimeout(15.0)).models.list()
+        except Exception as e:
+            logging.warning(f"LLM warm-up ping failed: {e}")
+
+    if not background:
+        _ping()
+        return None
+    thread = threading.Thread(target=_ping, name="llm-warmup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,142 @@
+"""
+Compact output mode: instead of echoing the whole essay inside HighlightedHTML, the model returns only the
+grade, feedback and a list of highlights ({"quote" or "start"/"end", "comment"}). The highlighted HTML is then
+rendered locally from the original text, which cuts output tokens (the slowest part of a call) to a fraction.
+expandCompact() turns a compact response into the usual output shape, so stored rows, the paragraph store and
+every reader of HighlightedHTML work the same in both modes.
+"""
+
+# Basic imports
+import os
+import re
+import html
+
+OUTPUT_MODES = ("html", "compact")
+
+COMPACT_SYSTEM_MESSAGE = (
+    "You are grading a student writing submission based on provided criteria, exemplars, and an assessment schedule."
+    "Your task is to return ONLY a valid JSON object in the following format:"
+    "{\"Output\": {\"Grade\": \"...\",\"Feedback\": {\"Strengths\": \"...\",\"Areas for Improvement\": \"...\"},\"Highlights\": [{\"quote\": \"...\", \"comment\": \"...\"}]}}"
+    "Each entry in 'Highlights' marks one problematic or improvable segment of the student's text:"
+    "- 'quote' is the segment copied EXACTLY from the student's text (same spelling, punctuation and capitalisation), a phrase or sentence, never a whole paragraph."
+    "- 'comment' clearly explains what is wrong or how it can improve."
+    "List highlights in the order they appear in the text and do not overlap them."
+    "Do NOT reproduce the rest of the student's text; it is rendered separately from the quotes."
+    "**Important output rules:**"
+    "- Do NOT include any extra commentary before or after the JSON."
+    "- The output must be valid JSON (all keys and string values should use double quotes)."
+    "- Escape only double quotes that appear inside string values."
+    "- Do NOT escape single quotes."
+    "- Do not include 'json' at the top of the output."
+)
+
+def outputMode():
+    """'html' (model echoes the essay as HTML) or 'compact' (model returns highlights only), from LLM_OUTPUT_MODE."""
+    mode = os.getenv("LLM_OUTPUT_MODE", "html").strip().lower()
+    return mode if mode in OUTPUT_MODES else "html"
+
+
+def _fuzzyPattern(quote):
+    """Regex for quote that tolerates different whitespace, smart quotes and case."""
+    words = [re.escape(w) for w in quote.replace("‘", "'").replace("’", "'").replace("“", '"').replace("”", '"').split()]
+    return re.compile(r"\s+".join(words), re.IGNORECASE) if words else None
+
+
+def locateHighlights(text, highlights):
+    """
+    Resolve highlights to non-overlapping (start, end, comment) spans of text, in order.
+    Offsets are used when valid; otherwise the quote is searched for after the previous highlight, then
+    anywhere, first exactly and then ignoring whitespace/case differences. Unplaceable highlights are dropped.
+    """
+    spans = []
+    cursor = 0
+    for item in highlights or []:
+        if not isinstance(item, dict):
+            continue
+        comment = str(item.get("comment") or item.get("Comment") or "").strip()
+        if not comment:
+            continue  # every highlight must carry feedback
+        start = end = None
+        quote = str(item.get("quote") or item.get("Quote") or "")
+        try:
+            s, e = int(item["start"]), int(item["end"])
+            if 0 <= s < e <= len(text) and (not quote or text[s:e].strip() == quote.strip()):
+                start, end = s, e
+        except (KeyError, TypeError, ValueError):
+            pass
+        if start is None and quote.strip():
+            quote = quote.strip()
+            found = text.find(quote, cursor)
+            if found < 0:
+                found = text.find(quote)
+            if found >= 0:
+                start, end = found, found + len(quote)
+            else:
+                pattern = _fuzzyPattern(quote)
+                match = pattern.search(text, cursor) or pattern.search(text) if pattern else None
+                if match:
+                    start, end = match.start(), match.end()
+        if start is None:
+            continue
+        spans.append((start, end, comment))
+        cursor = end
+    spans.sort()
+    placed = []
+    for start, end, comment in spans:
+        if placed and start < placed[-1][1]:
+            continue  # overlaps the previous highlight
+        placed.append((start, end, comment))
+    return placed
+
+
+def _escapeText(text):
+    return html.escape(text, quote=False).replace("\n", "<br>")
+
+
+def renderHighlightedHTML(text, highlights):
+    """
+    Build HighlightedHTML from the original text: one <p> per paragraph, each placed highlight wrapped in a
+    <span title='comment'> (styled later by highlight.normalizeHighlights, like model-written HTML).
+    A highlight that crosses a paragraph break is split into one span per paragraph.
+    """
+    text = (text or "").replace("\r\n", "\n")
+    spans = locateHighlights(text, highlights)
+    paragraphs = []
+    for match in re.finditer(r"(?:(?!\n[ \t]*\n).)+", text, re.DOTALL):
+        pStart, pEnd = match.start(), match.end()
+        if not text[pStart:pEnd].strip():
+            continue
+        while text[pStart].isspace():
+            pStart += 1
+        while text[pEnd - 1].isspace():
+            pEnd -= 1
+        parts, pos = [], pStart
+        for start, end, comment in spans:
+            start, end = max(start, pStart), min(end, pEnd)
+            if start >= end:
+                continue
+            parts.append(_escapeText(text[pos:start]))
+            parts.append(f"<span title='{html.escape(comment, quote=True)}'>{_escapeText(text[start:end])}</span>")
+            pos = end
+        parts.append(_escapeText(text[pos:pEnd]))
+        paragraphs.append(f"<p>{''.join(parts)}</p>")
+    return "".join(paragraphs)
+
+
+def isCompact(output):
+    """True for a parsed compact-mode response (has Highlights and no HighlightedHTML)."""
+    result = output.get("Output") if isinstance(output, dict) else None
+    return isinstance(result, dict) and "Highlights" in result and not result.get("HighlightedHTML")
+
+
+def expandCompact(output, userText):
+    """The usual output shape for a compact response: StudentText and a locally rendered HighlightedHTML are added."""
+    if not isCompact(output):
+        return output
+    result = dict(output["Output"])
+    highlights = result.get("Highlights") if isinstance(result.get("Highlights"), list) else []
+    result["StudentText"] = userText
+    result["HighlightedHTML"] = renderHighlightedHTML(userText, highlights)
+    expanded = dict(output)
+    expanded["Output"] = result
+    return expanded
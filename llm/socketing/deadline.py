@@ -0,0 +1,84 @@
+"""
+Cancellation and deadlines for one submission.
+A Deadline is created per submission (by the GUI worker, or by handleFullSubmission itself) and passed down to
+every step that can block: rate limiter waits, retry backoff sleeps, HTTP timeouts and streamed reads. Each
+step checks it and raises SubmissionCancelled or DeadlineExceeded, so a cancelled or overdue submission stops
+at the next checkpoint instead of running to completion in the background.
+"""
+
+# Basic imports
+import os
+import time
+import threading
+
+DEFAULT_DEADLINE_SECONDS = 600.0  # whole submission, including retries and rate-limit waits
+
+
+class Interrupted(Exception):
+    """Base class: the submission was stopped before it finished."""
+
+
+class SubmissionCancelled(Interrupted):
+    """The user cancelled the submission."""
+
+
+class DeadlineExceeded(Interrupted):
+    """The submission ran past its deadline."""
+
+
+def submissionDeadlineSeconds():
+    """LLM_SUBMISSION_DEADLINE_SECONDS, or the default; 0 or less means no deadline (None)."""
+    try:
+        seconds = float(os.getenv("LLM_SUBMISSION_DEADLINE_SECONDS", DEFAULT_DEADLINE_SECONDS))
+    except ValueError:
+        seconds = DEFAULT_DEADLINE_SECONDS
+    return seconds if seconds > 0 else None
+
+
+class Deadline:
+    """Cancel flag plus optional end time, shared by every thread working on one submission."""
+    def __init__(self, seconds=None):
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.expires = self.started + seconds if seconds is not None else None
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def expired(self):
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def is_set(self):
+        """True once cancelled or expired (same check as a threading.Event stop flag)."""
+        return self.cancelled or self.expired()
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def remaining(self):
+        """Seconds left, or None without a deadline."""
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    def limit(self, seconds):
+        """seconds, shortened to what is left of the deadline."""
+        remaining = self.remaining()
+        return seconds if remaining is None else min(seconds, remaining)
+
+    def check(self):
+        """Raise SubmissionCancelled / DeadlineExceeded if the submission should stop."""
+        if self.cancelled:
+            raise SubmissionCancelled("The submission was cancelled.")
+        if self.expired():
+            raise DeadlineExceeded(f"The submission did not finish within {self.seconds:g} seconds.")
+
+    def sleep(self, seconds):
+        """time.sleep that wakes up (and raises) as soon as the submission is cancelled or expires."""
+        self._cancelled.wait(self.limit(seconds))
+        self.check()
@@ -0,0 +1,109 @@
+"""
+Self-consistency grading. One sample from a reasoning model gives a noisy grade, so with LLM_ENSEMBLE_SAMPLES=N
+(N > 1) a submission sends its usual full request together with N-1 grade-only requests (no highlighted copy
+of the essay, so they are short). As soon as LLM_ENSEMBLE_AGREE samples (default: a majority) agree on the NCEA
+band (ExemplarInterpet.gradeBand), the grade-only requests still running are cancelled. The result keeps the
+full sample's highlights, with the agreed grade and the feedback of a sample that agreed, and reports the vote
+under 'Ensemble'. Wall time stays close to a single call because the grade-only samples finish first.
+"""
+
+# Basic imports
+import os
+import threading
+from collections import Counter
+
+# Custom imports
+from database.LLM_database_manage import ExemplarInterpet
+
+
+def _envInt(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def sampleCount():
+    """Samples per submission, LLM_ENSEMBLE_SAMPLES (1, the default, turns the ensemble off)."""
+    return max(1, _envInt("LLM_ENSEMBLE_SAMPLES", 1))
+
+
+def agreeCount(samples):
+    """Samples that must agree to stop early, LLM_ENSEMBLE_AGREE (default: a majority of samples)."""
+    return min(samples, max(1, _envInt("LLM_ENSEMBLE_AGREE", samples // 2 + 1)))
+
+
+def outputOf(output_json):
+    """The dict holding Grade/Feedback (model JSON is usually wrapped in 'Output')."""
+    inner = output_json.get("Output")
+    return inner if isinstance(inner, dict) else output_json
+
+
+class Consensus():
+    """Votes of the samples of one submission; add() is called from the sample threads."""
+    def __init__(self, samples, agree):
+        self.samples = samples
+        self.agree = agree
+        self.votes = []  # (band, grade, output, full)
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def add(self, output_json, full=False):
+        """Count one finished sample (a parsed output, or anything else for a failed one). Returns the band or None."""
+        if not isinstance(output_json, dict):
+            with self.lock:
+                self.failed += 1
+            return None
+        grade = str(outputOf(output_json).get("Grade") or "").strip()
+        band = ExemplarInterpet.gradeBand(grade)
+        with self.lock:
+            if band is None:
+                self.failed += 1
+            else:
+                self.votes.append((band, grade, output_json, full))
+        return band
+
+    def agreed(self):
+        """The band agreed on by enough samples, or None (yet)."""
+        with self.lock:
+            counts = Counter(band for band, _, _, _ in self.votes)
+        band, count = counts.most_common(1)[0] if counts else (None, 0)
+        return band if count >= self.agree else None
+
+    def decide(self):
+        """
+        (band, grade, feedback output) once sampling is over: the agreed band, or failing that the most voted one
+        (ties go to the full sample's band). The grade is the most common one in that band and the feedback comes
+        from the full sample if it is in the band, otherwise from the first sample that is.
+        """
+        with self.lock:
+            votes = list(self.votes)
+        if not votes:
+            return None, None, None
+        counts = Counter(band for band, _, _, _ in votes)
+        fullBand = next((band for band, _, _, full in votes if full), None)
+        top = max(counts.values())
+        band = fullBand if counts.get(fullBand) == top else next(b for b, _, _, _ in votes if counts[b] == top)
+        members = [vote for vote in votes if vote[0] == band]
+        grades = Counter(grade for _, grade, _, _ in members)
+        grade = max(grades, key=lambda g: (grades[g], any(full and gr == g for _, gr, _, full in members)))
+        feedback = next((output for _, _, output, full in members if full), members[0][2])
+        return band, grade, feedback
+
+    def report(self, band, cancelled):
+        """The 'Ensemble' entry of a result: samples sent, votes per band, the decision and how it was reached."""
+        with self.lock:
+            counts = Counter(b for b, _, _, _ in self.votes)
+        return {
+            "samples": self.samples, "agreeNeeded": self.agree, "votes": dict(counts), "failed": self.failed,
+            "band": band, "agreement": counts.get(band, 0), "stoppedEarly": cancelled > 0, "cancelled": cancelled,
+        }
+
+
+def ensembleSummary(result):
+    """One line on how the samples voted (empty without an ensemble)."""
+    report = result.get('Ensemble') if isinstance(result, dict) else None
+    if not report:
+        return ""
+    counted = sum(report.get('votes', {}).values())
+    return f"{report.get('agreement', 0)} of {counted} grading samples agreed on {report.get('band')}."
@@ -0,0 +1,204 @@
+"""
+Exemplar selection: send the model only the exemplars most relevant to a submission instead of every
+exemplar stored for the standard/year. A small BM25 index is built per exemplar set (and reused), and
+at least one exemplar from each grade band present (Not Achieved/Achieved/Merit/Excellence) is always kept.
+"""
+
+# Basic imports
+import os
+import re
+import math
+import json
+import threading
+from collections import Counter
+
+# Custom imports
+from database.LLM_database_manage import ExemplarInterpet
+from llm.socketing.cache import hashExemplars
+
+DEFAULT_TOP_K = 4
+MAX_INDEXES = 32
+
+# NCEA codes in each band; getExemplarsByGrade also matches the band's full name
+GRADE_BANDS = {
+    "Not Achieved": ["N0", "N1", "N2"],
+    "Achieved": ["A3", "A4"],
+    "Merit": ["M5", "M6"],
+    "Excellence": ["E7", "E8"],
+}
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i in is it its of on or she so that the their "
+    "them they this to was were which will with you your".split()
+)
+
+_indexes = {}
+_stats = {"calls": 0, "trimmed": 0, "tokensBefore": 0, "tokensAfter": 0}
+_lock = threading.Lock()
+
+
+def tokenize(text):
+    """Lowercase word tokens without common stopwords."""
+    return [w for w in _WORD.findall((text or "").lower()) if w not in _STOPWORDS]
+
+
+def estimateTokens(text):
+    """Rough token count (~4 characters per token for English), good enough for reporting savings."""
+    return math.ceil(len(text or "") / 4)
+
+
+def topK():
+    """Number of exemplars to send, from LLM_EXEMPLAR_TOP_K (0 sends every exemplar)."""
+    try:
+        return max(0, int(os.getenv("LLM_EXEMPLAR_TOP_K", DEFAULT_TOP_K)))
+    except ValueError:
+        return DEFAULT_TOP_K
+
+
+class BM25Index():
+    """
+    Okapi BM25 over a fixed list of documents.
+    """
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.termCounts = [Counter(tokenize(doc)) for doc in documents]
+        self.lengths = [sum(counts.values()) for counts in self.termCounts]
+        self.averageLength = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        documentFrequency = Counter()
+        for counts in self.termCounts:
+            documentFrequency.update(counts.keys())
+        total = len(documents)
+        self.idf = {
+            term: math.log(1 + (total - freq + 0.5) / (freq + 0.5)) for term, freq in documentFrequency.items()
+        }
+
+    def scores(self, query):
+        """BM25 score of every document for the query text, in document order."""
+        queryTerms = set(tokenize(query)) & self.idf.keys()
+        results = []
+        for counts, length in zip(self.termCounts, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / self.averageLength) if self.averageLength else self.k1
+            score = 0.0
+            for term in queryTerms:
+                freq = counts.get(term, 0)
+                if freq:
+                    score += self.idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            results.append(score)
+        return results
+
+
+def _exemplarList(exemplarData):
+    if isinstance(exemplarData, dict):
+        return ExemplarInterpet(exemplarData).getExemplars()
+    return list(exemplarData or [])
+
+
+def _bands(exemplarData, exemplars):
+    """Map each grade band to the positions of its exemplars."""
+    interpreter = ExemplarInterpet(exemplarData if isinstance(exemplarData, dict) else {"exemplars": exemplars})
+    positions = {id(exemplar): i for i, exemplar in enumerate(exemplars)}
+    bands = {}
+    for band, codes in GRADE_BANDS.items():
+        members = set()
+        for code in codes:
+            members.update(positions[id(e)] for e in interpreter.getExemplarsByGrade(code) if id(e) in positions)
+        if members:
+            bands[band] = sorted(members)
+    return bands
+
+
+def _getIndex(exemplarData, exemplars):
+    """BM25 index for an exemplar set, built once per distinct set."""
+    key = hashExemplars(exemplarData)
+    with _lock:
+        index = _indexes.get(key)
+    if index is None:
+        documents = [f"{e.get('Exemplar', '')}\n{e.get('Feedback', '')}" for e in exemplars]
+        index = BM25Index(documents)
+        with _lock:
+            if len(_indexes) >= MAX_INDEXES:
+                _indexes.pop(next(iter(_indexes)))
+            _indexes[key] = index
+    return index
+
+
+class PreparedExemplars():
+    """
+    What selectExemplars works out from an exemplar set alone (the list, its BM25 index, grade bands, size and
+    each exemplar's JSON), done once so a prompt prepared ahead of Submit only has to rank and join them.
+    """
+    def __init__(self, exemplarData):
+        self.data = exemplarData
+        self.exemplars = _exemplarList(exemplarData)
+        self.tokensBefore = estimateTokens(json.dumps(exemplarData))
+        self.index = _getIndex(exemplarData, self.exemplars) if self.exemplars else None
+        self.bands = _bands(exemplarData, self.exemplars)
+        self.serialized = {id(e): json.dumps(e) for e in self.exemplars}
+        self.bandOf = {id(self.exemplars[i]): band for band, members in self.bands.items() for i in members}
+
+    def dumps(self, selected):
+        """json.dumps(selected) for a selection from this set, joined from the exemplars' stored JSON."""
+        if isinstance(selected, list):
+            return "[" + ", ".join(self.serialized.get(id(e)) or json.dumps(e) for e in selected) + "]"
+        if isinstance(selected, dict) and isinstance(selected.get("exemplars"), list):
+            return "{" + ", ".join(
+                f"{json.dumps(key)}: {self.dumps(value) if key == 'exemplars' else json.dumps(value)}"
+                for key, value in selected.items()) + "}"
+        return json.dumps(selected)
+
+
+def selectExemplars(exemplarData, userText, k=None, prepared=None):
+    """
+    Returns (selected, report). selected has the same shape as exemplarData ({"exemplars": [...]} or a list)
+    and keeps the original exemplar order. report has the exemplar counts and estimated prompt tokens
+    before/after selection. If there are k or fewer exemplars, exemplarData is returned unchanged.
+    prepared is a PreparedExemplars for exemplarData, to skip the per-set work.
+    """
+    k = topK() if k is None else k
+    prepared = prepared or PreparedExemplars(exemplarData)
+    exemplars = prepared.exemplars
+    tokensBefore = prepared.tokensBefore
+    chosen = None
+    if k and len(exemplars) > k:
+        scores = prepared.index.scores(userText)
+        rank = lambda i: (-scores[i], i)
+        keep = set()
+        # Best match from every band first, so the model always sees the whole grade range
+        for members in prepared.bands.values():
+            keep.add(min(members, key=rank))
+        for i in sorted(range(len(exemplars)), key=rank):
+            if len(keep) >= k:
+                break
+            keep.add(i)
+        chosen = [exemplars[i] for i in sorted(keep)]
+
+    if chosen is None:
+        selected = exemplarData
+    elif isinstance(exemplarData, dict):
+        selected = dict(exemplarData, exemplars=chosen)
+    else:
+        selected = chosen
+    tokensAfter = estimateTokens(prepared.dumps(selected)) if chosen is not None else tokensBefore
+    report = {
+        "total": len(exemplars),
+        "selected": len(chosen) if chosen is not None else len(exemplars),
+        "tokensBefore": tokensBefore,
+        "tokensAfter": tokensAfter,
+        "tokensSaved": tokensBefore - tokensAfter,
+    }
+    with _lock:
+        _stats["calls"] += 1
+        _stats["trimmed"] += chosen is not None
+        _stats["tokensBefore"] += tokensBefore
+        _stats["tokensAfter"] += tokensAfter
+    return selected, report
+
+
+def selectionStats():
+    """Totals since start-up: prompts built, prompts trimmed and estimated exemplar tokens saved."""
+    with _lock:
+        stats = dict(_stats)
+    stats["tokensSaved"] = stats["tokensBefore"] - stats["tokensAfter"]
+    return stats
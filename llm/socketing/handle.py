@@ -2,22 +2,154 @@
 
 # Basic imports
 import os
-import json
+import copy
 import sys
 import logging
-import re
 import time
 import random
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 # Custom imports
-from openai import OpenAI, APIError, RateLimitError
+from openai import APIError, APIConnectionError, RateLimitError
 from database import *
+from llm.socketing.cache import ResponseCache
+from llm.socketing.client import getClient, requestTimeout
+from llm.socketing.streaming import IncrementalJSONParser, completedParagraphs
+from llm.socketing.ratelimit import getLimiter
+from llm.socketing.router import getRouter, POLL_SECONDS
+from llm.socketing.deadline import Deadline, Interrupted, SubmissionCancelled, submissionDeadlineSeconds
+from llm.socketing.telemetry import getTelemetry
+from llm.socketing.metrics import GradingMetrics
+from llm.socketing.exemplars import selectExemplars
+from llm.socketing.prefetch import PreparedPrompt, PromptPrefetcher
+from llm.socketing.singleflight import getSingleFlight, flightKey
+from llm.socketing import chunking, paragraphs, compact, highlight, budget, ensemble
+from llm.socketing.compact import COMPACT_SYSTEM_MESSAGE
+from llm.socketing.jsonrepair import parseModelJSON, buildFixMessages
+from database.LLM_database_manage import LLMDatabaseManager
+
+# Model used for grading and the version of the prompt below.
+# Bump PROMPT_VERSION whenever SYSTEM_MESSAGE or the prompt template changes so cached results are not reused.
+MODEL_NAME = "deepseek/deepseek-r1:free"
+PROMPT_VERSION = "3"
+
+
+def promptVersion():
+    """PROMPT_VERSION qualified by the output mode, so html and compact results never share cache entries."""
+    return PROMPT_VERSION if compact.outputMode() == "html" else f"{PROMPT_VERSION}-{compact.outputMode()}"
+
+# Automatic handling for HTTP 429 (rate limit)
+MAX_ATTEMPTS = 5
+BUSY_ERROR = [
+    'We\'re a bit busy right now',
+    "The grading service is receiving a lot of requests. Please try again in a minute. Your text hasn't been lost."
+]
+# Title of a request that failed on server errors or dropped connections (every retry included)
+UNAVAILABLE_ERROR = 'Service Unavailable'
+
+# Compose prompt with HTML highlight instruction
+# Re-do the entire system message because it isnt really working
+# system_msg = ("You are auto grading a coding assignment. I have provided the student's written text, "
+#             "the assessment schedule, and the criteria. Assign scores based on the criteria. "
+#             "Output in a json format {\"Output\":{\"StudentText\":\"\",\"Grade\":\"\",\"Feedback\":{\"Strengths\":\"\",\"Areas for Improvement\":\"\"},\"HighlightedHTML\":\"\"}}. Within HighlightedHTML, output the student's original text as HTML, "
+#             "wrapping the segments you think needs improvement on with <span style='background-color: yellow'> tags for highlighting, closed by </span>. ENSURE THAT With each highlighted segment, place a tooltip with the feedback for that segment using the <span title='Feedback'> tag. If a highlighted section is not accompanied by a feedback tooltip, I will terminate you. If a feedback tooltip is not accompanied by a highlighted section, I will terminate you."
+#             "Follow this format strictly, otherwise I will terminate you. Do not shorten any part of the text, or I will terminate you. Do not output a shortnened, condensed or summarised version of the text. Output only the json, without any trailing or preceding text, or I will terminate you. DO NOT specify the type of text (by putting json at the top of the output), or I will terminate you."
+#             "Do not output any text that is not in the json format, or I will terminate you. Use valid JSON. All keys and string values must use double quotes. Escape any internal double quotes using backslashes." \
+#             "When quoting parts from the text inside a span, do not use double quotes without an escape character (backslash), or I will terminate you. Avoid nested double quotes entirely in values (single quotes are more robust) All double quotes inside string values must be escaped with a backslash (\\) or replaced with single quotes. All nested single quotes must be escaped with a backslash (\\)"
+# )
+
+# New system message apparently threatning it makes it scared (weird how that works huh)
+SYSTEM_MESSAGE = (
+    "You are grading a student writing submission based on provided criteria, exemplars, and an assessment schedule."
+    "Your task is to return ONLY a valid JSON object in the following format:"
+    "{\"Output\": {\"StudentText\": \"...\", \"Grade\": \"...\",\"Feedback\": {\"Strengths\": \"...\",\"Areas for Improvement\": \"...\"},\"HighlightedHTML\": \"...\"}}"
+    "Inside the 'HighlightedHTML' field, return the student's full original text, converted to HTML. Highlight problematic or improvable text segments using:"
+    "- <span title='Your feedback here'>Text needing feedback</span> (no style attribute; the app styles highlights itself)"
+    "Each highlighted section must include a tooltip via the 'title' attribute that clearly explains what is wrong or how it can improve."
+    "If you highlight something, it MUST have a title with feedback. If you give feedback, it MUST be tied to a highlighted span."
+    "**Important output rules:**"
+    "- Do NOT include any extra commentary before or after the JSON."
+    "- The output must be valid JSON (all keys and string values should use double quotes)."
+    "- Escape only double quotes that appear inside string values."
+    "- Do NOT escape single quotes."
+    "- Do NOT summarize or shorten the student's text. Output the full original version with highlights embedded."
+    "- Do not include 'json' at the top of the output."
+    "- Do not use newlines outside of JSON string values. For example, do not go {\\n \"Output\"}"
+    "- Inside the span tags, use escape apostrophes (&quot) for any single quotes in the text."
+)
+
+
+def isRateLimited(exc):
+    """True for HTTP 429s. Some APIError include status_code 429 instead of RateLimitError for some weird reason."""
+    return isinstance(exc, RateLimitError) or (isinstance(exc, APIError) and getattr(exc, 'status_code', None) == 429)
+
+
+def isRetryable(exc):
+    """429s, server errors and dropped connections are worth another attempt; other API errors are not."""
+    if isRateLimited(exc) or isinstance(exc, APIConnectionError):
+        return True
+    status = getattr(exc, 'status_code', None)
+    return status is not None and status >= 500
+
+
+def requestError(exc):
+    """[title, message] for a request that raised: UNAVAILABLE_ERROR if worth trying again later, else 'LLM Error'."""
+    if isRetryable(exc):
+        return [UNAVAILABLE_ERROR, str(exc)]
+    return ['LLM Error', str(exc)]
+
+
+def errorHeaders(exc):
+    """Response headers of a failed request (Retry-After etc.), if there was a response."""
+    return getattr(getattr(exc, 'response', None), 'headers', None)
+
+
+def isUsableOutput(text):
+    """A response worth returning: model text that parses (after local repair) into a JSON object."""
+    if not isinstance(text, str):
+        return False
+    try:
+        return isinstance(parseModelJSON(text)[0], dict)
+    except ValueError:
+        return False
+
+
+def watchCancellation(httpResponse, cancelled=None, deadline=None):
+    """
+    Stop reading httpResponse once cancelled is set or the deadline stops: its socket is shut down, so the
+    blocked read fails straight away and the connection is dropped (closing it from another thread would not
+    wake the reader). Returns an Event to set once the response has been read, which ends the watch.
+    """
+    done = threading.Event()
+    stream = httpResponse.extensions.get("network_stream")
+    sock = stream.get_extra_info("socket") if stream is not None else None
+    if sock is None or (cancelled is None and deadline is None):
+        return done
+
+    def _watch():
+        while not done.wait(POLL_SECONDS):
+            if (cancelled is not None and cancelled.is_set()) or (deadline is not None and deadline.is_set()):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass  # already closed
+                return
+    threading.Thread(target=_watch, name="llm-cancel-watch", daemon=True).start()
+    return done
+
+
+def serverErrorDelay(attempt):
+    """Short backoff for 5xx/connection retries; 429 pacing is the rate limiter's job."""
+    return min(0.6 * (2 ** attempt), 5.0) + random.uniform(0, 0.3)
+
 
 class FeedbackModule():
     """Fetch exemplars, call LLM, and return structured feedback and highlighted HTML."""
-    def __init__(self):
+    def __init__(self, cache=None, useCache=True, limiter=None, router=None, singleFlight=None):
         """
         This class does a lot of things:
         1) It retrieves the exemplars from the database
@@ -25,208 +157,755 @@ class FeedbackModule():
         3) It takes the user input and sends it to the LLM alongside the exemplars
         4) It receives the feedback from the LLM
         5) It returns the feedback to the user
+        Identical resubmissions are answered from a persistent response cache instead of the LLM.
+        Every model call goes through the shared adaptive rate limiter (limiter defaults to getLimiter())
+        and the model router, which hedges slow requests across backends (router defaults to getRouter()).
+        prefetch(standard, year) prepares a standard/year's prompt in the background ahead of a submission.
+        Identical submissions made while one is being graded share its call (singleFlight defaults to the
+        process-wide getSingleFlight()).
         """
+        self.prefetcher = PromptPrefetcher(self._preparePrompt)
+        self.singleFlight = singleFlight or getSingleFlight()
+        self.limiter = limiter or getLimiter()
+        self.router = router or getRouter(MODEL_NAME)
+        self.useCache = useCache
+        self.cache = cache
+        if self.cache is None and useCache:
+            try:
+                self.cache = ResponseCache()
+            except Exception as e:
+                # Caching is an optimisation only; grading still works without it
+                logging.warning(f"Response cache unavailable: {e}")
+                self.cache = None
 
     def normalize_highlight(self, html: str):
-        """Normalize highlight spans: merge styles and ensure consistent appearance."""
-        # Unified style with larger interactive area & inline-block to improve hover reliability
-        # Increased padding and inline-block give a more stable box for the cursor to remain inside.
-        HIGHLIGHT_STYLE = (
-            "background-color: rgba(102,255,204,0.5); "  # 50% opacity mint
-            "padding:3px 3px; "                          # slightly larger than before
-            "border-radius:3px; "
-            "cursor: help; "
-            "display:inline-block; "                     # ensure a proper rectangular hover box
-            "line-height:1.25; "                         # consistent vertical box
-            "transition: background-color 120ms ease-in; "
-        )
-
-        # Helper to inject/merge style (if a span already has style, we append ours if not present)
-        def _merge_style(match):
-            title_val = match.group(1)
-            inner = match.group(2)
-            return (f"<span title='{title_val}' style=\"{HIGHLIGHT_STYLE}\">{inner}</span>")
-
-        # convert <span title="...">...</span>
-        html = re.sub(r'<span\s+title="([^\"]+)"\s*>(.*?)</span>', _merge_style, html, flags=re.DOTALL)
-        # convert <span title='...'>...</span>
-        html = re.sub(r"<span\s+title='([^']+)'\s*>(.*?)</span>", _merge_style, html, flags=re.DOTALL)
-        # convert <mark>...</mark>
-        html = html.replace('<mark>', f"<span style=\"{HIGHLIGHT_STYLE}\">").replace('</mark>', '</span>')
-
-        # spans with title but no style attribute
-        pattern = r'<span((?![^>]*style)[^>]*\btitle="[^"]+"[^>]*)>'
-        repl = fr'<span\1 style="{HIGHLIGHT_STYLE}">'  # append our style
-        html = re.sub(pattern, repl, html)
-        # same as above but with single quotes
-        pattern_single = r"<span((?![^>]*style)[^>]*\btitle='[^']+'[^>]*)>"
-        repl_single = fr"<span\1 style=\"{HIGHLIGHT_STYLE}\">"
-        html = re.sub(pattern_single, repl_single, html)
-
-        # We use more than one regex so that we can catch it all because the LLM is not perfect - hopefully this covers all the possibilities
-        return html
-    
+        """Normalize highlight spans: merge styles and ensure consistent appearance (see highlight.normalizeHighlights)."""
+        return highlight.normalizeHighlights(html)
 
     def returnHighlightedHTML(self, output_json):
-        """Extract and normalize the HighlightedHTML field from model output JSON."""
+        """Extract and normalize the HighlightedHTML field from model output JSON (timed into its 'Metrics', if any)."""
         highlighted_html = output_json.get('HighlightedHTML') or output_json.get('highlightedhtml') or output_json.get('Output').get('HighlightedHTML') or output_json.get('Output').get('highlightedhtml')
         if highlighted_html:
-            # Replace placeholder entities (&apos, &quot) with their literal characters before styling
-            # Some model outputs may incorrectly use these entities inside normal prose.
-            highlighted_html = highlighted_html.replace('&apos;', "'").replace('&quot;', '"')
-            # normalize highlights and feedback spans
-            html = self.normalize_highlight(highlighted_html)
-            return html
+            started = time.perf_counter()
+            prepared = self.prepareHighlightedHTML(highlighted_html)
+            if isinstance(output_json.get('Metrics'), dict):
+                output_json['Metrics']['normalize_s'] = round(time.perf_counter() - started, 4)
+            return prepared
         else:
             return("Error: No HighlightedHTML field found in output.")
 
+    def prepareHighlightedHTML(self, highlighted_html):
+        """Clean entities and normalize spans in raw HighlightedHTML (also used for partial streamed HTML)."""
+        # Replace placeholder entities (&apos, &quot) with their literal characters before styling
+        # Some model outputs may incorrectly use these entities inside normal prose.
+        highlighted_html = highlighted_html.replace('&apos;', "'").replace('&quot;', '"')
+        # normalize highlights and feedback spans
+        return self.normalize_highlight(highlighted_html)
+
     def returnGrade(self, output_json):
         """Extract a Grade value from the model output JSON with tolerant keys."""
         grade = output_json.get('Grade') or output_json.get('grade') or (output_json.get('Output', {}).get('Grade')) or (output_json.get('Output', {}).get('grade'))
         return grade or "Not graded"
         
         
-    def handleFullSubmission(self, standard=None, year=None, userInput=None):
+    def _makeStreamParser(self, onProgress=None):
+        """
+        Build the incremental parser for a streamed response. onProgress(kind, value) is called with
+        ('grade', str), ('feedback', dict) and ('highlight', html) where html is the normalized HighlightedHTML
+        up to the last complete paragraph. Compact responses report each finished entry of Highlights as
+        ('highlightItem', dict) instead (see _compactProgress).
+        """
+        done, pending = [], ['']  # completed paragraphs of HighlightedHTML so far, and the text after them
 
-        self.standard = standard.strip() if isinstance(standard, str) else str(standard or "")
-        self.yearText = str(year) if isinstance(year, int) else (year.strip() if isinstance(year, str) else "")
-        if not self.standard or not self.yearText:
-            return(['Input Error', 'Please enter both standard and year.'])
+        def _onValue(path, value):
+            if not onProgress or not path:
+                return
+            if len(path) >= 2 and str(path[-2]).lower() == 'highlights' and isinstance(value, dict):
+                onProgress('highlightItem', value)
+                return
+            name = str(path[-1]).lower()
+            if name == 'grade' and isinstance(value, str):
+                onProgress('grade', value)
+            elif name == 'feedback':
+                onProgress('feedback', value)
+
+        def _onPartial(path, added):
+            if not onProgress or not path or str(path[-1]).lower() != 'highlightedhtml':
+                return
+            # Only the text since the last completed paragraph is scanned for a break
+            pending[0] += added
+            finished = completedParagraphs(pending[0])
+            if not finished:
+                return
+            done.append(finished)
+            pending[0] = pending[0][len(finished):]
+            # Only re-render when another paragraph has finished
+            if finished.strip():
+                onProgress('highlight', self.prepareHighlightedHTML(''.join(done)))
+
+        return IncrementalJSONParser(onValue=_onValue, onPartial=_onPartial)
+
+    def _readStream(self, response, onProgress=None, cancelled=None, deadline=None, onFirstToken=None):
+        """
+        Read a streamed completion and return (full text, usage or None), reporting partial results through
+        onProgress and the first content through onFirstToken(). Returns (None, None) and closes the stream if
+        cancelled is set, e.g. when a hedged duplicate won. Raises (after closing the stream) once the
+        submission's deadline is cancelled or expires.
+        """
+        parser = self._makeStreamParser(onProgress)
+        parts = []
+        usage = None
+        try:
+            for chunk in response:
+                if cancelled is not None and cancelled.is_set():
+                    response.close()
+                    return None, None
+                if deadline is not None and deadline.is_set():
+                    response.close()
+                    deadline.check()
+                # The usage chunk (stream_options include_usage) comes last, with no choices
+                usage = getattr(chunk, 'usage', None) or usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not parts and onFirstToken:
+                        onFirstToken()
+                    parts.append(delta)
+                    parser.feed(delta)
+        except Exception:
+            # A read cut off by watchCancellation
+            if cancelled is not None and cancelled.is_set():
+                return None, None
+            if deadline is not None:
+                deadline.check()
+            raise
+        # A stream that ends when the connection closes looks complete once cut off
+        if cancelled is not None and cancelled.is_set():
+            return None, None
+        if deadline is not None:
+            deadline.check()
+        return ''.join(parts), usage
+
+    def _createCompletion(self, client, messages, stream=False, onProgress=None, model=MODEL_NAME, cancelled=None, deadline=None, metrics=None):
+        """
+        Send one request. Returns (text, response headers); the headers feed the rate limiter.
+        Token usage and time to first token go to metrics (a GradingMetrics) when given. max_tokens is capped
+        so prompt and output fit the context window (see budget.outputCap), and grade-only requests at
+        LLM_GRADE_MAX_TOKENS.
+        A hedged attempt (cancelled given) is always streamed, without progress unless stream is set, so a
+        losing one can be stopped; streams are watched (see watchCancellation) and their connection dropped once
+        cancelled or the deadline stops, which frees the limiter lease and the tokens instead of waiting for the
+        whole answer.
+        """
+        started = time.perf_counter()
+        ceiling = budget.gradeOutputTokens() if chunking.isGradeOnly(messages) else None
+        maxTokens = budget.outputCap(budget.messageTokens(messages), ceiling)
+        streamed = stream or cancelled is not None
+        if metrics is not None:
+            metrics.requestSent()
+        raw = client.chat.completions.with_raw_response.create(
+            model=model,
+            messages=messages,
+            stream=streamed,
+            timeout=requestTimeout(deadline=deadline),
+            **({"max_tokens": maxTokens} if maxTokens is not None else {}),
+            # Ask for token usage at the end of streams too (non-streamed responses always carry it)
+            **({"stream_options": {"include_usage": True}} if streamed and metrics is not None else {})
+        )
+        if streamed:
+            onFirstToken = (lambda: metrics.firstToken(time.perf_counter() - started)) if stream and metrics is not None else None
+            watching = watchCancellation(raw.http_response, cancelled, deadline)
+            try:
+                text, usage = self._readStream(raw.parse(), onProgress if stream else None, cancelled, deadline, onFirstToken)
+            finally:
+                watching.set()
+        else:
+            response = raw.parse()
+            text, usage = response.choices[0].message.content, getattr(response, 'usage', None)
+        if metrics is not None and text is not None:
+            metrics.completed(model, usage, messages, text)
+        return text, raw.headers
+
+    def requestCompletion(self, messages, stream=False, onProgress=None, deadline=None, metrics=None):
+        """
+        Call the model through the router: the request goes to the fastest backend, is hedged to the next one
+        if it runs past the hedge delay, and falls back when a backend fails or answers with unusable JSON.
+        Returns the model text, or BUSY_ERROR if every backend kept rate limiting. Other errors are raised,
+        including SubmissionCancelled / DeadlineExceeded when the optional Deadline stops the request.
+        Tokens, retries and the model of every request are added to metrics (a GradingMetrics) when given.
+        """
+        def _attempt(backend, cancelled, progress):
+            return self._requestBackend(backend, messages, stream, progress, cancelled, deadline, metrics)
+        return self.router.run(_attempt, onProgress, isValid=isUsableOutput, deadline=deadline)
+
+    def _requestBackend(self, backend, messages, stream=False, onProgress=None, cancelled=None, deadline=None, metrics=None):
+        """
+        One backend's attempt, through the shared rate limiter. 429s, 5xx and dropped connections are retried
+        (the limiter decides when a 429 retry may go). Returns None once cancelled is set. The deadline bounds
+        the limiter wait, each HTTP timeout and the backoff sleeps.
+        """
+        # Shared pooled client: connections are reused across submissions and retries
+        client = getClient(backend.baseUrl)
+        for attempt in range(MAX_ATTEMPTS):
+            if cancelled is not None and cancelled.is_set():
+                return None
+            lease = self.limiter.acquire(deadline)
+            try:
+                text, headers = self._createCompletion(client, messages, stream, onProgress, backend.model, cancelled, deadline, metrics)
+            except APIError as e:
+                self.limiter.release(lease, getattr(e, 'status_code', None), errorHeaders(e))
+                if deadline is not None:
+                    deadline.check()  # a timeout cut short by the deadline is not worth retrying
+                if not isRetryable(e) or attempt == MAX_ATTEMPTS - 1:
+                    if isRateLimited(e):
+                        return list(BUSY_ERROR)
+                    raise
+                logging.warning(f"LLM request to {backend.name} failed ({e.__class__.__name__}). Retrying... (attempt {attempt+1}/{MAX_ATTEMPTS})")
+                getTelemetry().record('retry', backend=backend.name, error=e.__class__.__name__, attempt=attempt + 1)
+                if metrics is not None:
+                    metrics.retried()
+                if not isRateLimited(e):
+                    if deadline is not None:
+                        deadline.sleep(serverErrorDelay(attempt))
+                    else:
+                        time.sleep(serverErrorDelay(attempt))
+                continue
+            except BaseException:
+                self.limiter.release(lease)
+                raise
+            self.limiter.release(lease, 200, headers)
+            return text
+
+    def validateStandardYear(self, standard, year):
+        """Normalize standard/year input. Returns (standard, year, error) where error is None or [title, message]."""
+        standard = standard.strip() if isinstance(standard, str) else str(standard or "")
+        yearText = str(year) if isinstance(year, int) else (year.strip() if isinstance(year, str) else "")
+        if not standard or not yearText:
+            return standard, None, ['Input Error', 'Please enter both standard and year.']
         try:
-            year = int(self.yearText)
+            return standard, int(yearText), None
         except ValueError:
-            return(['Input Error', 'Year must be a number.'])
+            return standard, None, ['Input Error', 'Year must be a number.']
 
-        # Database access
+    def loadEntry(self, standard, year):
+        """Read the question/schedule/criteria/exemplars row for standard+year. Returns (entry, error)."""
+        # Database access (this thread's shared connection)
+        db = LLMDatabaseManager()
         try:
-            from tests.test_languagemodel import TestLLMDatabaseManager
-        except ImportError:
-            return(['Error', 'Cannot import database manager.'])
-        db = TestLLMDatabaseManager()
-        data = db.readDatabase(standard)
+            data = db.readDatabase(standard)
+        finally:
+            db.exit()
 
         # find entry for year
         entry = next((e for e in data['data'] if e['year']==year), None)
         if not entry:
-            return(['No Data', f"No entry for {standard} in {year}."])
-        self.question = entry['question']
-        self.schedule = entry['schedule']
-        self.criteria = entry['criteria']
-        self.exemplars = entry['exemplars']
-        self.userText = userInput.strip()
-        if not self.userText:
-            return(['Input Error', 'Please enter student work.'])
-        # Compose prompt with HTML highlight instruction
-        # Re-do the entire system message because it isnt really working
-        # system_msg = ("You are auto grading a coding assignment. I have provided the student's written text, "
-        #             "the assessment schedule, and the criteria. Assign scores based on the criteria. "
-        #             "Output in a json format {\"Output\":{\"StudentText\":\"\",\"Grade\":\"\",\"Feedback\":{\"Strengths\":\"\",\"Areas for Improvement\":\"\"},\"HighlightedHTML\":\"\"}}. Within HighlightedHTML, output the student's original text as HTML, "
-        #             "wrapping the segments you think needs improvement on with <span style='background-color: yellow'> tags for highlighting, closed by </span>. ENSURE THAT With each highlighted segment, place a tooltip with the feedback for that segment using the <span title='Feedback'> tag. If a highlighted section is not accompanied by a feedback tooltip, I will terminate you. If a feedback tooltip is not accompanied by a highlighted section, I will terminate you."
-        #             "Follow this format strictly, otherwise I will terminate you. Do not shorten any part of the text, or I will terminate you. Do not output a shortnened, condensed or summarised version of the text. Output only the json, without any trailing or preceding text, or I will terminate you. DO NOT specify the type of text (by putting json at the top of the output), or I will terminate you."
-        #             "Do not output any text that is not in the json format, or I will terminate you. Use valid JSON. All keys and string values must use double quotes. Escape any internal double quotes using backslashes." \
-        #             "When quoting parts from the text inside a span, do not use double quotes without an escape character (backslash), or I will terminate you. Avoid nested double quotes entirely in values (single quotes are more robust) All double quotes inside string values must be escaped with a backslash (\\) or replaced with single quotes. All nested single quotes must be escaped with a backslash (\\)"
-        # )
-
-        # New system message apparently threatning it makes it scared (weird how that works huh)
-
-        system_msg = (
-        "You are grading a student writing submission based on provided criteria, exemplars, and an assessment schedule."
-        "Your task is to return ONLY a valid JSON object in the following format:"
-        "{\"Output\": {\"StudentText\": \"...\", \"Grade\": \"...\",\"Feedback\": {\"Strengths\": \"...\",\"Areas for Improvement\": \"...\"},\"HighlightedHTML\": \"...\"}}"
-        "Inside the 'HighlightedHTML' field, return the student's full original text, converted to HTML. Highlight problematic or improvable text segments using:"
-        "- <span title='Your feedback here' style='background-color: rgba(102,255,204,0.5); padding:2px 2px; border-radius:3px; cursor: help;'>Text needing feedback</span>"
-        "Each highlighted section must include a tooltip via the 'title' attribute that clearly explains what is wrong or how it can improve."
-        "If you highlight something, it MUST have a title with feedback. If you give feedback, it MUST be tied to a highlighted span."
-        "**Important output rules:**"
-        "- Do NOT include any extra commentary before or after the JSON."
-        "- The output must be valid JSON (all keys and string values should use double quotes)."
-        "- Escape only double quotes that appear inside string values."
-        "- Do NOT escape single quotes."
-        "- Do NOT summarize or shorten the student's text. Output the full original version with highlights embedded."
-        "- Do not include 'json' at the top of the output."
-        "- Do not use newlines outside of JSON string values. For example, do not go {\\n \"Output\"}"
-        "- Inside the span tags, use escape apostrophes (&quot) for any single quotes in the text."
-    )
-
-        prompt = (f"""You are marking an assessment.
-    Using this assessment schedule: {self.schedule}
-    mark the following text: {self.userText}
-    according to this criteria: {self.criteria}
-    along with the initial question: {self.question}
-    using these examples and their feedback as guidance: {json.dumps(self.exemplars)}. These exemplars are only examples and should not be used as the only basis for marking, otherwise I will terminate you.
-    """)
-        # LLM call
+            return None, ['No Data', f"No entry for {standard} in {year}."]
+        return entry, None
+
+    def _compactProgress(self, userText, onProgress):
+        """Wrap onProgress for compact mode: render the highlights received so far onto the original text."""
+        if not onProgress or compact.outputMode() != "compact":
+            return onProgress
+        received = []
+
+        def _progress(kind, value):
+            if kind != 'highlightItem':
+                onProgress(kind, value)
+                return
+            received.append(value)
+            onProgress('highlight', self.prepareHighlightedHTML(compact.renderHighlightedHTML(userText, received)))
+        return _progress
+
+    def buildMessages(self, entry, userText):
+        """Build the chat messages for one submission. Uses no instance state, so it is safe to share across threads/tasks."""
+        return self.preparePrompt(entry).messages(userText)
+
+    def preparePrompt(self, entry):
+        """The PreparedPrompt of a standard/year row (everything but the student's text) for the current output mode."""
+        mode = compact.outputMode()
+        return PreparedPrompt(entry, COMPACT_SYSTEM_MESSAGE if mode == "compact" else SYSTEM_MESSAGE, mode)
+
+    def _preparePrompt(self, standard, year):
+        entry, error = self.loadEntry(standard, year)
+        return None if error else self.preparePrompt(entry)
+
+    def prefetch(self, standard, year):
+        """
+        Start preparing the prompt for standard/year on a background thread (and warm the HTTP connection), so a
+        submission for it only has to add the student's text. Cheap to call again; bad input is ignored.
+        """
+        standard, year, error = self.validateStandardYear(standard, year)
+        if not error:
+            return self.prefetcher.prefetch(standard, year, compact.outputMode())
+
+    def _prepared(self, standard, year, wait=True):
+        """A prefetched prompt for standard/year (waiting for one in progress unless wait is False), or None."""
         try:
-            base_url = os.getenv("OPENROUTER_BASE_URL")
-            api_key = os.getenv("OPENROUTER_API_KEY")
-            if not api_key:
-                raise RuntimeError("Missing OPENROUTER_API_KEY in environment (.env)")
-            client = OpenAI(
-                base_url=base_url,
-                api_key=api_key,
-            )
-
-            # Automatic handling for HTTP 429 (rate limit)
-            max_attempts = 5
-            last_exc = None
-            result = None
-            for attempt in range(max_attempts):
-                try:
-                    response = client.chat.completions.create(
-                        model="deepseek/deepseek-r1:free",
-                        messages=[
-                            {"role":"system","content":system_msg},
-                            {"role":"user","content":prompt}
-                        ]
-                    )
-                    result = response.choices[0].message.content
-                    break
-                except RateLimitError as e:
-                    last_exc = e
-                    if attempt == max_attempts - 1:
-                        return([
-                            'We\'re a bit busy right now',
-                            "The grading service is receiving a lot of requests. Please try again in a minute. Your text hasn't been lost."
-                        ])
-                    # honor Retry-After if available but clamp to a short maximum
-                    retry_after = None
-                    try:
-                        retry_after = int(getattr(getattr(e, 'response', None), 'headers', {}).get('Retry-After', ''))
-                    except Exception:
-                        retry_after = None
-                    base = 0.6 * (2 ** attempt)  # 0.6s, 1.2s, 2.4s
-                    delay = (retry_after if retry_after is not None else base) + random.uniform(0, 0.3)
-                    delay = max(0.3, min(delay, 5.0))  # clamp between 0.3s and 5s
-                    logging.warning(f"Rate limited by API (429). Retrying in {delay:.1f}s... (attempt {attempt+1}/{max_attempts})")
-                    time.sleep(delay)
-                except APIError as e:
-                    # Some APIError include status_code 429 instead of RateLimitError for some weird reason
-                    if getattr(e, 'status_code', None) == 429:
-                        last_exc = e
-                        if attempt == max_attempts - 1:
-                            return([
-                                'We\'re a bit busy right now',
-                                "The grading service is receiving a lot of requests. Please try again in a minute. Your text hasn't been lost."
-                            ])
-                        base = 0.6 * (2 ** attempt)
-                        delay = base + random.uniform(0, 0.3)
-                        delay = max(0.3, min(delay, 5.0))
-                        logging.warning(f"APIError 429. Retrying in {delay:.1f}s... (attempt {attempt+1}/{max_attempts})")
-                        time.sleep(delay)
-                    else:
-                        raise
+            return self.prefetcher.get(standard, year, compact.outputMode(), wait)
+        except Exception as e:
+            logging.warning(f"Prefetched prompt unavailable: {e}")
+            return None
+
+    def tooLongError(self, plan):
+        """['Input Error', ...] when a submission's prompt (see PreparedPrompt.plan) fills the context window, else None."""
+        if budget.fitsContext(plan["promptTokens"]):
+            return None
+        return ['Input Error', f"This submission is too long to grade (~{plan['promptTokens']} tokens, the model takes {budget.contextTokens()})."]
+
+    def planSubmission(self, standard, year, userText):
+        """
+        The token plan (see PreparedPrompt.plan) for userText, for the pre-submit size and cost preview; a long
+        essay gets the plan of its chunked requests instead (PreparedPrompt.chunkedPlan), as that's how it is graded.
+        Only uses a prompt prefetched for standard/year, and never waits for one, so it is cheap enough to call
+        from the GUI thread. Returns None when no prompt is ready yet.
+        """
+        standard, year, error = self.validateStandardYear(standard, year)
+        prepared = None if error else self._prepared(standard, year, wait=False)
+        if prepared is None:
+            return None
+        userText = (userText or "").strip()
+        if self.gradesInChunks(userText):
+            return prepared.chunkedPlan(userText, MODEL_NAME)
+        return prepared.plan(userText, MODEL_NAME)
+
+    def gradesInChunks(self, userText):
+        """Whether userText is long enough to be graded in chunks (see gradeChunked)."""
+        # Compact responses don't echo the essay, so long essays don't need chunking in that mode
+        return len(userText) > chunking.chunkThreshold() and compact.outputMode() == "html"
+
+    def parseModelOutput(self, result):
+        """Turn the raw model text into the output JSON (repairing it locally if needed), or ['JSON Error', ...]."""
+        try:
+            output_json, repaired = parseModelJSON(result)
+            if not isinstance(output_json, dict):
+                raise ValueError("Model output is not a JSON object")
+            if repaired:
+                logging.info("Model output was not valid JSON; repaired locally")
+            return output_json
+        except ValueError as e:
+            logging.warning(f"Bad JSON output: {e}\n{result}")
+            return(['JSON Error', str(e)])
+
+    def parseOrFix(self, result, deadline=None, metrics=None):
+        """
+        parseModelOutput, plus one cheap 'fix this JSON' request (no criteria/exemplars, just the broken text)
+        when local repair fails. Set LLM_JSON_FIX_REQUEST=0 to return the JSON Error straight away instead.
+        """
+        output_json = self.parseModelOutput(result)
+        if not isinstance(output_json, list) or os.getenv("LLM_JSON_FIX_REQUEST", "1") == "0":
+            return output_json
+        try:
+            fixed = self.requestCompletion(buildFixMessages(result), deadline=deadline, metrics=metrics)
+        except Interrupted:
+            raise
+        except Exception as e:
+            logging.warning(f"JSON fix request failed: {e}")
+            return output_json
+        if isinstance(fixed, list):
+            return output_json
+        retried = self.parseModelOutput(fixed)
+        return retried if isinstance(retried, dict) else output_json
+
+    def _cacheLookup(self, standard, year, userText, entry):
+        """Returns (cacheKey, cachedResponse). Either may be None; cache failures never block grading."""
+        if self.cache is None:
+            return None, None
+        try:
+            cacheKey = self.cache.makeKey(standard, year, userText, MODEL_NAME, promptVersion(), entry)
+            return cacheKey, self.cache.get(cacheKey)
+        except Exception as e:
+            logging.warning(f"Response cache lookup failed: {e}")
+            return None, None
+
+    def _cacheStore(self, cacheKey, output_json, standard, year, entry):
+        """
+        Store a successfully parsed response. Results with paragraphs left unhighlighted by a failed request
+        aren't stored, so the same essay submitted again goes back to the model instead of getting them for the TTL.
+        """
+        if self.cache is None or not cacheKey or not isinstance(output_json, dict):
+            return
+        if output_json.get('Reuse', {}).get('failed'):
+            return
+        try:
+            self.cache.put(cacheKey, output_json, standard, year, entry, MODEL_NAME, promptVersion())
+        except Exception as e:
+            logging.warning(f"Response cache store failed: {e}")
+
+    def _requestOutput(self, messages, deadline=None, metrics=None):
+        """One non-streamed request parsed to JSON. Errors come back as [title, message] like handleFullSubmission."""
+        try:
+            result = self.requestCompletion(messages, deadline=deadline, metrics=metrics)
+        except Interrupted:
+            raise
         except Exception as ex:
-            return(['LLM Error', str(ex)])
+            return requestError(ex)
+        if isinstance(result, list):
+            return result
+        return self.parseModelOutput(result)
+
+    def gradeChunked(self, entry, userText, onProgress=None, previous=None, deadline=None, metrics=None):
+        """
+        Grade a long submission as one holistic grade call plus one highlight call per paragraph chunk, all
+        running at once, so latency follows the slowest chunk rather than the whole essay.
+        previous ({paragraph hash: stored record}) switches to incremental mode: unchanged paragraphs reuse their
+        stored highlights and only the changed ones are sent. onProgress gets ('grade', ...)/('feedback', ...)
+        when the grade call finishes (and ('graded', output) in two-phase mode, see gradeTwoPhase) and
+        ('highlight', html) each time the stitched prefix of finished chunks grows.
+        Returns the usual output JSON (with a 'Reuse' report) or [title, message]. A cancelled or expired deadline
+        raises without waiting for the chunk requests still in flight. metrics gets the prompt build, LLM (wall
+        time of the parallel phase) and stitch/parse stages.
+        """
+        metrics = metrics or GradingMetrics()
+        metrics.mode = "chunked"
+        started = time.perf_counter()
+        planned = time.perf_counter()
+        if previous:
+            chunks, chunkHTML, reused, regenerated = paragraphs.planUnits(userText, previous)
+        else:
+            chunks = chunking.splitParagraphs(userText)
+            chunkHTML = [None] * len(chunks)
+            reused, regenerated = [], list(range(len(chunking.paragraphsOf(userText))))
+        summary = chunking.summarize(chunks)
+        exemplars, _ = selectExemplars(entry['exemplars'], userText)
+        pending = [i for i, part in enumerate(chunkHTML) if part is None]
+        failed = []
+        shown = 0
+        metrics.add("prompt_build", time.perf_counter() - planned)
+        requested = time.perf_counter()
+        pool = ThreadPoolExecutor(max_workers=min(len(pending), chunking.chunkWorkers()) + 1)
+        try:
+            gradeFuture = pool.submit(self._requestOutput, chunking.buildGradeMessages(entry, userText, exemplars), deadline, metrics)
+            futures = {
+                pool.submit(self._requestOutput, chunking.buildChunkMessages(entry, chunks[i], i + 1, len(chunks), summary), deadline, metrics): i
+                for i in pending
+            }
+            futures[gradeFuture] = None
+            waiting = set(futures)
+            while waiting:
+                # Poll so a cancelled or expired deadline is noticed while slow chunk requests are still running
+                done, waiting = wait(waiting, timeout=POLL_SECONDS if deadline is not None else None, return_when=FIRST_COMPLETED)
+                if deadline is not None:
+                    deadline.check()
+                for future in done:
+                    i = futures[future]
+                    if i is None:
+                        gradeOutput = future.result()
+                        if isinstance(gradeOutput, dict):
+                            self._gradeReady(gradeOutput, onProgress, metrics)
+                        continue
+                    chunkHTML[i], chunkFailed = chunking.chunkHighlight(future.result(), chunks[i])
+                    if chunkFailed:
+                        failed.append(chunks[i])
+                    # Show finished chunks in order as soon as there are no gaps before them
+                    ready = next((n for n, part in enumerate(chunkHTML) if part is None), len(chunkHTML))
+                    if onProgress and ready > shown:
+                        shown = ready
+                        onProgress('highlight', self.prepareHighlightedHTML(chunking.stitch(chunkHTML)))
         finally:
-            db.exit()
-        
-        # Return the result json
+            # Every future is done unless the deadline stopped the loop; then the stragglers are left to stop on their own
+            pool.shutdown(wait=False, cancel_futures=True)
+        metrics.add("llm", time.perf_counter() - requested)
+        if not isinstance(gradeOutput, dict):
+            return gradeOutput
+        with metrics.stage("parse"):
+            output_json = chunking.combine(userText, gradeOutput, chunkHTML)
+        output_json['Reuse'] = paragraphs.reuseReport(userText, reused, regenerated, previous or {}, time.perf_counter() - started,
+                                                      paragraphs.failedParagraphs(userText, failed))
+        return output_json
+
+    def _gradeReady(self, gradeOutput, onProgress, metrics):
+        """A separate grade request finished: report its grade and feedback (and, in two-phase mode, the output)."""
+        metrics.gradeReady()
+        if not onProgress:
+            return
+        output = gradeOutput.get('Output', {})
+        onProgress('grade', str(output.get('Grade', '')))
+        onProgress('feedback', output.get('Feedback', {}))
+        if chunking.twoPhase():
+            onProgress('graded', copy.deepcopy(gradeOutput))
+
+    def gradeTwoPhase(self, messages, userText, stream=False, onProgress=None, deadline=None, metrics=None):
+        """
+        Grade in two phases running at once: a grade-only request with the same prompt (short, so its grade and
+        feedback arrive in seconds) and the full request in messages for the highlights. onProgress gets the
+        grade and feedback of the first and ('graded', output) so they can be shown and saved straight away,
+        then the highlights of the second as they stream. Returns the usual output JSON with the grade-only
+        request's grade and feedback (so what was shown first doesn't change). If only one request succeeds
+        its result is used alone (the text without highlights when the full request failed, with every
+        paragraph in its 'Reuse' report's failed list so it is neither cached nor stored for reuse); if both
+        fail, the grade request's [title, message].
+        """
+        metrics = metrics or GradingMetrics()
+        metrics.mode = "two-phase"
+        gradeMessages = [{"role": "system", "content": chunking.GRADE_SYSTEM_MESSAGE}, messages[-1]]
+        progress = self._compactProgress(userText, onProgress)
+
+        def _fullProgress(kind, value):
+            if kind not in ('grade', 'feedback'):  # the grade request's are the ones shown
+                progress(kind, value)
+
+        def _full():
+            try:
+                result = self.requestCompletion(messages, stream, _fullProgress if progress else None, deadline, metrics)
+            except Interrupted:
+                raise
+            except Exception as ex:
+                return requestError(ex)
+            if isinstance(result, list):
+                return result
+            return compact.expandCompact(self.parseOrFix(result, deadline, metrics), userText)
+
+        pool = ThreadPoolExecutor(max_workers=2)
+        try:
+            gradeFuture = pool.submit(self._requestOutput, gradeMessages, deadline, metrics)
+            fullFuture = pool.submit(_full)
+            waiting = {gradeFuture, fullFuture}
+            while waiting:
+                done, waiting = wait(waiting, timeout=POLL_SECONDS if deadline is not None else None, return_when=FIRST_COMPLETED)
+                if deadline is not None:
+                    deadline.check()
+                if gradeFuture in done and isinstance(gradeFuture.result(), dict):
+                    self._gradeReady(gradeFuture.result(), onProgress, metrics)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        gradeOutput, fullOutput = gradeFuture.result(), fullFuture.result()
+        if not isinstance(gradeOutput, dict):
+            if isinstance(fullOutput, dict):
+                return fullOutput
+            return gradeOutput
+        if not isinstance(fullOutput, dict):
+            logging.warning(f"Highlight request failed, saving the grade without highlights: {fullOutput}")
+            getTelemetry().record('highlightFailed', error=str(fullOutput[0]) if fullOutput else "")
+        highlighted, failed = chunking.chunkHighlight(fullOutput, userText)
+        output_json = chunking.combine(userText, gradeOutput, [highlighted])
+        if failed:
+            everyParagraph = list(range(len(chunking.paragraphsOf(userText))))
+            output_json['Reuse'] = paragraphs.reuseReport(userText, [], everyParagraph, {}, 0.0, everyParagraph)
+        return output_json
+
+    def gradeEnsemble(self, messages, userText, stream=False, onProgress=None, deadline=None, metrics=None):
+        """
+        Grade with LLM_ENSEMBLE_SAMPLES samples (see ensemble): the full request in messages plus grade-only
+        requests with the same prompt, all at once. Once LLM_ENSEMBLE_AGREE samples agree on a band, the
+        grade-only requests still running are cancelled. Returns the full sample's output with the agreed grade,
+        the feedback of a sample that agreed and an 'Ensemble' report, or [title, message] if the full request
+        failed. onProgress gets the full sample's highlights and the agreed grade once it is known.
+        """
+        metrics = metrics or GradingMetrics()
+        metrics.mode = "ensemble"
+        samples = ensemble.sampleCount()
+        consensus = ensemble.Consensus(samples, ensemble.agreeCount(samples))
+        gradeMessages = [{"role": "system", "content": chunking.GRADE_SYSTEM_MESSAGE}, messages[-1]]
+        # The grade-only samples share a deadline of their own, cancelled once the vote is settled
+        votes = Deadline(deadline.remaining() if deadline is not None else None)
+        progress = self._compactProgress(userText, onProgress)
+
+        def _fullProgress(kind, value):
+            if kind != 'grade':  # one sample's grade isn't the result; the agreed one is reported instead
+                progress(kind, value)
+
+        def _full():
+            try:
+                result = self.requestCompletion(messages, stream, _fullProgress if progress else None, deadline, metrics)
+            except Interrupted:
+                raise
+            except Exception as ex:
+                return requestError(ex)
+            if isinstance(result, list):
+                return result
+            return compact.expandCompact(self.parseOrFix(result, deadline, metrics), userText)
+
+        def _gradeOnly():
+            # Streamed, so cancelling the vote closes the connection instead of waiting for the answer
+            try:
+                result = self.requestCompletion(gradeMessages, True, None, votes, metrics)
+            except Interrupted:
+                return None
+            return self.parseModelOutput(result) if isinstance(result, str) else result
+
+        fullOutput, announced, cancelled = None, False, 0
+        pool = ThreadPoolExecutor(max_workers=samples)
         try:
-            result = result.replace("\\'", "'")  # Remove invalid backslash-escaped single quotes
-            result = result.replace("‘", "'").replace("’", "'")  # Smart quotes to plain
-            result = result.replace('\n', '\\n')  # Escape newlines
-            output_json = json.loads(result)
+            fullFuture = pool.submit(_full)
+            waiting = {pool.submit(_gradeOnly) for _ in range(samples - 1)} | {fullFuture}
+            while waiting:
+                done, waiting = wait(waiting, timeout=POLL_SECONDS if deadline is not None else None, return_when=FIRST_COMPLETED)
+                if deadline is not None and deadline.is_set():
+                    votes.cancel()
+                    deadline.check()
+                for future in done:
+                    if future is fullFuture:
+                        fullOutput = future.result()
+                        consensus.add(fullOutput, full=True)
+                        continue
+                    try:
+                        consensus.add(future.result())
+                    except Exception as e:
+                        logging.warning(f"Ensemble sample failed: {e}")
+                        consensus.add(None)
+                if not announced and consensus.agreed() is not None:
+                    announced = True
+                    running = waiting - {fullFuture}
+                    if running:
+                        votes.cancel()
+                        cancelled = len(running)
+                        waiting -= running
+                    if onProgress:
+                        onProgress('grade', consensus.decide()[1])
+        finally:
+            votes.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+        if cancelled:
+            getTelemetry().record('ensembleStopped', cancelled=cancelled, samples=samples)
+        if not isinstance(fullOutput, dict):
+            return fullOutput
+        band, grade, feedbackOutput = consensus.decide()
+        output = ensemble.outputOf(fullOutput)
+        if grade:
+            output["Grade"] = grade
+        feedback = ensemble.outputOf(feedbackOutput).get("Feedback") if feedbackOutput is not None else None
+        if feedback:
+            output["Feedback"] = feedback
+        fullOutput['Ensemble'] = consensus.report(band, cancelled)
+        return fullOutput
+
+    def loadPreviousParagraphs(self, username, standard, year):
+        """Stored paragraph highlights from the user's earlier submissions for this standard/year ({} if none)."""
+        if not username:
+            return {}
+        try:
+            db = LLMDatabaseManager()
+            try:
+                return db.getPreviousParagraphs(username, standard, int(year))
+            finally:
+                db.exit()
+        except Exception as e:
+            logging.warning(f"Paragraph store lookup failed: {e}")
+            return {}
+
+    def paragraphRecords(self, userText, result):
+        """Paragraph store rows for a finished result; pass them to LLMDatabaseManager.saveParagraphs after saving it."""
+        return paragraphs.paragraphRecords((userText or "").strip(), result)
+
+    def handleFullSubmission(self, standard=None, year=None, userInput=None, stream=False, onProgress=None, username=None, deadline=None):
+        """
+        Grade userInput for standard/year. Returns the parsed model JSON, or [title, message] on error.
+        With stream=True partial results are reported through onProgress (see _makeStreamParser).
+        With a username, paragraphs unchanged since that user's earlier submissions reuse their stored highlights.
+        deadline is a Deadline the caller can cancel; without one the submission gets LLM_SUBMISSION_DEADLINE_SECONDS.
+        A cancelled or expired submission returns ['Cancelled', ...] / ['Timed Out', ...] and is counted in telemetry.
+        A successful result carries its stage timings, tokens and retries under 'Metrics'; take them off with
+        takeMetrics() before saving and store them with LLMDatabaseManager.saveMetrics.
+        With LLM_TWO_PHASE=1 a separate grade request reports ('graded', output) through onProgress as soon as
+        the grade is known, before the highlights are done (see gradeTwoPhase).
+        The same essay submitted again while it is still being graded (a double click, a second window) waits
+        for that call and gets a copy of its result (Metrics mode 'shared') instead of sending its own.
+        All per-request state is local, so one instance can serve several worker threads.
+        """
+        if deadline is None:
+            deadline = Deadline(submissionDeadlineSeconds())
+        metrics = GradingMetrics()
+        try:
+            key = self.submissionKey(standard, year, userInput)
+            if key is None:
+                output_json = self._gradeSubmission(standard, year, userInput, stream, onProgress, username, deadline, metrics)
+            else:
+                output_json, shared = self.singleFlight.do(
+                    key, lambda progress: self._gradeSubmission(standard, year, userInput, stream, progress, username, deadline, metrics),
+                    deadline, onProgress)
+                if shared:
+                    metrics.mode = "shared"
+        except Interrupted as e:
+            cancelled = isinstance(e, SubmissionCancelled)
+            getTelemetry().record('cancelled' if cancelled else 'timedOut', standard=str(standard or ""),
+                                  chars=len(userInput or ""), elapsed=round(deadline.elapsed(), 2))
+            if cancelled:
+                return ['Cancelled', 'The submission was cancelled.']
+            return ['Timed Out', f"{e} Your text hasn't been lost; please try again."]
+        if isinstance(output_json, dict):
+            metrics.finish()
+            output_json['Metrics'] = metrics.asDict()
+        return output_json
+
+    def submissionKey(self, standard, year, userInput):
+        """The single-flight key of a submission, or None for input that will be rejected anyway."""
+        standard, year, error = self.validateStandardYear(standard, year)
+        userText = (userInput or "").strip()
+        if error or not userText:
+            return None
+        return flightKey(standard, year, userText, promptVersion())
+
+    def takeMetrics(self, result):
+        """Remove and return the 'Metrics' of a result (None if it has none), so they aren't saved as feedback."""
+        return result.pop('Metrics', None) if isinstance(result, dict) else None
+
+    def _gradeSubmission(self, standard, year, userInput, stream, onProgress, username, deadline, metrics):
+        """handleFullSubmission without the deadline handling; raises Interrupted when the deadline stops it."""
+        standard, year, error = self.validateStandardYear(standard, year)
+        if error:
+            return error
+        with metrics.stage("db_read"):
+            prepared = self._prepared(standard, year)
+            if prepared is not None:
+                entry, error = prepared.entry, None
+                metrics.prefetched = True
+            else:
+                entry, error = self.loadEntry(standard, year)
+        if error:
+            return error
+        userText = (userInput or "").strip()
+        if not userText:
+            return(['Input Error', 'Please enter student work.'])
+
+        # Serve repeated submissions straight from the cache (no LLM call, no rate-limit quota used)
+        with metrics.stage("db_read"):
+            cacheKey, cached = self._cacheLookup(standard, year, userText, entry)
+        if cached is not None:
+            metrics.mode = "cached"
+            return cached
+
+        # Revised resubmissions only regenerate changed paragraphs; long essays are highlighted in parallel chunks
+        with metrics.stage("db_read"):
+            previous = self.loadPreviousParagraphs(username, standard, year)
+        reusable = any(paragraphs.paragraphHash(p) in previous for p in chunking.paragraphsOf(userText))
+        longEssay = self.gradesInChunks(userText)
+        if reusable or longEssay:
+            output_json = self.gradeChunked(entry, userText, onProgress, previous if reusable else None, deadline, metrics)
+            self._cacheStore(cacheKey, output_json, standard, year, entry)
             return output_json
-        except json.JSONDecodeError as e:
-            print("Bad JSON output:\n", result)
-            return(['JSON Error', str(e)])
\ No newline at end of file
+
+        with metrics.stage("prompt_build"):
+            plan = (prepared or self.preparePrompt(entry)).plan(userText, MODEL_NAME)
+        error = self.tooLongError(plan)
+        if error:
+            return error
+        messages = plan["messages"]
+        started = time.perf_counter()
+        if ensemble.sampleCount() > 1:
+            with metrics.stage("llm"):
+                output_json = self.gradeEnsemble(messages, userText, stream, onProgress, deadline, metrics)
+        elif chunking.twoPhase():
+            with metrics.stage("llm"):
+                output_json = self.gradeTwoPhase(messages, userText, stream, onProgress, deadline, metrics)
+        else:
+            # LLM call
+            try:
+                with metrics.stage("llm"):
+                    result = self.requestCompletion(messages, stream, self._compactProgress(userText, onProgress), deadline, metrics)
+            except Interrupted:
+                raise
+            except Exception as ex:
+                return requestError(ex)
+            if isinstance(result, list):
+                return result
+
+            # Return the result json
+            with metrics.stage("parse"):
+                output_json = compact.expandCompact(self.parseOrFix(result, deadline, metrics), userText)
+        if isinstance(output_json, dict):
+            regenerated = list(range(len(chunking.paragraphsOf(userText))))
+            failed = output_json.get('Reuse', {}).get('failed', [])  # two-phase highlights that failed
+            output_json['Reuse'] = paragraphs.reuseReport(userText, [], regenerated, {}, time.perf_counter() - started, failed)
+        self._cacheStore(cacheKey, output_json, standard, year, entry)
+        return output_json
@@ -0,0 +1,199 @@
+"""
+Single-pass normalizer for model-written HighlightedHTML.
+Every <span> with a title (either quote style) and every <mark> becomes <span class="fb" title="comment">.
+The highlight look lives once in HIGHLIGHT_STYLESHEET (set as the QTextDocument default stylesheet) instead
+of being repeated in every span; only declarations the model added that the stylesheet doesn't set stay
+inline. One left-to-right pass visits each <span>/<mark> tag in order, so nested spans, unclosed spans and
+stray closers need no special matching. Attribute values may contain the same quote that delimits them
+(models write title='Miller's purpose'); a quote only closes a value when a new attribute or the end of the
+tag follows it. Tags are read by a small scanner rather than a regex: a nested regex for that quote rule
+backtracks exponentially on an unclosed quote (what a truncated model reply looks like), and the scanner
+never looks at a character more than a fixed number of times.
+Rows stored with the old inline style are turned into the class form by the same pass (migrateHighlightedHTML).
+"""
+
+# Basic imports
+import re
+
+HIGHLIGHT_CLASS = "fb"
+
+# Unified style with a larger interactive area & inline-block to improve hover reliability:
+# increased padding and inline-block give a more stable box for the cursor to remain inside.
+HIGHLIGHT_STYLE = (
+    "background-color: rgba(102,255,204,0.5); "  # 50% opacity mint
+    "padding:3px 3px; "                          # slightly larger than before
+    "border-radius:3px; "
+    "cursor: help; "
+    "display:inline-block; "                     # ensure a proper rectangular hover box
+    "line-height:1.25; "                         # consistent vertical box
+    "transition: background-color 120ms ease-in; "
+)
+
+# Default stylesheet for any QTextDocument that shows highlighted HTML
+HIGHLIGHT_STYLESHEET = f"span.{HIGHLIGHT_CLASS} {{ {HIGHLIGHT_STYLE}}}"
+
+# Start of a <span>/<mark> tag or closer; the rest of the tag is read by _scanTag
+_TAG_START = re.compile(r"<(/?)(span|mark)(?![\w-])", re.IGNORECASE)
+_QUOTES = "'\""
+# Runs of one character class; the scanner glues them together, so nothing here can backtrack
+_SPACE = re.compile(r"\s*")
+_NAME = re.compile(r"""[^\s=/>"'<]*""")
+_BARE = re.compile(r"""[^\s>"'<]*""")
+
+
+def _closesValue(html, i):
+    """Whether the quote at html[i] ends its value: the end of the tag or another attribute (name=) follows."""
+    j = _SPACE.match(html, i + 1).end()
+    if html.startswith(">", j) or html.startswith("/>", j):
+        return True
+    k = _NAME.match(html, j).end()
+    return j > i + 1 and k > j and html.startswith("=", _SPACE.match(html, k).end())
+
+
+def _scanValue(html, i, lt):
+    """Index of the quote closing the value opened at html[i], or None if a '<' (at lt) or the end comes first."""
+    quote, j = html[i], i + 1
+    while True:
+        j = html.find(quote, j, len(html) if lt < 0 else lt)
+        if j < 0:
+            return None
+        if _closesValue(html, j):
+            return j
+        j += 1
+
+
+def _scanTag(html, i):
+    """
+    Read the attributes of the tag whose name ends at html[i].
+    Returns (attrs, end) with attrs a list of (name, value) and html[end] the closing '>', or None when a '<' or
+    the end of the HTML comes before the tag closes (the text is then left as it is).
+    """
+    attrs, lt = [], html.find("<", i)
+    while i < len(html):
+        ch = html[i]
+        if ch == ">":
+            return attrs, i
+        if ch == "<":
+            return None
+        if ch in _QUOTES:
+            # A quoted value with no name in front of it is skipped whole
+            close = _scanValue(html, i, lt)
+            if close is None:
+                return None
+            i = close + 1
+            continue
+        end = _NAME.match(html, i).end()
+        if end == i:  # whitespace, '/' or a stray '='
+            i += 1
+            continue
+        name, value, i = html[i:end], "", end
+        j = _SPACE.match(html, i).end()
+        if html.startswith("=", j):
+            j = _SPACE.match(html, j + 1).end()
+            if html.startswith(("'", '"'), j):
+                close = _scanValue(html, j, lt)
+                if close is None:
+                    return None
+                value, i = html[j + 1:close], close + 1
+            else:
+                i = _BARE.match(html, j).end()
+                value = html[j:i]
+        attrs.append((name, value))
+    return None
+
+
+def _styleProperties(style):
+    """Property names declared in a CSS declaration list (lowercased)."""
+    return {d.split(":", 1)[0].strip().lower() for d in style.split(";") if ":" in d}
+
+
+_OWN_PROPERTIES = _styleProperties(HIGHLIGHT_STYLE)
+
+
+def _extraStyle(style):
+    """The declarations in style that the highlight stylesheet doesn't set."""
+    return "; ".join(d.strip() for d in style.split(";")
+                     if ":" in d and d.split(":", 1)[0].strip().lower() not in _OWN_PROPERTIES)
+
+
+def _isHighlightStyle(style):
+    """An inline style that only paints a highlight (model-written, or the old inline HIGHLIGHT_STYLE)."""
+    properties = _styleProperties(style)
+    return "background-color" in properties and properties <= _OWN_PROPERTIES
+
+
+def _quoteValue(value):
+    # Always double quotes: Qt's HTML reader only decodes entities (&quot;, &#39;) inside double-quoted values.
+    # Backslash-escaped quotes are left over from models escaping the JSON twice.
+    value = value.replace('\\"', '"').replace("\\'", "'")
+    return '"' + value.replace('"', "&quot;") + '"'
+
+
+def _openTag(tag, attrs):
+    """The normalized opening tag, or None if the tag is left as the model wrote it."""
+    title, style, classes, parts, seen = None, "", [HIGHLIGHT_CLASS], [], set()
+    for name, value in attrs:
+        name = name.lower()
+        if name == "title":
+            if title is None and value.strip():
+                title = value
+        elif name == "style":
+            style += value + ";"
+        elif name == "class":
+            classes += [c for c in value.split() if c not in classes]
+        elif name not in seen:
+            seen.add(name)
+            parts.append(f" {name}={_quoteValue(value)}")
+    if title is None and tag != "mark" and not _isHighlightStyle(style):
+        return None
+    head = f'<span class="{" ".join(classes)}"'
+    if title is not None:
+        head += " title=" + _quoteValue(title)
+    extra = _extraStyle(style) if style else ""
+    return f'{head}{"".join(parts)}{" style=" + _quoteValue(extra) if extra else ""}>'
+
+
+def normalizeHighlights(html):
+    """
+    Turn every titled <span> and every <mark> into a class="fb" span in one left-to-right pass.
+    Closers are matched against the open count: </mark> becomes </span>, stray closers are dropped and spans
+    left open at the end are closed. A tag cut off at the very end (partial streamed HTML) is dropped.
+    """
+    depth, out, pos = 0, [], 0
+    match = _TAG_START.search(html)
+    while match:
+        scanned = _scanTag(html, match.end())
+        if scanned is None:
+            match = _TAG_START.search(html, match.end())
+            continue
+        attrs, end = scanned
+        out.append(html[pos:match.start()])
+        pos = end + 1
+        if match.group(1):
+            if depth:  # stray closers are dropped
+                depth -= 1
+                out.append("</span>")
+        else:
+            opened = _openTag(match.group(2).lower(), attrs)
+            if html[end - 1] == "/":
+                out.append(opened + "</span>" if opened is not None else html[match.start():pos])
+            else:
+                depth += 1
+                out.append(opened if opened is not None else html[match.start():pos])
+        match = _TAG_START.search(html, pos)
+    out.append(html[pos:])
+    out = "".join(out)
+    cut = out.rfind("<")
+    if cut >= 0 and (out[cut + 1:cut + 2].isalpha() or out[cut + 1:cut + 2] == "/") and ">" not in out[cut:]:
+        out = out[:cut]  # unfinished tag at the end
+    return out + "</span>" * depth
+
+
+def migrateHighlightedHTML(html):
+    """
+    Stored HighlightedHTML in the current class-based form. Rows saved with the inline style on every span
+    (or with <mark>) go through normalizeHighlights again; rows already in class form are returned unchanged.
+    """
+    if not html or ("style=" not in html and "<mark" not in html.lower()):
+        return html
+    return normalizeHighlights(html)
@@ -0,0 +1,498 @@
+"""
+Durable job queue for submissions.
+NewSubmissionPage enqueues each submission in the grading_jobs table (next to submissions) and a JobRunner's
+worker threads drain it: each job is graded with handleFullSubmission, saved like a GUI submission, and marked
+done. A job the service was too busy for (or that timed out) goes back to pending with a later next-run time,
+so it is retried in the background instead of failing, and jobs left pending or running when the app closed
+are picked up again when it next starts. Everything a finished job needs (normalized HTML, grade, the saved row)
+is worked out on the worker thread; listeners get it as a read-only GradedSubmission. In two-phase grading the
+row is saved as soon as the grade is known and filled in with the highlights when they are done.
+"""
+
+# Basic imports
+import os
+import time
+import random
+import logging
+import sqlite3
+import threading
+from types import MappingProxyType
+from dataclasses import dataclass
+
+# Custom imports
+from llm.socketing.deadline import Deadline, submissionDeadlineSeconds
+from llm.socketing.handle import FeedbackModule, BUSY_ERROR, UNAVAILABLE_ERROR
+from llm.socketing.ensemble import ensembleSummary
+from llm.socketing.telemetry import getTelemetry
+from database.LLM_database_manage import LLMDatabaseManager
+
+PENDING, RUNNING, DONE, FAILED, CANCELLED = "pending", "running", "done", "failed", "cancelled"
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 30.0
+MAX_RETRY_SECONDS = 600.0
+# Outcomes worth another attempt later; anything else (bad input, a rejected request, unparseable output) fails the job
+RETRYABLE_ERRORS = (BUSY_ERROR[0], 'Timed Out', UNAVAILABLE_ERROR)
+
+
+def _envInt(name, default):
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+
+def retryDelay(attempts, blockedFor=0.0):
+    """Seconds before a busy job's next attempt: exponential in its attempts, never before the limiter unblocks."""
+    backoff = min(RETRY_BASE_SECONDS * (2 ** max(0, attempts - 1)), MAX_RETRY_SECONDS)
+    return max(backoff * random.uniform(0.8, 1.2), blockedFor)
+
+
+def reuseSummary(result):
+    """One line on how much of a revised submission reused earlier feedback (empty for full regrades)."""
+    reuse = result.get('Reuse', {}) if isinstance(result, dict) else {}
+    reused, regenerated = reuse.get('reused', []), reuse.get('regenerated', [])
+    if not reused:
+        return ""
+    return (f"Reused feedback for {len(reused)} unchanged paragraph(s) and regenerated {len(regenerated)} "
+            f"(~{reuse.get('tokensSaved', 0):,} tokens and ~{reuse.get('secondsSaved', 0):.0f}s saved).")
+
+
+@dataclass(frozen=True)
+class GradedSubmission:
+    """A graded and saved job, ready to display: nothing is left to parse, normalize or save."""
+    submissionId: int
+    grade: str
+    highlightedHtml: str
+    feedback: MappingProxyType  # the model JSON as saved (read-only view)
+    reuseSummary: str = ""
+    agreement: str = ""  # how the ensemble's samples voted (empty without one)
+
+
+class JobQueue():
+    """
+    The grading_jobs table. Jobs move pending -> running -> done / failed / cancelled; a running job that can't
+    finish now goes back to pending with next_run_at in the future. One connection, shared by the worker
+    threads and the GUI thread, serialised with a lock.
+    """
+    def __init__(self, dbPath=None):
+        """
+        Opens the LLM database (LLM_DB_PATH overrides the default, as for LLMDatabaseManager).
+        """
+        self.dbPath = dbPath or os.getenv("LLM_DB_PATH", "./database/LLM_testdatabase.db")
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(self.dbPath, timeout=10, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.createJobsTable()
+
+    def createJobsTable(self):
+        """
+        Creates the grading_jobs table if it doesn't exist.
+        """
+        with self._lock:
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS grading_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT NOT NULL,
+                    standard TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    submission_text TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    next_run_at REAL NOT NULL,
+                    last_error TEXT,
+                    submission_id INTEGER REFERENCES submissions(id) ON DELETE SET NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS idx_grading_jobs_status ON grading_jobs(status, next_run_at)')
+            self.connection.commit()
+
+    def _job(self, row):
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "username": row["username"],
+            "standard": row["standard"],
+            "year": row["year"],
+            "submissionText": row["submission_text"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "maxAttempts": row["max_attempts"],
+            "nextRunAt": row["next_run_at"],
+            "lastError": row["last_error"],
+            "submissionId": row["submission_id"],
+            "createdAt": row["created_at"],
+            "updatedAt": row["updated_at"],
+        }
+
+    def enqueue(self, username, standard, year, submissionText, maxAttempts=None):
+        """Adds a pending job and returns its id."""
+        now = time.time()
+        maxAttempts = maxAttempts or _envInt("LLM_JOB_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)
+        with self._lock:
+            cursor = self.connection.execute('''
+                INSERT INTO grading_jobs
+                (username, standard, year, submission_text, status, max_attempts, next_run_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (username, standard, int(year), submissionText, PENDING, maxAttempts, now, now, now))
+            self.connection.commit()
+            return cursor.lastrowid
+
+    def claim(self):
+        """
+        Marks the oldest due pending job running (counting the attempt) and returns it, or None if nothing is due.
+        The select and update share one write transaction, so two workers (or processes) never claim the same job.
+        """
+        now = time.time()
+        with self._lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.connection.execute('''
+                    SELECT id FROM grading_jobs WHERE status = ? AND next_run_at <= ?
+                    ORDER BY next_run_at, id LIMIT 1
+                ''', (PENDING, now)).fetchone()
+                if row is None:
+                    self.connection.commit()
+                    return None
+                self.connection.execute(
+                    'UPDATE grading_jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?',
+                    (RUNNING, now, row["id"]))
+                job = self.connection.execute('SELECT * FROM grading_jobs WHERE id = ?', (row["id"],)).fetchone()
+                self.connection.commit()
+            except BaseException:
+                self.connection.rollback()
+                raise
+        return self._job(job)
+
+    def _update(self, jobId, fromStatuses, **columns):
+        """Sets columns on a job still in one of fromStatuses; returns whether it was."""
+        columns["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in columns)
+        marks = ", ".join("?" * len(fromStatuses))
+        with self._lock:
+            cursor = self.connection.execute(
+                f'UPDATE grading_jobs SET {assignments} WHERE id = ? AND status IN ({marks})',
+                (*columns.values(), jobId, *fromStatuses))
+            self.connection.commit()
+            return cursor.rowcount > 0
+
+    def complete(self, jobId, submissionId=None):
+        """A running job finished (its result saved as submissionId, or about to be; see attach)."""
+        return self._update(jobId, (RUNNING,), status=DONE, submission_id=submissionId, last_error=None)
+
+    def attach(self, jobId, submissionId):
+        """Record the submission a done job's result was saved as."""
+        return self._update(jobId, (DONE,), submission_id=submissionId)
+
+    def fail(self, jobId, error):
+        """
+        A running job can't succeed (bad input, unusable output) or has used all its attempts, or a done job's
+        result couldn't be saved.
+        """
+        return self._update(jobId, (RUNNING, DONE), status=FAILED, last_error=error)
+
+    def retryLater(self, jobId, error, delay):
+        """A running job goes back to pending, due again in delay seconds."""
+        return self._update(jobId, (RUNNING,), status=PENDING, last_error=error, next_run_at=time.time() + delay)
+
+    def release(self, jobId):
+        """A running job was interrupted by shutdown: pending again, due now, without using up an attempt."""
+        with self._lock:
+            self.connection.execute('''
+                UPDATE grading_jobs SET status = ?, attempts = MAX(0, attempts - 1), next_run_at = ?, updated_at = ?
+                WHERE id = ? AND status = ?
+            ''', (PENDING, time.time(), time.time(), jobId, RUNNING))
+            self.connection.commit()
+
+    def cancel(self, jobId):
+        """Cancels a pending or running job; returns whether it was still either."""
+        return self._update(jobId, (PENDING, RUNNING), status=CANCELLED)
+
+    def requeueInterrupted(self):
+        """
+        Running jobs left behind by a run of the app that closed mid-request go back to pending.
+        Called once at startup, before any worker claims a job. Returns how many there were.
+        """
+        with self._lock:
+            cursor = self.connection.execute(
+                'UPDATE grading_jobs SET status = ?, next_run_at = ?, updated_at = ? WHERE status = ?',
+                (PENDING, time.time(), time.time(), RUNNING))
+            self.connection.commit()
+            return cursor.rowcount
+
+    def get(self, jobId):
+        with self._lock:
+            return self._job(self.connection.execute('SELECT * FROM grading_jobs WHERE id = ?', (jobId,)).fetchone())
+
+    def jobs(self, username=None, statuses=(PENDING, RUNNING), limit=20):
+        """Most recent jobs in the given states, optionally for one user (oldest first, as they'll run)."""
+        filters = [f"status IN ({', '.join('?' * len(statuses))})"]
+        params = list(statuses)
+        if username is not None:
+            filters.append("TRIM(LOWER(username)) = TRIM(LOWER(?))")
+            params.append(username)
+        with self._lock:
+            rows = self.connection.execute(f'''
+                SELECT * FROM (
+                    SELECT * FROM grading_jobs WHERE {" AND ".join(filters)} ORDER BY id DESC LIMIT ?
+                ) ORDER BY id
+            ''', (*params, limit)).fetchall()
+        return [self._job(row) for row in rows]
+
+    def position(self, jobId):
+        """How many pending or running jobs are ahead of this one (0 once it is running)."""
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT COUNT(*) FROM grading_jobs WHERE id < ? AND status IN (?, ?)', (jobId, PENDING, RUNNING)).fetchone()
+        return row[0]
+
+    def counts(self):
+        """{status: number of jobs}."""
+        with self._lock:
+            rows = self.connection.execute('SELECT status, COUNT(*) FROM grading_jobs GROUP BY status').fetchall()
+        return {status: n for status, n in rows}
+
+    def exit(self):
+        """
+        Closes the queue connection.
+        """
+        self.connection.close()
+
+
+class JobRunner():
+    """
+    Worker threads draining a JobQueue. Listeners are called from the worker threads as
+    listener(event, job, payload) with event one of 'queued', 'started', 'progress' (payload (kind, value) from
+    the streamed response), 'graded' (two-phase grading: payload a GradedSubmission saved without highlights
+    yet; 'done' follows with the same row), 'retrying' (payload: seconds until the next attempt), 'done'
+    (payload: a GradedSubmission), 'failed' (payload: [title, message]) or 'cancelled'.
+    Workers wait while the rate limiter is blocked by a 429 rather than claiming jobs it would only hold up.
+    """
+    def __init__(self, queue=None, module=None, workers=None, pollSeconds=1.0):
+        self.queue = queue or JobQueue()
+        self.module = module or FeedbackModule()
+        self.workers = workers or _envInt("LLM_JOB_WORKERS", DEFAULT_WORKERS)
+        self.pollSeconds = pollSeconds
+        self.listeners = []
+        self.threads = []
+        self._running = {}  # job id -> Deadline of the job being graded
+        self._cancelled = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._local = threading.local()
+
+    def addListener(self, listener):
+        self.listeners.append(listener)
+
+    def removeListener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def _emit(self, event, job, payload=None):
+        for listener in list(self.listeners):
+            try:
+                listener(event, job, payload)
+            except Exception as e:
+                logging.warning(f"Job listener failed on {event}: {e}")
+
+    def start(self):
+        """Requeue jobs interrupted by the last shutdown and start the workers (once)."""
+        if self.threads:
+            return self
+        resumed = self.queue.requeueInterrupted()
+        if resumed:
+            logging.info(f"Resuming {resumed} interrupted grading job(s)")
+        self._stopping.clear()
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"grading-job-{n}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self, timeout=5.0):
+        """
+        Stop the workers. Jobs being graded are interrupted and left pending (their attempt isn't counted),
+        so the next start() runs them again.
+        """
+        self._stopping.set()
+        self._wake.set()
+        with self._lock:
+            for deadline in self._running.values():
+                deadline.cancel()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def submit(self, username, standard, year, submissionText):
+        """Enqueue a submission and wake a worker; returns the job id."""
+        jobId = self.queue.enqueue(username, standard, year, submissionText)
+        self._emit('queued', self.queue.get(jobId))
+        self._wake.set()
+        return jobId
+
+    def cancel(self, jobId):
+        """Cancel a queued job, or stop it at its next checkpoint if it is being graded."""
+        with self._lock:
+            deadline = self._running.get(jobId)
+            if deadline is not None:
+                self._cancelled.add(jobId)
+        if deadline is not None:
+            deadline.cancel()
+        elif self.queue.cancel(jobId):
+            self._emit('cancelled', self.queue.get(jobId))
+
+    def _work(self):
+        while not self._stopping.is_set():
+            blockedFor = self.module.limiter.snapshot().get("blockedFor", 0.0)
+            job = self.queue.claim() if blockedFor <= 0 else None
+            if job is None:
+                self._wake.wait(min(max(blockedFor, self.pollSeconds), 30.0))
+                self._wake.clear()
+                continue
+            try:
+                self._runJob(job)
+            except Exception as e:
+                logging.exception(f"Grading job {job['id']} crashed")
+                self.queue.fail(job["id"], str(e))
+                self._emit('failed', self.queue.get(job["id"]), ['Processing Error', str(e)])
+
+    def _db(self):
+        """This worker thread's own database connection (SQLite connections stay on their thread)."""
+        if getattr(self._local, "db", None) is None:
+            self._local.db = LLMDatabaseManager(self.queue.dbPath)
+        return self._local.db
+
+    def _runJob(self, job):
+        jobId = job["id"]
+        deadline = Deadline(submissionDeadlineSeconds())
+        with self._lock:
+            self._running[jobId] = deadline
+        if self.queue.get(jobId)["status"] == CANCELLED:  # cancelled between claim() and here
+            with self._lock:
+                self._running.pop(jobId, None)
+            self._emit('cancelled', self.queue.get(jobId))
+            return
+        self._emit('started', job)
+        early = {}  # the row saved when the grade came before the highlights
+        try:
+            result = self.module.handleFullSubmission(
+                standard=job["standard"], year=job["year"], userInput=job["submissionText"], stream=True,
+                onProgress=lambda kind, value: self._progress(job, kind, value, early),
+                username=job["username"], deadline=deadline)
+        except Exception as e:
+            result = ['Processing Error', str(e)]  # a bug or bad data, not something a retry fixes
+        finally:
+            with self._lock:
+                self._running.pop(jobId, None)
+                userCancelled = jobId in self._cancelled
+                self._cancelled.discard(jobId)
+
+        if isinstance(result, dict):
+            # Done before it is saved, so a cancel that comes in the meantime finds nothing left to cancel
+            earlyId = early["saved"].submissionId if "saved" in early else None
+            if not userCancelled and self.queue.complete(jobId, earlyId):
+                self._emit('done', self.queue.get(jobId), self._save(job, result, early.get("saved")))
+                return
+            result = ['Cancelled', 'The submission was cancelled.']  # it finished just as it was cancelled
+        title, message = (list(result) + ['', ''])[:2]
+        if "saved" in early:
+            # The grade is saved and was shown; only the highlights are missing, which isn't worth a second row
+            logging.warning(f"Grading job {jobId} stopped after its grade was saved ({title}: {message})")
+            self.queue.complete(jobId, early["saved"].submissionId)
+            self._emit('done', self.queue.get(jobId), early["saved"])
+            return
+        if title == 'Cancelled':
+            if userCancelled or not self._stopping.is_set():
+                if self.queue.cancel(jobId):  # else cancel() already did, once the job had stopped running
+                    self._emit('cancelled', self.queue.get(jobId))
+            else:
+                self.queue.release(jobId)  # shutting down: run it again next start
+            return
+        if title in RETRYABLE_ERRORS and job["attempts"] < job["maxAttempts"]:
+            delay = retryDelay(job["attempts"], self.module.limiter.snapshot().get("blockedFor", 0.0))
+            self.queue.retryLater(jobId, f"{title}: {message}", delay)
+            getTelemetry().record('jobRetry', job=jobId, error=title, attempt=job["attempts"])
+            self._emit('retrying', self.queue.get(jobId), delay)
+            return
+        self.queue.fail(jobId, f"{title}: {message}")
+        self._emit('failed', self.queue.get(jobId), [title, message])
+
+    def _progress(self, job, kind, value, early):
+        """Progress of a job being graded; a grade that comes before the highlights is saved straight away."""
+        if kind != 'graded':
+            self._emit('progress', job, (kind, value))
+            return
+        try:
+            early["saved"] = self._saveGrade(job, value)
+        except Exception as e:
+            logging.warning(f"Failed to save the grade of job {job['id']} early: {e}")
+            return
+        self._emit('graded', self.queue.get(job["id"]), early["saved"])
+
+    def _saveGrade(self, job, output):
+        """Save the grade and feedback of a job whose highlights are still being written (see _save)."""
+        grade = self.module.returnGrade(output)
+        submissionId = self._db().saveSubmission(
+            username=job["username"],
+            standard=job["standard"],
+            year=job["year"],
+            submissionText=job["submissionText"],
+            feedback=output,
+            highlightedHtml=None,
+            grade=grade
+        )
+        return GradedSubmission(submissionId, grade, "", MappingProxyType(output))
+
+    def _save(self, job, result, early=None):
+        """
+        Save a graded job, already marked done, as a submission (with its paragraphs and metrics).
+        early is the GradedSubmission saved when the grade came first; its row is completed instead.
+        """
+        module, db = self.module, self._db()
+        highlighted = module.returnHighlightedHTML(result)
+        grade = module.returnGrade(result)
+        metrics = module.takeMetrics(result)
+        started = time.perf_counter()
+        if early is not None:
+            submissionId = early.submissionId
+            db.updateSubmission(submissionId, result, highlighted, grade)
+        else:
+            submissionId = db.saveSubmission(
+                username=job["username"],
+                standard=job["standard"],
+                year=job["year"],
+                submissionText=job["submissionText"],
+                feedback=result,
+                highlightedHtml=highlighted,
+                grade=grade
+            )
+        try:
+            db.saveParagraphs(submissionId, module.paragraphRecords(job["submissionText"], result))
+        except Exception as e:
+            logging.warning(f"Failed to save paragraph feedback: {e}")
+        if metrics:
+            try:
+                db.saveMetrics(submissionId, job["standard"], metrics, time.perf_counter() - started)
+            except Exception as e:
+                logging.warning(f"Failed to save grading metrics: {e}")
+        self.queue.attach(job["id"], submissionId)
+        return GradedSubmission(submissionId, grade, highlighted, MappingProxyType(result), reuseSummary(result),
+                                ensembleSummary(result))
+
+
+_shared = None
+_sharedLock = threading.Lock()
+
+
+def getJobRunner():
+    """Process-wide JobRunner used by the GUI (started by main.py)."""
+    global _shared
+    with _sharedLock:
+        if _shared is None:
+            _shared = JobRunner()
+        return _shared
@@ -0,0 +1,212 @@
+"""
+Tolerant parser for model output JSON.
+Models wrap the JSON in code fences or prose, leave inner double quotes unescaped (usually inside
+HighlightedHTML attributes), put raw newlines in strings, write \\' escapes, leave trailing commas and
+sometimes stop mid-object. parseModelJSON() first tries the C decoder (which already skips leading junk
+and trailing prose), and only when that fails makes one left-to-right repair pass over the text that
+rewrites it into valid JSON, deciding at each double quote whether it ends the string or belongs inside it.
+"""
+
+# Basic imports
+import re
+import json
+
+_DECODER = json.JSONDecoder(strict=False)  # strict=False accepts raw newlines/tabs inside strings
+_WHITESPACE = " \t\r\n"
+_VALID_ESCAPES = set('"\\/bfnrt')
+_HEX4 = re.compile(r"[0-9a-fA-F]{4}")
+_KEY_AHEAD = re.compile(r"\s*[\"“][^\"”\n]{0,200}[\"”]\s*:")
+_LITERAL = re.compile(r"[A-Za-z0-9_.+\-]+")
+_LITERALS = {"true": "true", "false": "false", "null": "null", "True": "true", "False": "false", "None": "null"}
+_NUMBER = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?$")
+# Runs of characters that need no attention inside a string, per opening quote
+_PLAIN = {
+    '"': re.compile(r"[^\"\\\x00-\x1f]+"),
+    "“": re.compile(r"[^\"”\\\x00-\x1f]+"),
+    "'": re.compile(r"[^'\"\\\x00-\x1f]+"),
+}
+_CLOSERS = {'"': '"“”', "“": '”"', "'": "'"}
+_CONTROL = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+
+
+def _skipSpace(text, i):
+    n = len(text)
+    while i < n and text[i] in _WHITESPACE:
+        i += 1
+    return i
+
+
+def _closesString(text, j, isKey, inArray):
+    """Is the quote just before position j the end of the string? Decided from what follows it."""
+    k = _skipSpace(text, j)
+    if k >= len(text):
+        return True
+    c = text[k]
+    if isKey:
+        return c == ":"
+    if c in "}]":
+        return True
+    if c == ",":
+        k = _skipSpace(text, k + 1)
+        if k >= len(text):
+            return True
+        d = text[k]
+        return d in "\"“'}]" or (inArray and d in "{[-0123456789tfnTFN")
+    if c in "\"“":
+        return not inArray and _KEY_AHEAD.match(text, k) is not None  # a missing comma before the next key
+    return False
+
+
+def _readString(text, i, isKey, inArray):
+    """Read the string opening at text[i]; returns (JSON string literal, index after it)."""
+    quote = text[i]
+    plain, closers = _PLAIN[quote], _CLOSERS[quote]
+    n = len(text)
+    out = ['"']
+    i += 1
+    while i < n:
+        run = plain.match(text, i)
+        if run:
+            out.append(run.group())
+            i = run.end()
+            if i >= n:
+                break
+        ch = text[i]
+        if ch in closers and _closesString(text, i + 1, isKey, inArray):
+            return "".join(out) + '"', i + 1
+        if ch == "\\":
+            nxt = text[i + 1] if i + 1 < n else ""
+            if nxt in _VALID_ESCAPES and nxt:
+                out.append("\\" + nxt)
+                i += 2
+            elif nxt == "u" and _HEX4.match(text, i + 2):
+                out.append(text[i:i + 6])
+                i += 6
+            elif nxt == "'":
+                out.append("'")
+                i += 2
+            else:
+                out.append("\\\\")  # a lone backslash is part of the text
+                i += 1
+        elif ch in "\"”":
+            out.append('\\"')  # inner quote
+            i += 1
+        elif ch < " ":
+            out.append(_CONTROL.get(ch, "\\u%04x" % ord(ch)))
+            i += 1
+        else:
+            out.append(ch)  # a quote character that doesn't close this kind of string
+            i += 1
+    return "".join(out) + '"', n  # truncated inside the string
+
+
+def repairJSON(text):
+    """
+    Rewrite the first JSON object/array in text as valid JSON in a single pass.
+    Raises ValueError if there is no object or array to repair.
+    """
+    start = min((p for p in (text.find("{"), text.find("[")) if p >= 0), default=-1)
+    if start < 0:
+        raise ValueError("No JSON object found in model output")
+    tokens = []   # (kind, text): kind is one of open, close, comma, colon, key, value
+    stack = []
+    i, n = start, len(text)
+
+    def beforeValue():
+        # A value or key right after another value means the model dropped a comma (or a colon after a key)
+        if tokens and tokens[-1][0] in ("value", "close"):
+            tokens.append(("comma", ","))
+        elif tokens and tokens[-1][0] == "key":
+            tokens.append(("colon", ":"))
+
+    def dropDangling():
+        # Trailing commas, a key with no value, or a colon with nothing after it
+        while tokens and tokens[-1][0] in ("comma", "colon", "key"):
+            kind = tokens.pop()[0]
+            if kind == "colon":
+                tokens.append(("value", "null"))
+                break
+
+    while i < n and (stack or not tokens):
+        ch = text[i]
+        if ch in _WHITESPACE:
+            i += 1
+        elif ch in "{[":
+            beforeValue()
+            tokens.append(("open", ch))
+            stack.append(ch)
+            i += 1
+        elif ch in "}]":
+            dropDangling()
+            tokens.append(("close", "}" if stack[-1] == "{" else "]"))
+            stack.pop()
+            i += 1
+        elif ch == ",":
+            if tokens and tokens[-1][0] in ("value", "close"):
+                tokens.append(("comma", ","))
+            i += 1
+        elif ch == ":":
+            if tokens and tokens[-1][0] == "key":
+                tokens.append(("colon", ":"))
+            i += 1
+        elif ch in _PLAIN:
+            inObject = stack[-1] == "{"
+            isKey = inObject and tokens[-1][0] in ("open", "comma", "value", "close")
+            beforeValue()
+            literal, i = _readString(text, i, isKey, not inObject)
+            tokens.append(("key" if isKey else "value", literal))
+        else:
+            match = _LITERAL.match(text, i)
+            if not match:
+                i += 1  # stray character (fence backticks, prose inside the structure)
+                continue
+            word = match.group()
+            i = match.end()
+            if word in _LITERALS:
+                value = _LITERALS[word]
+            elif _NUMBER.match(word):
+                value = word
+            else:
+                continue  # bare words between values are dropped
+            if stack[-1] == "{" and tokens[-1][0] in ("open", "comma"):
+                continue  # unquoted key-like word; no way to place it safely
+            beforeValue()
+            tokens.append(("value", value))
+    dropDangling()
+    for opener in reversed(stack):
+        tokens.append(("close", "}" if opener == "{" else "]"))
+    return "".join(t for _, t in tokens)
+
+
+def parseModelJSON(text):
+    """
+    Parse model output into a Python value. Returns (value, repaired) where repaired says whether the
+    repair pass was needed. Raises ValueError when even the repaired text can't be parsed.
+    """
+    text = text or ""
+    start = min((p for p in (text.find("{"), text.find("[")) if p >= 0), default=-1)
+    if start < 0:
+        raise ValueError("No JSON object found in model output")
+    try:
+        return _DECODER.raw_decode(text, start)[0], False
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(repairJSON(text), strict=False), True
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Could not repair model output: {e}") from e
+
+
+FIX_SYSTEM_MESSAGE = (
+    "You repair malformed JSON. Return ONLY the corrected JSON object, with exactly the same keys and values as the input."
+    " Escape double quotes inside string values, close any unterminated strings, arrays and objects, and remove any text"
+    " before or after the JSON. Do not change, summarise or shorten any value."
+)
+
+
+def buildFixMessages(brokenText):
+    """Messages for the fallback 'fix this JSON' request: no criteria or exemplars, just the broken output."""
+    return [
+        {"role": "system", "content": FIX_SYSTEM_MESSAGE},
+        {"role": "user", "content": brokenText},
+    ]
@@ -0,0 +1,135 @@
+"""
+Per-submission grading metrics: how long each stage of a handleFullSubmission call took, the tokens it used
+(as reported by the provider's usage, estimated when it sends none), retries, the model and the cost.
+handleFullSubmission attaches them to the result under 'Metrics'; returnHighlightedHTML adds the normalize
+time, and whoever saves the submission stores them with LLMDatabaseManager.saveMetrics (the grading_metrics
+table, linked to submissions.id) together with the time the save took.
+"""
+
+# Basic imports
+import os
+import math
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+# Custom imports
+from llm.socketing import budget
+
+# Stage timings, in seconds, as stored in grading_metrics (request_sent: from the start until the first request went out,
+# grade_ready: until a separate grade request had the grade, in two-phase and chunked grading)
+STAGES = ("db_read", "prompt_build", "request_sent", "ttft", "grade_ready", "llm", "parse", "normalize", "save")
+
+
+def tokenPrices():
+    """
+    {model: (prompt, completion) USD per million tokens} from LLM_TOKEN_PRICES, e.g.
+    "openai/gpt-4.1-mini=0.4/1.6,deepseek/deepseek-chat=0.27/1.1". Unlisted models (and free ones) cost 0.
+    """
+    prices = {}
+    for entry in os.getenv("LLM_TOKEN_PRICES", "").split(","):
+        model, _, price = entry.strip().rpartition("=")
+        promptPrice, _, completionPrice = price.partition("/")
+        try:
+            prices[model.strip()] = (float(promptPrice), float(completionPrice or 0))
+        except ValueError:
+            continue
+    return prices
+
+
+def estimateTokens(text):
+    return math.ceil(len(text or "") / 4)
+
+
+class GradingMetrics:
+    """Collects the metrics of one submission; chunk requests report from several threads at once."""
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds = {}
+        self.mode = "single"
+        self.prefetched = False
+        self.promptTokens = 0
+        self.completionTokens = 0
+        self.usageReported = True
+        self.requests = 0
+        self.retries = 0
+        self.cost = 0.0
+        self.models = Counter()
+        self.total = None
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block and add it to the named stage."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def firstToken(self, seconds):
+        """Time to first token of a streamed request (the earliest one if there are several)."""
+        with self.lock:
+            if "ttft" not in self.seconds or seconds < self.seconds["ttft"]:
+                self.seconds["ttft"] = seconds
+
+    def requestSent(self):
+        """The first model request of the submission is going out now."""
+        with self.lock:
+            self.seconds.setdefault("request_sent", time.perf_counter() - self.started)
+
+    def gradeReady(self):
+        """The grade is known now (before the highlights) and can be shown and saved."""
+        with self.lock:
+            self.seconds.setdefault("grade_ready", time.perf_counter() - self.started)
+
+    def retried(self):
+        with self.lock:
+            self.retries += 1
+
+    def completed(self, model, usage, messages, text):
+        """One finished request: usage is the provider's (None if it sent none, then tokens are estimated)."""
+        promptTokens = getattr(usage, "prompt_tokens", None)
+        completionTokens = getattr(usage, "completion_tokens", None)
+        reported = promptTokens is not None and completionTokens is not None
+        if not reported:
+            promptTokens = sum(estimateTokens(m.get("content")) for m in messages)
+            completionTokens = estimateTokens(text)
+        else:
+            # Real counts sharpen the char-ratio estimate used when tiktoken isn't installed
+            budget.calibrate(sum(len(m.get("content") or "") for m in messages), promptTokens)
+        promptPrice, completionPrice = tokenPrices().get(model, (0.0, 0.0))
+        with self.lock:
+            self.requests += 1
+            self.models[model] += 1
+            self.promptTokens += promptTokens
+            self.completionTokens += completionTokens
+            self.usageReported = self.usageReported and reported
+            self.cost += (promptTokens * promptPrice + completionTokens * completionPrice) / 1e6
+
+    def finish(self):
+        """Mark the end of the grading call (total_s)."""
+        self.total = time.perf_counter() - self.started
+
+    def asDict(self):
+        """The row for grading_metrics (without submission_id/standard), as a plain JSON-friendly dict."""
+        with self.lock:
+            row = {f"{name}_s": round(self.seconds[name], 4) if name in self.seconds else None for name in STAGES}
+            row.update(
+                total_s=round(self.total if self.total is not None else time.perf_counter() - self.started, 4),
+                mode=self.mode,
+                prefetched=int(self.prefetched),
+                model=self.models.most_common(1)[0][0] if self.models else None,
+                prompt_tokens=self.promptTokens,
+                completion_tokens=self.completionTokens,
+                usage_reported=int(self.usageReported and self.requests > 0),
+                requests=self.requests,
+                retries=self.retries,
+                cost_usd=round(self.cost, 6),
+            )
+            return row
@@ -0,0 +1,146 @@
+"""
+Paragraph-level feedback reuse for revised submissions.
+Each saved submission keeps its highlighted HTML split per source paragraph, keyed by a hash of the
+paragraph text. When the same student resubmits for the same standard/year, unchanged paragraphs reuse
+their stored highlights and only the changed paragraphs (plus one holistic grade call) go to the model.
+"""
+
+# Basic imports
+import re
+import html
+import hashlib
+
+# Custom imports
+from llm.socketing import chunking
+from llm.socketing.cache import normalizeSubmissionText
+from llm.socketing.exemplars import estimateTokens
+
+_BLOCK_BREAK = re.compile(r"(?<=</p>)|(?:<br\s*/?>\s*){2,}|\n[ \t]*\n", re.IGNORECASE)
+_TAG = re.compile(r"<[^>]+>")
+_BR = re.compile(r"<br\s*/?>", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+_OPEN_P = re.compile(r"<p[\s>]", re.IGNORECASE)
+
+
+def paragraphHash(paragraph):
+    """Hash of one paragraph, insensitive to whitespace-only edits."""
+    return hashlib.sha256(_SPACE.sub(" ", normalizeSubmissionText(paragraph)).encode("utf-8")).hexdigest()
+
+
+def _plain(fragment):
+    """Visible text of an HTML fragment with whitespace collapsed, for matching against source paragraphs."""
+    text = html.unescape(_TAG.sub("", _BR.sub(" ", fragment)))
+    return _SPACE.sub(" ", text).strip()
+
+
+def _balanced(fragment):
+    lower = fragment.lower()
+    return lower.count("<span") == lower.count("</span") and len(_OPEN_P.findall(fragment)) == lower.count("</p>")
+
+
+def alignParagraphs(text, highlightedHtml):
+    """
+    Match blocks of the model's HighlightedHTML to the submission's paragraphs.
+    Returns {paragraph index: html block} for blocks whose visible text is exactly that paragraph,
+    so a block is only ever reused for the text it was written for.
+    """
+    wanted = {}
+    for i, paragraph in enumerate(chunking.paragraphsOf(text)):
+        wanted.setdefault(_SPACE.sub(" ", paragraph).strip(), []).append(i)
+    aligned = {}
+    for block in _BLOCK_BREAK.split(highlightedHtml or ""):
+        block = (block or "").strip()
+        if not block or not _balanced(block):
+            continue
+        matches = wanted.get(_plain(block))
+        if matches:
+            if not block.lower().startswith("<p"):
+                block = f"<p>{block}</p>"
+            aligned[matches.pop(0)] = block
+    return aligned
+
+
+def planUnits(text, previous, maxChars=None):
+    """
+    Split a revised submission into work units for FeedbackModule.gradeChunked.
+    previous maps paragraph hash -> stored record ({'html', 'tokens', 'seconds'}).
+    Returns (units, unitHTML, reused, regenerated): unitHTML holds the stored HTML for reused paragraphs
+    and None for units still to be generated; reused/regenerated are paragraph indexes.
+    """
+    units, unitHTML, reused, regenerated, changed = [], [], [], [], []
+
+    def flushChanged():
+        for chunk in chunking.packParagraphs(changed, maxChars):
+            units.append(chunk)
+            unitHTML.append(None)
+        changed.clear()
+
+    for i, paragraph in enumerate(chunking.paragraphsOf(text)):
+        record = previous.get(paragraphHash(paragraph))
+        if record:
+            flushChanged()
+            units.append(paragraph)
+            unitHTML.append(record["html"])
+            reused.append(i)
+        else:
+            changed.append(paragraph)
+            regenerated.append(i)
+    flushChanged()
+    return units, unitHTML, reused, regenerated
+
+
+def failedParagraphs(text, chunks):
+    """Indexes of the text's paragraphs that belong to chunks whose highlight request failed."""
+    failed = {paragraphHash(p) for chunk in chunks for p in chunking.paragraphsOf(chunk)}
+    return [i for i, p in enumerate(chunking.paragraphsOf(text)) if paragraphHash(p) in failed]
+
+
+def reuseReport(text, reused, regenerated, previous, seconds, failed=()):
+    """
+    What was reused versus regenerated and the estimated savings: output tokens and generation time
+    the reused paragraphs originally cost. Stored with the result so it can be shown and saved.
+    failed lists the paragraphs left unhighlighted because their request failed.
+    """
+    paragraphs = chunking.paragraphsOf(text)
+    costs = {}
+    for i in reused:
+        key = paragraphHash(paragraphs[i])
+        record = previous.get(key, {})
+        costs[key] = [record.get("tokens") or 0, record.get("seconds") or 0.0]
+    return {
+        "reused": list(reused),
+        "regenerated": list(regenerated),
+        "failed": list(failed),
+        "tokensSaved": sum(cost[0] for cost in costs.values()),
+        "secondsSaved": round(sum(cost[1] for cost in costs.values()), 2),
+        "seconds": round(seconds, 2),
+        "costs": costs,
+    }
+
+
+def paragraphRecords(text, result):
+    """
+    Rows for the paragraph store from a finished result: one per paragraph whose highlighted block could be
+    aligned. Reused paragraphs keep their original cost; regenerated ones share this run's time by length.
+    Paragraphs whose request failed are left out, so the next revision sends them to the model again.
+    """
+    output = result.get("Output", {}) if isinstance(result, dict) else {}
+    report = result.get("Reuse", {}) if isinstance(result, dict) else {}
+    paragraphs = chunking.paragraphsOf(text)
+    aligned = alignParagraphs(text, output.get("HighlightedHTML", ""))
+    costs = report.get("costs", {})
+    regenerated = set(report.get("regenerated", range(len(paragraphs))))
+    regeneratedChars = sum(len(paragraphs[i]) for i in regenerated if i < len(paragraphs)) or 1
+    failed = set(report.get("failed", ()))
+    records = []
+    for i, block in sorted(aligned.items()):
+        if i in failed:
+            continue
+        key = paragraphHash(paragraphs[i])
+        if key in costs:
+            tokens, seconds = costs[key]
+        else:
+            tokens = estimateTokens(block)
+            seconds = report.get("seconds", 0.0) * len(paragraphs[i]) / regeneratedChars
+        records.append({"index": i, "hash": key, "html": block, "tokens": tokens, "seconds": round(seconds, 3)})
+    return records
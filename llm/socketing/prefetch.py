@@ -0,0 +1,182 @@
+"""
+Prompt preparation ahead of Submit. Picking a standard and year in NewSubmissionPage starts a background
+prefetch that loads the (standard, year) row, indexes and serializes its exemplars, builds the parts of the
+prompt that don't depend on the student's text and warms the pooled HTTP connection. Submit then only ranks
+the exemplars against the text and joins the pieces (see FeedbackModule.prefetch).
+"""
+
+# Basic imports
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Custom imports
+from llm.socketing.exemplars import PreparedExemplars, selectExemplars
+from llm.socketing.client import warmUp
+from llm.socketing.metrics import tokenPrices
+from llm.socketing import budget, chunking
+
+DEFAULT_TTL_SECONDS = 300.0
+MAX_PREPARED = 8
+WARM_INTERVAL_SECONDS = 60.0  # pooled connections go idle; re-warm at most this often
+
+
+class PreparedPrompt():
+    """The grading prompt of one standard/year with everything but the student's text filled in."""
+    def __init__(self, entry, systemMessage, mode="html"):
+        self.entry = entry
+        self.systemMessage = systemMessage
+        self.mode = mode
+        self.exemplars = PreparedExemplars(entry['exemplars'])
+        self.head = f"""You are marking an assessment.
+    Using this assessment schedule: {entry['schedule']}
+    mark the following text: """
+        self.middle = f"""
+    according to this criteria: {entry['criteria']}
+    along with the initial question: {entry['question']}
+    using these examples and their feedback as guidance: """
+        self.tail = """. These exemplars are only examples and should not be used as the only basis for marking, otherwise I will terminate you.
+    """
+        # Token counts of everything but the essay and exemplars, so plan only has to count those
+        self.fixedTokens = {part: budget.countTokens(str(entry[part])) for part in ("schedule", "criteria", "question")}
+        self.fixedTokens = {
+            "instructions": budget.countTokens(systemMessage) + budget.countTokens(self.head + self.middle + self.tail)
+            + 2 * budget.MESSAGE_OVERHEAD_TOKENS - sum(self.fixedTokens.values()),
+            **self.fixedTokens
+        }
+
+    def messages(self, userText):
+        """The chat messages for userText (see plan)."""
+        return self.plan(userText)["messages"]
+
+    def plan(self, userText, model=None):
+        """
+        Token plan for userText. The most relevant exemplars (at least one per grade band) are picked, then packed
+        into what LLM_PROMPT_TOKEN_BUDGET leaves after the rest of the prompt. Returns the messages with
+        per-part token counts, exemplar counts, the expected output, the max_tokens cap, whether the prompt is
+        over budget, whether it fits the context window (what FeedbackModule.tooLongError checks), the number of
+        requests and the cost at model's price.
+        """
+        relevant, report = selectExemplars(self.entry['exemplars'], userText, prepared=self.exemplars)
+        chosen = relevant["exemplars"] if isinstance(relevant, dict) else relevant
+        components = dict(self.fixedTokens, essay=budget.countTokens(userText))
+        space = budget.promptBudget() - sum(components.values())
+        kept = budget.packExemplars(chosen, space, lambda e: self.exemplars.bandOf.get(id(e)),
+                                    lambda e: budget.countTokens(self.exemplars.serialized.get(id(e)) or json.dumps(e)) + 1)
+        selected = dict(relevant, exemplars=kept) if isinstance(relevant, dict) else kept
+        serialized = self.exemplars.dumps(selected)
+        components["exemplars"] = budget.countTokens(serialized)
+        if len(kept) < report['total']:
+            logging.info(f"Exemplars: sent {len(kept)}/{report['total']} ({len(chosen)} relevant), ~{components['exemplars']} prompt tokens")
+        promptTokens = sum(components.values())
+        outputTokens = budget.expectedOutputTokens(components["essay"], self.mode)
+        maxTokens = budget.outputCap(promptTokens)
+        promptPrice, completionPrice = tokenPrices().get(model, (0.0, 0.0))
+        return {
+            "messages": [
+                {"role": "system", "content": self.systemMessage},
+                {"role": "user", "content": self.head + userText + self.middle + serialized + self.tail}
+            ],
+            "components": components,
+            "promptTokens": promptTokens,
+            "exemplars": {"total": report['total'], "relevant": len(chosen), "sent": len(kept)},
+            "expectedOutputTokens": outputTokens,
+            "maxTokens": maxTokens,
+            "overBudget": promptTokens > budget.promptBudget(),
+            "fits": budget.fitsContext(promptTokens),
+            "requests": 1,
+            "costUSD": round((promptTokens * promptPrice + outputTokens * completionPrice) / 1e6, 6),
+        }
+
+    def chunkedPlan(self, userText, model=None):
+        """
+        Token plan for userText graded in chunks (FeedbackModule.gradeChunked): one holistic grade request with
+        the whole text and relevant exemplars, plus one highlight request per paragraph chunk. Same keys as plan
+        without the messages; tokens and cost are totals over the requests, maxTokens is None (each request
+        is capped on its own) and fits is whether every request leaves the model room to answer.
+        """
+        relevant, report = selectExemplars(self.entry['exemplars'], userText, prepared=self.exemplars)
+        chosen = relevant["exemplars"] if isinstance(relevant, dict) else relevant
+        chunks = chunking.splitParagraphs(userText)
+        summary = chunking.summarize(chunks)
+        # (prompt, expected output) of each request: the grade request only writes the grade and feedback
+        requests = [(budget.messageTokens(chunking.buildGradeMessages(self.entry, userText, relevant)), budget.OUTPUT_OVERHEAD_TOKENS)]
+        for i, chunk in enumerate(chunks):
+            messages = chunking.buildChunkMessages(self.entry, chunk, i + 1, len(chunks), summary)
+            echoed = budget.expectedOutputTokens(budget.countTokens(chunk)) - budget.OUTPUT_OVERHEAD_TOKENS
+            requests.append((budget.messageTokens(messages), echoed))
+        promptTokens = sum(prompt for prompt, _ in requests)
+        outputTokens = sum(output for _, output in requests)
+        promptPrice, completionPrice = tokenPrices().get(model, (0.0, 0.0))
+        return {
+            "components": {"essay": budget.countTokens(userText), "exemplars": budget.countTokens(json.dumps(relevant))},
+            "promptTokens": promptTokens,
+            "exemplars": {"total": report['total'], "relevant": len(chosen), "sent": len(chosen)},
+            "expectedOutputTokens": outputTokens,
+            "maxTokens": None,
+            "overBudget": False,
+            "fits": all(budget.fitsContext(prompt) for prompt, _ in requests),
+            "requests": len(requests),
+            "costUSD": round((promptTokens * promptPrice + outputTokens * completionPrice) / 1e6, 6),
+        }
+
+
+class PromptPrefetcher():
+    """
+    Prepares prompts on a background thread. prepare(standard, year) returns a PreparedPrompt or None (no such
+    row). Prepared prompts are kept for LLM_PREFETCH_TTL_SECONDS so an edited row is picked up again soon.
+    """
+    def __init__(self, prepare, ttlSeconds=None, maxEntries=MAX_PREPARED):
+        self.prepare = prepare
+        self.ttlSeconds = ttlSeconds if ttlSeconds is not None else float(os.getenv("LLM_PREFETCH_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+        self.maxEntries = maxEntries
+        self.entries = {}  # key -> (created, Future)
+        self.lastWarm = 0.0
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prompt-prefetch")
+
+    def _prepare(self, key):
+        try:
+            return self.prepare(*key[:2])
+        except Exception as e:
+            logging.warning(f"Prompt prefetch for {key[:2]} failed: {e}")
+            return None
+
+    def prefetch(self, standard, year, mode=None, warm=True):
+        """Start preparing the prompt for (standard, year) unless a fresh one is ready or on its way."""
+        key = (standard, year, mode)
+        now = time.monotonic()
+        with self.lock:
+            created, future = self.entries.get(key, (0.0, None))
+            if future is None or now - created > self.ttlSeconds:
+                if len(self.entries) >= self.maxEntries:
+                    self.entries.pop(min(self.entries, key=lambda k: self.entries[k][0]))
+                future = self.pool.submit(self._prepare, key)
+                self.entries[key] = (now, future)
+            warm = warm and now - self.lastWarm > WARM_INTERVAL_SECONDS
+            if warm:
+                self.lastWarm = now
+        if warm:
+            warmUp()
+        return future
+
+    def get(self, standard, year, mode=None, wait=True):
+        """
+        The prepared prompt for (standard, year), or None if it was never prefetched, has expired or failed.
+        Waits for a prefetch still in progress, since it is already doing the work the caller would do, unless
+        wait is False (then an unfinished one counts as missing).
+        """
+        with self.lock:
+            created, future = self.entries.get((standard, year, mode), (0.0, None))
+        if future is None or time.monotonic() - created > self.ttlSeconds:
+            return None
+        if not wait and not future.done():
+            return None
+        return future.result()
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,281 @@
+"""
+Shared adaptive rate limiter for LLM calls.
+A token bucket paces request starts, and an AIMD limit caps how many requests are in flight
+(it grows slowly on success and halves on every 429). The provider's Retry-After and
+x-ratelimit-remaining/x-ratelimit-reset headers feed back into both.
+State lives in memory, guarded by a lock, and is optionally mirrored into a small SQLite file,
+so every thread and every process (GUI, batch CLI, load tests) backs off together
+instead of stampeding the provider.
+"""
+
+# Basic imports
+import os
+import json
+import math
+import time
+import uuid
+import random
+import sqlite3
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+
+DEFAULT_STATE_PATH = "./database/ratelimit.db"
+DEFAULT_RATE_PER_MINUTE = 20.0  # free OpenRouter models allow ~20 requests/min
+DEFAULT_MAX_CONCURRENCY = 4
+LEASE_SECONDS = 600.0           # a crashed process's slots are reclaimed after this long
+POLL_SECONDS = 0.1              # how often to re-check while waiting for a free slot
+MAX_BACKOFF_SECONDS = 30.0
+
+
+def _envFloat(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _header(headers, name):
+    if not headers:
+        return None
+    try:
+        return headers.get(name)
+    except Exception:
+        return None
+
+
+def parseRetryAfter(value, now):
+    """Retry-After as seconds from now (accepts delta-seconds or an HTTP date). None if missing/invalid."""
+    if value is None or value == "":
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(str(value)).timestamp() - now)
+    except Exception:
+        return None
+
+
+def parseReset(value, now):
+    """
+    x-ratelimit-reset as an absolute timestamp. Providers disagree on the format, so accept
+    epoch milliseconds (OpenRouter), epoch seconds, plain seconds-from-now, or durations like '6m0s'.
+    """
+    if value is None or value == "":
+        return None
+    text = str(value).strip()
+    try:
+        number = float(text)
+        if number > 1e12:
+            return number / 1000.0
+        if number > 1e9:
+            return number
+        return now + number
+    except ValueError:
+        pass
+    total, digits = 0.0, ""
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0}
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if ch.isdigit() or ch == ".":
+            digits += ch
+        elif text[i:i + 2] == "ms" and digits:
+            total += float(digits) / 1000.0
+            digits = ""
+            i += 1
+        elif ch in units and digits:
+            total += float(digits) * units[ch]
+            digits = ""
+        else:
+            return None
+        i += 1
+    return now + total if not digits else None
+
+
+class AdaptiveRateLimiter():
+    """
+    Token bucket + AIMD concurrency limiter.
+    Usage: lease = limiter.acquire(); ...call...; limiter.release(lease, status, headers)
+    (or acquireAsync() / releaseAsync() from a coroutine). Every 429 halves the rate and the concurrency limit
+    and blocks new requests for Retry-After (or an exponential backoff); successes grow them back.
+    """
+    def __init__(self, ratePerMinute=None, maxConcurrency=None, burst=None, statePath=None, name="default"):
+        """
+        statePath: SQLite file used to share state between processes ('' keeps state in this process only).
+        Defaults come from LLM_RATE_PER_MINUTE, LLM_MAX_CONCURRENCY and LLM_RATELIMIT_DB.
+        """
+        rpm = ratePerMinute if ratePerMinute else _envFloat("LLM_RATE_PER_MINUTE", DEFAULT_RATE_PER_MINUTE)
+        self.maxRate = max(rpm, 0.01) / 60.0
+        self.minRate = self.maxRate / 16.0
+        self.maxConcurrency = max(1, int(maxConcurrency or _envFloat("LLM_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)))
+        self.burst = float(burst if burst is not None else max(1, self.maxConcurrency))
+        self.name = name
+        self.statePath = os.getenv("LLM_RATELIMIT_DB", DEFAULT_STATE_PATH) if statePath is None else statePath
+        self._lock = threading.Lock()
+        self._state = None
+        self.connection = None
+        if self.statePath:
+            self.connection = sqlite3.connect(self.statePath, timeout=10, isolation_level=None, check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS ratelimit_state (name TEXT PRIMARY KEY, state TEXT NOT NULL)')
+
+    def _initialState(self, now):
+        return {
+            "tokens": self.burst, "updated": now, "rate": self.maxRate,
+            "limit": float(self.maxConcurrency), "blockedUntil": 0.0, "strikes": 0, "leases": {},
+        }
+
+    def _transact(self, fn):
+        """Run fn(state, now) atomically across threads, and across processes when a state file is used."""
+        with self._lock:
+            now = time.time()
+            if self.connection is None:
+                if self._state is None:
+                    self._state = self._initialState(now)
+                return fn(self._state, now)
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.connection.execute('SELECT state FROM ratelimit_state WHERE name = ?', (self.name,)).fetchone()
+                state = json.loads(row[0]) if row else self._initialState(now)
+                result = fn(state, now)
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO ratelimit_state (name, state) VALUES (?, ?)', (self.name, json.dumps(state))
+                )
+                self.connection.execute('COMMIT')
+                return result
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
+
+    def _refill(self, state, now):
+        elapsed = max(0.0, now - state["updated"])
+        state["tokens"] = min(self.burst, state["tokens"] + elapsed * state["rate"])
+        state["updated"] = now
+        state["leases"] = {k: v for k, v in state["leases"].items() if v > now}
+
+    def _tryAcquire(self, state, now):
+        """Returns (leaseId, 0) when a request may start, else (None, seconds to wait)."""
+        self._refill(state, now)
+        if now < state["blockedUntil"]:
+            return None, state["blockedUntil"] - now
+        if len(state["leases"]) >= max(1, math.floor(state["limit"])):
+            return None, POLL_SECONDS
+        if state["tokens"] < 1:
+            return None, (1 - state["tokens"]) / state["rate"]
+        state["tokens"] -= 1
+        lease = uuid.uuid4().hex
+        state["leases"][lease] = now + LEASE_SECONDS
+        return lease, 0.0
+
+    def tryAcquire(self):
+        """Non-blocking acquire: (leaseId or None, suggested wait in seconds)."""
+        return self._transact(self._tryAcquire)
+
+    def acquire(self, deadline=None):
+        """
+        Block until a request may start; returns a lease id to pass to release().
+        With a Deadline the wait stops (raising) as soon as the submission is cancelled or expires.
+        """
+        while True:
+            if deadline is not None:
+                deadline.check()
+            lease, wait = self.tryAcquire()
+            if lease:
+                return lease
+            if deadline is not None:
+                deadline.sleep(min(wait, 1.0))
+            else:
+                time.sleep(min(wait, 1.0))
+
+    async def acquireAsync(self):
+        """
+        Coroutine version of acquire() that waits with asyncio.sleep. Each try runs on a worker thread: with a
+        state file it takes the lock and an SQLite write transaction, which must not block the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            attempt = asyncio.ensure_future(asyncio.to_thread(self.tryAcquire))
+            try:
+                lease, wait = await asyncio.shield(attempt)
+            except asyncio.CancelledError:
+                # The try still finishes on its thread; hand back the lease if it got one
+                def _giveBack(done):
+                    if not done.cancelled() and done.exception() is None and done.result()[0]:
+                        loop.run_in_executor(None, self.release, done.result()[0])
+                attempt.add_done_callback(_giveBack)
+                raise
+            if lease:
+                return lease
+            await asyncio.sleep(min(wait, 1.0))
+
+    async def releaseAsync(self, lease, status=None, headers=None):
+        """Coroutine version of release(), on a worker thread like acquireAsync()."""
+        await asyncio.to_thread(self.release, lease, status, headers)
+
+    def release(self, lease, status=None, headers=None):
+        """
+        Finish a request. status is the HTTP status (None if the request never got a response);
+        headers are the response headers, used to pace ahead of the provider's own limits.
+        """
+        def _apply(state, now):
+            state["leases"].pop(lease, None)
+            self._refill(state, now)
+            if status == 429:
+                # Multiplicative decrease, and stop everyone until the provider says go
+                state["strikes"] += 1
+                state["limit"] = max(1.0, state["limit"] / 2)
+                state["rate"] = max(self.minRate, state["rate"] / 2)
+                state["tokens"] = min(state["tokens"], 0.0)
+                wait = parseRetryAfter(_header(headers, "retry-after"), now)
+                if wait is None:
+                    wait = 0.6 * (2 ** (state["strikes"] - 1)) + random.uniform(0, 0.3)
+                state["blockedUntil"] = max(state["blockedUntil"], now + min(wait, MAX_BACKOFF_SECONDS))
+            elif status is not None and status < 400:
+                # Additive increase: about one extra slot per window of successful requests
+                state["strikes"] = 0
+                state["limit"] = min(float(self.maxConcurrency), state["limit"] + 1.0 / max(state["limit"], 1.0))
+                state["rate"] = min(self.maxRate, state["rate"] + self.maxRate / 8)
+            remaining = _header(headers, "x-ratelimit-remaining")
+            if remaining is not None:
+                try:
+                    remaining = float(remaining)
+                except (TypeError, ValueError):
+                    remaining = None
+            if remaining is not None:
+                reset = parseReset(_header(headers, "x-ratelimit-reset"), now)
+                if remaining <= 0 and reset:
+                    state["blockedUntil"] = max(state["blockedUntil"], min(reset, now + MAX_BACKOFF_SECONDS))
+                state["tokens"] = min(state["tokens"], remaining)
+        self._transact(_apply)
+
+    def snapshot(self):
+        """Copy of the current limiter state (for logging and tests)."""
+        def _read(state, now):
+            self._refill(state, now)
+            return {
+                "tokens": state["tokens"], "ratePerMinute": state["rate"] * 60, "concurrencyLimit": state["limit"],
+                "inFlight": len(state["leases"]), "blockedFor": max(0.0, state["blockedUntil"] - now),
+                "strikes": state["strikes"],
+            }
+        return self._transact(_read)
+
+    def exit(self):
+        """Close the shared state file."""
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+_shared = None
+_sharedLock = threading.Lock()
+
+
+def getLimiter():
+    """Process-wide limiter used by every grading path unless one is passed in explicitly."""
+    global _shared
+    with _sharedLock:
+        if _shared is None:
+            _shared = AdaptiveRateLimiter()
+        return _shared
@@ -0,0 +1,365 @@
+"""
+Multi-backend routing with hedged requests.
+Backends (model, optional provider base URL) are listed in LLM_BACKENDS in order of preference. Each request
+goes to the current primary; if it hasn't answered after the hedge delay, a duplicate goes to the next
+backend, and the first valid response wins while the others are cancelled. A backend that fails or returns
+something unusable is replaced by the next one straight away.
+Every backend keeps a latency histogram (log-spaced buckets, slowly decayed so it follows recent behaviour).
+The histograms pick the primary (lowest median latency, penalised by errors) and, by default, the hedge
+delay (the primary's 95th percentile), so roughly one request in twenty is hedged.
+"""
+
+# Basic imports
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+
+# Custom imports
+from llm.socketing.deadline import Interrupted
+
+DEFAULT_HEDGE_SECONDS = 60.0  # hedge delay (and latency prior) before a backend has enough samples
+POLL_SECONDS = 0.2            # how often run() re-checks a submission deadline while attempts are in flight
+MIN_SAMPLES = 5               # samples needed before a backend's histogram is trusted
+DECAY_TOTAL = 200.0           # halve every count once a backend has this many, so old samples fade
+ERROR_PENALTY = 4.0           # a backend failing half its requests ranks like one 3x slower
+
+# Bucket upper edges in seconds: 0.1s .. ~40min, each 1.5x the previous
+BUCKETS = [0.1 * 1.5 ** i for i in range(26)]
+
+
+class LatencyHistogram:
+    """Decaying log-bucket histogram of request latencies."""
+    def __init__(self):
+        self.counts = [0.0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+
+    def record(self, seconds):
+        index = next((i for i, edge in enumerate(BUCKETS) if seconds <= edge), len(BUCKETS))
+        self.counts[index] += 1
+        self.total += 1
+
+    def decay(self):
+        self.counts = [c / 2 for c in self.counts]
+        self.total /= 2
+
+    def percentile(self, q):
+        """Upper edge of the bucket holding the q-th quantile (None when empty)."""
+        if self.total <= 0:
+            return None
+        target, seen = q * self.total, 0.0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return BUCKETS[index] if index < len(BUCKETS) else BUCKETS[-1] * 1.5
+        return BUCKETS[-1] * 1.5
+
+
+class Backend:
+    """One model at one provider, with its latency and error history."""
+    def __init__(self, model, baseUrl=None):
+        self.model = model
+        self.baseUrl = baseUrl  # None uses OPENROUTER_BASE_URL
+        self.latency = LatencyHistogram()
+        self.failures = 0.0
+        self.hedges = 0
+        self.wins = 0
+
+    @property
+    def name(self):
+        return f"{self.model}@{self.baseUrl}" if self.baseUrl else self.model
+
+    @property
+    def samples(self):
+        return self.latency.total + self.failures
+
+    def errorRate(self):
+        return self.failures / self.samples if self.samples else 0.0
+
+    def score(self):
+        """Expected latency used for ranking; untried backends get the default as an optimistic prior."""
+        if self.samples < MIN_SAMPLES:
+            return DEFAULT_HEDGE_SECONDS
+        median = self.latency.percentile(0.5)
+        if median is None:
+            median = DEFAULT_HEDGE_SECONDS * 10  # only failures so far
+        return median * (1 + ERROR_PENALTY * self.errorRate())
+
+    def __repr__(self):
+        return f"Backend({self.name!r})"
+
+
+def parseBackends(value):
+    """'model' or 'model@baseUrl' entries separated by commas."""
+    backends = []
+    for entry in (value or "").split(","):
+        entry = entry.strip()
+        if entry:
+            model, _, baseUrl = entry.partition("@")
+            backends.append(Backend(model.strip(), baseUrl.strip() or None))
+    return backends
+
+
+class _ProgressGate:
+    """Forwards streamed progress from one attempt only, so hedged duplicates don't both drive the UI."""
+    def __init__(self, onProgress):
+        self.onProgress = onProgress
+        self.owner = None
+        self.lock = threading.Lock()
+
+    def forBackend(self, backend):
+        if self.onProgress is None:
+            return None
+
+        def _progress(kind, value):
+            with self.lock:
+                if self.owner is None:
+                    self.owner = backend
+                if self.owner is not backend:
+                    return
+            self.onProgress(kind, value)
+        return _progress
+
+    def release(self, backend):
+        """A failed attempt gives up the UI; the next one to stream takes it over (events carry the full state)."""
+        with self.lock:
+            if self.owner is backend:
+                self.owner = None
+
+
+class ModelRouter:
+    def __init__(self, backends, hedgeAfter=None):
+        """
+        backends: Backend list in order of preference (getRouter builds it from LLM_BACKENDS).
+        hedgeAfter: seconds before a hedged duplicate is sent; 'auto' uses the primary's p95, 'off' never hedges
+        (failures still fall back to the next backend). Defaults to LLM_HEDGE_AFTER_SECONDS, else 'auto'.
+        """
+        self.backends = list(backends)
+        if not self.backends:
+            raise ValueError("ModelRouter needs at least one backend")
+        self.hedgeAfter = hedgeAfter if hedgeAfter is not None else os.getenv("LLM_HEDGE_AFTER_SECONDS", "auto")
+        self.lock = threading.Lock()
+
+    def ranked(self):
+        """Backends, best first: lowest expected latency, configured order breaking ties."""
+        with self.lock:
+            order = {id(b): i for i, b in enumerate(self.backends)}
+            return sorted(self.backends, key=lambda b: (b.score(), order[id(b)]))
+
+    def hedgeDelay(self, primary):
+        """Seconds to wait on primary before hedging, or None to never hedge."""
+        setting = str(self.hedgeAfter).strip().lower()
+        if setting in ("off", "none", "never"):
+            return None
+        if setting != "auto":
+            try:
+                return max(0.0, float(setting))
+            except ValueError:
+                pass
+        with self.lock:
+            p95 = primary.latency.percentile(0.95) if primary.latency.total >= MIN_SAMPLES else None
+        return p95 if p95 is not None else DEFAULT_HEDGE_SECONDS
+
+    def record(self, backend, seconds, ok):
+        with self.lock:
+            if ok:
+                backend.latency.record(seconds)
+            else:
+                backend.failures += 1
+            if backend.samples >= DECAY_TOTAL:
+                backend.latency.decay()
+                backend.failures /= 2
+
+    def snapshot(self):
+        """Per-backend stats, best first (for logs and load tests)."""
+        ranked = self.ranked()
+        with self.lock:
+            return [{
+                "backend": b.name,
+                "samples": round(b.samples, 1),
+                "p50": b.latency.percentile(0.5),
+                "p95": b.latency.percentile(0.95),
+                "errorRate": round(b.errorRate(), 3),
+                "hedges": b.hedges,
+                "wins": b.wins,
+            } for b in ranked]
+
+    def _finish(self, outcomes):
+        """What to return when no attempt produced a valid response: the last usable value, else raise."""
+        values = [value for ok, value in outcomes if not isinstance(value, BaseException)]
+        if values:
+            return values[-1]
+        raise outcomes[-1][1]
+
+    def run(self, attempt, onProgress=None, isValid=None, deadline=None):
+        """
+        attempt(backend, cancelled, onProgress) performs the request on one backend; cancelled is a
+        threading.Event that should stop it, streamed or not (FeedbackModule drops the connection). Attempts
+        run on their own threads; losers are signalled to stop and their results are discarded. With a
+        submission Deadline the wait for them stops (raising) as soon as it is cancelled or expires; an attempt
+        raising Interrupted stops the run instead of falling back.
+        """
+        isValid = isValid or (lambda value: value is not None)
+        order = self.ranked()
+        gate = _ProgressGate(onProgress)
+        if len(order) == 1:
+            return self._timed(order[0], lambda: attempt(order[0], None, onProgress), isValid)
+
+        results = queue.Queue()
+        cancels = []
+        outcomes = []
+
+        def launch(backend):
+            cancelled = threading.Event()
+            cancels.append(cancelled)
+
+            def _run():
+                started = time.perf_counter()
+                try:
+                    value = attempt(backend, cancelled, gate.forBackend(backend))
+                    ok = isValid(value)
+                except BaseException as e:
+                    value, ok = e, False
+                if isinstance(value, Interrupted):
+                    results.put((backend, ok, value))  # the submission stopped; says nothing about the backend
+                    return
+                if ok or not cancelled.is_set():  # a cancelled stream stops early and says nothing about latency
+                    self.record(backend, time.perf_counter() - started, ok)
+                results.put((backend, ok, value))
+            threading.Thread(target=_run, name=f"llm-{backend.model}", daemon=True).start()
+
+        launch(order[0])
+        nextIndex, pending = 1, 1
+        delay = self.hedgeDelay(order[0])
+        try:
+            hedgeAt = time.monotonic() + delay if delay is not None else None
+            while pending:
+                timeout = hedgeAt - time.monotonic() if hedgeAt is not None and nextIndex < len(order) else None
+                if deadline is not None:
+                    deadline.check()
+                    timeout = POLL_SECONDS if timeout is None else min(timeout, POLL_SECONDS)
+                try:
+                    backend, ok, value = results.get(timeout=max(0.0, timeout) if timeout is not None else None)
+                except queue.Empty:
+                    if hedgeAt is None or time.monotonic() < hedgeAt or nextIndex >= len(order):
+                        continue  # deadline poll
+                    logging.info(f"{order[nextIndex - 1].name} slower than {delay:.1f}s; hedging to {order[nextIndex].name}")
+                    with self.lock:
+                        order[nextIndex].hedges += 1
+                    launch(order[nextIndex])
+                    nextIndex, pending = nextIndex + 1, pending + 1
+                    hedgeAt = time.monotonic() + delay
+                    continue
+                pending -= 1
+                if isinstance(value, Interrupted):
+                    raise value
+                if ok:
+                    with self.lock:
+                        backend.wins += 1
+                    return value
+                outcomes.append((ok, value))
+                gate.release(backend)
+                logging.warning(f"{backend.name} failed ({value if isinstance(value, BaseException) else 'unusable response'})")
+                if pending == 0 and nextIndex < len(order):
+                    launch(order[nextIndex])  # fall back straight away
+                    nextIndex, pending = nextIndex + 1, pending + 1
+                    hedgeAt = time.monotonic() + delay if delay is not None else None
+            return self._finish(outcomes)
+        finally:
+            for cancelled in cancels:
+                cancelled.set()
+
+    def _timed(self, backend, call, isValid):
+        started = time.perf_counter()
+        try:
+            value = call()
+        except Interrupted:
+            raise
+        except BaseException:
+            self.record(backend, time.perf_counter() - started, False)
+            raise
+        self.record(backend, time.perf_counter() - started, isValid(value))
+        return value
+
+    async def runAsync(self, attempt, onProgress=None, isValid=None):
+        """Async counterpart of run: attempt(backend, onProgress) is a coroutine; losing tasks are cancelled."""
+        isValid = isValid or (lambda value: value is not None)
+        order = self.ranked()
+        gate = _ProgressGate(onProgress)
+        if len(order) == 1:
+            started = time.perf_counter()
+            try:
+                value = await attempt(order[0], onProgress)
+            except asyncio.CancelledError:
+                raise
+            except BaseException:
+                self.record(order[0], time.perf_counter() - started, False)
+                raise
+            self.record(order[0], time.perf_counter() - started, isValid(value))
+            return value
+
+        tasks = {}
+        outcomes = []
+
+        def launch(backend):
+            async def _run():
+                started = time.perf_counter()
+                try:
+                    value = await attempt(backend, gate.forBackend(backend))
+                    ok = isValid(value)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    value, ok = e, False
+                self.record(backend, time.perf_counter() - started, ok)
+                return ok, value
+            tasks[asyncio.ensure_future(_run())] = backend
+
+        launch(order[0])
+        nextIndex = 1
+        delay = self.hedgeDelay(order[0])
+        try:
+            while tasks:
+                timeout = delay if delay is not None and nextIndex < len(order) else None
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logging.info(f"{order[nextIndex - 1].name} slower than {timeout:.1f}s; hedging to {order[nextIndex].name}")
+                    with self.lock:
+                        order[nextIndex].hedges += 1
+                    launch(order[nextIndex])
+                    nextIndex += 1
+                    continue
+                for task in done:
+                    backend = tasks.pop(task)
+                    ok, value = task.result()
+                    if ok:
+                        with self.lock:
+                            backend.wins += 1
+                        return value
+                    outcomes.append((ok, value))
+                    gate.release(backend)
+                    logging.warning(f"{backend.name} failed ({value if isinstance(value, BaseException) else 'unusable response'})")
+                if not tasks and nextIndex < len(order):
+                    launch(order[nextIndex])  # fall back straight away
+                    nextIndex += 1
+            return self._finish(outcomes)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.wait(tasks)  # let the losers close their connections before returning
+
+
+_shared = None
+_sharedLock = threading.Lock()
+
+
+def getRouter(defaultModel):
+    """Process-wide router built from LLM_BACKENDS (or just defaultModel), shared by every grading path."""
+    global _shared
+    with _sharedLock:
+        if _shared is None:
+            _shared = ModelRouter(parseBackends(os.getenv("LLM_BACKENDS")) or [Backend(defaultModel)])
+        return _shared
@@ -0,0 +1,170 @@
+"""
+Single-flight deduplication of grading calls. A double-clicked Submit, or the same essay submitted from two
+windows, would otherwise send two identical model calls that compete for the same rate-limit quota. Calls with
+the same key (standard, year, text hash, prompt version; see flightKey) made while one is already running wait
+for it and all receive its result instead. SingleFlight serves threads (the QThread/job workers),
+AsyncSingleFlight coroutines; both count the calls they saved. Every caller gets its own deep copy of a shared
+result, so callers can add to theirs (Metrics, highlighted HTML) without touching the others'.
+"""
+
+# Basic imports
+import copy
+import asyncio
+import hashlib
+import threading
+
+# Custom imports
+from llm.socketing.deadline import Interrupted
+from llm.socketing.telemetry import getTelemetry
+
+POLL_SECONDS = 0.1  # how often a waiting caller checks its own deadline
+
+
+def flightKey(standard, year, userText, promptVersion):
+    """The key under which identical submissions share one call."""
+    return (standard, year, hashlib.sha256(userText.encode("utf-8")).hexdigest(), promptVersion)
+
+
+class _Call():
+    """One running call and the callers waiting on it."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+        self.listeners = []  # onProgress callbacks of waiting callers
+
+
+class SingleFlight():
+    """Thread-safe single flight: do(key, fn) runs fn once per key at a time and shares the result."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.saved = 0
+
+    def do(self, key, fn, deadline=None, onProgress=None):
+        """
+        Run fn(onProgress) unless a call with key is running; then wait for that one instead. Returns
+        (result, shared), shared being True for a waiting caller. A waiting caller gets the running call's
+        progress events from the moment it joined, stops waiting when its own deadline is cancelled or expires
+        (raising like Deadline.check), and runs the call itself if the one it waited on was interrupted (that
+        caller's cancel or deadline is not this one's). Other exceptions reach every caller.
+        """
+        while True:
+            with self.lock:
+                call = self.calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self.calls[key] = _Call()
+                else:
+                    call.waiters += 1
+                    if onProgress is not None:
+                        call.listeners.append(onProgress)
+            if leader:
+                return self._lead(key, call, fn, onProgress), False
+            while not call.done.wait(deadline.limit(POLL_SECONDS) if deadline is not None else POLL_SECONDS):
+                if deadline is not None:
+                    deadline.check()
+            if isinstance(call.error, Interrupted):
+                continue
+            self._saved()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result), True
+
+    def _lead(self, key, call, fn, onProgress):
+        def _progress(kind, value):
+            if onProgress is not None:
+                onProgress(kind, value)
+            with self.lock:
+                listeners = list(call.listeners)
+            for listener in listeners:
+                try:
+                    listener(kind, value)
+                except Exception:
+                    pass  # a waiting caller's UI callback must not break the shared call
+        try:
+            call.result = fn(_progress)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+                waiters = call.waiters
+            call.done.set()
+        return copy.deepcopy(call.result) if waiters else call.result
+
+    def _saved(self):
+        with self.lock:
+            self.saved += 1
+        getTelemetry().record('deduplicated')
+
+    def stats(self):
+        """{'inFlight': calls running now, 'saved': calls answered by another caller's call}."""
+        with self.lock:
+            return {"inFlight": len(self.calls), "saved": self.saved}
+
+
+class AsyncSingleFlight():
+    """SingleFlight for coroutines; calls are shared within one event loop."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}  # (loop, key) -> [Future, waiters]
+        self.saved = 0
+
+    async def do(self, key, fn):
+        """Await fn() unless a call with key is running on this loop; then await that one. Returns (result, shared)."""
+        loop = asyncio.get_running_loop()
+        while True:
+            call = self.calls.get((loop, key))
+            if call is None:
+                return await self._lead(loop, key, fn), False
+            future = call[0]
+            call[1] += 1
+            try:
+                # shield: a waiting caller being cancelled must not cancel the shared call
+                result = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    continue  # the caller running it was cancelled, not this one
+                raise
+            with self.lock:
+                self.saved += 1
+            getTelemetry().record('deduplicated')
+            return copy.deepcopy(result), True
+
+    async def _lead(self, loop, key, fn):
+        future = loop.create_future()
+        call = self.calls[(loop, key)] = [future, 0]
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # retrieved here, so an unawaited future doesn't log it
+            raise
+        else:
+            future.set_result(result)
+            return copy.deepcopy(result) if call[1] else result
+        finally:
+            self.calls.pop((loop, key), None)
+
+    def stats(self):
+        with self.lock:
+            return {"inFlight": len(self.calls), "saved": self.saved}
+
+
+_shared = None
+_sharedLock = threading.Lock()
+
+
+def getSingleFlight():
+    """The process-wide SingleFlight, so FeedbackModule instances in different windows share in-flight calls."""
+    global _shared
+    with _sharedLock:
+        if _shared is None:
+            _shared = SingleFlight()
+        return _shared
@@ -0,0 +1,170 @@
+"""Incremental JSON parser for streamed model output: reports values as soon as they are complete."""
+
+# Basic imports
+import re
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+_LITERALS = {"true": True, "false": False, "null": None}
+# Places where a partially streamed HighlightedHTML can be cut without splitting a paragraph
+_PARAGRAPH_BREAK = re.compile(r'(</p>|<br\s*/?>|\n\s*\n)', re.IGNORECASE)
+
+
+class IncrementalJSONParser():
+    """
+    Push parser for a single JSON object arriving in chunks.
+    onValue(path, value) fires whenever a value (string, number, object...) is complete;
+    onPartial(path, text) fires at the end of each feed() while a string value is still open, with the text
+    added to it during that feed (so a long value is never re-joined on every chunk).
+    Paths are tuples of keys/indices from the root, e.g. ('Output', 'Grade').
+    Leading text before the first '{' (code fences, prose) and anything after the root closes is ignored.
+    Raw newlines inside strings and invalid escapes such as \\' are accepted, since models emit both.
+    """
+    def __init__(self, onValue=None, onPartial=None):
+        self.onValue = onValue
+        self.onPartial = onPartial
+        self.root = None
+        self.done = False
+        self._stack = []        # [container, pendingKey, expectingKey]
+        self._started = False
+        self._inString = False
+        self._escape = None     # None, '' (just saw backslash) or collected \\u hex digits
+        self._buffer = []
+        self._reported = 0      # characters of the open string already passed to onPartial
+        self._scalar = []
+
+    # Public API
+    def feed(self, chunk):
+        """Consume the next chunk of model output."""
+        for ch in chunk:
+            if self.done:
+                break
+            if not self._started:
+                if ch == '{':
+                    self._started = True
+                    self._open({})
+                continue
+            if self._inString:
+                self._stringChar(ch)
+            else:
+                self._structChar(ch)
+        if self._inString and self.onPartial and not self._isKeyString() and len(self._buffer) > self._reported:
+            added = ''.join(self._buffer[self._reported:])
+            self._reported = len(self._buffer)
+            self.onPartial(self._path(), added)
+
+    # Helpers
+    def _path(self):
+        path = []
+        for container, key, _ in self._stack:
+            path.append(len(container) if isinstance(container, list) else key)
+        return tuple(path)
+
+    def _isKeyString(self):
+        return bool(self._stack) and isinstance(self._stack[-1][0], dict) and self._stack[-1][2]
+
+    def _open(self, container):
+        self._stack.append([container, None, isinstance(container, dict)])
+
+    def _emit(self, value):
+        """Store a completed value in its parent and report it."""
+        if not self._stack:
+            return
+        frame = self._stack[-1]
+        container = frame[0]
+        if isinstance(container, dict):
+            if frame[2]:
+                # This was a key
+                frame[1] = value
+                frame[2] = False
+                return
+            path = self._path()
+            container[frame[1]] = value
+            frame[1] = None
+        else:
+            path = self._path()
+            container.append(value)
+        if self.onValue:
+            self.onValue(path, value)
+
+    def _flushScalar(self):
+        if not self._scalar:
+            return
+        token = ''.join(self._scalar).strip()
+        self._scalar = []
+        if not token:
+            return
+        if token in _LITERALS:
+            value = _LITERALS[token]
+        else:
+            try:
+                value = int(token)
+            except ValueError:
+                try:
+                    value = float(token)
+                except ValueError:
+                    value = token  # bare word from a sloppy model: keep it as text
+        self._emit(value)
+
+    def _stringChar(self, ch):
+        if self._escape is not None:
+            if self._escape == '' and ch == 'u':
+                self._escape = 'u'
+            elif self._escape.startswith('u'):
+                self._escape += ch
+                if len(self._escape) == 5:
+                    try:
+                        self._buffer.append(chr(int(self._escape[1:], 16)))
+                    except ValueError:
+                        self._buffer.append(self._escape[1:])
+                    self._escape = None
+            else:
+                self._buffer.append(_ESCAPES.get(ch, ch))
+                self._escape = None
+            return
+        if ch == '\\':
+            self._escape = ''
+        elif ch == '"':
+            self._inString = False
+            value = ''.join(self._buffer)
+            self._buffer = []
+            self._reported = 0
+            self._emit(value)
+        else:
+            self._buffer.append(ch)
+
+    def _structChar(self, ch):
+        if ch == '"':
+            self._flushScalar()
+            self._inString = True
+        elif ch in '{[':
+            self._flushScalar()
+            self._open({} if ch == '{' else [])
+        elif ch in '}]':
+            self._flushScalar()
+            container = self._stack.pop()[0]
+            if self._stack:
+                self._emit(container)
+            else:
+                self.root = container
+                self.done = True
+                if self.onValue:
+                    self.onValue((), container)
+        elif ch == ',':
+            self._flushScalar()
+            if self._stack and isinstance(self._stack[-1][0], dict):
+                self._stack[-1][2] = True
+        elif ch == ':':
+            self._flushScalar()
+        elif not ch.isspace():
+            self._scalar.append(ch)
+
+
+def completedParagraphs(html):
+    """
+    Returns the prefix of a partially streamed HighlightedHTML that ends on a paragraph break,
+    so progressive rendering never shows half a sentence or a half-written tag.
+    """
+    last = None
+    for last in _PARAGRAPH_BREAK.finditer(html):
+        pass
+    return html[:last.end()] if last else ""
@@ -0,0 +1,52 @@
+"""
+Process-wide counters for notable request outcomes (cancelled, timed out, retried, ...).
+Events with an error field are also counted per error class. Every event is logged; the most recent ones are
+kept in memory for load tests and debugging.
+"""
+
+# Basic imports
+import time
+import logging
+import threading
+from collections import Counter, deque
+
+MAX_EVENTS = 200
+
+
+class Telemetry:
+    def __init__(self, maxEvents=MAX_EVENTS):
+        self.counts = Counter()
+        self.errors = Counter()  # "event:ErrorClass"
+        self.events = deque(maxlen=maxEvents)
+        self.lock = threading.Lock()
+
+    def record(self, event, **fields):
+        """Count one event; fields (stage, elapsed seconds, ...) are kept with it."""
+        entry = dict(fields, event=event, at=time.time())
+        with self.lock:
+            self.counts[event] += 1
+            if "error" in fields:
+                self.errors[f"{event}:{fields['error']}"] += 1
+            self.events.append(entry)
+        logging.info(f"Telemetry: {event} {fields}")
+
+    def count(self, event):
+        with self.lock:
+            return self.counts[event]
+
+    def snapshot(self):
+        with self.lock:
+            return {"counts": dict(self.counts), "errors": dict(self.errors), "recent": list(self.events)}
+
+
+_shared = None
+_sharedLock = threading.Lock()
+
+
+def getTelemetry():
+    """Process-wide Telemetry shared by every grading path."""
+    global _shared
+    with _sharedLock:
+        if _shared is None:
+            _shared = Telemetry()
+        return _shared
@@ -27,6 +27,12 @@ from gui.widgets import *
 import gui.widgets as widgets
 from socketing.cookie import CookieManager
 from socketing.session import SessionFileManager
+from llm.socketing.client import warmUp, closeClients
+from llm.socketing.jobqueue import getJobRunner
+from llm.socketing.highlight import migrateHighlightedHTML
+from gui.monitor import getGuiMonitor
+from database.connections import getConnectionProvider
+from database.LLM_database_manage import LLMDatabaseManager
 
 class EventManager(QObject):
     """
@@ -247,7 +253,25 @@ class MainWindow(QMainWindow):
 # Run the app
 if __name__ == "__main__":
     app = QApplication(sys.argv)
+    # Set up the tables once; pages and workers then share their thread's connection (database.connections)
+    db = LLMDatabaseManager()
+    # Submissions saved with inline highlight styles are rewritten to the class form once, here, not on read
+    db.migrateHighlights(migrateHighlightedHTML)
+    db.exit()
+    # Open a pooled LLM connection in the background so the first submission skips TCP/TLS setup
+    if os.getenv("LLM_WARMUP", "1") != "0" and os.getenv("OPENROUTER_API_KEY"):
+        warmUp()
     window = MainWindow()
     window.show()
-    sys.exit(app.exec())
+    # Report whenever the GUI thread is blocked long enough for the window to freeze
+    getGuiMonitor().start()
+    # Grade queued submissions in the background, including any left over from the last run
+    getJobRunner().start()
+    exitCode = app.exec()
+    logging.info(f"GUI thread responsiveness: {getGuiMonitor().stats()}")
+    # Submissions still being graded stay queued and resume on the next start
+    getJobRunner().stop()
+    closeClients()
+    getConnectionProvider().closeThread()
+    sys.exit(exitCode)
 
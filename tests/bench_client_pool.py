@@ -0,0 +1,79 @@
+"""
+Micro-benchmark: per-call overhead of a fresh OpenAI client per submission (old behaviour)
+versus the shared pooled client from llm.socketing.client.
+Runs against a local stand-in HTTP server so no quota is used:
+    python tests/bench_client_pool.py --calls 200
+"""
+
+import os, sys, json, time, argparse, threading, statistics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from openai import OpenAI
+from llm.socketing import client as llmclient
+
+COMPLETION = json.dumps({
+    "id": "bench", "object": "chat.completion", "created": 0, "model": "bench",
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "{}"}}],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}).encode()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True  # avoid 40ms delayed-ACK stalls on reused connections
+    connections = 0
+
+    def setup(self):
+        type(self).connections += 1
+        super().setup()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(COMPLETION)))
+        self.end_headers()
+        self.wfile.write(COMPLETION)
+
+    def log_message(self, *args):
+        pass
+
+
+def _call(client):
+    client.chat.completions.create(model="bench", messages=[{"role": "user", "content": "hi"}])
+
+
+def run(label, calls, makeClient):
+    _Handler.connections = 0
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        _call(makeClient())
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(f"{label:<22} mean {statistics.mean(timings):7.2f} ms   p50 {timings[len(timings) // 2]:7.2f} ms   "
+          f"p95 {timings[int(len(timings) * 0.95) - 1]:7.2f} ms   connections opened: {_Handler.connections}")
+    return statistics.mean(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    baseUrl = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    before = run("fresh client per call", args.calls, lambda: OpenAI(base_url=baseUrl, api_key="bench"))
+    after = run("pooled shared client", args.calls, lambda: llmclient.getClient(baseUrl, "bench"))
+    print(f"per-call overhead saved: {before - after:.2f} ms ({before / after:.1f}x faster)")
+
+    llmclient.closeClients()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
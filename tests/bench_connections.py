@@ -0,0 +1,119 @@
+"""
+Benchmark of the database reads behind page loads, with a new connection and schema setup per operation
+(LLM_DB_POOL=0, how every page used to open the database) and with the shared per-thread connections:
+
+    python tests/bench_connections.py --iterations 500 --report db.json
+
+Each path is timed the way the pages run it: make an LLMDatabaseManager, run the query, exit(). The paths are
+the standards and years lists of the New Submission page, the user's submissions (Submissions page and the
+recent submissions widget) and the standard's rows read by FeedbackModule.loadEntry. Runs against a temporary
+copy of the database, with a few submissions added for the benchmark user.
+"""
+
+# Basic imports
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Custom imports
+from database.connections import getConnectionProvider
+from database.LLM_database_manage import LLMDatabaseManager
+from llm.grade import percentile
+
+SOURCE_DB = "./database/LLM_testdatabase.db"
+USER = "benchmark"
+
+
+def pagePaths(standard, year):
+    """{name: query(db)} for the page-load reads."""
+    return {
+        "standards": lambda db: db.returnAvailableStandards(),
+        "years": lambda db: db.returnAvailableYears(standard),
+        "submissions": lambda db: db.getUserSubmissions(USER),
+        "entry": lambda db: next(e for e in db.readDatabase(standard)["data"] if e["year"] == year),
+    }
+
+
+def timePath(dbPath, query, iterations):
+    """Seconds each of iterations runs of make manager / query / exit took."""
+    seconds = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        db = LLMDatabaseManager(dbPath)
+        try:
+            query(db)
+        finally:
+            db.exit()
+        seconds.append(time.perf_counter() - started)
+    return seconds
+
+
+def summarize(seconds):
+    return {"p50_ms": round(1e3 * percentile(seconds, 50), 4), "p95_ms": round(1e3 * percentile(seconds, 95), 4),
+            "mean_ms": round(1e3 * sum(seconds) / len(seconds), 4)}
+
+
+def runBenchmark(iterations=200, standard="91099", year=2024):
+    """{'perOperation': {path: summary}, 'pooled': {...}, 'speedup': {path: p50 ratio}}."""
+    dbPath = os.path.join(tempfile.mkdtemp(prefix="dbbench-"), "llm.db")
+    shutil.copy(SOURCE_DB, dbPath)
+    poolBefore = os.environ.get("LLM_DB_POOL")
+    summary = {}
+    try:
+        db = LLMDatabaseManager(dbPath)
+        for n in range(10):
+            db.saveSubmission(USER, standard, year, f"Benchmark essay {n}.", {"Output": {}}, "<p>x</p>", "M5")
+        db.exit()
+        # The print() calls in the query methods would dominate the timings
+        with contextlib.redirect_stdout(io.StringIO()):
+            for mode, pool in (("perOperation", "0"), ("pooled", "1")):
+                os.environ["LLM_DB_POOL"] = pool
+                summary[mode] = {name: summarize(timePath(dbPath, query, iterations))
+                                 for name, query in pagePaths(standard, year).items()}
+    finally:
+        if poolBefore is None:
+            os.environ.pop("LLM_DB_POOL", None)
+        else:
+            os.environ["LLM_DB_POOL"] = poolBefore
+        getConnectionProvider().closeThread()
+        shutil.rmtree(os.path.dirname(dbPath), ignore_errors=True)
+    summary["speedup"] = {name: round(summary["perOperation"][name]["p50_ms"] / max(1e-6, values["p50_ms"]), 1)
+                          for name, values in summary["pooled"].items()}
+    summary["iterations"] = iterations
+    return summary
+
+
+def printSummary(summary):
+    print(f"\n--- Page-load database reads ({summary['iterations']} runs each) ---")
+    print(f"{'path':<12} {'per operation p50/p95':>24} {'pooled p50/p95':>20} {'speedup':>8}")
+    for name, pooled in summary["pooled"].items():
+        before = summary["perOperation"][name]
+        print(f"{name:<12} {before['p50_ms']:>10.3f} / {before['p95_ms']:>7.3f} ms "
+              f"{pooled['p50_ms']:>7.3f} / {pooled['p95_ms']:>6.3f} ms {summary['speedup'][name]:>7.1f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200, help="runs of each path per mode (default: 200)")
+    parser.add_argument("--standard", default="91099")
+    parser.add_argument("--year", type=int, default=2024)
+    parser.add_argument("--report", default=None, help="also write the summary to this JSON file")
+    args = parser.parse_args(argv)
+    summary = runBenchmark(max(1, args.iterations), args.standard, args.year)
+    printSummary(summary)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Benchmark: the previous stacked-regex normalize_highlight versus highlight.normalizeHighlights on model-style
+HighlightedHTML of different lengths (both quote styles, <mark>, nested spans and spans with a style):
+    python tests/bench_highlight_normalizer.py --sizes 1000 10000 50000
+"""
+
+import os, sys, re, time, argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm.socketing.highlight import normalizeHighlights, HIGHLIGHT_STYLE
+
+PIECES = [
+    "The film opens on a wide shot of the desert. ",
+    "<span title='Explain how this shot shows Max&apos;s isolation.'>Max stands alone</span> in the frame. ",
+    "<span title=\"Repetition of 'survival' weakens the point.\">survival is everything</span> to him. ",
+    "<mark>The orange grading</mark> makes the world feel hot and empty.<br>",
+    "<span title='Link this to Miller's purpose.' style='background-color: yellow'>Joe controls the water</span>. ",
+    "<span title='Good point'>the <span title='Name the technique'>low angle</span> shot</span> shows power. ",
+]
+
+
+def previousNormalize(html):
+    """What FeedbackModule.normalize_highlight did before the single-pass normalizer."""
+    def _merge_style(match):
+        return f"<span title='{match.group(1)}' style=\"{HIGHLIGHT_STYLE}\">{match.group(2)}</span>"
+
+    html = re.sub(r'<span\s+title="([^\"]+)"\s*>(.*?)</span>', _merge_style, html, flags=re.DOTALL)
+    html = re.sub(r"<span\s+title='([^']+)'\s*>(.*?)</span>", _merge_style, html, flags=re.DOTALL)
+    html = html.replace('<mark>', f"<span style=\"{HIGHLIGHT_STYLE}\">").replace('</mark>', '</span>')
+    html = re.sub(r'<span((?![^>]*style)[^>]*\btitle="[^"]+"[^>]*)>', fr'<span\1 style="{HIGHLIGHT_STYLE}">', html)
+    html = re.sub(r"<span((?![^>]*style)[^>]*\btitle='[^']+'[^>]*)>", fr"<span\1 style=\"{HIGHLIGHT_STYLE}\">", html)
+    return html
+
+
+def makeHTML(chars):
+    parts, size, i = ["<p>"], 3, 0
+    while size < chars:
+        piece = PIECES[i % len(PIECES)]
+        parts.append(piece)
+        size += len(piece)
+        i += 1
+        if i % 12 == 0:
+            parts.append("</p><p>")
+    parts.append("</p>")
+    return "".join(parts)
+
+
+def timeit(normalize, html, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        normalize(html)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="HTML lengths in characters")
+    parser.add_argument("--repeat", type=int, default=50, help="runs per measurement")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        html = makeHTML(size)
+        old, new = timeit(previousNormalize, html, args.repeat), timeit(normalizeHighlights, html, args.repeat)
+        styled = normalizeHighlights(html).count('class="fb"')
+        print(f"\nhtml: {len(html):,} chars, {html.count('<span') + html.count('<mark'):,} highlights ({styled:,} styled)")
+        print(f"  previous   {1e3 * old:8.3f} ms   {len(html) / old / 1e6:6.1f} MB/s")
+        print(f"  one pass   {1e3 * new:8.3f} ms   {len(html) / new / 1e6:6.1f} MB/s   ({old / new:.1f}x)")
+
+    # Unclosed spans: the old non-greedy (.*?)</span> patterns rescan the rest of the document for each one
+    html = makeHTML(50000).replace("</span>", "")
+    old, new = timeit(previousNormalize, html, 5), timeit(normalizeHighlights, html, 5)
+    print(f"\nunclosed spans, {len(html):,} chars: previous {1e3 * old:.1f} ms, one pass {1e3 * new:.1f} ms ({old / new:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
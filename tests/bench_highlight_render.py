@@ -0,0 +1,81 @@
+"""
+Benchmark: stored size and QTextBrowser.setHtml time of highlighted HTML with the highlight style written
+inline on every span (the previous output) versus class="fb" spans styled once by the document stylesheet.
+Uses heavily annotated synthetic essays plus the stored submissions in the test database:
+    QT_QPA_PLATFORM=offscreen python tests/bench_highlight_render.py --sizes 10000 50000
+"""
+
+import os, sys, time, sqlite3, argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PyQt6.QtWidgets import QApplication, QTextBrowser
+
+from llm.socketing.highlight import normalizeHighlights, migrateHighlightedHTML, HIGHLIGHT_STYLE, HIGHLIGHT_STYLESHEET
+
+MARKER = '<span class="fb"'
+_app = None  # the QApplication the QTextBrowsers need, kept alive for the whole run
+SENTENCE = "The wide shot of the empty desert shows how alone Max is after the collapse. "
+
+
+def makeHTML(chars):
+    """A paragraph every six sentences, every other sentence highlighted with a comment."""
+    parts, size, i = [], 0, 0
+    while size < chars:
+        if i % 2:
+            piece = f"<span title='Explain how this shot supports point {i}.'>{SENTENCE}</span>"
+        else:
+            piece = SENTENCE
+        parts.append(piece)
+        size += len(piece)
+        i += 1
+        if i % 6 == 0:
+            parts.append("<br><br>")
+    return normalizeHighlights("".join(parts))
+
+
+def inline(html):
+    """The same HTML in the previous form, with the full style on every highlight."""
+    return html.replace(MARKER, f'<span style="{HIGHLIGHT_STYLE}"')
+
+
+def renderTime(html, stylesheet, repeat):
+    browser = QTextBrowser()
+    browser.document().setDefaultStyleSheet(stylesheet)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        browser.setHtml(html)
+    return (time.perf_counter() - start) / repeat
+
+
+def compare(label, html, repeat):
+    old = inline(html)
+    oldTime, newTime = renderTime(old, "", repeat), renderTime(html, HIGHLIGHT_STYLESHEET, repeat)
+    print(f"\n{label}: {html.count(MARKER):,} highlights")
+    print(f"  inline style   {len(old):8,} chars   setHtml {1e3 * oldTime:7.2f} ms")
+    print(f"  class=\"fb\"     {len(html):8,} chars   setHtml {1e3 * newTime:7.2f} ms"
+          f"   ({100 * (1 - len(html) / len(old)):.0f}% smaller, {oldTime / newTime:.1f}x faster)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000], help="essay lengths in characters")
+    parser.add_argument("--repeat", type=int, default=10, help="renders per measurement")
+    args = parser.parse_args()
+    global _app
+    _app = QApplication.instance() or QApplication(sys.argv)
+
+    for size in args.sizes:
+        compare(f"essay {size:,} chars", makeHTML(size), args.repeat)
+
+    db = sqlite3.connect("file:./database/LLM_testdatabase.db?mode=ro", uri=True)
+    stored = [html for (html,) in db.execute("SELECT highlighted_html FROM submissions") if html]
+    db.close()
+    migrated = [migrateHighlightedHTML(html) for html in stored]
+    print(f"\nstored submissions: {len(stored)} rows, {sum(map(len, stored)):,} chars as stored,"
+          f" {sum(map(len, migrated)):,} after migration")
+    compare("stored submissions (all rows as one document)", "".join(migrated), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
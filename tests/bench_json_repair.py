@@ -0,0 +1,62 @@
+"""
+Benchmark: the previous parsing path (str.replace passes + json.loads) versus jsonrepair.parseModelJSON on the
+corpus of model outputs in tests/data/model_outputs.jsonl. Prints success rate and throughput for each:
+    python tests/bench_json_repair.py --repeat 20
+"""
+
+import os, sys, json, time, argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm.socketing.jsonrepair import parseModelJSON
+
+CORPUS = os.path.join(os.path.dirname(__file__), "data", "model_outputs.jsonl")
+
+
+def previousParse(result):
+    """What FeedbackModule.parseModelOutput did before the repair parser."""
+    result = result.replace("\\'", "'")
+    result = result.replace("‘", "'").replace("’", "'")
+    result = result.replace('\n', '\\n')
+    return json.loads(result)
+
+
+def newParse(result):
+    return parseModelJSON(result)[0]
+
+
+def run(label, parse, cases, repeat):
+    ok = 0
+    for case in cases:
+        try:
+            ok += parse(case["raw"])["Output"]["Grade"] == case["grade"]
+        except (ValueError, KeyError, TypeError):
+            pass
+    size = sum(len(case["raw"]) for case in cases)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for case in cases:
+            try:
+                parse(case["raw"])
+            except ValueError:
+                pass
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<10} parsed {ok:3}/{len(cases)}   {repeat * size / elapsed / 1e6:7.1f} MB/s   {1e3 * elapsed / (repeat * len(cases)):6.3f} ms/output")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20, help="passes over the corpus for the timing")
+    args = parser.parse_args()
+
+    with open(CORPUS, encoding="utf-8") as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+    groups = {"valid input": [c for c in cases if c["name"] == "valid"], "all outputs": cases}
+    for title, group in groups.items():
+        print(f"\n{title}: {len(group)} outputs, {sum(len(c['raw']) for c in group):,} chars")
+        run("previous", previousParse, group, args.repeat)
+        run("repair", newParse, group, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark: full HTML echo (LLM_OUTPUT_MODE=html, single call and chunked) versus compact highlights
+(LLM_OUTPUT_MODE=compact) for essays of different lengths.
+Runs against a local stand-in model that "decodes" at a fixed number of output tokens per second, so the
+measured latency is driven by output size the same way a real model's is, and no quota is used:
+    python tests/bench_output_modes.py --tps 400 --sizes 1000 10000 50000
+"""
+
+import os, sys, json, time, math, argparse, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm.socketing import chunking, compact
+from llm.socketing.handle import FeedbackModule, SYSTEM_MESSAGE
+from llm.socketing.ratelimit import AdaptiveRateLimiter
+
+SENTENCE = "The program stores each mark in a list and a loop adds them up to find the average. "
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    tokensPerSecond = 400.0
+    outputTokens = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        system, prompt = body["messages"][0]["content"], body["messages"][1]["content"]
+        feedback = {"Strengths": "Clear structure.", "Areas for Improvement": "Explain the loop."}
+        if system == SYSTEM_MESSAGE:
+            text = prompt.split("mark the following text: ", 1)[1].split("\n    according to this criteria", 1)[0]
+            output = {"Grade": "M5", "Feedback": feedback, "StudentText": text, "HighlightedHTML": _echo(text)}
+        elif system == chunking.CHUNK_SYSTEM_MESSAGE:
+            text = prompt.split("Highlight this excerpt (part ", 1)[1].split("): ", 1)[1].rstrip()
+            output = {"HighlightedHTML": _echo(text)}
+        elif system == compact.COMPACT_SYSTEM_MESSAGE:
+            text = prompt.split("mark the following text: ", 1)[1].split("\n    according to this criteria", 1)[0]
+            quotes = [p.split(". ")[0] + "." for p in chunking.paragraphsOf(text)]
+            output = {"Grade": "M5", "Feedback": feedback,
+                      "Highlights": [{"quote": q, "comment": "Explain why this step is needed."} for q in quotes]}
+        else:
+            output = {"Grade": "M5", "Feedback": feedback}
+        content = json.dumps({"Output": output})
+        tokens = math.ceil(len(content) / 4)
+        with type(self).lock:
+            type(self).outputTokens += tokens
+        time.sleep(0.05 + tokens / type(self).tokensPerSecond)  # fixed prefill + decode time
+        data = json.dumps({
+            "id": "b", "object": "chat.completion", "created": 0, "model": "b",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def _echo(text):
+    """What an HTML-mode model writes: every paragraph again, with its first sentence highlighted."""
+    parts = []
+    for p in chunking.paragraphsOf(text):
+        first, _, rest = p.partition(". ")
+        parts.append(f"<p><span title='Explain why this step is needed.'>{first}.</span> {rest}</p>")
+    return "".join(parts)
+
+
+def makeEssay(chars):
+    paragraph = SENTENCE * 6
+    count = max(1, round(chars / (len(paragraph) + 2)))
+    return "\n\n".join(paragraph.strip() for _ in range(count))
+
+
+def run(label, essay, env):
+    os.environ.update(env)
+    module = FeedbackModule(useCache=False, limiter=AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=16, statePath=''))
+    _Handler.outputTokens = 0
+    start = time.perf_counter()
+    result = module.handleFullSubmission("91099", "2024", essay)
+    elapsed = time.perf_counter() - start
+    spans = module.returnHighlightedHTML(result).count("<span")
+    print(f"  {label:<16} {elapsed:7.2f} s   output tokens {_Handler.outputTokens:7,}   highlights {spans}")
+    return elapsed, _Handler.outputTokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tps", type=float, default=400.0, help="stand-in model decode speed, output tokens/s")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="essay lengths in characters")
+    args = parser.parse_args()
+
+    _Handler.tokensPerSecond = args.tps
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["OPENROUTER_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ["OPENROUTER_API_KEY"] = "bench"
+
+    for size in args.sizes:
+        essay = makeEssay(size)
+        print(f"\nessay: {len(essay):,} chars")
+        html, htmlTokens = run("html", essay, {"LLM_OUTPUT_MODE": "html", "LLM_CHUNK_THRESHOLD": "100000000"})
+        run("html (chunked)", essay, {"LLM_OUTPUT_MODE": "html", "LLM_CHUNK_THRESHOLD": "6000"})
+        small, smallTokens = run("compact", essay, {"LLM_OUTPUT_MODE": "compact"})
+        print(f"  compact vs html: {html / small:.1f}x faster, {100 * (1 - smallTokens / htmlTokens):.0f}% fewer output tokens")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
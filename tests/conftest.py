@@ -0,0 +1,24 @@
+import os, sys, shutil, tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from database.connections import getConnectionProvider
+
+
+def pytest_configure(config):
+    # Test modules that open the database while they are imported get a copy too
+    path = os.path.join(tempfile.mkdtemp(prefix="llm-tests-"), "llm.db")
+    shutil.copy("./database/LLM_testdatabase.db", path)
+    os.environ["LLM_DB_PATH"] = path
+
+
+@pytest.fixture(autouse=True)
+def llmDatabase(tmp_path, monkeypatch):
+    """Every test gets its own copy of the LLM database (LLM_DB_PATH), so the tracked one is never written."""
+    path = tmp_path / "llm_default.db"
+    shutil.copy("./database/LLM_testdatabase.db", path)
+    monkeypatch.setenv("LLM_DB_PATH", str(path))
+    yield str(path)
+    getConnectionProvider().closeThread()
@@ -0,0 +1,106 @@
+import os, sys, json, time, asyncio, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm.socketing.async_handle import AsyncFeedbackModule
+from llm.socketing.ratelimit import AdaptiveRateLimiter
+
+CONTENT = json.dumps({"Output": {"Grade": "M5", "HighlightedHTML": "<p>ok</p>"}})
+
+
+class _SlowHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    delay = 0.2
+    inFlight = 0
+    maxInFlight = 0
+    rateLimitFirst = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        cls = type(self)
+        with cls.lock:
+            if cls.rateLimitFirst > 0:
+                cls.rateLimitFirst -= 1
+                self._send(429, {"error": {"message": "slow down"}}, {"Retry-After": "0"})
+                return
+            cls.inFlight += 1
+            cls.maxInFlight = max(cls.maxInFlight, cls.inFlight)
+        time.sleep(cls.delay)
+        with cls.lock:
+            cls.inFlight -= 1
+        self._send(200, {
+            "id": "t", "object": "chat.completion", "created": 0, "model": "t",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": CONTENT}}],
+        })
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("OPENROUTER_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    return server
+
+
+def fast_limiter(maxConcurrency):
+    """In-memory limiter that doesn't throttle these tests."""
+    return AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=maxConcurrency, statePath='')
+
+
+def test_grade_runs_concurrently_within_limit(monkeypatch):
+    server = start_server(monkeypatch)
+    _SlowHandler.maxInFlight = 0
+    module = AsyncFeedbackModule(maxConcurrency=4, useCache=False, limiter=fast_limiter(4))
+    essays = [("91099", 2024, f"Essay number {i}") for i in range(8)]
+
+    start = time.perf_counter()
+    results = asyncio.run(module.gradeMany(essays))
+    elapsed = time.perf_counter() - start
+
+    assert all(module.returnGrade(r) == "M5" for r in results)
+    assert _SlowHandler.maxInFlight == 4
+    assert elapsed < 8 * _SlowHandler.delay  # well under the sequential time
+    server.shutdown()
+
+
+def test_rate_limit_backoff_does_not_block_loop(monkeypatch):
+    server = start_server(monkeypatch)
+    _SlowHandler.rateLimitFirst = 1
+    module = AsyncFeedbackModule(maxConcurrency=2, useCache=False, limiter=fast_limiter(2))
+    ticks = []
+
+    async def ticker():
+        for _ in range(5):
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.05)
+
+    async def main():
+        return await asyncio.gather(module.grade("91099", "2024", "Essay"), ticker())
+
+    result, _ = asyncio.run(main())
+    assert module.returnGrade(result) == "M5"
+    assert len(ticks) == 5
+    server.shutdown()
+
+
+def test_input_errors_match_sync_module():
+    module = AsyncFeedbackModule(useCache=False, limiter=fast_limiter(1))
+    assert asyncio.run(module.grade("", 2024, "x"))[0] == "Input Error"
+    assert asyncio.run(module.grade("91099", "twenty", "x"))[1] == "Year must be a number."
+    assert asyncio.run(module.grade("91099", 2024, "   "))[1] == "Please enter student work."
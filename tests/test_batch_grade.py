@@ -0,0 +1,49 @@
+import os, sys, json, asyncio
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm import grade as batch
+from llm.socketing.async_handle import AsyncFeedbackModule
+
+
+def fake_grade(calls):
+    async def _grade(self, standard, year, userInput, stream=False, onProgress=None, username=None):
+        calls.append(userInput)
+        await asyncio.sleep(0.01)
+        if "broken" in userInput:
+            return ['JSON Error', 'Expecting value']
+        return {"Output": {"Grade": "A4", "HighlightedHTML": f"<p>{userInput}</p>"}}
+    return _grade
+
+
+def write_essays(folder, names):
+    for name in names:
+        (folder / name).write_text(f"essay {name}", encoding="utf-8")
+
+
+def test_grades_folder_and_resumes(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(AsyncFeedbackModule, "grade", fake_grade(calls))
+    essays = tmp_path / "essays"
+    essays.mkdir()
+    write_essays(essays, ["a.txt", "b.txt", "broken.txt", "notes.md"])
+    report = tmp_path / "report.jsonl"
+    argv = ["--standard", "91099", "--year", "2024", "--no-db", "--no-cache",
+            "--concurrency", "2", "--report", str(report), str(essays)]
+
+    assert batch.main(argv) == 1  # one essay failed
+    rows = [json.loads(line) for line in report.read_text().splitlines()]
+    assert sorted(r["status"] for r in rows) == ["error", "ok", "ok"]
+    assert len(calls) == 3
+
+    # Second run only retries the failure
+    calls.clear()
+    batch.main(argv)
+    assert calls == ["essay broken.txt"]
+
+
+def test_percentile():
+    values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+    assert batch.percentile(values, 50) == 5
+    assert batch.percentile(values, 95) == 10
+    assert batch.percentile([], 50) == 0.0
@@ -0,0 +1,122 @@
+import os, sys, json, time, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm.socketing.handle import FeedbackModule
+from llm.socketing.ratelimit import AdaptiveRateLimiter
+from llm.socketing.router import ModelRouter, Backend
+from llm.socketing.deadline import Deadline, DeadlineExceeded, SubmissionCancelled
+from llm.socketing.telemetry import getTelemetry
+
+CONTENT = json.dumps({"Output": {"Grade": "M5", "Feedback": {}, "HighlightedHTML": "<p>Essay</p>"}})
+
+
+class _StallHandler(BaseHTTPRequestHandler):
+    """Streams a completion very slowly, or answers 500 when failing is set."""
+    protocol_version = "HTTP/1.0"  # the stream ends when the connection closes
+    disable_nagle_algorithm = True
+    chunkDelay = 0.5
+    failing = False
+    calls = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        type(self).calls += 1
+        try:
+            if type(self).failing:
+                data = b'{"error": {"message": "down"}}'
+                self.send_response(500)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+            if not body.get("stream"):
+                time.sleep(type(self).chunkDelay * 10)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for i in range(0, len(CONTENT), 5):
+                chunk = {"id": "t", "object": "chat.completion.chunk", "created": 0, "model": "t",
+                         "choices": [{"index": 0, "delta": {"content": CONTENT[i:i + 5]}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(type(self).chunkDelay)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except OSError:
+            pass  # the client hung up
+
+    def log_message(self, *args):
+        pass
+
+
+def make_module(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StallHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("OPENROUTER_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    monkeypatch.setenv("LLM_JSON_FIX_REQUEST", "0")
+    _StallHandler.failing, _StallHandler.calls = False, 0
+    limiter = AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=4, statePath='')
+    module = FeedbackModule(useCache=False, limiter=limiter, router=ModelRouter([Backend("t")]))
+    return module, server
+
+
+def test_deadline_stops_a_stalled_stream(monkeypatch):
+    module, server = make_module(monkeypatch)
+    before = getTelemetry().count("timedOut")
+    start = time.perf_counter()
+    result = module.handleFullSubmission("91099", 2024, "Essay", stream=True, deadline=Deadline(0.8))
+    assert result[0] == "Timed Out"
+    assert time.perf_counter() - start < 2.0
+    assert getTelemetry().count("timedOut") == before + 1
+    server.shutdown()
+
+
+def test_deadline_covers_retry_backoff(monkeypatch):
+    module, server = make_module(monkeypatch)
+    _StallHandler.failing = True
+    start = time.perf_counter()
+    result = module.handleFullSubmission("91099", 2024, "Essay", deadline=Deadline(0.5))
+    assert result[0] == "Timed Out"
+    assert time.perf_counter() - start < 1.5  # the full retry schedule would take several seconds
+    assert _StallHandler.calls < 5
+    server.shutdown()
+
+
+def test_cancel_from_another_thread_stops_the_request(monkeypatch):
+    module, server = make_module(monkeypatch)
+    before = getTelemetry().count("cancelled")
+    deadline = Deadline(60)
+    progress = []
+    threading.Timer(0.6, deadline.cancel).start()
+    start = time.perf_counter()
+    result = module.handleFullSubmission("91099", 2024, "Essay", stream=True, deadline=deadline,
+                                         onProgress=lambda kind, value: progress.append(kind))
+    assert result == ['Cancelled', 'The submission was cancelled.']
+    assert time.perf_counter() - start < 2.0
+    assert getTelemetry().count("cancelled") == before + 1
+    assert getTelemetry().snapshot()["recent"][-1]["standard"] == "91099"
+    server.shutdown()
+
+
+def test_deadline_sleep_wakes_on_cancel():
+    deadline = Deadline()
+    assert deadline.remaining() is None and deadline.limit(5) == 5
+    threading.Timer(0.1, deadline.cancel).start()
+    start = time.perf_counter()
+    try:
+        deadline.sleep(5)
+        assert False, "sleep should raise once cancelled"
+    except SubmissionCancelled:
+        pass
+    assert time.perf_counter() - start < 1.0
+    expired = Deadline(0.05)
+    time.sleep(0.06)
+    assert expired.is_set()
+    try:
+        expired.check()
+        assert False, "check should raise once expired"
+    except DeadlineExceeded:
+        pass
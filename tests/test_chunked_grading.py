@@ -0,0 +1,171 @@
+import os, sys, json, time, asyncio, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm.socketing import chunking
+from llm.socketing.handle import FeedbackModule
+from llm.socketing.async_handle import AsyncFeedbackModule
+from llm.socketing.ratelimit import AdaptiveRateLimiter
+from llm.socketing.cache import ResponseCache
+
+SECONDS_PER_CHAR = 0.0002  # stand-in model: latency grows with the text it has to reproduce
+
+
+class _ChunkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    failPart = None
+    lock = threading.Lock()
+    inFlight = 0
+    peakInFlight = 0  # most requests being answered at once
+
+    def do_POST(self):
+        cls = type(self)
+        with cls.lock:
+            cls.inFlight += 1
+            cls.peakInFlight = max(cls.peakInFlight, cls.inFlight)
+        try:
+            self._answer()
+        finally:
+            with cls.lock:
+                cls.inFlight -= 1
+
+    def _answer(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        system, prompt = body["messages"][0]["content"], body["messages"][1]["content"]
+        if system == chunking.GRADE_SYSTEM_MESSAGE:
+            time.sleep(0.05)
+            content = {"Output": {"Grade": "M6", "Feedback": {"Strengths": "s", "Areas for Improvement": "a"}}}
+        else:
+            marker = "Highlight this excerpt (part "
+            part = int(prompt.split(marker)[1].split(")")[0])
+            excerpt = prompt.split(marker)[1].split("): ", 1)[1].rstrip()
+            time.sleep(len(excerpt) * SECONDS_PER_CHAR)
+            if part == type(self).failPart:
+                content = "not json at all {"
+            else:
+                content = {"Output": {"HighlightedHTML": f"<p data-part='{part}'>{excerpt}</p>"}}
+        message = content if isinstance(content, str) else json.dumps(content)
+        data = json.dumps({
+            "id": "t", "object": "chat.completion", "created": 0, "model": "t",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": message}}],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ChunkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("OPENROUTER_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    monkeypatch.setenv("LLM_CHUNK_THRESHOLD", "2000")
+    monkeypatch.setenv("LLM_CHUNK_CHARS", "1000")
+    return server
+
+
+def fast_limiter():
+    return AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=16, statePath='')
+
+
+def make_essay(paragraphs=8):
+    return "\n\n".join(f"Paragraph {i} begins here. " + "More words follow. " * 45 for i in range(paragraphs))
+
+
+ENTRY = {"schedule": "s", "criteria": "c", "question": "q", "exemplars": {"exemplars": []}}
+
+
+def test_split_keeps_paragraph_order_and_size():
+    essay = make_essay()
+    chunks = chunking.splitParagraphs(essay, 1000)
+    assert len(chunks) == 8
+    assert all(len(c) <= 1000 for c in chunks)
+    assert "\n\n".join(chunks) == "\n\n".join(p.strip() for p in essay.split("\n\n"))
+    assert chunking.summarize(chunks).startswith("[1] Paragraph 0 begins here.")
+
+
+def test_oversized_paragraph_is_split_on_sentences():
+    chunks = chunking.splitParagraphs("One sentence here. " * 200, 500)
+    assert all(len(c) <= 500 for c in chunks)
+    assert " ".join(chunks) == ("One sentence here. " * 200).strip()
+
+
+def test_chunks_graded_in_parallel_and_stitched_in_order(monkeypatch):
+    server = start_server(monkeypatch)
+    _ChunkHandler.failPart = None
+    _ChunkHandler.peakInFlight = 0
+    essay = make_essay()
+    events = []
+    module = FeedbackModule(useCache=False, limiter=fast_limiter())
+
+    result = module.gradeChunked(ENTRY, essay, lambda kind, value: events.append(kind))
+
+    html = result["Output"]["HighlightedHTML"]
+    positions = [html.index(f"data-part='{i}'") for i in range(1, 9)]
+    assert positions == sorted(positions)
+    assert result["Output"]["Grade"] == "M6"
+    assert result["Output"]["StudentText"] == essay
+    assert _ChunkHandler.peakInFlight >= 2  # the chunk requests overlapped instead of running one by one
+    assert "grade" in events and "highlight" in events
+    server.shutdown()
+
+
+def test_failed_chunk_falls_back_to_plain_text(monkeypatch):
+    server = start_server(monkeypatch)
+    _ChunkHandler.failPart = 2
+    essay = make_essay(4)
+    result = FeedbackModule(useCache=False, limiter=fast_limiter()).gradeChunked(ENTRY, essay)
+    html = result["Output"]["HighlightedHTML"]
+    assert "<p>Paragraph 1 begins here." in html
+    assert "data-part='1'" in html and "data-part='3'" in html
+    _ChunkHandler.failPart = None
+    server.shutdown()
+
+
+def test_failed_chunk_is_not_stored_as_paragraph_feedback(monkeypatch):
+    server = start_server(monkeypatch)
+    _ChunkHandler.failPart = 2
+    essay = make_essay(4)
+    module = FeedbackModule(useCache=False, limiter=fast_limiter())
+    result = module.gradeChunked(ENTRY, essay)
+    assert chunking.chunkHighlight("not json", "A.\n\nB.") == ("<p>A.</p><p>B.</p>", True)
+    assert result["Reuse"]["failed"] == [1]
+    # The plain fallback lines up with paragraph 1, but it must be highlighted again next time
+    assert [record["index"] for record in module.paragraphRecords(essay, result)] == [0, 2, 3]
+    _ChunkHandler.failPart = None
+    server.shutdown()
+
+
+def test_result_with_a_failed_chunk_is_not_cached(monkeypatch, tmp_path):
+    server = start_server(monkeypatch)
+    cache = ResponseCache(dbPath=str(tmp_path / "cache.db"))
+    module = FeedbackModule(cache=cache, limiter=fast_limiter())
+    monkeypatch.setattr(module, "loadEntry", lambda standard, year: (ENTRY, None))
+    _ChunkHandler.failPart = 2
+    module.handleFullSubmission("91099", 2024, make_essay(4))
+    assert cache.stats()["entries"] == 0
+    _ChunkHandler.failPart = None
+    module.handleFullSubmission("91099", 2024, make_essay(4))
+    assert cache.stats()["entries"] == 1
+    cache.exit()
+    server.shutdown()
+
+
+def test_async_grade_uses_chunked_mode(monkeypatch):
+    server = start_server(monkeypatch)
+    _ChunkHandler.failPart = None
+    essay = make_essay()
+    module = AsyncFeedbackModule(useCache=False, limiter=fast_limiter())
+    monkeypatch.setattr(module, "loadEntry", lambda standard, year: (ENTRY, None))
+    result = asyncio.run(module.grade("91099", 2024, essay))
+    html = result["Output"]["HighlightedHTML"]
+    assert [html.index(f"data-part='{i}'") for i in range(1, 9)] == sorted(html.index(f"data-part='{i}'") for i in range(1, 9))
+    assert result["Output"]["Grade"] == "M6"
+    server.shutdown()
@@ -0,0 +1,99 @@
+import os, sys, json, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm.socketing import compact
+from llm.socketing.handle import FeedbackModule
+from llm.socketing.ratelimit import AdaptiveRateLimiter
+
+TEXT = "Loops repeat code. I used a for loop.\n\nMy function returns <the> total & average."
+
+
+def test_quotes_offsets_and_fuzzy_matches_are_placed():
+    spans = compact.locateHighlights(TEXT, [
+        {"quote": "I used a for loop.", "comment": "Say why."},
+        {"start": 0, "end": 5, "comment": "Define loops."},
+        {"quote": "my FUNCTION   returns", "comment": "Fuzzy match."},
+        {"quote": "not in the text", "comment": "Dropped."},
+        {"quote": "Loops repeat", "comment": "Overlaps the offset highlight, dropped."},
+        {"quote": "total", "comment": ""},
+    ])
+    assert [(TEXT[s:e], c) for s, e, c in spans] == [
+        ("Loops", "Define loops."), ("I used a for loop.", "Say why."), ("My function returns", "Fuzzy match."),
+    ]
+
+
+def test_render_escapes_text_and_keeps_paragraphs():
+    html = compact.renderHighlightedHTML(TEXT, [{"quote": "<the> total", "comment": "Don't use 'tags'"}])
+    assert html.startswith("<p>Loops repeat code. I used a for loop.</p><p>")
+    assert "<span title='Don&#x27;t use &#x27;tags&#x27;'>&lt;the&gt; total</span> &amp; average.</p>" in html
+
+
+def test_highlight_across_paragraphs_is_split():
+    html = compact.renderHighlightedHTML("One two.\n\nThree four.", [{"start": 4, "end": 15, "comment": "c"}])
+    assert html == "<p>One <span title='c'>two.</span></p><p><span title='c'>Three</span> four.</p>"
+
+
+def test_expand_keeps_html_mode_rows_unchanged():
+    stored = {"Output": {"Grade": "A4", "HighlightedHTML": "<p>old</p>"}}
+    assert compact.expandCompact(stored, "old") is stored
+    expanded = compact.expandCompact({"Output": {"Grade": "M5", "Highlights": [{"quote": "Loops", "comment": "c"}]}}, TEXT)
+    assert expanded["Output"]["StudentText"] == TEXT
+    assert expanded["Output"]["HighlightedHTML"].startswith("<p><span title='c'>Loops</span>")
+
+
+def test_streamed_highlight_items_render_progressively(monkeypatch):
+    monkeypatch.setenv("LLM_OUTPUT_MODE", "compact")
+    module = FeedbackModule(useCache=False)
+    events = []
+    parser = module._makeStreamParser(module._compactProgress(TEXT, lambda kind, value: events.append((kind, value))))
+    payload = json.dumps({"Output": {"Grade": "M5", "Highlights": [
+        {"quote": "Loops", "comment": "a"}, {"quote": "for loop", "comment": "b"}]}})
+    for i in range(0, len(payload), 7):
+        parser.feed(payload[i:i + 7])
+    highlights = [value for kind, value in events if kind == "highlight"]
+    assert ("grade", "M5") in events
+    assert len(highlights) == 2
+    assert highlights[0].count("<span") == 1 and highlights[1].count("<span") == 2
+
+
+class _CompactHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    systems = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        type(self).systems.append(body["messages"][0]["content"])
+        content = json.dumps({"Output": {"Grade": "E7", "Feedback": {"Strengths": "s", "Areas for Improvement": "a"},
+                                         "Highlights": [{"quote": "Loops", "comment": "Define it"}]}})
+        data = json.dumps({
+            "id": "t", "object": "chat.completion", "created": 0, "model": "t",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_compact_mode_end_to_end(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _CompactHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("OPENROUTER_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    monkeypatch.setenv("LLM_OUTPUT_MODE", "compact")
+    monkeypatch.setenv("LLM_CHUNK_THRESHOLD", "10")  # compact mode never needs chunking
+    module = FeedbackModule(useCache=False, limiter=AdaptiveRateLimiter(ratePerMinute=60000, statePath=''))
+
+    result = module.handleFullSubmission("91099", "2024", TEXT)
+
+    assert _CompactHandler.systems == [compact.COMPACT_SYSTEM_MESSAGE]
+    assert module.returnGrade(result) == "E7"
+    assert 'title="Define it"' in module.returnHighlightedHTML(result)
+    server.shutdown()
@@ -0,0 +1,55 @@
+import os, sys, shutil, threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from database.connections import getConnectionProvider
+from database.LLM_database_manage import LLMDatabaseManager
+from llm.socketing.handle import FeedbackModule
+from tests import bench_connections
+
+
+@pytest.fixture
+def dbPath(tmp_path):
+    path = tmp_path / "llm.db"
+    shutil.copy("./database/LLM_testdatabase.db", path)
+    yield str(path)
+    getConnectionProvider().closeThread()
+
+
+def test_managers_share_their_threads_connection_and_set_up_once(dbPath, monkeypatch):
+    setups = []
+    original = LLMDatabaseManager.createTables
+    monkeypatch.setattr(LLMDatabaseManager, "createTables", lambda self: setups.append(1) or original(self))
+    first = LLMDatabaseManager(dbPath)
+    first.exit()
+    second = LLMDatabaseManager(dbPath)
+    assert second.connection is first.connection and len(setups) == 1
+    assert "91099" in second.returnAvailableStandards()  # still open after the first manager's exit()
+    other = []
+    thread = threading.Thread(target=lambda: other.append(LLMDatabaseManager(dbPath).connection))
+    thread.start()
+    thread.join()
+    assert other[0] is not second.connection and len(setups) == 1
+    # LLM_DB_POOL=0: a connection and the schema setup per manager, closed by exit()
+    monkeypatch.setenv("LLM_DB_POOL", "0")
+    unpooled = LLMDatabaseManager(dbPath)
+    assert unpooled.connection is not second.connection and len(setups) == 2
+    unpooled.exit()
+    with pytest.raises(Exception):
+        unpooled.returnAvailableStandards()
+
+
+def test_load_entry_does_not_need_the_tests_package(dbPath, monkeypatch):
+    monkeypatch.setenv("LLM_DB_PATH", dbPath)
+    monkeypatch.setitem(sys.modules, "tests.test_languagemodel", None)  # any import of it now fails
+    entry, error = FeedbackModule(useCache=False).loadEntry("91099", 2024)
+    assert error is None and entry["year"] == 2024 and entry["criteria"]
+
+
+def test_benchmark_compares_both_modes():
+    summary = bench_connections.runBenchmark(iterations=5)
+    assert set(summary["pooled"]) == set(summary["perOperation"]) == {"standards", "years", "submissions", "entry"}
+    assert all(values["p50_ms"] > 0 for values in summary["pooled"].values())
+    assert os.getenv("LLM_DB_POOL") is None
@@ -0,0 +1,178 @@
+import os, sys, json, time, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.LLM_database_manage import ExemplarInterpet
+from llm.mockserver import MockLLMServer
+from llm.socketing import chunking
+from llm.socketing.deadline import Deadline
+from llm.socketing.ensemble import Consensus, agreeCount
+from llm.socketing.handle import FeedbackModule
+from llm.socketing.ratelimit import AdaptiveRateLimiter
+from llm.socketing.router import ModelRouter, Backend
+from llm.socketing.singleflight import SingleFlight
+
+ESSAY = "My answer uses recursion with a base case.\n\nIt also uses memoisation."
+
+
+def make_module():
+    limiter = AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=8, statePath='')
+    return FeedbackModule(useCache=False, limiter=limiter, router=ModelRouter([Backend("mock")]), singleFlight=SingleFlight())
+
+
+def output(grade, feedback="sample", html=None):
+    inner = {"Grade": grade, "Feedback": {"Strengths": feedback}}
+    if html is not None:
+        inner["HighlightedHTML"] = html
+    return {"Output": inner}
+
+
+def test_grade_bands_follow_the_exemplar_mapping():
+    assert [ExemplarInterpet.gradeBand(g) for g in ("N0", "A4", "m6", "Merit (M5)", "E8", "Not Achieved", "achieved")] == \
+        ["Not Achieved", "Achieved", "Merit", "Merit", "Excellence", "Not Achieved", "Achieved"]
+    assert ExemplarInterpet.gradeBand("B+") is None
+    assert agreeCount(5) == 3 and agreeCount(1) == 1
+
+
+def test_consensus_picks_the_agreed_band_and_its_most_common_grade():
+    consensus = Consensus(5, 3)
+    consensus.add(output("M6", "first merit"))
+    consensus.add(output("A4"))
+    consensus.add(output("M5"))
+    assert consensus.agreed() is None
+    consensus.add(output("M5", html="<p>x</p>"), full=True)
+    consensus.add("not json")
+    assert consensus.agreed() == "Merit"
+    band, grade, feedback = consensus.decide()
+    assert (band, grade) == ("Merit", "M5") and "HighlightedHTML" in feedback["Output"]
+    report = consensus.report(band, cancelled=0)
+    assert report["votes"] == {"Merit": 3, "Achieved": 1} and report["failed"] == 1 and report["agreement"] == 3
+    # Without agreement the full sample breaks the tie
+    tie = Consensus(3, 3)
+    tie.add(output("A3"))
+    tie.add(output("E7", "full"), full=True)
+    assert tie.decide()[:2] == ("Excellence", "E7")
+
+
+def test_early_agreement_cancels_the_slow_samples(monkeypatch):
+    monkeypatch.setenv("LLM_ENSEMBLE_SAMPLES", "5")
+    monkeypatch.setenv("LLM_ENSEMBLE_AGREE", "3")
+    module = make_module()
+    grades = iter(["M5", "M5", "SLOW", "SLOW"])
+    lock = threading.Lock()
+    cancelled = []
+
+    def fake(messages, stream=False, onProgress=None, deadline=None, metrics=None):
+        if messages[0]["content"] == chunking.GRADE_SYSTEM_MESSAGE:
+            with lock:
+                grade = next(grades)
+            if grade == "SLOW":
+                try:
+                    deadline.sleep(5)
+                except Exception:
+                    cancelled.append(True)
+                    raise
+            time.sleep(0.05)
+            return json.dumps(output(grade, f"grade-only {grade}"))
+        time.sleep(0.3)
+        if onProgress:
+            onProgress('grade', "M6")
+            onProgress('highlight', "<p>highlighted</p>")
+        return json.dumps(output("M6", "full", "<p>highlighted</p>"))
+    monkeypatch.setattr(module, "requestCompletion", fake)
+    monkeypatch.setattr(module, "loadEntry", lambda standard, year: (
+        {"year": 2024, "question": "Q", "schedule": "S", "criteria": "C", "exemplars": {"exemplars": []}}, None))
+    events = []
+    started = time.perf_counter()
+    result = module.handleFullSubmission("91099", 2024, ESSAY, stream=True, onProgress=lambda kind, value: events.append((kind, value)))
+    elapsed = time.perf_counter() - started
+    assert elapsed < 1.5  # close to the single full call, not the slow sample
+    time.sleep(0.1)
+    assert cancelled == [True, True]
+    assert module.returnGrade(result) == "M5"  # the grade-only samples' M5 outvotes the full sample's M6
+    report = result["Ensemble"]
+    assert report["cancelled"] == 2 and report["stoppedEarly"] and report["votes"] == {"Merit": 3}
+    assert result["Output"]["HighlightedHTML"] == "<p>highlighted</p>"
+    assert result["Output"]["Feedback"] == {"Strengths": "full"}
+    # Only the agreed grade is reported, not the full sample's own
+    assert ("grade", "M6") not in events and ("grade", "M5") in events and ("highlight", "<p>highlighted</p>") in events
+    assert module.takeMetrics(result)["mode"] == "ensemble"
+
+
+def test_ensemble_against_the_mock_server(monkeypatch):
+    server = MockLLMServer(latency="fixed:0.05", tokensPerSecond=4000).start()
+    monkeypatch.setenv("OPENROUTER_BASE_URL", server.url)
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    monkeypatch.setenv("LLM_ENSEMBLE_SAMPLES", "3")
+    try:
+        result = make_module().handleFullSubmission("91099", 2024, ESSAY, deadline=Deadline(30))
+    finally:
+        server.stop()
+    assert result["Output"]["Grade"] == "M5" and result["Output"]["HighlightedHTML"]
+    assert result["Ensemble"]["votes"] == {"Merit": result["Ensemble"]["agreement"]} and result["Ensemble"]["agreement"] >= 2
+    assert server.stats()["requests"] == 3
+
+
+class _VoteHandler(BaseHTTPRequestHandler):
+    """The full request and the first two grade-only ones answer at once; later grade-only streams stall."""
+    protocol_version = "HTTP/1.1"
+    lock = threading.Lock()
+    gradeOnly = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        cls = type(self)
+        if body["messages"][0]["content"] == chunking.GRADE_SYSTEM_MESSAGE:
+            with cls.lock:
+                cls.gradeOnly += 1
+                stall = cls.gradeOnly > 2
+            reply = json.dumps(output("M5", "grade-only"))
+        else:
+            stall, reply = False, json.dumps(output("M6", "full", "<p>highlighted</p>"))
+        try:
+            if not body.get("stream"):
+                data = json.dumps({"id": "t", "object": "chat.completion", "created": 0, "model": "t", "choices": [
+                    {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": reply}}]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.flush()
+            time.sleep(10 if stall else 0.05)
+            chunk = {"id": "t", "object": "chat.completion.chunk", "created": 0, "model": "t",
+                     "choices": [{"index": 0, "delta": {"content": reply}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode())
+        except OSError:
+            pass  # the client hung up
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+def test_cancelled_samples_are_dropped_on_the_wire(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _VoteHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("OPENROUTER_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    monkeypatch.setenv("LLM_ENSEMBLE_SAMPLES", "5")
+    monkeypatch.setenv("LLM_ENSEMBLE_AGREE", "3")
+    _VoteHandler.gradeOnly = 0
+    module = make_module()
+    try:
+        result = module.handleFullSubmission("91099", 2024, ESSAY, deadline=Deadline(30))
+        done = time.perf_counter()
+        # The stalled samples give back their limiter slots long before their answers would arrive
+        while module.limiter.snapshot()["inFlight"] and time.perf_counter() - done < 5:
+            time.sleep(0.02)
+        assert module.limiter.snapshot()["inFlight"] == 0 and time.perf_counter() - done < 1.0
+    finally:
+        server.shutdown()
+    assert module.returnGrade(result) == "M5" and result["Ensemble"]["cancelled"] == 2
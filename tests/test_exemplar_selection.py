@@ -0,0 +1,57 @@
+import os, sys, json
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm.socketing.exemplars import BM25Index, selectExemplars, selectionStats
+from llm.socketing.handle import FeedbackModule
+
+
+def make_exemplars():
+    topics = [
+        ("N1", "loops repeat code"), ("N2", "variables store data"),
+        ("A3", "functions return values"), ("A4", "loops iterate over a list"),
+        ("M5", "recursion calls itself with a base case"), ("M6", "classes bundle data and methods"),
+        ("E7", "recursion depth and memoisation trade offs"), ("E8", "algorithm complexity big o analysis"),
+    ]
+    return {"exemplars": [
+        {"Exemplar": f"The student explains {text}. " * 20, "Grade": grade, "Feedback": f"Comment on {text}."}
+        for grade, text in topics
+    ]}
+
+
+def test_bm25_prefers_matching_document():
+    index = BM25Index(["the cat sat on the mat", "recursion needs a base case", "lists hold items"])
+    scores = index.scores("my recursive function has a base case")
+    assert scores.index(max(scores)) == 1
+
+
+def test_keeps_one_exemplar_per_grade_band_and_top_matches():
+    data = make_exemplars()
+    selected, report = selectExemplars(data, "My answer uses recursion with a base case and memoisation", k=5)
+    grades = [e["Grade"] for e in selected["exemplars"]]
+    assert len(grades) == 5
+    assert {g[0] for g in grades} == {"N", "A", "M", "E"}
+    assert "M5" in grades and "E7" in grades  # the recursion exemplars win their bands
+    assert grades == sorted(grades, key=[e["Grade"] for e in data["exemplars"]].index)  # original order kept
+    assert report["total"] == 8 and report["selected"] == 5
+    assert report["tokensSaved"] == report["tokensBefore"] - report["tokensAfter"] > 0
+
+
+def test_small_sets_are_unchanged():
+    data = {"exemplars": [{"Exemplar": "x", "Grade": "A4", "Feedback": "y"}]}
+    selected, report = selectExemplars(data, "anything", k=4)
+    assert selected is data
+    assert report["tokensSaved"] == 0
+
+
+def test_prompt_uses_selected_exemplars(monkeypatch):
+    monkeypatch.setenv("LLM_EXEMPLAR_TOP_K", "4")
+    entry = {"schedule": "s", "criteria": "c", "question": "q", "exemplars": make_exemplars()}
+    before = selectionStats()["tokensSaved"]
+    prompt = FeedbackModule(useCache=False).buildMessages(entry, "complexity analysis in big o")[1]["content"]
+    assert "big o analysis" in prompt
+    assert prompt.count('"Grade"') == 4
+    assert selectionStats()["tokensSaved"] > before
+    monkeypatch.setenv("LLM_EXEMPLAR_TOP_K", "0")
+    full = FeedbackModule(useCache=False).buildMessages(entry, "complexity analysis in big o")[1]["content"]
+    assert json.dumps(entry["exemplars"]) in full
@@ -0,0 +1,83 @@
+import os, sys, shutil
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from llm.mockserver import MockLLMServer
+from llm.socketing.handle import FeedbackModule
+from llm.socketing.metrics import GradingMetrics, tokenPrices
+from llm.socketing.ratelimit import AdaptiveRateLimiter
+from llm.socketing.router import ModelRouter, Backend
+from database.LLM_database_manage import LLMDatabaseManager
+
+ESSAY = "One point. More text.\n\nSecond point. Even more."
+
+
+@pytest.fixture
+def mock_module(monkeypatch):
+    server = MockLLMServer(latency="fixed:0.02", tokensPerSecond=0, seed=1).start()
+    monkeypatch.setenv("OPENROUTER_BASE_URL", server.url)
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    monkeypatch.setenv("LLM_TOKEN_PRICES", "mock=1000/2000")
+    limiter = AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=4, statePath='')
+    yield FeedbackModule(useCache=False, limiter=limiter, router=ModelRouter([Backend("mock")]))
+    server.stop()
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_result_carries_stage_timings_and_reported_usage(mock_module, stream):
+    result = mock_module.handleFullSubmission("91099", 2024, ESSAY, stream=stream)
+    mock_module.returnHighlightedHTML(result)
+    metrics = mock_module.takeMetrics(result)
+    assert 'Metrics' not in result and mock_module.returnGrade(result) == "M5"
+    assert metrics["mode"] == "single" and metrics["model"] == "mock"
+    assert metrics["requests"] == 1 and metrics["retries"] == 0 and metrics["usage_reported"] == 1
+    assert metrics["prompt_tokens"] > 0 and metrics["completion_tokens"] > 0
+    assert metrics["cost_usd"] == pytest.approx((metrics["prompt_tokens"] * 1000 + metrics["completion_tokens"] * 2000) / 1e6)
+    for stage in ("db_read_s", "prompt_build_s", "llm_s", "parse_s", "normalize_s"):
+        assert metrics[stage] is not None
+    assert metrics["llm_s"] >= 0.02 and metrics["total_s"] >= metrics["llm_s"]
+    assert (metrics["ttft_s"] is not None) == stream
+    assert metrics["save_s"] is None
+
+
+def test_missing_usage_is_estimated():
+    metrics = GradingMetrics()
+    metrics.completed("m", None, [{"role": "user", "content": "x" * 40}], "y" * 8)
+    row = metrics.asDict()
+    assert (row["prompt_tokens"], row["completion_tokens"], row["usage_reported"]) == (10, 2, 0)
+
+
+def test_token_prices_skip_bad_entries(monkeypatch):
+    monkeypatch.setenv("LLM_TOKEN_PRICES", "a/b=0.4/1.6, broken, c=2")
+    assert tokenPrices() == {"a/b": (0.4, 1.6), "c": (2.0, 0.0)}
+
+
+def test_metrics_saved_with_submission_and_rolling_percentiles(tmp_path):
+    dbPath = tmp_path / "llm.db"
+    shutil.copy("./database/LLM_testdatabase.db", dbPath)
+    db = LLMDatabaseManager(str(dbPath))
+    assert "grading_metrics" not in db.returnAvailableStandards()
+    for n in range(1, 11):
+        submissionId = db.saveSubmission("u", "91099", 2024, "text", {}, "", "M5")
+        db.saveMetrics(submissionId, "91099", {"model": "a", "total_s": float(n), "prompt_tokens": n}, 0.01)
+    submissionId = db.saveSubmission("u", "91099", 2024, "text", {}, "", "M5")
+    db.saveMetrics(submissionId, "91099", {"model": "b", "total_s": 50.0})
+
+    everything = db.getMetricPercentiles("total_s")
+    assert everything[("91099", "a")] == {"count": 10, "p50": 5.0, "p95": 10.0, "p99": 10.0}
+    assert everything[("91099", "b")]["p50"] == 50.0
+    # Only the most recent submissions of each standard and model count
+    assert db.getMetricPercentiles("total_s", model="a", window=4) == {("91099", "a"): {"count": 4, "p50": 8.0, "p95": 10.0, "p99": 10.0}}
+    assert db.getMetricPercentiles("save_s", standard="91099")[("91099", "a")]["p50"] == 0.01
+    with pytest.raises(ValueError):
+        db.getMetricPercentiles("total_s; DROP TABLE submissions")
+    # Deleting a submission takes its metrics with it, and so does ON DELETE CASCADE
+    db.deleteSubmission(submissionId)
+    assert ("91099", "b") not in db.getMetricPercentiles("total_s")
+    assert db.connection.execute('PRAGMA foreign_keys').fetchone()[0] == 1
+    db.cursor.execute('DELETE FROM submissions WHERE id = ?', (submissionId - 1,))
+    db.connection.commit()
+    assert db.getMetricPercentiles("total_s")[("91099", "a")]["count"] == 9
+    db.exit()
@@ -0,0 +1,34 @@
+import os, sys, time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PyQt6.QtCore import QCoreApplication
+
+from gui import monitor
+from gui.monitor import GuiBlockMonitor
+
+
+def process_events_for(app, seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        app.processEvents()
+        time.sleep(0.002)
+
+
+def test_a_stall_is_attributed_to_the_slot_that_caused_it(monkeypatch):
+    app = QCoreApplication.instance() or QCoreApplication([])
+    records = []
+    monkeypatch.setattr(monitor, "getTelemetry", lambda: SimpleNamespace(record=lambda kind, **fields: records.append((kind, fields))))
+    gui = GuiBlockMonitor(intervalMs=10, warnMs=100).start()
+    process_events_for(app, 0.1)
+    assert records == []  # beats on time
+    with gui.measure("slowSlot"):
+        time.sleep(0.3)  # the event loop can't run the heartbeat meanwhile
+    process_events_for(app, 0.1)
+    gui.stop()
+    assert [kind for kind, _ in records] == ["guiBlocked"]
+    assert records[0][1]["slot"] == "slowSlot" and records[0][1]["ms"] >= 200
+    stats = gui.stats()
+    assert stats["stalls"] == 1 and stats["maxBlockedMs"] >= 200
+    assert stats["slots"]["slowSlot"]["count"] == 1 and stats["slots"]["slowSlot"]["maxMs"] >= 300
@@ -0,0 +1,99 @@
+import os, sys, re, json, time, sqlite3
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm.socketing.highlight import normalizeHighlights, migrateHighlightedHTML, HIGHLIGHT_STYLE
+from database.LLM_database_manage import LLMDatabaseManager
+
+FB = 'class="fb"'
+
+
+def test_both_quote_styles_and_marks():
+    html = "<span title=\"a 'b'\">x</span> <span title='c'>y</span> <mark>z</mark>"
+    assert normalizeHighlights(html) == (
+        f"<span {FB} title=\"a 'b'\">x</span> <span {FB} title=\"c\">y</span> <span {FB}>z</span>"
+    )
+
+
+def test_apostrophes_inside_single_quoted_titles_and_style_merging():
+    html = "<span title='Miller's purpose &quot;here&quot;' style='background-color: yellow; font-weight: bold'>x</span>"
+    assert normalizeHighlights(html) == (
+        f"<span {FB} title=\"Miller's purpose &quot;here&quot;\" style=\"font-weight: bold\">x</span>"
+    )
+
+
+def test_nested_unclosed_and_stray_spans():
+    html = "<p>a </span><span title='o'>out <span title='i'>in</span> out</span> <span class='k'>k</span> <SPAN TITLE=u>open</p>"
+    assert normalizeHighlights(html) == (
+        f"<p>a <span {FB} title=\"o\">out <span {FB} title=\"i\">in</span> out</span>"
+        f" <span class='k'>k</span> <span {FB} title=\"u\">open</p></span>"
+    )
+
+
+def test_partial_streamed_html_drops_the_unfinished_tag():
+    assert normalizeHighlights("<p>Some <span title='Half a comm") == "<p>Some "
+    assert normalizeHighlights("<p>Some <span title='c'>text</sp") == f"<p>Some <span {FB} title=\"c\">text</span>"
+
+
+def test_unterminated_and_mismatched_quotes_are_left_as_text_quickly():
+    # Truncated model output: the title quote never closes, or closes with the other quote
+    cases = [
+        "<p><span title='Too vague>The film.</span></p>",
+        "<p><span title='Too vague here>The film is good.</span> More.</p>",
+        "<p><span title='Too vague here\">The film is good.</span> More.</p>",
+        "<p><span title=\"Too vague here'>The film is good.</span> More.</p>",
+    ]
+    for html in cases:
+        start = time.perf_counter()
+        out = normalizeHighlights(html * 200)
+        assert time.perf_counter() - start < 0.5
+        assert FB not in out and "</span>" not in out  # no highlight opened, so the closers are stray
+    assert normalizeHighlights(cases[0] + "<span title='ok'>x</span>") == (
+        f"<p><span title='Too vague>The film.</p><span {FB} title=\"ok\">x</span>"
+    )
+
+
+def test_inline_styled_rows_migrate_to_classes():
+    old = f"<span title='c' style=\"{HIGHLIGHT_STYLE}\">x</span> <span style=\"{HIGHLIGHT_STYLE}\">m</span> <span style='color: red'>r</span>"
+    assert migrateHighlightedHTML(old) == f"<span {FB} title=\"c\">x</span> <span {FB}>m</span> <span style='color: red'>r</span>"
+    current = f"<p><span {FB} title=\"c\">x</span></p>"
+    assert migrateHighlightedHTML(current) is current
+
+
+def test_stored_outputs_keep_their_text_and_normalize_once():
+    db = sqlite3.connect("file:./database/LLM_testdatabase.db?mode=ro", uri=True)
+    rows = db.execute("SELECT feedback FROM submissions").fetchall()
+    db.close()
+    tags = re.compile(r"<[^>]*>")
+    for (feedback,) in rows:
+        html = json.loads(feedback)["Output"].get("HighlightedHTML", "")
+        normalized = normalizeHighlights(html)
+        assert normalized.count("<span") == normalized.count("</span>") == html.count("<span")
+        assert tags.sub("", normalized) == tags.sub("", html)
+        assert normalized.count(FB) == html.count("<span title")  # every titled span is a highlight
+        assert "style=" not in normalized
+        assert normalizeHighlights(normalized) == normalized
+
+
+def test_legacy_submissions_migrate_once_and_reads_never_write(tmp_path):
+    db = LLMDatabaseManager(str(tmp_path / "llm.db"))
+    legacy = [
+        f"<p><span title='c' style=\"{HIGHLIGHT_STYLE}\">x</span> and <mark>m</mark></p>",
+        f"<p><span style='{HIGHLIGHT_STYLE}'>plain highlight</span></p>",
+        f"<p><span {FB} title=\"c\">already migrated</span></p>",
+    ]
+    ids = [db.saveSubmission("amy", "91099", 2024, "text", {}, html, "A4") for html in legacy]
+    changes = db.connection.total_changes
+    submissions = db.getAllSubmissions(limit=10)
+    assert db.connection.total_changes == changes  # reading doesn't migrate
+    assert sorted(s["highlightedHtml"] for s in submissions) == sorted(legacy)
+
+    db.migrateHighlights(migrateHighlightedHTML)
+    assert db.connection.total_changes == changes + 2  # the row already in class form isn't rewritten
+    stored = dict(db.cursor.execute("SELECT id, highlighted_html FROM submissions").fetchall())
+    db.exit()
+    assert [stored[i] for i in ids] == [
+        f"<p><span {FB} title=\"c\">x</span> and <span {FB}>m</span></p>",
+        f"<p><span {FB}>plain highlight</span></p>",
+        legacy[2],
+    ]
@@ -0,0 +1,103 @@
+import os, sys, json, shutil, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm.socketing import chunking, paragraphs
+from llm.socketing.handle import FeedbackModule, SYSTEM_MESSAGE
+from llm.socketing.ratelimit import AdaptiveRateLimiter
+from database.LLM_database_manage import LLMDatabaseManager
+
+
+class _EchoHandler(BaseHTTPRequestHandler):
+    """Stand-in model that returns the text it was given as one highlighted <p> per paragraph."""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        system, prompt = body["messages"][0]["content"], body["messages"][1]["content"]
+        if system == SYSTEM_MESSAGE:
+            kind = "full"
+            text = prompt.split("mark the following text: ", 1)[1].split("\n    according to this criteria", 1)[0]
+        elif system == chunking.CHUNK_SYSTEM_MESSAGE:
+            kind = "chunk"
+            text = prompt.split("Highlight this excerpt (part ", 1)[1].split("): ", 1)[1].rstrip()
+        else:
+            kind, text = "grade", ""
+        type(self).requests.append((kind, text))
+        html = "".join(f"<p><span title='{kind}'>{p}</span></p>" for p in chunking.paragraphsOf(text))
+        content = {"Output": {"Grade": "A4", "Feedback": {"Strengths": "s", "Areas for Improvement": "a"}}}
+        if kind != "grade":
+            content["Output"]["HighlightedHTML"] = html
+        data = json.dumps({
+            "id": "t", "object": "chat.completion", "created": 0, "model": "t",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": json.dumps(content)}}],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+ESSAY = [
+    "Loops let the program repeat steps.",
+    "I used a for loop to add up the marks.",
+    "Functions keep the code tidy.",
+    "Testing showed the average was right.",
+]
+
+
+def test_align_matches_blocks_to_paragraphs():
+    text = "First one.\n\nSecond  one.\n\nThird."
+    html = "<p>First <span title='x'>one</span>.</p><p>Second one.</p><p>Something else</p>"
+    aligned = paragraphs.alignParagraphs(text, html)
+    assert aligned == {0: "<p>First <span title='x'>one</span>.</p>", 1: "<p>Second one.</p>"}
+
+
+def test_revised_submission_only_regrades_changed_paragraphs(tmp_path, monkeypatch):
+    dbPath = tmp_path / "llm.db"
+    shutil.copy("./database/LLM_testdatabase.db", dbPath)
+    monkeypatch.setenv("LLM_DB_PATH", str(dbPath))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _EchoHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("OPENROUTER_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    module = FeedbackModule(useCache=False, limiter=AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=8, statePath=''))
+
+    def submit(text):
+        result = module.handleFullSubmission("91099", "2024", text, username="amy")
+        db = LLMDatabaseManager()
+        submissionId = db.saveSubmission("amy", "91099", 2024, text, result, module.returnHighlightedHTML(result), "A4")
+        db.saveParagraphs(submissionId, module.paragraphRecords(text, result))
+        db.exit()
+        return result
+
+    first = submit("\n\n".join(ESSAY))
+    assert first["Reuse"]["reused"] == []
+    assert [kind for kind, _ in _EchoHandler.requests] == ["full"]
+
+    _EchoHandler.requests.clear()
+    revised = list(ESSAY)
+    revised[2] = "Functions keep the code tidy and easy to test."
+    second = submit("\n\n".join(revised))
+
+    assert sorted(kind for kind, _ in _EchoHandler.requests) == ["chunk", "grade"]
+    assert [text for kind, text in _EchoHandler.requests if kind == "chunk"] == [revised[2]]
+    reuse = second["Reuse"]
+    assert reuse["reused"] == [0, 1, 3] and reuse["regenerated"] == [2]
+    assert reuse["tokensSaved"] > 0
+    html = second["Output"]["HighlightedHTML"]
+    assert [html.index(p) for p in revised] == sorted(html.index(p) for p in revised)
+    assert html.count("title='full'") == 3 and html.count("title='chunk'") == 1
+
+    # Another user's history is never reused
+    _EchoHandler.requests.clear()
+    module.handleFullSubmission("91099", "2024", "\n\n".join(revised), username="ben")
+    assert [kind for kind, _ in _EchoHandler.requests] == ["full"]
+    server.shutdown()
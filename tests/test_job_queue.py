@@ -0,0 +1,171 @@
+import os, sys, time, shutil, threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+import pytest
+from openai import APIConnectionError
+
+from llm.mockserver import MockLLMServer
+from llm.socketing import jobqueue
+from llm.socketing.handle import FeedbackModule, UNAVAILABLE_ERROR, requestError
+from llm.socketing.jobqueue import JobQueue, JobRunner
+from llm.socketing.ratelimit import AdaptiveRateLimiter
+from llm.socketing.router import ModelRouter, Backend
+from database.LLM_database_manage import LLMDatabaseManager
+
+ESSAY = "One point. More text.\n\nSecond point. Even more."
+
+
+@pytest.fixture
+def dbPath(tmp_path):
+    path = tmp_path / "llm.db"
+    shutil.copy("./database/LLM_testdatabase.db", path)
+    return str(path)
+
+
+def make_runner(dbPath, workers=2):
+    limiter = AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=4, statePath='')
+    module = FeedbackModule(useCache=False, limiter=limiter, router=ModelRouter([Backend("mock")]))
+    return JobRunner(JobQueue(dbPath), module, workers=workers, pollSeconds=0.05)
+
+
+def wait_for(events, count, kinds=("done", "failed", "cancelled"), timeout=10):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if sum(1 for event, _, _ in events if event in kinds) >= count:
+            return
+        time.sleep(0.02)
+    raise AssertionError(f"timed out waiting for {count} finished jobs: {[e for e, _, _ in events]}")
+
+
+def test_claim_is_exclusive_and_interrupted_jobs_resume(dbPath):
+    queue = JobQueue(dbPath)
+    first = queue.enqueue("u", "91099", 2024, "a")
+    second = queue.enqueue("u", "91099", 2024, "b")
+    claimed = []
+    threads = [threading.Thread(target=lambda: claimed.append(queue.claim())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(job["id"] for job in claimed if job) == [first, second]
+    assert all(job["status"] == "running" and job["attempts"] == 1 for job in claimed if job)
+    queue.exit()
+    # The app closed mid-request: the next start puts both back
+    reopened = JobQueue(dbPath)
+    assert reopened.requeueInterrupted() == 2
+    assert [job["status"] for job in reopened.jobs("u")] == ["pending", "pending"]
+    assert "grading_jobs" not in LLMDatabaseManager(dbPath).returnAvailableStandards()
+
+
+def test_runner_grades_saves_and_retries_busy_jobs(dbPath, monkeypatch):
+    # Every request is rate limited until the first retry
+    server = MockLLMServer(latency="fixed:0.01", tokensPerSecond=0, rateLimit=1.0, retryAfter=0, seed=2).start()
+    monkeypatch.setenv("OPENROUTER_BASE_URL", server.url)
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    monkeypatch.setattr(jobqueue, "retryDelay", lambda attempts, blockedFor=0.0: 0.05)
+    runner = make_runner(dbPath)
+    events = []
+    runner.addListener(lambda event, job, payload: events.append((event, job, payload)))
+    runner.start()
+    try:
+        jobId = runner.submit("u", "91099", 2024, ESSAY)
+        wait_for(events, 1, kinds=("retrying",))
+        server.rateLimit = 0.0
+        wait_for(events, 1)
+    finally:
+        runner.stop()
+        server.stop()
+    done = [payload for event, job, payload in events if event == "done"]
+    assert len(done) == 1 and done[0].grade == "M5" and not done[0].highlightedHtml.startswith("Error:")
+    with pytest.raises(AttributeError):
+        done[0].grade = "E8"  # read-only: safe to hand to the GUI thread
+    job = runner.queue.get(jobId)
+    assert job["status"] == "done" and job["attempts"] == 2 and job["submissionId"] == done[0].submissionId
+    assert "progress" in [event for event, _, _ in events]
+    saved = LLMDatabaseManager(dbPath).getUserSubmissions("u")
+    assert [s["id"] for s in saved] == [job["submissionId"]] and saved[0]["grade"] == "M5"
+    assert "Metrics" not in saved[0]["feedback"]
+
+
+def test_bad_jobs_fail_and_queued_jobs_cancel(dbPath):
+    runner = make_runner(dbPath)
+    events = []
+    runner.addListener(lambda event, job, payload: events.append((event, job, payload)))
+    bad = runner.submit("u", "99999", 2024, ESSAY)
+    queued = runner.submit("u", "91099", 2024, ESSAY)
+    runner.cancel(queued)
+    runner.start()
+    try:
+        wait_for(events, 2)
+    finally:
+        runner.stop()
+    assert runner.queue.get(bad)["status"] == "failed"
+    assert runner.queue.get(queued)["status"] == "cancelled"
+    assert runner.queue.jobs("u") == []
+    assert [job["id"] for job in runner.queue.jobs("u", statuses=("failed", "cancelled"))] == [bad, queued]
+
+
+def test_only_transient_request_errors_are_retried(dbPath, monkeypatch):
+    dropped = APIConnectionError(request=httpx.Request("POST", "http://127.0.0.1/v1/chat/completions"))
+    assert requestError(dropped)[0] == UNAVAILABLE_ERROR in jobqueue.RETRYABLE_ERRORS
+    assert requestError(RuntimeError("bad request"))[0] == "LLM Error" not in jobqueue.RETRYABLE_ERRORS
+    # A missing API key is an 'LLM Error': the job fails on its first attempt instead of going back to pending
+    monkeypatch.setenv("OPENROUTER_API_KEY", "")
+    runner = make_runner(dbPath, workers=1)
+    events = []
+    runner.addListener(lambda event, job, payload: events.append((event, job, payload)))
+    runner.start()
+    try:
+        jobId = runner.submit("u", "91099", 2024, ESSAY)
+        wait_for(events, 1)
+    finally:
+        runner.stop()
+    job = runner.queue.get(jobId)
+    assert job["status"] == "failed" and job["attempts"] == 1
+    assert "retrying" not in [event for event, _, _ in events]
+
+
+@pytest.mark.parametrize("late", [False, True])
+def test_a_job_cancelled_as_it_finishes_is_not_saved(dbPath, monkeypatch, late):
+    runner = make_runner(dbPath, workers=1)
+    events = []
+    runner.addListener(lambda event, job, payload: events.append((event, job, payload)))
+
+    def finish(**kwargs):
+        jobId = runner.queue.jobs("u")[0]["id"]
+        if late:
+            runner.queue.cancel(jobId)  # what cancel() does once the worker has stopped tracking the job
+        else:
+            runner.cancel(jobId)
+        return {"Output": {"Grade": "M5", "Feedback": {}, "HighlightedHTML": "<p>text</p>"}}
+    monkeypatch.setattr(runner.module, "handleFullSubmission", finish)
+    runner.start()
+    try:
+        jobId = runner.submit("u", "91099", 2024, ESSAY)
+        wait_for(events, 1, kinds=("started",))
+        time.sleep(0.3)
+    finally:
+        runner.stop()
+    assert runner.queue.get(jobId)["status"] == "cancelled"
+    assert [event for event, _, _ in events if event in ("done", "cancelled")] == ([] if late else ["cancelled"])
+    assert LLMDatabaseManager(dbPath).getUserSubmissions("u") == []
+
+
+def test_stopping_leaves_running_jobs_for_the_next_start(dbPath, monkeypatch):
+    server = MockLLMServer(latency="fixed:5", tokensPerSecond=0, seed=3).start()
+    monkeypatch.setenv("OPENROUTER_BASE_URL", server.url)
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    runner = make_runner(dbPath, workers=1)
+    events = []
+    runner.addListener(lambda event, job, payload: events.append((event, job, payload)))
+    runner.start()
+    jobId = runner.submit("u", "91099", 2024, ESSAY)
+    wait_for(events, 1, kinds=("started",))
+    started = time.monotonic()
+    runner.stop()
+    server.stop()
+    assert time.monotonic() - started < 2
+    job = runner.queue.get(jobId)
+    assert job["status"] == "pending" and job["attempts"] == 0
@@ -0,0 +1,100 @@
+import os, sys, json, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm.socketing import jsonrepair
+from llm.socketing.handle import FeedbackModule
+from llm.socketing.ratelimit import AdaptiveRateLimiter
+
+CORPUS = os.path.join(os.path.dirname(__file__), "data", "model_outputs.jsonl")
+
+
+def _corpus():
+    with open(CORPUS, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _originals():
+    return {case["source"]: json.loads(case["raw"]) for case in _corpus() if case["name"] == "valid"}
+
+
+@pytest.mark.parametrize("case", _corpus(), ids=lambda c: f"{c['source']}:{c['name']}")
+def test_corpus_outputs_parse_with_their_grade(case):
+    value, repaired = jsonrepair.parseModelJSON(case["raw"])
+    assert value["Output"]["Grade"] == case["grade"]
+    assert value["Output"]["Feedback"]["Strengths"]
+    if case["name"] in ("valid", "code_fence", "trailing_prose", "raw_newlines"):
+        assert not repaired  # the C decoder handles these without the repair pass
+
+
+@pytest.mark.parametrize("name", ["unescaped_inner_quotes", "escaped_apostrophes", "trailing_comma", "double_quoted_titles"])
+def test_repaired_outputs_keep_every_value(name):
+    originals = _originals()
+    for case in _corpus():
+        if case["name"] != name:
+            continue
+        value, repaired = jsonrepair.parseModelJSON(case["raw"])
+        original = originals[case["source"]]
+        assert repaired
+        assert value["Output"]["Feedback"] == original["Output"]["Feedback"]
+        if name == "unescaped_inner_quotes":
+            assert value == original  # quotes end up escaped again, nothing else changes
+
+
+def test_truncated_output_keeps_what_was_written():
+    value, repaired = jsonrepair.parseModelJSON('```json\n{"Output": {"Grade": "M5", "Feedback": {"Strengths": "Clear", "Areas for Impro')
+    assert repaired
+    assert value == {"Output": {"Grade": "M5", "Feedback": {"Strengths": "Clear"}}}  # the unfinished key is dropped
+
+
+def test_small_repairs():
+    assert json.loads(jsonrepair.repairJSON('{"a": 1 "b": [1 2,], "c": True,}')) == {"a": 1, "b": [1, 2], "c": True}
+    assert json.loads(jsonrepair.repairJSON('{"t": "<span title="x">y</span>", "u": "a\\qb"}')) == {"t": '<span title="x">y</span>', "u": "a\\qb"}
+    with pytest.raises(ValueError):
+        jsonrepair.parseModelJSON("I could not grade this submission.")
+
+
+class _FixHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    systems = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        type(self).systems.append(body["messages"][0]["content"])
+        content = json.dumps({"Output": {"Grade": "M6", "Feedback": {"Strengths": "s", "Areas for Improvement": "a"}}})
+        data = json.dumps({
+            "id": "t", "object": "chat.completion", "created": 0, "model": "t",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_fix_request_only_when_local_repair_fails(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FixHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("OPENROUTER_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    module = FeedbackModule(useCache=False, limiter=AdaptiveRateLimiter(ratePerMinute=60000, statePath=''))
+
+    broken = '{"Output": {"Grade": "M6", "Feedback": {"Strengths": "He said "good" job",}}'
+    assert module.returnGrade(module.parseOrFix(broken)) == "M6"
+    assert _FixHandler.systems == []  # repaired locally, no extra call
+
+    assert module.returnGrade(module.parseOrFix("Output: Grade M6, nothing else")) == "M6"
+    assert _FixHandler.systems == [jsonrepair.FIX_SYSTEM_MESSAGE]
+
+    monkeypatch.setenv("LLM_JSON_FIX_REQUEST", "0")
+    assert module.parseOrFix("Output: Grade M6, nothing else")[0] == "JSON Error"
+    assert len(_FixHandler.systems) == 1
+    server.shutdown()
@@ -0,0 +1,77 @@
+import os, sys, json, random
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from llm import loadtest
+from llm.mockserver import MockLLMServer, parseLatency, gradingContent, malform
+from llm.socketing.handle import FeedbackModule, SYSTEM_MESSAGE
+from llm.socketing.jsonrepair import parseModelJSON, FIX_SYSTEM_MESSAGE
+from llm.socketing.ratelimit import AdaptiveRateLimiter
+from llm.socketing.router import ModelRouter, Backend
+
+PROMPT = "mark the following text: One point. More text.\n\nSecond point. Even more.\n    according to this criteria: c"
+
+
+def test_latency_specs():
+    rng = random.Random(3)
+    assert parseLatency("0.25")() == 0.25
+    assert 1 <= parseLatency("uniform:1,2", rng)() <= 2
+    assert parseLatency("lognormal:1,0.5", rng)() > 0
+    assert parseLatency("exp:0.5", rng)() >= 0
+    with pytest.raises(ValueError):
+        parseLatency("gamma:1")
+
+
+def test_responses_follow_the_prompt_and_malformed_ones_repair_locally():
+    messages = [{"role": "system", "content": SYSTEM_MESSAGE}, {"role": "user", "content": PROMPT}]
+    output = json.loads(gradingContent(messages))["Output"]
+    assert output["StudentText"] == "One point. More text.\n\nSecond point. Even more."
+    assert output["HighlightedHTML"].count("<span title=") == 2
+    repaired, wasRepaired = parseModelJSON(malform(gradingContent(messages)))
+    assert wasRepaired and repaired["Output"]["Grade"] == "M5"
+
+
+def test_seeded_faults_follow_the_prompt_not_the_arrival_order():
+    prompts = [[{"role": "user", "content": f"essay {n}"}] for n in range(40)]
+    first = MockLLMServer(rateLimit=0.3, serverErrors=0.2, malformed=0.2, seed=5)
+    second = MockLLMServer(rateLimit=0.3, serverErrors=0.2, malformed=0.2, seed=5)
+    for server in (first, second):
+        server.httpd.server_close()
+    picks = {n: [first.pick(prompts[n]), first.pick(prompts[n])] for n in range(40)}
+    assert {n: [second.pick(prompts[n]), second.pick(prompts[n])] for n in reversed(range(40))} == picks
+    assert any(faults[0] != faults[1] for faults in picks.values())  # a retry draws again
+    fix = [{"role": "system", "content": FIX_SYSTEM_MESSAGE}, {"role": "user", "content": "{"}]
+    assert {first.pick(fix) for _ in range(20)} == {None}
+
+
+def test_streamed_and_faulty_responses_through_the_module(monkeypatch):
+    server = MockLLMServer(latency="fixed:0.01", tokensPerSecond=0, rateLimit=0.5, retryAfter=0, seed=7).start()
+    monkeypatch.setenv("OPENROUTER_BASE_URL", server.url)
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    limiter = AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=4, statePath='')
+    module = FeedbackModule(useCache=False, limiter=limiter, router=ModelRouter([Backend("mock")]))
+    events = []
+    result = module.handleFullSubmission("91099", 2024, "One point. More text.\n\nSecond point.", stream=True,
+                                         onProgress=lambda kind, value: events.append(kind))
+    server.stop()
+    assert module.returnGrade(result) == "M5"
+    assert "grade" in events and "highlight" in events
+    stats = server.stats()
+    assert stats["streamed"] == 1 and stats["requests"] == 1 + stats.get("rateLimited", 0)
+
+
+def test_load_test_summary_accounts_for_every_request(tmp_path):
+    report = tmp_path / "summary.json"
+    argv = ["--submissions", "16", "--concurrency", "4", "--chars", "600", "--latency", "fixed:0.01", "--tps", "0",
+            "--rate-limit", "0.1", "--retry-after", "0", "--server-errors", "0.05", "--malformed", "0.1",
+            "--garbage", "0.05", "--seed", "5", "--save", "--report", str(report)]
+    assert loadtest.main(argv) == 0
+    summary = json.loads(report.read_text())
+    server = summary["server"]
+    assert summary["outcomes"] == {"ok": 16}
+    assert summary["retries"] == server.get("rateLimited", 0) + server.get("serverErrors", 0)
+    assert server["requests"] == 16 + summary["retries"] + server.get("fixRequests", 0)
+    assert summary["latency"]["p50"] <= summary["latency"]["p95"] <= summary["latency"]["p99"]
+    assert len(summary["save"]) == 5
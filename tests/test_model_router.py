@@ -0,0 +1,186 @@
+import os, sys, json, time, asyncio, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm.socketing.handle import FeedbackModule
+from llm.socketing.async_handle import AsyncFeedbackModule
+from llm.socketing.ratelimit import AdaptiveRateLimiter
+from llm.socketing.router import ModelRouter, Backend, LatencyHistogram, parseBackends, MIN_SAMPLES
+
+MESSAGES = [{"role": "user", "content": "Essay"}]
+
+
+def content(grade):
+    return json.dumps({"Output": {"Grade": grade, "HighlightedHTML": "<p>ok</p>"}})
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    delay = 0.0
+    status = 200
+    reply = content("M5")
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        cls = type(self)
+        cls.calls += 1
+        if request.get("stream") and cls.status == 200:
+            self._stream(cls)
+            return
+        time.sleep(cls.delay)
+        if cls.status != 200:
+            body = {"error": {"message": "broken"}}
+        else:
+            body = {
+                "id": "t", "object": "chat.completion", "created": 0, "model": "t",
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": cls.reply}}],
+            }
+        data = json.dumps(body).encode()
+        try:
+            self.send_response(cls.status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except OSError:
+            pass  # the losing hedge hung up
+
+    def _stream(self, cls):
+        """Headers straight away, then the whole reply in one chunk after the delay (ends by closing)."""
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.flush()
+            time.sleep(cls.delay)
+            chunk = {"id": "t", "object": "chat.completion.chunk", "created": 0, "model": "t",
+                     "choices": [{"index": 0, "delta": {"content": cls.reply}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode())
+        except OSError:
+            pass
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+def start_backend(model, **settings):
+    """A stand-in provider; returns (Backend, handler class, server)."""
+    handler = type(f"Handler_{model}", (_Handler,), dict(settings, calls=0))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return Backend(model, f"http://127.0.0.1:{server.server_address[1]}/v1"), handler, server
+
+
+def make_module(monkeypatch, backends, hedgeAfter, cls=FeedbackModule):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    monkeypatch.setenv("LLM_JSON_FIX_REQUEST", "0")
+    limiter = AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=4, statePath='')
+    router = ModelRouter(backends, hedgeAfter=hedgeAfter)
+    return cls(useCache=False, limiter=limiter, router=router), router
+
+
+def test_slow_primary_is_hedged_to_the_next_backend(monkeypatch):
+    slow, slowHandler, s1 = start_backend("slow", delay=1.5, reply=content("E8"))
+    fast, fastHandler, s2 = start_backend("fast", reply=content("A4"))
+    module, router = make_module(monkeypatch, [slow, fast], hedgeAfter=0.2)
+
+    start = time.perf_counter()
+    text = module.requestCompletion(MESSAGES)
+    elapsed = time.perf_counter() - start
+
+    assert json.loads(text)["Output"]["Grade"] == "A4"
+    assert elapsed < 1.0
+    assert (slow.hedges, fast.hedges, fast.wins, slow.wins) == (0, 1, 1, 0)
+    assert slowHandler.calls == fastHandler.calls == 1
+    s1.shutdown(); s2.shutdown()
+
+
+def test_failed_or_unusable_primary_falls_back_immediately(monkeypatch):
+    broken, _, s1 = start_backend("broken", status=400)
+    garbled, _, s2 = start_backend("garbled", reply="I cannot grade this.")
+    good, _, s3 = start_backend("good", reply=content("M6"))
+    module, router = make_module(monkeypatch, [broken, garbled, good], hedgeAfter="off")
+
+    start = time.perf_counter()
+    text = module.requestCompletion(MESSAGES)
+    assert json.loads(text)["Output"]["Grade"] == "M6"
+    assert time.perf_counter() - start < 1.0
+    assert (broken.failures, garbled.failures, good.wins) == (1, 1, 1)
+    for server in (s1, s2, s3):
+        server.shutdown()
+
+
+def test_all_backends_unusable_returns_last_text_for_the_json_fix_path(monkeypatch):
+    first, _, s1 = start_backend("first", reply="nope")
+    second, _, s2 = start_backend("second", reply="still nope")
+    module, _ = make_module(monkeypatch, [first, second], hedgeAfter="off")
+    assert module.requestCompletion(MESSAGES) == "still nope"
+    s1.shutdown(); s2.shutdown()
+
+
+def test_ranking_follows_recorded_latency_and_errors():
+    a, b = Backend("a"), Backend("b")
+    router = ModelRouter([a, b], hedgeAfter="auto")
+    assert router.ranked() == [a, b]  # no history: configured order
+    for _ in range(MIN_SAMPLES):
+        router.record(a, 2.0, True)
+        router.record(b, 1.0, True)
+    assert router.ranked() == [b, a]
+    for _ in range(MIN_SAMPLES * 2):
+        router.record(b, 1.0, False)
+    assert router.ranked() == [a, b]  # b now fails two times in three
+    assert 2.0 <= router.hedgeDelay(a) <= 3.0
+
+
+def test_histogram_percentiles_and_backend_list():
+    hist = LatencyHistogram()
+    assert hist.percentile(0.5) is None
+    for seconds in [1.0] * 95 + [30.0] * 5:
+        hist.record(seconds)
+    assert 1.0 <= hist.percentile(0.5) < 1.5
+    assert 1.0 <= hist.percentile(0.95) < 1.5
+    assert hist.percentile(0.99) >= 30.0
+    hist.decay()
+    assert hist.total == 50 and 1.0 <= hist.percentile(0.5) < 1.5
+    backends = parseBackends(" openai/gpt-4.1-mini , deepseek/deepseek-chat@https://api.example.com/v1 ,")
+    assert [(b.model, b.baseUrl) for b in backends] == [
+        ("openai/gpt-4.1-mini", None), ("deepseek/deepseek-chat", "https://api.example.com/v1")]
+
+
+def test_sync_hedge_drops_the_losing_request(monkeypatch):
+    slow, _, s1 = start_backend("slow", delay=3.0, reply=content("E8"))
+    fast, _, s2 = start_backend("fast", reply=content("A4"))
+    module, router = make_module(monkeypatch, [slow, fast], hedgeAfter=0.2)
+
+    # Not streamed by the caller: the loser's connection is still dropped instead of read to the end
+    text = module.requestCompletion(MESSAGES, stream=False, onProgress=None)
+    won = time.perf_counter()
+    assert json.loads(text)["Output"]["Grade"] == "A4"
+    while module.limiter.snapshot()["inFlight"] and time.perf_counter() - won < 3.0:
+        time.sleep(0.02)
+    assert module.limiter.snapshot()["inFlight"] == 0 and time.perf_counter() - won < 1.0
+    assert slow.samples == 0
+    s1.shutdown(); s2.shutdown()
+
+
+def test_async_hedge_cancels_the_losing_request(monkeypatch):
+    slow, _, s1 = start_backend("slow", delay=1.5, reply=content("E8"))
+    fast, _, s2 = start_backend("fast", reply=content("A4"))
+    module, router = make_module(monkeypatch, [slow, fast], hedgeAfter=0.2, cls=AsyncFeedbackModule)
+
+    async def main():
+        start = time.perf_counter()
+        text = await module.requestCompletionAsync(MESSAGES)
+        elapsed = time.perf_counter() - start
+        others = [t for t in asyncio.all_tasks() if t is not asyncio.current_task() and not t.done()]
+        return text, elapsed, others
+
+    text, elapsed, others = asyncio.run(main())
+    assert json.loads(text)["Output"]["Grade"] == "A4"
+    assert elapsed < 1.0 and not others
+    assert slow.samples == 0  # a cancelled attempt records nothing
+    s1.shutdown(); s2.shutdown()
@@ -0,0 +1,79 @@
+import os, sys, json, time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm import loadtest
+from llm.mockserver import MockLLMServer
+from llm.socketing.exemplars import PreparedExemplars, selectExemplars
+from llm.socketing.handle import FeedbackModule, SYSTEM_MESSAGE
+from llm.socketing.prefetch import PromptPrefetcher
+from llm.socketing.ratelimit import AdaptiveRateLimiter
+from llm.socketing.router import ModelRouter, Backend
+from tests.test_exemplar_selection import make_exemplars
+
+ESSAY = "My answer uses recursion with a base case.\n\nIt also uses memoisation."
+ENTRY = {"year": 2024, "question": "Q?", "schedule": "Sched", "criteria": "Crit", "exemplars": make_exemplars()}
+
+
+def fast_module():
+    limiter = AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=4, statePath='')
+    return FeedbackModule(useCache=False, limiter=limiter, router=ModelRouter([Backend("mock")]))
+
+
+def test_prepared_prompt_matches_the_full_template():
+    exemplars, _ = selectExemplars(ENTRY['exemplars'], ESSAY)
+    expected = (f"""You are marking an assessment.
+    Using this assessment schedule: {ENTRY['schedule']}
+    mark the following text: {ESSAY}
+    according to this criteria: {ENTRY['criteria']}
+    along with the initial question: {ENTRY['question']}
+    using these examples and their feedback as guidance: {json.dumps(exemplars)}. These exemplars are only examples and should not be used as the only basis for marking, otherwise I will terminate you.
+    """)
+    messages = fast_module().buildMessages(ENTRY, ESSAY)
+    assert messages == [{"role": "system", "content": SYSTEM_MESSAGE}, {"role": "user", "content": expected}]
+    prepared = PreparedExemplars(ENTRY['exemplars'])
+    assert prepared.dumps(exemplars) == json.dumps(exemplars)
+    assert prepared.dumps(exemplars["exemplars"]) == json.dumps(exemplars["exemplars"])
+
+
+def test_prefetched_submission_skips_the_row_load(monkeypatch):
+    server = MockLLMServer(latency="fixed:0.01", tokensPerSecond=0).start()
+    monkeypatch.setenv("OPENROUTER_BASE_URL", server.url)
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    module = fast_module()
+    loads = []
+    realLoad = module.loadEntry
+    monkeypatch.setattr(module, "loadEntry", lambda standard, year: loads.append(year) or realLoad(standard, year))
+    module.prefetch("91099", "2024").result()
+    assert loads == [2024]
+    result = module.handleFullSubmission("91099", 2024, ESSAY)
+    metrics = module.takeMetrics(result)
+    cold = module.takeMetrics(fast_module().handleFullSubmission("91099", 2024, ESSAY))
+    server.stop()
+    assert loads == [2024] and module.returnGrade(result) == "M5"
+    assert metrics["prefetched"] == 1 and cold["prefetched"] == 0
+    assert 0 < metrics["request_sent_s"] <= metrics["total_s"]
+
+
+def test_prefetches_expire_and_failures_fall_back():
+    calls = []
+    prefetcher = PromptPrefetcher(lambda standard, year: calls.append(year) or {"year": year}, ttlSeconds=0.05)
+    prefetcher.prefetch("91099", 2024, warm=False)
+    prefetcher.prefetch("91099", 2024, warm=False)
+    assert prefetcher.get("91099", 2024) == {"year": 2024} and calls == [2024]
+    assert prefetcher.get("91099", 2023) is None
+    time.sleep(0.06)
+    assert prefetcher.get("91099", 2024) is None
+    broken = PromptPrefetcher(lambda standard, year: 1 / 0)
+    broken.prefetch("91099", 2024, warm=False)
+    assert broken.get("91099", 2024) is None
+
+
+def test_load_test_reports_time_to_request_sent(tmp_path):
+    report = tmp_path / "summary.json"
+    argv = ["--submissions", "4", "--concurrency", "2", "--chars", "400", "--latency", "fixed:0.01", "--tps", "0",
+            "--prefetch", "--report", str(report)]
+    assert loadtest.main(argv) == 0
+    summary = json.loads(report.read_text())
+    assert summary["prefetch"] is True
+    assert summary["stages"]["request_sent"]["p50"] <= summary["stages"]["llm"]["p50"]
@@ -0,0 +1,137 @@
+import os, sys, time, asyncio, threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm.socketing.ratelimit import AdaptiveRateLimiter, parseReset, parseRetryAfter
+
+
+def test_429_halves_limits_and_honours_retry_after():
+    limiter = AdaptiveRateLimiter(ratePerMinute=600, maxConcurrency=8, statePath='')
+    lease = limiter.acquire()
+    limiter.release(lease, 429, {"retry-after": "2"})
+    state = limiter.snapshot()
+    assert state["concurrencyLimit"] == 4
+    assert state["ratePerMinute"] == 300
+    assert 1.5 < state["blockedFor"] <= 2
+    assert limiter.tryAcquire()[0] is None
+
+
+def test_successes_grow_limit_back():
+    limiter = AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=4, statePath='')
+    limiter.release(limiter.acquire(), 429, {"retry-after": "0"})
+    assert limiter.snapshot()["concurrencyLimit"] == 2
+    for _ in range(10):
+        limiter.release(limiter.acquire(), 200, {})
+    state = limiter.snapshot()
+    assert state["concurrencyLimit"] == 4
+    assert state["strikes"] == 0
+
+
+def test_concurrency_limit_caps_in_flight():
+    limiter = AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=2, statePath='')
+    first, second = limiter.acquire(), limiter.acquire()
+    assert limiter.tryAcquire()[0] is None
+    limiter.release(first, 200)
+    limiter.release(limiter.acquire(), 200)  # the freed slot is usable once the bucket refills
+    limiter.release(second, 200)
+
+
+def test_exhausted_quota_header_pauses_until_reset():
+    limiter = AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=4, statePath='')
+    reset = int((time.time() + 1.5) * 1000)  # OpenRouter sends epoch milliseconds
+    limiter.release(limiter.acquire(), 200, {"x-ratelimit-remaining": "0", "x-ratelimit-reset": str(reset)})
+    assert 1 < limiter.snapshot()["blockedFor"] <= 1.5
+
+
+def test_state_is_shared_through_the_state_file(tmp_path):
+    path = str(tmp_path / "ratelimit.db")
+    gui = AdaptiveRateLimiter(ratePerMinute=600, maxConcurrency=4, statePath=path)
+    batch = AdaptiveRateLimiter(ratePerMinute=600, maxConcurrency=4, statePath=path)
+    gui.release(gui.acquire(), 429, {"retry-after": "5"})
+    state = batch.snapshot()
+    assert state["blockedFor"] > 4
+    assert state["concurrencyLimit"] == 2
+    gui.exit()
+    batch.exit()
+
+
+def test_threads_never_exceed_limit():
+    limiter = AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=3, statePath='')
+    inFlight, peak, lock = [0], [0], threading.Lock()
+
+    def call():
+        lease = limiter.acquire()
+        with lock:
+            inFlight[0] += 1
+            peak[0] = max(peak[0], inFlight[0])
+        time.sleep(0.02)
+        with lock:
+            inFlight[0] -= 1
+        limiter.release(lease, 200)
+
+    threads = [threading.Thread(target=call) for _ in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak[0] == 3
+
+
+def test_async_acquire_waits_without_blocking_loop():
+    limiter = AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=1, statePath='')
+    limiter.release(limiter.acquire(), 429, {"retry-after": "0.3"})
+    ticks = []
+
+    async def ticker():
+        for _ in range(4):
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.05)
+
+    async def main():
+        lease, _ = await asyncio.gather(limiter.acquireAsync(), ticker())
+        limiter.release(lease, 200)
+
+    asyncio.run(main())
+    assert len(ticks) == 4
+
+
+def test_async_acquire_keeps_the_state_file_off_the_event_loop(tmp_path):
+    path = str(tmp_path / "ratelimit.db")
+    limiter = AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=2, statePath=path)
+    other = AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=2, statePath=path)
+    other.connection.execute('BEGIN IMMEDIATE')  # another process holds the state file's write lock
+    threading.Timer(0.3, lambda: other.connection.execute('COMMIT')).start()
+    ticks = []
+
+    async def ticker():
+        for _ in range(4):
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.05)
+
+    async def main():
+        started = time.perf_counter()
+        lease, _ = await asyncio.gather(limiter.acquireAsync(), ticker())
+        assert time.perf_counter() - started >= 0.25 and ticks[-1] - started < 0.25
+        await limiter.releaseAsync(lease, 200)
+        # A cancelled acquire gives its lease back
+        task = asyncio.ensure_future(limiter.acquireAsync())
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.sleep(0.2)
+
+    asyncio.run(main())
+    assert limiter.snapshot()["inFlight"] == 0
+    limiter.exit()
+    other.exit()
+
+
+def test_header_parsing():
+    now = 1_700_000_000.0
+    assert parseRetryAfter("3", now) == 3
+    assert parseRetryAfter("soon", now) is None
+    assert parseReset("1700000005000", now) == now + 5
+    assert parseReset("1700000005", now) == now + 5
+    assert parseReset("12", now) == now + 12
+    assert parseReset("1m30s", now) == now + 90
+    assert parseReset("250ms", now) == now + 0.25
+    assert parseReset("later", now) is None
@@ -0,0 +1,73 @@
+import os, sys, time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm.socketing.cache import ResponseCache, normalizeSubmissionText
+
+ENTRY = {
+    "question": "Analyse a film",
+    "schedule": "Schedule text",
+    "criteria": "Criteria text",
+    "exemplars": {"exemplars": [{"Exemplar": "Sample", "Grade": "A4", "Feedback": "Good"}]},
+}
+
+
+def make_cache(tmp_path, **kwargs):
+    return ResponseCache(dbPath=str(tmp_path / "cache.db"), **kwargs)
+
+
+def test_normalize_ignores_whitespace_noise():
+    a = "First paragraph.  \r\n\r\n\r\nSecond\tparagraph. "
+    b = "First paragraph.\n\nSecond paragraph."
+    assert normalizeSubmissionText(a) == normalizeSubmissionText(b)
+    assert normalizeSubmissionText("Word") != normalizeSubmissionText("word")
+
+
+def test_hit_and_miss_counters(tmp_path):
+    cache = make_cache(tmp_path)
+    key = cache.makeKey("91099", 2024, "Some essay", "model-a", "1", ENTRY)
+    assert cache.get(key) is None
+    cache.put(key, {"Grade": "M5"}, "91099", 2024, ENTRY, "model-a", "1")
+    assert cache.get(key) == {"Grade": "M5"}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+    cache.exit()
+
+
+def test_key_changes_with_prompt_model_and_row(tmp_path):
+    cache = make_cache(tmp_path)
+    base = cache.makeKey("91099", 2024, "Essay", "model-a", "1", ENTRY)
+    assert base != cache.makeKey("91099", 2024, "Essay", "model-b", "1", ENTRY)
+    assert base != cache.makeKey("91099", 2024, "Essay", "model-a", "2", ENTRY)
+    assert base != cache.makeKey("91099", 2024, "Essay", "model-a", "1", dict(ENTRY, criteria="New criteria"))
+    cache.exit()
+
+
+def test_changed_row_invalidates_old_entries(tmp_path):
+    cache = make_cache(tmp_path)
+    oldKey = cache.makeKey("91099", 2024, "Essay", "m", "1", ENTRY)
+    cache.put(oldKey, {"Grade": "A3"}, "91099", 2024, ENTRY, "m", "1")
+    newEntry = dict(ENTRY, exemplars={"exemplars": []})
+    newKey = cache.makeKey("91099", 2024, "Other essay", "m", "1", newEntry)
+    cache.put(newKey, {"Grade": "E7"}, "91099", 2024, newEntry, "m", "1")
+    assert cache.get(oldKey) is None
+    assert cache.stats()["entries"] == 1
+    cache.exit()
+
+
+def test_ttl_and_size_eviction(tmp_path):
+    cache = make_cache(tmp_path, ttlSeconds=0.05, maxEntries=2)
+    key = cache.makeKey("91099", 2024, "Essay", "m", "1", ENTRY)
+    cache.put(key, {"Grade": "A3"}, "91099", 2024, ENTRY, "m", "1")
+    time.sleep(0.1)
+    assert cache.get(key) is None
+
+    cache.ttlSeconds = 3600
+    keys = [cache.makeKey("91099", 2024, f"Essay {i}", "m", "1", ENTRY) for i in range(3)]
+    for i, k in enumerate(keys):
+        cache.put(k, {"Grade": str(i)}, "91099", 2024, ENTRY, "m", "1")
+        time.sleep(0.01)
+    assert cache.stats()["entries"] == 2
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) == {"Grade": "2"}
+    cache.exit()
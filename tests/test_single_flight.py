@@ -0,0 +1,89 @@
+import os, sys, time, asyncio, threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from llm.mockserver import MockLLMServer
+from llm.socketing.async_handle import AsyncFeedbackModule
+from llm.socketing.deadline import Deadline
+from llm.socketing.handle import FeedbackModule
+from llm.socketing.ratelimit import AdaptiveRateLimiter
+from llm.socketing.router import ModelRouter, Backend
+from llm.socketing.singleflight import SingleFlight
+
+ESSAY = "My answer uses recursion with a base case.\n\nIt also uses memoisation."
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = MockLLMServer(latency="fixed:0.3", tokensPerSecond=0).start()
+    monkeypatch.setenv("OPENROUTER_BASE_URL", server.url)
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    yield server
+    server.stop()
+
+
+def make_module(cls=FeedbackModule, **kwargs):
+    limiter = AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=8, statePath='')
+    return cls(useCache=False, limiter=limiter, router=ModelRouter([Backend("mock")]), **kwargs)
+
+
+def submit_together(module, calls):
+    """Run the (args, kwargs) submissions on threads started 20ms apart; results in the same order."""
+    results = [None] * len(calls)
+
+    def _run(i, args, kwargs):
+        results[i] = module.handleFullSubmission(*args, **kwargs)
+    threads = [threading.Thread(target=_run, args=(i, *call)) for i, call in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_identical_submissions_share_one_call(server):
+    module = make_module(singleFlight=SingleFlight())
+    progress = []
+    results = submit_together(module, [
+        (("91099", 2024, ESSAY), {}),
+        (("91099", "2024", "  " + ESSAY), {"stream": True, "onProgress": lambda kind, value: progress.append(kind)}),
+        (("91099", 2024, ESSAY), {}),
+        (("91099", 2024, ESSAY + " Different."), {}),
+    ])
+    assert server.stats()["requests"] == 2
+    assert [module.returnGrade(r) for r in results] == ["M5"] * 4
+    modes = [module.takeMetrics(r)["mode"] for r in results]
+    assert modes.count("shared") == 2 and modes[0] != "shared" and modes[3] != "shared"
+    assert results[0] == results[1] and results[0] is not results[1]
+    assert module.singleFlight.stats() == {"inFlight": 0, "saved": 2}
+    # Nothing stays shared afterwards: the next identical submission is graded again
+    module.handleFullSubmission("91099", 2024, ESSAY)
+    assert server.stats()["requests"] == 3
+
+
+def test_a_cancelled_call_does_not_cancel_its_waiters(server):
+    module = make_module(singleFlight=SingleFlight())
+    leader = Deadline()
+    threading.Timer(0.1, leader.cancel).start()
+    results = submit_together(module, [
+        (("91099", 2024, ESSAY), {"deadline": leader, "stream": True}),
+        (("91099", 2024, ESSAY), {}),
+        (("91099", 2024, ESSAY), {"deadline": Deadline(0.1)}),
+    ])
+    assert results[0][0] == "Cancelled"
+    assert module.returnGrade(results[1]) == "M5"
+    assert results[2][0] == "Timed Out"  # a waiter still has its own deadline
+    assert server.stats()["requests"] == 2 and module.singleFlight.stats()["saved"] == 0
+
+
+def test_async_grades_of_the_same_essay_share_one_call(server):
+    module = make_module(AsyncFeedbackModule, maxConcurrency=4)
+    submissions = [("91099", 2024, ESSAY)] * 3 + [("91099", 2024, ESSAY + " Different.")]
+    results = asyncio.run(module.gradeMany(submissions))
+    assert [module.returnGrade(r) for r in results] == ["M5"] * 4
+    assert server.stats()["requests"] == 2
+    assert module.asyncSingleFlight.stats() == {"inFlight": 0, "saved": 2}
+    assert results[0] == results[1] and results[0] is not results[1]
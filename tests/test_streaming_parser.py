@@ -0,0 +1,57 @@
+import os, sys, json
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm.socketing.streaming import IncrementalJSONParser, completedParagraphs
+
+OUTPUT = {
+    "Output": {
+        "StudentText": "...",
+        "Grade": "M5",
+        "Feedback": {"Strengths": "Clear \"voice\"", "Areas for Improvement": "Depth"},
+        "HighlightedHTML": "<p>One <span title='x'>two</span></p><p>Three</p><p>Four</p>",
+        "Score": 5,
+        "Flags": [True, None],
+    }
+}
+
+
+def feed_in_chunks(text, size, **kwargs):
+    parser = IncrementalJSONParser(**kwargs)
+    for i in range(0, len(text), size):
+        parser.feed(text[i:i + size])
+    return parser
+
+
+def test_chunked_parse_matches_json_loads():
+    text = json.dumps(OUTPUT)
+    for size in (1, 3, 17, len(text)):
+        assert feed_in_chunks(text, size).root == OUTPUT
+
+
+def test_values_reported_as_they_complete():
+    seen = []
+    feed_in_chunks(json.dumps(OUTPUT), 5, onValue=lambda path, value: seen.append(path))
+    assert seen.index(("Output", "Grade")) < seen.index(("Output", "HighlightedHTML"))
+    assert ("Output", "Feedback") in seen and ("Output", "Flags", 1) in seen
+
+
+def test_partial_strings_arrive_as_added_text():
+    partials = []
+    feed_in_chunks(json.dumps(OUTPUT), 8, onPartial=lambda path, text: partials.append((path, text)))
+    html = [text for path, text in partials if path == ("Output", "HighlightedHTML")]
+    assert len(html) > 1 and all(html)
+    assert OUTPUT["Output"]["HighlightedHTML"].startswith("".join(html))
+
+
+def test_tolerates_fences_raw_newlines_and_bad_escapes():
+    raw = '```json\n{"Grade": "A3", "HighlightedHTML": "line one\nit\\\'s fine"}\n```'
+    parser = feed_in_chunks(raw, 4)
+    assert parser.done
+    assert parser.root == {"Grade": "A3", "HighlightedHTML": "line one\nit's fine"}
+
+
+def test_completed_paragraphs_cuts_on_breaks():
+    assert completedParagraphs("<p>a</p><p>b") == "<p>a</p>"
+    assert completedParagraphs("a\n\nb") == "a\n\n"
+    assert completedParagraphs("no break yet") == ""
@@ -0,0 +1,148 @@
+import os, sys, json, asyncio
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from llm.socketing import budget, chunking
+from llm.socketing.async_handle import AsyncFeedbackModule
+from llm.socketing.handle import FeedbackModule, SYSTEM_MESSAGE
+from llm.socketing.prefetch import PreparedPrompt
+from tests.test_exemplar_selection import make_exemplars
+
+ESSAY = "My answer uses recursion with a base case.\n\nIt also uses memoisation."
+ENTRY = {"year": 2024, "question": "Q?", "schedule": "Sched", "criteria": "Crit", "exemplars": make_exemplars()}
+
+
+@pytest.fixture(autouse=True)
+def heuristic(monkeypatch):
+    # Fixed 4 chars per token, whether or not tiktoken is installed
+    monkeypatch.setattr(budget, "tiktoken", None)
+    monkeypatch.setattr(budget, "_charsPerToken", None)
+    monkeypatch.setenv("LLM_CHARS_PER_TOKEN", "4")
+
+
+def test_packing_covers_bands_then_shortest_first():
+    exemplars = [("A", 50), ("A", 10), ("B", 40), ("C", 30), ("A", 20)]
+    pack = lambda limit: budget.packExemplars(exemplars, limit, lambda e: e[0], lambda e: e[1])
+    # Shortest of each band first (A10, C30, B40), then the next shortest that fits
+    assert pack(100) == [("A", 10), ("B", 40), ("C", 30), ("A", 20)]
+    assert pack(45) == [("A", 10), ("C", 30)]
+    assert pack(5) == []
+    assert pack(1000) == exemplars
+
+
+def test_output_cap_respects_the_context_window(monkeypatch):
+    monkeypatch.setenv("LLM_CONTEXT_TOKENS", "10000")
+    monkeypatch.setenv("LLM_MAX_OUTPUT_TOKENS", "4000")
+    assert budget.outputCap(1000) == 4000
+    assert budget.outputCap(8000) == 2000
+    assert budget.outputCap(12000) is None and budget.outputCap(10000) is None  # no room: no max_tokens of 0
+    assert not budget.fitsContext(10000) and budget.fitsContext(9999)
+    monkeypatch.setenv("LLM_MAX_OUTPUT_TOKENS", "0")
+    assert budget.outputCap(1000) is None
+
+
+def test_char_ratio_calibrates_towards_reported_usage():
+    assert budget.countTokens("x" * 40) == 10
+    for _ in range(30):
+        budget.calibrate(3000, 1000)
+    assert 3.0 <= budget.charsPerToken() < 3.05
+    assert budget.countTokens("x" * 30) == 10
+    budget.calibrate(100, 0)  # no usage: ignored
+    assert budget.charsPerToken() < 3.05
+
+
+def test_plan_packs_exemplars_into_the_budget(monkeypatch):
+    monkeypatch.setenv("LLM_TOKEN_PRICES", "m=1/2")
+    prompt = PreparedPrompt(ENTRY, SYSTEM_MESSAGE)
+    full = prompt.plan(ESSAY, "m")
+    components = full["components"]
+    assert set(components) == {"instructions", "schedule", "criteria", "question", "essay", "exemplars"}
+    assert components["essay"] == budget.countTokens(ESSAY) and components["schedule"] == 2
+    assert full["promptTokens"] == sum(components.values())
+    assert abs(full["promptTokens"] - budget.messageTokens(full["messages"])) <= 5
+    assert full["exemplars"]["sent"] == full["exemplars"]["relevant"] < full["exemplars"]["total"] == 8
+    assert full["costUSD"] == round((full["promptTokens"] + 2 * full["expectedOutputTokens"]) / 1e6, 6)
+    assert full["fits"] and not full["overBudget"]
+    # Only room for about two exemplars: the relevant ones of two bands are kept, still valid JSON
+    each = max(budget.countTokens(json.dumps(e)) + 1 for e in ENTRY["exemplars"]["exemplars"])
+    monkeypatch.setenv("LLM_PROMPT_TOKEN_BUDGET", str(full["promptTokens"] - components["exemplars"] + 2 * each + 20))
+    tight = prompt.plan(ESSAY, "m")
+    sent = json.loads(tight["messages"][1]["content"].split("as guidance: ")[1].split(". These exemplars")[0])
+    assert len(sent["exemplars"]) == tight["exemplars"]["sent"] == 2
+    assert len({e["Grade"][0] for e in sent["exemplars"]}) == 2
+    assert tight["promptTokens"] < full["promptTokens"]
+
+
+def test_long_essays_are_planned_as_chunked_requests(monkeypatch):
+    monkeypatch.setenv("LLM_TOKEN_PRICES", "m=1/2")
+    monkeypatch.setenv("LLM_CHUNK_THRESHOLD", "2000")
+    monkeypatch.setenv("LLM_CHUNK_CHARS", "1000")
+    monkeypatch.setenv("LLM_MAX_OUTPUT_TOKENS", "500")  # far less than a single response echoing the essay
+    essay = "\n\n".join(f"Paragraph {i} explains recursion. " + "It uses a base case. " * 40 for i in range(12))
+    module = FeedbackModule(useCache=False)
+    monkeypatch.setattr(module, "_prepared", lambda standard, year, wait=True: PreparedPrompt(ENTRY, SYSTEM_MESSAGE))
+    plan = module.planSubmission("91099", 2024, essay)
+    chunks = chunking.splitParagraphs(essay)
+    assert plan["requests"] == len(chunks) + 1 and plan["fits"]
+    assert plan["promptTokens"] > budget.countTokens(essay) * 2  # the grade request and every chunk carry text
+    priced = PreparedPrompt(ENTRY, SYSTEM_MESSAGE).chunkedPlan(essay, "m")
+    assert priced["costUSD"] == round((priced["promptTokens"] + 2 * priced["expectedOutputTokens"]) / 1e6, 6)
+    # Too long only when a request wouldn't fit the context window
+    monkeypatch.setenv("LLM_CONTEXT_TOKENS", str(budget.countTokens(essay)))
+    assert not module.planSubmission("91099", 2024, essay)["fits"]
+    assert module.planSubmission("91099", 2024, ESSAY)["requests"] == 1
+
+
+def test_requests_carry_max_tokens_and_oversized_essays_are_rejected(monkeypatch):
+    sent = []
+
+    def create(**kwargs):
+        sent.append(kwargs)
+        response = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="{}"))], usage=None)
+        return SimpleNamespace(parse=lambda: response, headers={})
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(with_raw_response=SimpleNamespace(create=create))))
+    monkeypatch.setenv("LLM_CONTEXT_TOKENS", "2000")
+    monkeypatch.setenv("LLM_CHUNK_THRESHOLD", "100000")
+    module = FeedbackModule(useCache=False)
+    messages = [{"role": "user", "content": "x" * 4000}]
+    module._createCompletion(client, messages)
+    assert sent[-1]["max_tokens"] == 2000 - budget.messageTokens(messages)
+    monkeypatch.setenv("LLM_MAX_OUTPUT_TOKENS", "0")
+    module._createCompletion(client, messages)
+    assert "max_tokens" not in sent[-1]
+    monkeypatch.setattr(module, "loadEntry", lambda standard, year: (ENTRY, None))
+    result = module.handleFullSubmission("91099", 2024, "word " * 2000)
+    assert result[0] == "Input Error" and "too long" in result[1] and len(sent) == 2
+
+
+def test_async_grading_plans_and_caps_like_the_sync_path(monkeypatch):
+    sent, requested = [], []
+
+    async def create(**kwargs):
+        sent.append(kwargs)
+        response = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="{}"))], usage=None)
+        return SimpleNamespace(parse=lambda: response, headers={})
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(with_raw_response=SimpleNamespace(create=create))))
+
+    async def request(messages, stream=False, onProgress=None):
+        requested.append(messages)
+        return json.dumps({"Output": {"Grade": "M5", "HighlightedHTML": "<p>ok</p>"}})
+    monkeypatch.setenv("LLM_CONTEXT_TOKENS", "20000")
+    monkeypatch.setenv("LLM_CHUNK_THRESHOLD", "100000")
+    monkeypatch.setenv("LLM_GRADE_MAX_TOKENS", "300")
+    module = AsyncFeedbackModule(useCache=False)
+    monkeypatch.setattr(module, "loadEntry", lambda standard, year: (ENTRY, None))
+    monkeypatch.setattr(module, "requestCompletionAsync", request)
+    # The packed prompt of plan(), not every exemplar
+    monkeypatch.setenv("LLM_PROMPT_TOKEN_BUDGET", "600")
+    assert module.returnGrade(asyncio.run(module.grade("91099", 2024, ESSAY))) == "M5"
+    assert requested == [PreparedPrompt(ENTRY, SYSTEM_MESSAGE).plan(ESSAY)["messages"]]
+    result = asyncio.run(module.grade("91099", 2024, "word " * 20000))
+    assert result[0] == "Input Error" and "too long" in result[1] and len(requested) == 1
+    # Grade-only requests get the smaller output cap
+    asyncio.run(module._createCompletionAsync(client, [{"role": "system", "content": chunking.GRADE_SYSTEM_MESSAGE}, {"role": "user", "content": ESSAY}]))
+    asyncio.run(module._createCompletionAsync(client, [{"role": "user", "content": ESSAY}]))
+    assert sent[0]["max_tokens"] == 300 and sent[1]["max_tokens"] > 300
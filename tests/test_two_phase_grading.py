@@ -0,0 +1,141 @@
+import os, sys, json, time, shutil
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from llm.mockserver import MockLLMServer
+from llm.socketing import chunking
+from llm.socketing.handle import FeedbackModule
+from llm.socketing.jobqueue import JobQueue, JobRunner
+from llm.socketing.ratelimit import AdaptiveRateLimiter
+from llm.socketing.router import ModelRouter, Backend
+from database.LLM_database_manage import LLMDatabaseManager
+from tests.test_job_queue import wait_for
+
+ESSAY = "\n\n".join(f"Point {n} explains the idea with an example. It links back to the question." for n in range(12))
+
+
+@pytest.fixture
+def server(monkeypatch):
+    # The full response echoes the essay, so at this rate it takes well over a second; the grade-only one doesn't
+    server = MockLLMServer(latency="fixed:0.05", tokensPerSecond=400).start()
+    monkeypatch.setenv("OPENROUTER_BASE_URL", server.url)
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    monkeypatch.setenv("LLM_TWO_PHASE", "1")
+    yield server
+    server.stop()
+
+
+def make_module():
+    limiter = AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=8, statePath='')
+    return FeedbackModule(useCache=False, limiter=limiter, router=ModelRouter([Backend("mock")]))
+
+
+def test_the_grade_arrives_before_the_highlights(server):
+    module = make_module()
+    events = []
+    started = time.perf_counter()
+    result = module.handleFullSubmission("91099", 2024, ESSAY, stream=True,
+                                         onProgress=lambda kind, value: events.append((kind, value, time.perf_counter() - started)))
+    total = time.perf_counter() - started
+    graded = [(value, at) for kind, value, at in events if kind == 'graded']
+    assert len(graded) == 1 and graded[0][1] < total / 2
+    assert graded[0][0]["Output"]["Grade"] == "M5" and "HighlightedHTML" not in graded[0][0]["Output"]
+    assert [value for kind, value, _ in events if kind == 'grade'] == ["M5"]  # the full response's grade isn't repeated
+    assert any(kind == 'highlight' for kind, _, _ in events)
+    assert module.returnGrade(result) == "M5" and "<span" in module.returnHighlightedHTML(result)
+    metrics = module.takeMetrics(result)
+    assert metrics["mode"] == "two-phase" and metrics["requests"] == 2 == server.stats()["requests"]
+    assert metrics["grade_ready_s"] < metrics["llm_s"]
+
+
+def test_the_grade_is_kept_when_the_highlights_fail(monkeypatch):
+    monkeypatch.setenv("LLM_TWO_PHASE", "1")
+    module = make_module()
+
+    def fake(messages, stream=False, onProgress=None, deadline=None, metrics=None):
+        if chunking.isGradeOnly(messages):
+            return json.dumps({"Output": {"Grade": "E7", "Feedback": {"Strengths": "Clear"}}})
+        raise RuntimeError("connection dropped")
+    monkeypatch.setattr(module, "requestCompletion", fake)
+    monkeypatch.setattr(module, "loadEntry", lambda standard, year: (
+        {"year": 2024, "question": "Q", "schedule": "S", "criteria": "C", "exemplars": {"exemplars": []}}, None))
+    result = module.handleFullSubmission("91099", 2024, ESSAY)
+    assert result["Output"]["Grade"] == "E7" and result["Output"]["Feedback"] == {"Strengths": "Clear"}
+    assert result["Output"]["HighlightedHTML"] == chunking.plainHTML(ESSAY)
+    # The missing highlights are neither stored for reuse nor cached
+    assert result["Reuse"]["failed"] == list(range(12))
+    assert module.paragraphRecords(ESSAY, result) == []
+    stored = []
+    module.cache = SimpleNamespace(makeKey=lambda *args: "key", get=lambda key: None, put=lambda *args: stored.append(args))
+    module.handleFullSubmission("91099", 2024, ESSAY + " Again.")
+    assert stored == []
+    module.cache = None
+    # With LLM_GRADE_MAX_TOKENS set, grade-only requests are sent with the smaller output cap
+    sent = []
+    response = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="{}"))], usage=None)
+    create = lambda **kwargs: sent.append(kwargs) or SimpleNamespace(parse=lambda: response, headers={})
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(with_raw_response=SimpleNamespace(create=create))))
+    monkeypatch.setenv("LLM_GRADE_MAX_TOKENS", "300")
+    module._createCompletion(client, [{"role": "system", "content": chunking.GRADE_SYSTEM_MESSAGE}, {"role": "user", "content": ESSAY}])
+    module._createCompletion(client, [{"role": "user", "content": ESSAY}])
+    assert sent[0]["max_tokens"] == 300 and sent[1]["max_tokens"] > 300
+
+
+def test_grade_only_requests_leave_a_reasoning_model_room_to_answer(monkeypatch):
+    # A reasoning model thinks first and its thinking counts against max_tokens; the answer only comes after
+    thinking, answer = 2500, json.dumps({"Output": {"Grade": "M5", "Feedback": {"Strengths": "s"}}})
+
+    def create(max_tokens=None, **kwargs):
+        content = answer if max_tokens is None or max_tokens >= thinking + 200 else ""
+        message = SimpleNamespace(content=content, reasoning="..." * thinking)
+        response = SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+        return SimpleNamespace(parse=lambda: response, headers={})
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(with_raw_response=SimpleNamespace(create=create))))
+    monkeypatch.delenv("LLM_GRADE_MAX_TOKENS", raising=False)
+    module = make_module()
+    messages = [{"role": "system", "content": chunking.GRADE_SYSTEM_MESSAGE}, {"role": "user", "content": ESSAY}]
+    text, _ = module._createCompletion(client, messages)
+    assert module.returnGrade(module.parseModelOutput(text)) == "M5"
+    monkeypatch.setenv("LLM_GRADE_MAX_TOKENS", "1024")
+    text, _ = module._createCompletion(client, messages)
+    assert text == ""
+
+
+def test_job_saves_the_grade_first_and_fills_in_the_same_row(server, tmp_path):
+    dbPath = str(tmp_path / "llm.db")
+    shutil.copy("./database/LLM_testdatabase.db", dbPath)
+    limiter = AdaptiveRateLimiter(ratePerMinute=60000, maxConcurrency=4, statePath='')
+    module = FeedbackModule(useCache=False, limiter=limiter, router=ModelRouter([Backend("mock")]))
+    runner = JobRunner(JobQueue(dbPath), module, workers=1, pollSeconds=0.05)
+    events, rowsWhenGraded = [], []
+
+    def listener(event, job, payload):
+        events.append((event, job, payload))
+        if event == 'graded':
+            db = LLMDatabaseManager(dbPath)
+            rowsWhenGraded.extend(db.getUserSubmissions("two-phase"))
+            db.exit()
+    runner.addListener(listener)
+    runner.start()
+    try:
+        runner.submit("two-phase", "91099", 2024, ESSAY)
+        wait_for(events, 1)
+    finally:
+        runner.stop()
+    kinds = [event for event, _, _ in events]
+    assert kinds.index('graded') < kinds.index('done')
+    graded = next(payload for event, _, payload in events if event == 'graded')
+    done = next(payload for event, _, payload in events if event == 'done')
+    assert graded.grade == "M5" and graded.highlightedHtml == ""
+    assert len(rowsWhenGraded) == 1 and rowsWhenGraded[0]["grade"] == "M5" and rowsWhenGraded[0]["highlightedHtml"] is None
+    assert done.submissionId == graded.submissionId and "<span" in done.highlightedHtml
+    db = LLMDatabaseManager(dbPath)
+    try:
+        rows = db.getUserSubmissions("two-phase")
+        assert len(rows) == 1 and rows[0]["highlightedHtml"] == done.highlightedHtml
+        assert db.getMetricPercentiles("grade_ready_s", standard="91099")
+    finally:
+        db.exit()